@@ -46,6 +46,8 @@ resource "aws_api_gateway_integration" "execution_integration" {
   resource_id = aws_api_gateway_resource.execution_resource[0].id
   http_method = aws_api_gateway_method.execution_method[0].http_method
 
+  # Query parameters are passed on as decoded, escaped strings: action plus the link's id (short links),
+  # digest and item (digest links) or taskToken, sm and ex (full links)
   integration_http_method = "POST"
   type                    = "AWS"
   uri                     = module.lambda_handle_approval_callback[0].lambda_function_invoke_arn
@@ -66,7 +68,7 @@ resource "aws_api_gateway_integration" "execution_integration" {
   },
   "queryStringParameters": {
 #foreach($queryParam in $input.params().querystring.keySet())
-    "$queryParam": "$input.params().querystring.get($queryParam)"#if($foreach.hasNext),#end
+    "$queryParam": "$util.escapeJavaScript($input.params().querystring.get($queryParam))"#if($foreach.hasNext),#end
 #end
   }
 }
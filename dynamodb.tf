@@ -0,0 +1,47 @@
+#######################################################
+# State shared between functions
+#######################################################
+resource "aws_dynamodb_table" "state" {
+  count        = local.state_table_enabled ? 1 : 0
+  name         = format("%s-state", local.name_prefix)
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  attribute {
+    name = "collection"
+    type = "S"
+  }
+
+  # Sparse index of the items that have to be listed, e.g. waiters and pending approvals.
+  # Listing them reads their collection only, not every item of the table.
+  global_secondary_index {
+    name            = "collection"
+    hash_key        = "collection"
+    range_key       = "pk"
+    projection_type = "ALL"
+  }
+
+  # Items written with a TTL are removed by DynamoDB some time after they expire
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  point_in_time_recovery {
+    enabled = false
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = merge(
+    { Name = format("%s-state", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
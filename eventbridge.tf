@@ -71,7 +71,14 @@ module "eventbridge" {
   }
 
   targets = {
-    tgw_create_auto_attach = [
+    # Create events either start the accept state machine or are queued for the batch accepter
+    tgw_create_auto_attach = local.accept_batch_enabled ? [
+      {
+        name            = "TGW Batch Accepter"
+        arn             = aws_sqs_queue.accept_batch[0].arn
+        attach_role_arn = false
+      }
+      ] : [
       {
         name            = "TGW Accepter"
         arn             = aws_sfn_state_machine.tgw_auto_accept.arn
@@ -110,4 +117,66 @@ module "eventbridge" {
   ]
 
   tags = local.common_merged_tags
-}
\ No newline at end of file
+}
+#######################################################
+# Schedule for the pendingAcceptance sweeper
+#######################################################
+resource "aws_cloudwatch_event_rule" "sweep_pending_attachments" {
+  count               = var.sweeper_enabled ? 1 : 0
+  name                = format("%s-sweep-pending-attachments", local.name_prefix)
+  description         = "Periodically reconcile TGW attachments left in pendingAcceptance"
+  schedule_expression = var.sweeper_schedule_expression
+
+  tags = merge(
+    { Name = format("%s-sweep-pending-attachments", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
+
+resource "aws_cloudwatch_event_target" "sweep_pending_attachments" {
+  count = var.sweeper_enabled ? 1 : 0
+  rule  = aws_cloudwatch_event_rule.sweep_pending_attachments[0].name
+  arn   = module.lambda_sweep_pending_attachments[0].lambda_function_arn
+}
+
+#######################################################
+# Schedule for the attachment watcher
+#######################################################
+resource "aws_cloudwatch_event_rule" "watch_attachments" {
+  count               = var.attachment_watcher_enabled ? 1 : 0
+  name                = format("%s-watch-attachments", local.name_prefix)
+  description         = "Periodically resume routing manager executions waiting for TGW attachments"
+  schedule_expression = var.attachment_watcher_schedule_expression
+
+  tags = merge(
+    { Name = format("%s-watch-attachments", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
+
+resource "aws_cloudwatch_event_target" "watch_attachments" {
+  count = var.attachment_watcher_enabled ? 1 : 0
+  rule  = aws_cloudwatch_event_rule.watch_attachments[0].name
+  arn   = module.lambda_watch_attachments[0].lambda_function_arn
+}
+
+#######################################################
+# Schedule for the approval digest
+#######################################################
+resource "aws_cloudwatch_event_rule" "send_approval_digest" {
+  count               = local.approval_digest_enabled ? 1 : 0
+  name                = format("%s-send-approval-digest", local.name_prefix)
+  description         = "Periodically send pending manual approvals as one digest"
+  schedule_expression = var.approval_digest_schedule_expression
+
+  tags = merge(
+    { Name = format("%s-send-approval-digest", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
+
+resource "aws_cloudwatch_event_target" "send_approval_digest" {
+  count = local.approval_digest_enabled ? 1 : 0
+  rule  = aws_cloudwatch_event_rule.send_approval_digest[0].name
+  arn   = module.lambda_send_approval_digest[0].lambda_function_arn
+}
@@ -0,0 +1,118 @@
+"""
+Cold start benchmark of the Lambda handler modules.
+
+Imports each handler in a fresh interpreter, the way a new execution
+environment does, and measures the time spent importing the module and
+running its init code, and whether the AWS SDK was loaded by it. Each handler
+is measured with client prewarming off (on-demand cold start) and forced on
+(provisioned concurrency and SnapStart, see clients.prewarm_clients).
+
+The results are checked against benchmarks/cold_start_budget.json:
+
+    max_init_ms   Median on-demand init time allowed for the handler
+    lazy_sdk      If true, importing the handler must not load boto3 or botocore
+
+and the script exits with status 1 if a handler is over its budget.
+
+Usage (from the functions directory):
+    python benchmarks/bench_cold_start.py [--runs 5] [--handlers validate_iam,handle_accept] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+COMMON_DIR = os.path.join(SRC_DIR, 'common', 'python')
+BUDGET_FILE = os.path.join(BENCH_DIR, 'cold_start_budget.json')
+
+# Run in the child interpreter: import the handler and report what it cost
+PROBE = '''
+import json, sys, time
+sys.path[:0] = [sys.argv[1], sys.argv[2]]
+started = time.perf_counter()
+import handler
+init_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({'init_ms': init_ms, 'boto3': 'boto3' in sys.modules, 'botocore': 'botocore' in sys.modules}))
+'''
+
+# Configuration a deployed function would have, so init takes the same paths
+ENVIRONMENT = {
+    'AWS_REGION': 'eu-north-1',
+    'AWS_DEFAULT_REGION': 'eu-north-1',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'IPAM_POOL_IDS': '',
+    'ALLOWED_PRINCIPAL_PATTERNS': '',
+}
+
+
+def handler_names():
+    return sorted(
+        name for name in os.listdir(SRC_DIR)
+        if os.path.isfile(os.path.join(SRC_DIR, name, 'handler.py'))
+    )
+
+
+def measure(name, prewarm, runs):
+    env = dict(os.environ, **ENVIRONMENT, CLIENT_PREWARM='always' if prewarm else 'never')
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE, os.path.join(SRC_DIR, name), COMMON_DIR],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'init_ms': round(statistics.median(s['init_ms'] for s in samples), 1),
+        'boto3': samples[0]['boto3'],
+        'botocore': samples[0]['botocore'],
+    }
+
+
+def check(name, result, budget):
+    limits = {**budget.get('default', {}), **budget.get('handlers', {}).get(name, {})}
+    failures = []
+    if 'max_init_ms' in limits and result['init_ms'] > limits['max_init_ms']:
+        failures.append(f"init {result['init_ms']} ms > {limits['max_init_ms']} ms")
+    if limits.get('lazy_sdk'):
+        failures.extend(f"{sdk} loaded at import" for sdk in ('boto3', 'botocore') if result[sdk])
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--handlers', help='Comma separated handler names, default all')
+    parser.add_argument('--budget', default=BUDGET_FILE)
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+
+    with open(args.budget) as f:
+        budget = json.load(f)
+    names = args.handlers.split(',') if args.handlers else handler_names()
+
+    results = {}
+    failed = False
+    print(f"{'handler':<28} {'init ms':>8} {'boto3':>6} {'botocore':>9} {'prewarmed ms':>13}  budget")
+    for name in names:
+        lazy = measure(name, prewarm=False, runs=args.runs)
+        eager = measure(name, prewarm=True, runs=args.runs)
+        failures = check(name, lazy, budget)
+        failed = failed or bool(failures)
+        results[name] = {'on_demand': lazy, 'prewarmed': eager, 'failures': failures}
+        status = '; '.join(failures) if failures else 'ok'
+        print(f"{name:<28} {lazy['init_ms']:>8} {str(lazy['boto3']):>6} {str(lazy['botocore']):>9} {eager['init_ms']:>13}  {status}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
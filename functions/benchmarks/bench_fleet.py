@@ -0,0 +1,345 @@
+"""
+Scale benchmark of the attachment handlers over a synthetic fleet.
+
+Builds a fleet in moto (sfn_local.fleet): transit gateways with route tables,
+IPAM pools with allocations and one VPC attachment per event. Every handler an
+attachment event reaches is invoked in-process for every attachment, in
+workflow order:
+
+    create events   validate_iam, validate_ipam, handle_accept,
+                    handle_attachment_tags, accept_pipeline (all stages),
+                    handle_accept_batch (SQS batches)
+    accept events   wait_for_available_tgwa, collect_pool_tags,
+                    handle_association, handle_propagation (with the
+                    collect_pool_tags result, as the routing manager passes it)
+
+The approval and scheduled functions are not driven by attachment events and
+are left out; bench_workflows.py covers the watcher.
+
+Each handler gets its own cold pool and tag caches, like a separate Lambda
+function, which then stay warm for the rest of its events. Recorded per
+handler: latency percentiles and the first (cold cache) invocation, EC2 calls
+per attachment by operation (every page of a paginated call counts), errors
+and returned results, and the peak memory allocated by an invocation,
+sampled with tracemalloc on every Nth invocation (those are left out of the
+latency figures).
+
+Results are written as JSON. Pass a previous results file with --compare to
+print the change of each figure.
+
+Usage (from the functions directory):
+    python benchmarks/bench_fleet.py [--transit-gateways 4] [--pools 20] [--allocations 500]
+        [--attachments 2000] [--batch-size 10] [--page-size 1000] [--memory-every 25]
+        [--handlers validate_ipam,collect_pool_tags] [--output fleet.json] [--compare baseline.json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'common', 'python'))
+
+ACCOUNT = '123456789012'
+REGION = 'eu-north-1'
+CREATE = 'CreateTransitGatewayVpcAttachment'
+ACCEPT = 'AcceptTransitGatewayVpcAttachment'
+
+# Handler directory -> event the handler is invoked with, in workflow order
+HANDLERS = {
+    'validate_iam': CREATE,
+    'validate_ipam': CREATE,
+    'handle_accept': CREATE,
+    'handle_attachment_tags': CREATE,
+    'accept_pipeline': CREATE,
+    'handle_accept_batch': CREATE,
+    'wait_for_available_tgwa': ACCEPT,
+    'collect_pool_tags': ACCEPT,
+    'handle_association': ACCEPT,
+    'handle_propagation': ACCEPT,
+}
+
+# Figures compared by --compare, lower is better for all of them
+COMPARED = [
+    ('p50_ms', ('latency_ms', 'p50')),
+    ('p99_ms', ('latency_ms', 'p99')),
+    ('first_ms', ('first_ms',)),
+    ('ec2/att', ('ec2_calls_per_attachment',)),
+    ('peak KiB', ('peak_memory_kib',)),
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def invocations(source, events, accepted, batch_size):
+    """Yield (attachments covered, payload) for each invocation of a handler."""
+    from pipeline import STAGES
+
+    if source == 'handle_accept_batch':
+        for start in range(0, len(events), batch_size):
+            chunk = events[start:start + batch_size]
+            yield len(chunk), {'Records': [
+                {'messageId': f"msg-{start + n}", 'body': json.dumps(event)} for n, event in enumerate(chunk)
+            ]}
+    elif source == 'accept_pipeline':
+        for event in events:
+            yield 1, {'Stages': list(STAGES), 'Event': event}
+    elif source in ('handle_association', 'handle_propagation'):
+        for event, pool_tags in zip(events, accepted):
+            yield 1, dict(event, GetPoolTagsPayload={'Payload': pool_tags})
+    else:
+        for event in events:
+            yield 1, event
+
+
+def measure(handler, function_name, payloads, calls, memory_every):
+    """Invoke a handler with every payload, returning its raw measurements and results."""
+    from sfn_local.aws import LambdaContext
+
+    durations, peaks, results, errors, outcomes = [], [], [], Counter(), Counter()
+    attachments = 0
+    first_ms = None
+    before = Counter(calls)
+    devnull = open(os.devnull, 'w')
+    for n, (covered, payload) in enumerate(payloads):
+        attachments += covered
+        # Payloads reach Lambda as JSON
+        payload = json.loads(json.dumps(payload))
+        sampled = memory_every and n % memory_every == memory_every - 1
+        if sampled:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            # Handlers write their metrics (EMF) to stdout
+            with contextlib.redirect_stdout(devnull):
+                result = handler(payload, LambdaContext(function_name))
+        except Exception as e:
+            result = None
+            errors[f"{type(e).__name__}: {e}"[:200]] += 1
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if sampled:
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        else:
+            durations.append(elapsed_ms)
+        if first_ms is None:
+            first_ms = elapsed_ms
+        results.append(json.loads(json.dumps(result, default=str)))
+        if isinstance(result, dict) and 'batchItemFailures' in result:
+            outcomes['RETRY'] += len(result['batchItemFailures'])
+            outcomes['DONE'] += covered - len(result['batchItemFailures'])
+        elif isinstance(result, dict) and 'Results' in result:
+            # accept_pipeline: the last stage run decides
+            stages = list(result['Results'].values())
+            outcomes[str(stages[-1]['Payload'].get('result')) if stages else 'None'] += 1
+        elif result is not None:
+            outcomes[str(result.get('result') if isinstance(result, dict) else result)] += 1
+    devnull.close()
+    made = Counter(calls)
+    made.subtract(before)
+    return {
+        'invocations': len(results),
+        'attachments': attachments,
+        'durations': durations,
+        'first_ms': first_ms,
+        'peaks': peaks,
+        'errors': errors,
+        'outcomes': outcomes,
+        'calls': +made,
+    }, results
+
+
+def summarize(raw):
+    durations = raw['durations'] or [0.0]
+    total_calls = sum(raw['calls'].values())
+    attachments = raw['attachments'] or 1
+    return {
+        'invocations': raw['invocations'],
+        'attachments': raw['attachments'],
+        'errors': sum(raw['errors'].values()),
+        'error_samples': [f"{count}x {error}" for error, count in raw['errors'].most_common(3)],
+        'outcomes': dict(raw['outcomes'].most_common()),
+        'latency_ms': {
+            'mean': round(sum(durations) / len(durations), 3),
+            'p50': round(percentile(durations, 0.5), 3),
+            'p90': round(percentile(durations, 0.9), 3),
+            'p99': round(percentile(durations, 0.99), 3),
+            'max': round(max(durations), 3),
+        },
+        'first_ms': round(raw['first_ms'] or 0.0, 3),
+        'ec2_calls': total_calls,
+        'ec2_calls_per_attachment': round(total_calls / attachments, 3),
+        'ec2_calls_by_operation': {op: round(count / attachments, 3) for op, count in sorted(raw['calls'].items())},
+        'peak_memory_kib': round(max(raw['peaks']) / 1024, 1) if raw['peaks'] else None,
+        'memory_samples': len(raw['peaks']),
+    }
+
+
+def reset_container_caches():
+    """Drop the warm caches of the common layer, as a freshly started function would have them."""
+    import ipam_lookup
+    import pool_index
+
+    pool_index._index.clear()
+    ipam_lookup.clear_pool_cache()
+
+
+def run(args):
+    from sfn_local.fleet import build_fleet, handler_environment, pool_id
+
+    os.environ.update(handler_environment(ACCOUNT, REGION, [pool_id(n) for n in range(args.pools)]))
+    # Keep the accept batch sequential so calls and latencies belong to this benchmark's thread
+    os.environ.setdefault('ACCEPT_MAX_WORKERS', '1')
+
+    from moto import mock_aws
+
+    with mock_aws():
+        from clients import get_client
+        from sfn_local.aws import count_api_calls, install_ec2_extensions, load_handler
+        from sfn_local.fleet import attachment_event
+
+        ec2 = get_client('ec2', REGION)
+        started = time.perf_counter()
+        fleet = build_fleet(ec2, ACCOUNT, REGION, transit_gateways=args.transit_gateways, pools=args.pools,
+                            allocations=args.allocations, attachments=args.attachments)
+        build_seconds = time.perf_counter() - started
+        install_ec2_extensions(ec2, fleet.ipam_pools, page_size=args.page_size)
+        calls = count_api_calls(ec2)
+
+        events = {name: [attachment_event(a, ACCOUNT, name) for a in fleet.attachments] for name in (CREATE, ACCEPT)}
+        selected = args.handlers.split(',') if args.handlers else list(HANDLERS)
+        accepted = [{} for _ in fleet.attachments]
+        handlers = {}
+        for source in HANDLERS:
+            # The routing handlers need the pool tags collected before them
+            if source not in selected and not (source == 'collect_pool_tags' and
+                                               {'handle_association', 'handle_propagation'} & set(selected)):
+                continue
+            reset_container_caches()
+            module = load_handler(source)
+            payloads = invocations(source, events[HANDLERS[source]], accepted, args.batch_size)
+            raw, results = measure(module.lambda_handler, source, payloads, calls, args.memory_every)
+            if source == 'collect_pool_tags':
+                accepted = [r or {} for r in results]
+            if source in selected:
+                handlers[source] = summarize(raw)
+                print(f"  {source:<26} {raw['invocations']:>6} invocations", file=sys.stderr)
+
+    return {
+        'benchmark': 'fleet',
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'parameters': {
+            'transit_gateways': args.transit_gateways,
+            'pools': args.pools,
+            'allocations_per_pool': args.allocations,
+            'attachments': args.attachments,
+            'batch_size': args.batch_size,
+            'page_size': args.page_size,
+            'memory_every': args.memory_every,
+        },
+        'fleet_build_seconds': round(build_seconds, 2),
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == 'darwin' else 1),
+        'handlers': handlers,
+    }
+
+
+def figure(summary, path):
+    for key in path:
+        summary = (summary or {}).get(key)
+    return summary
+
+
+def print_results(results, baseline=None):
+    params = results['parameters']
+    print(f"\nFleet: {params['transit_gateways']} transit gateways, {params['pools']} pools x "
+          f"{params['allocations_per_pool']} allocations, {params['attachments']} attachments "
+          f"(revision {results['revision']}, max RSS {results['max_rss_kib'] // 1024} MiB)")
+    print(f"  {'handler':<26} {'calls':>6} {'errors':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+          f"{'first ms':>9} {'ec2/att':>8} {'peak KiB':>9}")
+    for name, s in results['handlers'].items():
+        latency = s['latency_ms']
+        print(f"  {name:<26} {s['invocations']:>6} {s['errors']:>6} {latency['p50']:>8} {latency['p90']:>8} "
+              f"{latency['p99']:>8} {s['first_ms']:>9} {s['ec2_calls_per_attachment']:>8} "
+              f"{s['peak_memory_kib'] if s['peak_memory_kib'] is not None else '-':>9}")
+        print(f"    outcomes: {s['outcomes']}")
+        for error in s['error_samples']:
+            print(f"    error: {error}")
+    if baseline is None:
+        return
+
+    print(f"\nChange from {baseline.get('revision')} ({baseline.get('timestamp')}):")
+    if baseline.get('parameters') != params:
+        print(f"  warning: baseline parameters differ: {baseline.get('parameters')}")
+    print(f"  {'handler':<26} " + ' '.join(f"{label:>16}" for label, _ in COMPARED))
+    for name, s in results['handlers'].items():
+        before = baseline.get('handlers', {}).get(name)
+        if before is None:
+            print(f"  {name:<26} not in baseline")
+            continue
+        cells = []
+        for _, path in COMPARED:
+            old, new = figure(before, path), figure(s, path)
+            if old is None or new is None:
+                cells.append('-')
+            elif old == 0:
+                cells.append(f"{old}->{new}")
+            else:
+                cells.append(f"{(new - old) / old * 100:+.1f}%")
+        print(f"  {name:<26} " + ' '.join(f"{cell:>16}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--transit-gateways', type=int, default=4)
+    parser.add_argument('--pools', type=int, default=20)
+    parser.add_argument('--allocations', type=int, default=500, help='Allocations per pool')
+    parser.add_argument('--attachments', type=int, default=2000, help='Attachments, each with a create and accept event')
+    parser.add_argument('--batch-size', type=int, default=10, help='SQS batch size of handle_accept_batch')
+    parser.add_argument('--page-size', type=int, default=1000, help='Largest page of the paged IPAM calls')
+    parser.add_argument('--memory-every', type=int, default=25,
+                        help='Trace memory on every Nth invocation of a handler, 0 to disable')
+    parser.add_argument('--handlers', help='Comma-separated handler directories, default all')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Results JSON of an earlier run to compare with')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    unknown = set(args.handlers.split(',')) - set(HANDLERS) if args.handlers else set()
+    if unknown:
+        parser.error(f"unknown handlers: {', '.join(sorted(unknown))}")
+
+    results = run(args)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark of CloudTrail event parsing on state machine payloads.
+
+Each state of the state machines receives the CloudTrail event merged with the
+results of the previous states, so payloads grow to several KB. This parses
+such payloads into CloudTrailEvent, TGWAttachment and TGW the way every
+handler does, comparing the current models with the previous implementation
+(json.loads tried first, responseElements walked once per model).
+
+Usage (from the functions directory):
+    python benchmarks/bench_models.py [--iterations 20000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'common', 'python'))
+
+import models  # noqa: E402
+from models import TGW, CloudTrailEvent, TGWAttachment  # noqa: E402
+
+
+def legacy_parse(raw_event):
+    """The previous from_raw and from_event implementations, inlined."""
+    try:
+        data = json.loads(raw_event)
+    except (TypeError, ValueError):
+        data = raw_event
+    detail = data.get('detail', {})
+    result = []
+    for fields in (('vpcOwnerId', 'vpcId', 'transitGatewayAttachmentId', 'state'), ('transitGatewayId',)):
+        if 'AcceptTransitGatewayVpcAttachmentResponse' in detail['responseElements']:
+            resp = detail['responseElements']['AcceptTransitGatewayVpcAttachmentResponse']['transitGatewayVpcAttachment']
+        elif 'CreateTransitGatewayVpcAttachmentResponse' in detail['responseElements']:
+            resp = detail['responseElements']['CreateTransitGatewayVpcAttachmentResponse']['transitGatewayVpcAttachment']
+        else:
+            raise ValueError("Invalid event type")
+        result.append([str(resp.get(f, '')) for f in fields])
+    return result
+
+
+def current_parse(raw_event):
+    ct_event = CloudTrailEvent.from_raw(raw_event)
+    return TGWAttachment.from_event(ct_event), TGW.from_event(ct_event)
+
+
+def invoke_result(payload):
+    """A lambda:invoke task result as merged into the state machine state."""
+    return {
+        'ExecutedVersion': '$LATEST',
+        'Payload': payload,
+        'SdkHttpMetadata': {
+            'AllHttpHeaders': {
+                'X-Amz-Executed-Version': ['$LATEST'],
+                'x-amzn-Remapped-Content-Length': ['0'],
+                'Connection': ['keep-alive'],
+                'x-amzn-RequestId': ['0f6a5d7e-1111-4c3b-9a0e-2b1c5d6e7f80'],
+                'Content-Length': [str(len(json.dumps(payload)))],
+                'Date': ['Mon, 12 May 2025 10:00:00 GMT'],
+                'X-Amzn-Trace-Id': ['Root=1-6821c8a0-1234567890abcdef01234567;Parent=1a2b3c4d5e6f7a8b;Sampled=0'],
+                'Content-Type': ['application/json'],
+            },
+            'HttpStatusCode': 200,
+        },
+        'SdkResponseMetadata': {'RequestId': '0f6a5d7e-1111-4c3b-9a0e-2b1c5d6e7f80'},
+        'StatusCode': 200,
+    }
+
+
+def make_payload(steps):
+    attachment = {
+        'transitGatewayAttachmentId': 'tgw-attach-0123456789abcdef0',
+        'transitGatewayId': 'tgw-0123456789abcdef0',
+        'vpcId': 'vpc-0123456789abcdef0',
+        'vpcOwnerId': '111111111111',
+        'state': 'pendingAcceptance',
+        'subnetIds': [f'subnet-0123456789abcde{n:02x}' for n in range(3)],
+        'creationTime': 'May 12, 2025 10:00:00 AM',
+        'options': {'dnsSupport': 'enable', 'ipv6Support': 'disable', 'applianceModeSupport': 'disable'},
+        'tagSet': {'item': [{'key': 'Name', 'value': 'spoke'}, {'key': 'team', 'value': 'network'}]},
+    }
+    payload = {
+        'version': '0',
+        'id': '7bf73129-1428-4cd3-a780-95db273d1602',
+        'detail-type': 'AWS API Call via CloudTrail',
+        'source': 'aws.ec2',
+        'account': '222222222222',
+        'time': '2025-05-12T10:00:00Z',
+        'region': 'eu-north-1',
+        'resources': [],
+        'detail': {
+            'eventVersion': '1.10',
+            'userIdentity': {
+                'type': 'AssumedRole',
+                'principalId': 'AROAEXAMPLE:terraform',
+                'arn': 'arn:aws:sts::111111111111:assumed-role/network-admin/terraform',
+                'accountId': '111111111111',
+                'sessionContext': {
+                    'sessionIssuer': {'type': 'Role', 'arn': 'arn:aws:iam::111111111111:role/network-admin'},
+                    'attributes': {'creationDate': '2025-05-12T09:59:00Z', 'mfaAuthenticated': 'false'},
+                },
+            },
+            'eventTime': '2025-05-12T10:00:00Z',
+            'eventSource': 'ec2.amazonaws.com',
+            'eventName': 'CreateTransitGatewayVpcAttachment',
+            'awsRegion': 'eu-north-1',
+            'sourceIPAddress': '198.51.100.10',
+            'userAgent': 'APN/1.0 HashiCorp/1.0 Terraform/1.9.0 terraform-provider-aws/5.90.0',
+            'requestParameters': {'CreateTransitGatewayVpcAttachmentRequest': {
+                'TransitGatewayId': attachment['transitGatewayId'], 'VpcId': attachment['vpcId'],
+                'SubnetIds': attachment['subnetIds'],
+            }},
+            'responseElements': {'CreateTransitGatewayVpcAttachmentResponse': {
+                'requestId': '0f6a5d7e-2222-4c3b-9a0e-2b1c5d6e7f80',
+                'transitGatewayVpcAttachment': attachment,
+            }},
+            'requestID': '0f6a5d7e-2222-4c3b-9a0e-2b1c5d6e7f80',
+            'eventID': '0f6a5d7e-3333-4c3b-9a0e-2b1c5d6e7f80',
+            'readOnly': False,
+            'eventType': 'AwsApiCall',
+            'managementEvent': True,
+            'recipientAccountId': '222222222222',
+        },
+    }
+    names = ['IAMValidationPayload', 'IPAMValidationPayload', 'AcceptAttachmentPayload', 'TagAttachmentPayload',
+             'WaitForAvailablePayload', 'GetPoolTagsPayload', 'HandleAssociationPayload']
+    for name in names[:steps]:
+        payload[name] = invoke_result({
+            'result': 'SUCCESS',
+            'attachment': {'account_id': '111111111111', 'vpc_id': attachment['vpcId'],
+                           'attachment_id': attachment['transitGatewayAttachmentId'], 'state': 'pendingAcceptance'},
+            'message': f'{name} completed for attachment {attachment["transitGatewayAttachmentId"]}',
+        })
+    return payload
+
+
+def per_call_us(func, raw, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func(raw)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"JSON backend: {'orjson' if models.orjson else 'json'}")
+    print(f"{'steps':>5} {'bytes':>7} {'input':>5} {'legacy us':>10} {'current us':>11}")
+    for steps in (0, 3, 7):
+        payload = make_payload(steps)
+        as_json = json.dumps(payload)
+        assert legacy_parse(payload)[0][2] == current_parse(payload)[0].attachment_id
+        for label, raw in (('dict', payload), ('str', as_json)):
+            legacy = per_call_us(legacy_parse, raw, args.iterations)
+            current = per_call_us(current_parse, raw, args.iterations)
+            print(f"{steps:>5} {len(as_json):>7} {label:>5} {legacy:>10.2f} {current:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Micro-benchmark of principal matching against large allowed pattern lists.
+
+Compares the compiled PrincipalMatcher with a linear fnmatch scan for a mix of
+exact ARNs, 'prefix*' patterns and patterns with wildcards in the middle.
+
+Usage (from the functions directory):
+    python benchmarks/bench_principal_matcher.py [--sizes 100,1000,10000] [--lookups 2000]
+"""
+
+import argparse
+import fnmatch
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'common', 'python'))
+
+from principal_matcher import PrincipalMatcher  # noqa: E402
+
+
+def linear_match(identity, patterns):
+    for pattern in patterns:
+        if fnmatch.fnmatch(identity, pattern):
+            return pattern
+    return None
+
+
+def make_patterns(count, rng):
+    patterns = []
+    for n in range(count):
+        account = f'{rng.randrange(10 ** 12):012d}'
+        kind = n % 4
+        if kind == 0:
+            patterns.append(f'arn:aws:iam::{account}:role/network-admin')
+        elif kind == 1:
+            patterns.append(f'arn:aws:iam::{account}:role/network-*')
+        elif kind == 2:
+            patterns.append(f'arn:aws:iam::{account}:role/tgw-?-attacher')
+        else:
+            patterns.append(f'arn:aws:iam::{account}:assumed-role/*/session-*')
+    return patterns
+
+
+def make_identities(patterns, count, rng):
+    identities = []
+    for _ in range(count):
+        pattern = rng.choice(patterns)
+        identity = pattern.replace('*', 'x').replace('?', 'a')
+        # Half of the lookups are for principals that are not allowed
+        if rng.random() < 0.5:
+            identity = identity.replace('arn:aws:iam::', 'arn:aws:iam::9', 1)
+        identities.append(identity)
+    return identities
+
+
+def per_lookup_us(func, identities):
+    started = time.perf_counter()
+    for identity in identities:
+        func(identity)
+    return (time.perf_counter() - started) / len(identities) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', default='100,1000,10000')
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'patterns':>9} {'compile ms':>11} {'first us':>9} {'matcher us':>11} {'fnmatch us':>11}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        patterns = make_patterns(size, rng)
+        identities = make_identities(patterns, args.lookups, rng)
+
+        started = time.perf_counter()
+        matcher = PrincipalMatcher(patterns)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        # Per-node regexes are compiled on first use, time the warm matcher
+        first_us = per_lookup_us(matcher.match, identities)
+        matcher_us = per_lookup_us(matcher.match, identities)
+        # The linear scan is slow at large sizes, a sample is enough
+        sample = identities[:max(10, args.lookups * 100 // size)]
+        fnmatch_us = per_lookup_us(lambda i: linear_match(i, patterns), sample)
+        print(f"{size:>9} {compile_ms:>11.1f} {first_us:>9.2f} {matcher_us:>11.2f} {fnmatch_us:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
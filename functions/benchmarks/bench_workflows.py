@@ -0,0 +1,180 @@
+"""
+End-to-end benchmark of the accept and routing manager workflows.
+
+Runs the rendered state machine definitions with the local executor
+(sfn_local), invoking the Lambda handlers in-process against moto. Each
+attachment of a simulated fleet goes through the accept workflow, then through
+the routing manager with the accept event, as EventBridge would start it.
+
+Reports throughput and latency per workflow and, per state, latency, the
+largest input and output payload and retries.
+
+The definitions default to sfn_local/definitions, rendered for IAM and IPAM
+validation, attachment tagging, pool tag lookup, association and propagation.
+To run your deployment's definitions:
+
+    terraform output -raw tgw_auto_accept_state_machine_definition > accept.json
+    terraform output -raw routing_manager_state_machine_definition > routing_manager.json
+
+Usage (from the functions directory):
+    python benchmarks/bench_workflows.py [--attachments 50] [--workers 1] [--accept accept.json]
+        [--routing-manager routing_manager.json] [--json out.json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'common', 'python'))
+
+DEFINITIONS_DIR = os.path.join(os.path.dirname(__file__), '..', 'sfn_local', 'definitions')
+
+
+def configure_environment(definitions):
+    """Set the account, region and handler configuration before any handler is loaded."""
+    from sfn_local.fleet import handler_environment, pool_id
+
+    arns = [
+        state['Arguments'].get('FunctionName') or state['Arguments'].get('TopicArn', '')
+        for definition in definitions for state in definition['States'].values()
+        if isinstance(state.get('Arguments'), dict)
+    ]
+    arn = next(a for a in arns if a.startswith('arn:'))
+    _, _, _, region, account = arn.split(':')[:5]
+    os.environ.update(handler_environment(account, region, [pool_id(0)]))
+    return region, account
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(results, elapsed):
+    durations = [r.duration_ms for r in results]
+    states = {}
+    for result in results:
+        for record in result.states:
+            entry = states.setdefault(record.name, {'durations': [], 'input': 0, 'output': 0, 'retries': 0,
+                                                    'backoff': 0.0, 'errors': 0})
+            entry['durations'].append(record.duration_ms)
+            entry['input'] = max(entry['input'], record.input_bytes)
+            entry['output'] = max(entry['output'], record.output_bytes)
+            entry['retries'] += record.retries
+            entry['backoff'] += record.backoff_seconds
+            entry['errors'] += bool(record.error)
+    return {
+        'executions': len(results),
+        'succeeded': sum(r.status == 'SUCCEEDED' for r in results),
+        'failures': sorted({f"{r.error}: {r.cause}"[:200] for r in results if r.status != 'SUCCEEDED'}),
+        'throughput_per_second': round(len(results) / elapsed, 1) if elapsed else 0,
+        'latency_ms': {'p50': round(percentile(durations, 0.5), 2), 'p95': round(percentile(durations, 0.95), 2),
+                       'max': round(max(durations), 2)},
+        'states': {
+            name: {
+                'entered': len(entry['durations']),
+                'p50_ms': round(percentile(entry['durations'], 0.5), 2),
+                'p95_ms': round(percentile(entry['durations'], 0.95), 2),
+                'max_input_bytes': entry['input'],
+                'max_output_bytes': entry['output'],
+                'retries': entry['retries'],
+                'backoff_seconds': round(entry['backoff'], 2),
+                'errors': entry['errors'],
+            }
+            for name, entry in states.items()
+        },
+    }
+
+
+def print_summary(name, summary):
+    latency = summary['latency_ms']
+    print(f"\n{name}: {summary['succeeded']}/{summary['executions']} succeeded, "
+          f"{summary['throughput_per_second']} executions/s, "
+          f"latency p50 {latency['p50']} ms, p95 {latency['p95']} ms, max {latency['max']} ms")
+    for failure in summary['failures']:
+        print(f"  failed: {failure}")
+    print(f"  {'state':<32} {'entered':>7} {'p50 ms':>8} {'p95 ms':>8} {'in B':>7} {'out B':>7} {'retries':>7} {'errors':>6}")
+    for state, s in summary['states'].items():
+        print(f"  {state:<32} {s['entered']:>7} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['max_input_bytes']:>7} "
+              f"{s['max_output_bytes']:>7} {s['retries']:>7} {s['errors']:>6}")
+
+
+def run(machine, inputs, workers):
+    started = time.perf_counter()
+    # Keep the handlers' EMF metric lines out of the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(machine.start_execution, inputs))
+        else:
+            results = [machine.start_execution(i) for i in inputs]
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--attachments', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=1, help='Concurrent executions')
+    parser.add_argument('--accept', default=os.path.join(DEFINITIONS_DIR, 'accept.json'))
+    parser.add_argument('--routing-manager', default=os.path.join(DEFINITIONS_DIR, 'routing_manager.json'))
+    parser.add_argument('--json', help='Write the summaries to this file')
+    args = parser.parse_args()
+
+    with open(args.accept) as f:
+        accept_definition = json.load(f)
+    with open(args.routing_manager) as f:
+        routing_definition = json.load(f)
+    region, account = configure_environment([accept_definition, routing_definition])
+
+    from moto import mock_aws
+
+    with mock_aws():
+        from clients import get_client
+        from sfn_local import LocalStateMachine
+        from sfn_local.aws import install_ec2_extensions, lambda_resources, load_handler, route_task_tokens, sns_publish
+        from sfn_local.fleet import attachment_event, build_fleet
+
+        ec2 = get_client('ec2', region)
+        sns = get_client('sns', region)
+        fleet = build_fleet(ec2, account, region, attachments=args.attachments)
+        install_ec2_extensions(ec2, fleet.ipam_pools)
+        for definition in (accept_definition, routing_definition):
+            for state in definition['States'].values():
+                topic_arn = (state.get('Arguments') or {}).get('TopicArn') if isinstance(state.get('Arguments'), dict) else None
+                if topic_arn:
+                    sns.create_topic(Name=topic_arn.rsplit(':', 1)[-1])
+
+        handlers = {}
+        machines = {}
+        for name, definition in (('accept', accept_definition), ('routing-manager', routing_definition)):
+            resources = lambda_resources(definition, handlers)
+            resources['arn:aws:states:::sns:publish'] = sns_publish(sns)
+            machines[name] = LocalStateMachine(definition, resources, name=name)
+        route_task_tokens(get_client('stepfunctions', region), machines.values())
+        # In watcher mode the scheduled watch_attachments function completes the wait step's token
+        if any(s.get('Resource', '').endswith('.waitForTaskToken') for s in routing_definition['States'].values()):
+            watcher = load_handler('watch_attachments')
+            machines['routing-manager'].token_pollers.append(lambda: watcher.lambda_handler({}, None, sleep=lambda s: None))
+
+        summaries = {}
+        inputs = [attachment_event(a, account, 'CreateTransitGatewayVpcAttachment') for a in fleet.attachments]
+        results, elapsed = run(machines['accept'], inputs, args.workers)
+        summaries['accept'] = summarize(results, elapsed)
+        inputs = [attachment_event(a, account, 'AcceptTransitGatewayVpcAttachment') for a in fleet.attachments]
+        results, elapsed = run(machines['routing-manager'], inputs, args.workers)
+        summaries['routing-manager'] = summarize(results, elapsed)
+
+    for name, summary in summaries.items():
+        print_summary(name, summary)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
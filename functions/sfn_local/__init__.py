@@ -0,0 +1,21 @@
+"""
+Local execution of the Step Functions workflows.
+
+Runs the rendered state machine definitions in-process, with the Lambda
+handlers invoked as Python functions against moto, to measure and load test
+the workflows end to end without deploying them.
+"""
+
+from .executor import ExecutionResult, LocalStateMachine, StateRecord, TaskError
+from .jsonata import UNDEFINED, JSONataError, compile_expression, resolve
+
+__all__ = [
+    'ExecutionResult',
+    'JSONataError',
+    'LocalStateMachine',
+    'StateRecord',
+    'TaskError',
+    'UNDEFINED',
+    'compile_expression',
+    'resolve',
+]
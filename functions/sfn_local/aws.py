@@ -0,0 +1,265 @@
+"""
+Task resources running the Lambda handlers in-process against moto.
+
+lambda_resources() loads the handler module of every function a definition
+invokes, matched by the function name suffixes set in lambda.tf, and wraps it
+like the lambda:invoke integration: the payload goes through JSON both ways,
+and an exception becomes a task error named after its type.
+
+moto does not implement every EC2 call the handlers make.
+install_ec2_extensions() answers those on a client from a small in-memory
+IPAM model. route_task_tokens() delivers SendTaskSuccess/SendTaskFailure calls
+to the local state machines instead of moto.
+"""
+
+import importlib.util
+import json
+import os
+import sys
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .executor import LocalStateMachine, TaskError
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+COMMON_DIR = os.path.join(SRC_DIR, 'common', 'python')
+
+# Function name suffix (lambda.tf) -> handler directory in src/
+LAMBDA_SOURCES = {
+    'validate-iam': 'validate_iam',
+    'validate-ipam': 'validate_ipam',
+    'validate-cidr-overlap': 'validate_cidr_overlap',
+    'accepter': 'handle_accept',
+    'accept-pipeline': 'accept_pipeline',
+    'wait-for-available-tgwa': 'wait_for_available_tgwa',
+    'get-pool-tags': 'collect_pool_tags',
+    'handle-association': 'handle_association',
+    'handle-propagation': 'handle_propagation',
+    'handle-attachment-tags': 'handle_attachment_tags',
+    'send-approval-email': 'send_approval_email',
+    'handle-approval-callback': 'handle_approval_callback',
+    'send-approval-digest': 'send_approval_digest',
+    'watch-attachments': 'watch_attachments',
+}
+
+
+class LambdaContext:
+    """The parts of the Lambda context object the handlers use."""
+
+    def __init__(self, function_name: str, timeout_seconds: float = 900):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self.invoked_function_arn = f"arn:aws:lambda:local:000000000000:function:{function_name}"
+        self._timeout_seconds = timeout_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int(self._timeout_seconds * 1000)
+
+
+def load_handler(source: str):
+    """
+    Import src/<source>/handler.py under its own module name.
+
+    Handlers read their configuration from the environment at import, so set
+    it before loading. Every handler module is named 'handler', the unique
+    name lets several of them be loaded at once.
+    """
+    if COMMON_DIR not in sys.path:
+        sys.path.insert(0, COMMON_DIR)
+    path = os.path.join(SRC_DIR, source, 'handler.py')
+    spec = importlib.util.spec_from_file_location(f"sfn_local_{source}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def lambda_invoke(handler: Callable, function_name: str) -> Callable:
+    """Wrap a Lambda handler as an arn:aws:states:::lambda:invoke task resource."""
+
+    def invoke(arguments: Dict, context: Dict) -> Dict:
+        payload = json.loads(json.dumps(arguments.get('Payload')))
+        try:
+            result = handler(payload, LambdaContext(function_name))
+        except Exception as e:
+            cause = {'errorMessage': str(e), 'errorType': type(e).__name__}
+            raise TaskError(type(e).__name__, json.dumps(cause)) from e
+        return {
+            'ExecutedVersion': '$LATEST',
+            'Payload': json.loads(json.dumps(result, default=str)),
+            'StatusCode': 200,
+        }
+
+    return invoke
+
+
+def _function_names(definition: Dict) -> List[str]:
+    names = []
+    for state in definition.get('States', {}).values():
+        function_name = str(state.get('Arguments', {}).get('FunctionName', '')) if isinstance(state.get('Arguments'), dict) else ''
+        if function_name.startswith('arn:'):
+            function_name = function_name.split(':')[6]
+        if function_name and function_name not in names:
+            names.append(function_name)
+    return names
+
+
+def source_for(function_name: str) -> Optional[str]:
+    """Return the handler directory of a deployed function name, by its longest matching suffix."""
+    matches = [suffix for suffix in LAMBDA_SOURCES if function_name.endswith(suffix)]
+    return LAMBDA_SOURCES[max(matches, key=len)] if matches else None
+
+
+def lambda_resources(definition: Dict, handlers: Optional[Dict[str, Any]] = None) -> Dict[str, Callable]:
+    """
+    Build the lambda:invoke resources of every function a definition invokes.
+
+    Args:
+        definition: Rendered state machine definition
+        handlers: Already loaded handler modules by source directory, shared
+            between definitions; modules loaded here are added to it
+
+    Returns:
+        Resources keyed 'lambda:<function name>' for LocalStateMachine
+
+    Raises:
+        ValueError: If a function name matches no known handler
+    """
+    handlers = handlers if handlers is not None else {}
+    resources = {}
+    for function_name in _function_names(definition):
+        source = source_for(function_name)
+        if source is None:
+            raise ValueError(f"No handler known for function {function_name}")
+        if source not in handlers:
+            handlers[source] = load_handler(source)
+        resources[f"lambda:{function_name}"] = lambda_invoke(handlers[source].lambda_handler, function_name)
+    return resources
+
+
+def sns_publish(sns) -> Callable:
+    """The arn:aws:states:::sns:publish resource, publishing with the given client."""
+
+    def publish(arguments: Dict, context: Dict) -> Dict:
+        message = arguments['Message']
+        kwargs = {k: v for k, v in arguments.items() if k != 'Message'}
+        # The integration serialises a JSON message, the API takes a string
+        response = sns.publish(Message=message if isinstance(message, str) else json.dumps(message), **kwargs)
+        return {'MessageId': response['MessageId']}
+
+    return publish
+
+
+def _short_circuit(client, operation: str, respond: Callable[[Dict], Dict]) -> None:
+    """Answer an operation on a client with respond(params) instead of sending the request."""
+    from botocore.awsrequest import AWSResponse
+
+    service = client.meta.service_model.service_id.hyphenize()
+
+    def capture(params, context, **kwargs):
+        context['sfn_local_params'] = dict(params)
+
+    def answer(context, **kwargs):
+        parsed = respond(context.get('sfn_local_params', {}))
+        parsed.setdefault('ResponseMetadata', {'HTTPStatusCode': 200, 'RetryAttempts': 0})
+        return AWSResponse('https://sfn-local', 200, {}, None), parsed
+
+    client.meta.events.register(f"before-parameter-build.{service}.{operation}", capture)
+    client.meta.events.register(f"before-call.{service}.{operation}", answer)
+
+
+def _page(items: List[Dict], params: Dict, page_size: int) -> Tuple[List[Dict], Dict]:
+    """Slice one page of items by NextToken (an offset here) and MaxResults, like the paged EC2 calls."""
+    start = int(params.get('NextToken') or 0)
+    end = start + min(params.get('MaxResults') or page_size, page_size)
+    return items[start:end], ({'NextToken': str(end)} if end < len(items) else {})
+
+
+def install_ec2_extensions(ec2, ipam_pools: Optional[Dict[str, Dict]] = None, page_size: int = 1000) -> None:
+    """
+    Answer the EC2 calls moto does not implement on a client.
+
+    Args:
+        ec2: EC2 client the handlers use (from clients.get_client)
+        ipam_pools: IPAM pools by ID, each {'tags': {key: value}, 'vpcs': [vpc IDs]}
+        page_size: Largest page of the paged IPAM calls, 1000 is the EC2 maximum
+    """
+    ipam_pools = ipam_pools or {}
+    scope_id = 'ipam-scope-0local'
+
+    def accept(params):
+        return {'TransitGatewayVpcAttachment': {
+            'TransitGatewayAttachmentId': params['TransitGatewayAttachmentId'],
+            'State': 'pending',
+        }}
+
+    def describe_pools(params):
+        pool_ids = params.get('IpamPoolIds') or list(ipam_pools)
+        return {'IpamPools': [
+            {
+                'IpamPoolId': pool_id,
+                'IpamScopeArn': f"arn:aws:ec2::000000000000:ipam-scope/{scope_id}",
+                'Tags': [{'Key': k, 'Value': v} for k, v in ipam_pools[pool_id].get('tags', {}).items()],
+            }
+            for pool_id in pool_ids if pool_id in ipam_pools
+        ]}
+
+    def pool_allocations(params):
+        pool = ipam_pools.get(params['IpamPoolId'], {})
+        page, token = _page([{'ResourceId': vpc_id, 'ResourceType': 'vpc'} for vpc_id in pool.get('vpcs', [])],
+                            params, page_size)
+        return {'IpamPoolAllocations': page, **token}
+
+    def resource_cidrs(params):
+        cidrs = [
+            {'IpamPoolId': pool_id, 'ResourceId': params['ResourceId'], 'IpamScopeId': scope_id}
+            for pool_id, pool in ipam_pools.items() if params.get('ResourceId') in pool.get('vpcs', [])
+        ]
+        page, token = _page(cidrs, params, page_size)
+        return {'IpamResourceCidrs': page, **token}
+
+    _short_circuit(ec2, 'AcceptTransitGatewayVpcAttachment', accept)
+    _short_circuit(ec2, 'DescribeIpamPools', describe_pools)
+    _short_circuit(ec2, 'GetIpamPoolAllocations', pool_allocations)
+    _short_circuit(ec2, 'GetIpamResourceCidrs', resource_cidrs)
+    _short_circuit(ec2, 'GetTransitGatewayAttachmentPropagations',
+                   lambda params: {'TransitGatewayAttachmentPropagations': []})
+
+
+def count_api_calls(client) -> Counter:
+    """
+    Count the calls made with a client by operation name.
+
+    Every page of a paginator is a call. The counter is live, copy it to take
+    a snapshot.
+    """
+    calls = Counter()
+    service = client.meta.service_model.service_id.hyphenize()
+
+    def count(model, **kwargs):
+        calls[model.name] += 1
+
+    client.meta.events.register(f"before-parameter-build.{service}", count)
+    return calls
+
+
+def route_task_tokens(sfn, machines: Iterable[LocalStateMachine]) -> None:
+    """Deliver SendTaskSuccess/SendTaskFailure calls made with a client to the local state machines."""
+    machines = list(machines)
+
+    def deliver(params, complete):
+        from botocore.exceptions import ClientError
+
+        for machine in machines:
+            try:
+                complete(machine, params)
+                return {}
+            except TaskError:
+                continue
+        raise ClientError({'Error': {'Code': 'TaskDoesNotExist', 'Message': 'Task token not found'}},
+                          'SendTaskSuccess')
+
+    _short_circuit(sfn, 'SendTaskSuccess', lambda params: deliver(
+        params, lambda m, p: m.send_task_success(p['taskToken'], p['output'])))
+    _short_circuit(sfn, 'SendTaskFailure', lambda params: deliver(
+        params, lambda m, p: m.send_task_failure(p['taskToken'], p.get('error', ''), p.get('cause', ''))))
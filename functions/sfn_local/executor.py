@@ -0,0 +1,362 @@
+"""
+In-process interpreter for the JSONata state machine definitions.
+
+Runs a rendered definition (the JSON of aws_sfn_state_machine.definition)
+state by state: Task, Choice, Pass, Succeed and Fail states, the JSONata
+Arguments, Output, Condition and Assign fields, Retry and Catch, TimeoutSeconds
+and the .waitForTaskToken integration pattern. Task resources are Python
+callables, so the Lambda handlers run in-process (see aws.py).
+
+Every state entered is recorded with its latency, input and output sizes and
+retries, which is what the workflow benchmark aggregates.
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from .jsonata import UNDEFINED, resolve
+
+# Step Functions rejects state input or output larger than this
+MAX_PAYLOAD_BYTES = 256 * 1024
+
+WAIT_FOR_TASK_TOKEN = '.waitForTaskToken'
+
+
+class TaskError(Exception):
+    """
+    A task failure, with the error name and cause Step Functions would report.
+
+    Attributes:
+        error: Error name matched by Retry and Catch ErrorEquals
+        cause: Error cause
+    """
+
+    def __init__(self, error: str, cause: str = ''):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+
+@dataclass
+class StateRecord:
+    """
+    One state entered during an execution.
+
+    Attributes:
+        name: State name
+        type: State type
+        duration_ms: Wall time spent in the state, including retries but not backoff
+        input_bytes: Size of the state input as JSON
+        output_bytes: Size of the state output as JSON
+        attempts: Resource invocations, 1 plus retries
+        backoff_seconds: Retry delay Step Functions would have waited
+        error: Error the state failed with, caught or not
+    """
+    name: str
+    type: str
+    duration_ms: float = 0.0
+    input_bytes: int = 0
+    output_bytes: int = 0
+    attempts: int = 0
+    backoff_seconds: float = 0.0
+    error: str = ''
+
+    @property
+    def retries(self) -> int:
+        return max(self.attempts - 1, 0)
+
+
+@dataclass
+class ExecutionResult:
+    """
+    Outcome of an execution.
+
+    Attributes:
+        name: Execution name
+        status: 'SUCCEEDED' or 'FAILED'
+        output: Execution output, for succeeded executions
+        error: Error name, for failed executions
+        cause: Error cause, for failed executions
+        duration_ms: Wall time of the execution
+        states: States entered, in order
+    """
+    name: str
+    status: str
+    output: Any = None
+    error: str = ''
+    cause: str = ''
+    duration_ms: float = 0.0
+    states: List[StateRecord] = field(default_factory=list)
+
+
+def _error_matches(error: str, error_equals: List[str]) -> bool:
+    if error == 'States.Runtime':
+        # Runtime errors end the execution, they cannot be retried or caught
+        return False
+    for name in error_equals:
+        if name in (error, 'States.ALL'):
+            return True
+        if name == 'States.TaskFailed' and error != 'States.Timeout':
+            return True
+    return False
+
+
+def _size(value: Any) -> int:
+    return len(json.dumps(value, separators=(',', ':'), default=str))
+
+
+class _TokenChannel:
+    """Outcomes of .waitForTaskToken tasks, sent back by send_task_success/failure."""
+
+    def __init__(self):
+        self.outcomes: Dict[str, Dict] = {}
+        self.pending: set = set()
+        self.lock = threading.Lock()
+
+    def complete(self, token: str, outcome: Dict) -> None:
+        with self.lock:
+            if token not in self.pending:
+                raise TaskError('TaskDoesNotExist', f"Task token {token[:16]}... is not waiting")
+            self.pending.discard(token)
+            self.outcomes[token] = outcome
+
+
+class LocalStateMachine:
+    """
+    A state machine definition executed in-process.
+
+    Resources are looked up by the Task state's Resource ARN, without the
+    .waitForTaskToken suffix. For lambda:invoke the function name from the
+    FunctionName argument is tried first ('lambda:<function name>', qualifier
+    removed), so each Lambda task can run a different handler.
+
+    Args:
+        definition: Definition as a dict or JSON string
+        resources: Callables taking (arguments, context) and returning the task result
+        name: State machine name used in the context object
+        sleep: Called with each retry or token poll delay; defaults to not sleeping,
+            delays are still reported in the records
+        token_pollers: Called while a .waitForTaskToken task waits for its token,
+            e.g. a watcher handler that completes tokens
+        token_poll_seconds: Simulated time between two rounds of token_pollers
+        max_transitions: Fail executions entering more states than this
+    """
+
+    def __init__(self, definition, resources: Dict[str, Callable], name: str = 'local',
+                 sleep: Callable[[float], None] = lambda seconds: None,
+                 token_pollers: Optional[List[Callable[[], Any]]] = None,
+                 token_poll_seconds: float = 5.0, max_transitions: int = 1000):
+        self.definition = json.loads(definition) if isinstance(definition, str) else definition
+        if self.definition.get('QueryLanguage', 'JSONPath') != 'JSONata':
+            raise ValueError("Only JSONata state machines are supported")
+        self.resources = resources
+        self.name = name
+        self.sleep = sleep
+        self.token_pollers = token_pollers or []
+        self.token_poll_seconds = token_poll_seconds
+        self.max_transitions = max_transitions
+        self.arn = f"arn:aws:states:local:000000000000:stateMachine:{name}"
+        self._tokens = _TokenChannel()
+
+    def send_task_success(self, token: str, output: str) -> None:
+        """Complete a waiting task with output (a JSON string), like states:SendTaskSuccess."""
+        self._tokens.complete(token, {'output': json.loads(output)})
+
+    def send_task_failure(self, token: str, error: str = '', cause: str = '') -> None:
+        """Fail a waiting task, like states:SendTaskFailure."""
+        self._tokens.complete(token, {'error': error or 'States.TaskFailed', 'cause': cause})
+
+    def start_execution(self, execution_input: Any, name: Optional[str] = None) -> ExecutionResult:
+        """
+        Run an execution to completion.
+
+        Args:
+            execution_input: Execution input
+            name: Execution name, a UUID by default
+
+        Returns:
+            ExecutionResult with the output or error and the states entered
+        """
+        name = name or str(uuid.uuid4())
+        started = time.perf_counter()
+        result = ExecutionResult(name=name, status='RUNNING')
+        context = {
+            'Execution': {
+                'Id': f"{self.arn.replace(':stateMachine:', ':execution:')}:{name}",
+                'Name': name,
+                'Input': execution_input,
+                'StartTime': datetime.now(timezone.utc).isoformat(),
+                'RoleArn': '',
+            },
+            'StateMachine': {'Id': self.arn, 'Name': self.name},
+        }
+        variables: Dict[str, Any] = {}
+        state_name = self.definition['StartAt']
+        state_input = execution_input
+        try:
+            for _ in range(self.max_transitions):
+                state = self.definition['States'][state_name]
+                record = StateRecord(name=state_name, type=state['Type'], input_bytes=_size(state_input))
+                result.states.append(record)
+                if record.input_bytes > MAX_PAYLOAD_BYTES:
+                    raise TaskError('States.DataLimitExceeded', f"Input of {state_name} is {record.input_bytes} bytes")
+                state_started = time.perf_counter()
+                try:
+                    output, next_state = self._run_state(state_name, state, state_input, context, variables, record)
+                finally:
+                    record.duration_ms = (time.perf_counter() - state_started) * 1000
+                record.output_bytes = _size(output)
+                if record.output_bytes > MAX_PAYLOAD_BYTES:
+                    raise TaskError('States.DataLimitExceeded', f"Output of {state_name} is {record.output_bytes} bytes")
+                if next_state is None:
+                    result.status = 'SUCCEEDED'
+                    result.output = output
+                    break
+                state_name, state_input = next_state, output
+            else:
+                raise TaskError('States.Runtime', f"Execution exceeded {self.max_transitions} state transitions")
+        except TaskError as e:
+            result.status = 'FAILED'
+            result.error = e.error
+            result.cause = e.cause
+        result.duration_ms = (time.perf_counter() - started) * 1000
+        return result
+
+    def _run_state(self, name: str, state: Dict, state_input: Any, context: Dict, variables: Dict,
+                   record: StateRecord):
+        """Run one state, returning its output and the next state name (None at the end)."""
+        context['State'] = {'Name': name, 'EnteredTime': datetime.now(timezone.utc).isoformat(), 'RetryCount': 0}
+        states = {'input': state_input, 'context': context}
+        kind = state['Type']
+
+        if kind == 'Choice':
+            for choice in state.get('Choices', []):
+                if resolve(choice['Condition'], {**variables, 'states': states}) is True:
+                    return self._output(choice, state_input, states, variables, default=state_input), choice['Next']
+            if 'Default' not in state:
+                raise TaskError('States.NoChoiceMatched', f"No choice matched in {name}")
+            return self._output(state, state_input, states, variables, default=state_input), state['Default']
+
+        if kind == 'Fail':
+            scope = {**variables, 'states': states}
+            raise TaskError(resolve(state.get('Error', 'States.Fail'), scope), resolve(state.get('Cause', ''), scope))
+
+        if kind in ('Pass', 'Succeed'):
+            output = self._output(state, state_input, states, variables, default=state_input)
+            return output, None if kind == 'Succeed' or state.get('End') else state['Next']
+
+        if kind != 'Task':
+            raise ValueError(f"State {name} has unsupported type {kind}")
+
+        try:
+            task_result = self._run_task(state, states, variables, record)
+        except TaskError as e:
+            record.error = e.error
+            for catcher in state.get('Catch', []):
+                if _error_matches(e.error, catcher['ErrorEquals']):
+                    states['errorOutput'] = {'Error': e.error, 'Cause': e.cause}
+                    output = self._output(catcher, state_input, states, variables, default=states['errorOutput'])
+                    return output, catcher['Next']
+            raise
+        states['result'] = task_result
+        output = self._output(state, state_input, states, variables, default=task_result)
+        return output, None if state.get('End') else state['Next']
+
+    @staticmethod
+    def _output(spec: Dict, state_input: Any, states: Dict, variables: Dict, default: Any) -> Any:
+        scope = {**variables, 'states': states}
+        # Assign sees the same values as Output, then takes effect for later states
+        assigned = {key: resolve(value, scope) for key, value in spec.get('Assign', {}).items()}
+        output = resolve(spec['Output'], scope) if 'Output' in spec else default
+        variables.update(assigned)
+        return None if output is UNDEFINED else output
+
+    def _run_task(self, state: Dict, states: Dict, variables: Dict, record: StateRecord) -> Any:
+        resource_arn = state['Resource']
+        wait_for_token = resource_arn.endswith(WAIT_FOR_TASK_TOKEN)
+        if wait_for_token:
+            resource_arn = resource_arn[:-len(WAIT_FOR_TASK_TOKEN)]
+        attempts_per_retrier: Dict[int, int] = {}
+        timeout = state.get('TimeoutSeconds')
+
+        while True:
+            token = None
+            if wait_for_token:
+                token = uuid.uuid4().hex + uuid.uuid4().hex
+                states['context']['Task'] = {'Token': token}
+                self._tokens.pending.add(token)
+            arguments = resolve(state.get('Arguments', '{% $states.input %}'), {**variables, 'states': states})
+            record.attempts += 1
+            try:
+                started = time.perf_counter()
+                task_result = self._resource(resource_arn, arguments)(arguments, states['context'])
+                if timeout is not None and time.perf_counter() - started > timeout:
+                    raise TaskError('States.Timeout', f"Task did not complete within {timeout} seconds")
+                if wait_for_token:
+                    task_result = self._wait_for_token(token, timeout)
+                return task_result
+            except TaskError as e:
+                if token:
+                    self._tokens.pending.discard(token)
+                delay = self._retry_delay(state.get('Retry', []), e.error, attempts_per_retrier)
+                if delay is None:
+                    raise
+                record.backoff_seconds += delay
+                states['context']['State']['RetryCount'] += 1
+                self.sleep(delay)
+
+    def _resource(self, resource_arn: str, arguments: Any) -> Callable:
+        if resource_arn == 'arn:aws:states:::lambda:invoke' and isinstance(arguments, dict):
+            function_name = str(arguments.get('FunctionName', ''))
+            # arn:aws:lambda:region:account:function:name[:qualifier]
+            if function_name.startswith('arn:'):
+                function_name = function_name.split(':')[6]
+            resource = self.resources.get(f"lambda:{function_name}")
+            if resource is not None:
+                return resource
+        resource = self.resources.get(resource_arn)
+        if resource is None:
+            raise ValueError(f"No local resource for {resource_arn}")
+        return resource
+
+    def _wait_for_token(self, token: str, timeout: Optional[float]) -> Any:
+        waited = 0.0
+        while token not in self._tokens.outcomes:
+            if not self.token_pollers or (timeout is not None and waited >= timeout):
+                self._tokens.pending.discard(token)
+                raise TaskError('States.Timeout', f"Task token was not completed after {waited} seconds")
+            for poller in self.token_pollers:
+                poller()
+            if token in self._tokens.outcomes:
+                break
+            self.sleep(self.token_poll_seconds)
+            waited += self.token_poll_seconds
+        outcome = self._tokens.outcomes.pop(token)
+        if 'error' in outcome:
+            raise TaskError(outcome['error'], outcome['cause'])
+        return outcome['output']
+
+    @staticmethod
+    def _retry_delay(retriers: List[Dict], error: str, attempts: Dict[int, int]) -> Optional[float]:
+        """Return the delay before the next attempt, or None if no retrier allows one."""
+        for index, retrier in enumerate(retriers):
+            if not _error_matches(error, retrier['ErrorEquals']):
+                continue
+            # The first matching retrier decides, with its own attempt count
+            attempt = attempts.get(index, 0)
+            if attempt >= retrier.get('MaxAttempts', 3):
+                return None
+            attempts[index] = attempt + 1
+            delay = retrier.get('IntervalSeconds', 1) * retrier.get('BackoffRate', 2.0) ** attempt
+            if 'MaxDelaySeconds' in retrier:
+                delay = min(delay, retrier['MaxDelaySeconds'])
+            if retrier.get('JitterStrategy') == 'FULL':
+                delay = random.uniform(0, delay)
+            return delay
+        return None
@@ -0,0 +1,155 @@
+"""
+Synthetic Transit Gateway and IPAM fleets for local runs and benchmarks.
+
+build_fleet() creates transit gateways, route tables, VPCs and attachments in
+moto and an IPAM model (pools with tags and allocations) for
+install_ec2_extensions(). Each pool belongs to one transit gateway and tags
+its route tables, like a pool per routing domain; VPCs are spread over the
+pools of their transit gateway and pools are padded with allocations of other
+VPCs up to the requested count.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+
+@dataclass
+class Fleet:
+    """
+    A synthetic fleet.
+
+    Attributes:
+        account: Account ID of every resource
+        region: Region of every resource
+        transit_gateway_ids: Transit gateway IDs
+        route_tables: Route table IDs of each transit gateway
+        attachments: Items as returned by create_transit_gateway_vpc_attachment
+        ipam_pools: Pools by ID, {'tags': {...}, 'vpcs': [...]}, for install_ec2_extensions
+        pool_of_vpc: Pool ID holding each attached VPC
+    """
+    account: str
+    region: str
+    transit_gateway_ids: List[str] = field(default_factory=list)
+    route_tables: Dict[str, List[str]] = field(default_factory=dict)
+    attachments: List[Dict] = field(default_factory=list)
+    ipam_pools: Dict[str, Dict] = field(default_factory=dict)
+    pool_of_vpc: Dict[str, str] = field(default_factory=dict)
+
+
+def pool_id(index: int) -> str:
+    return f"ipam-pool-{index:017x}"
+
+
+def handler_environment(account: str, region: str, pool_ids: List[str]) -> Dict[str, str]:
+    """
+    Environment configuring the handlers for a fleet: every validation, tagging and routing step on.
+
+    Set it before loading the handlers, they read it at import.
+    """
+    return {
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_REGION': region,
+        'AWS_DEFAULT_REGION': region,
+        'MOTO_ACCOUNT_ID': account,
+        'LOG_LEVEL': 'ERROR',
+        'ALLOWED_PRINCIPAL_PATTERNS': f'arn:aws:sts::{account}:assumed-role/network-admin/*',
+        'IPAM_POOL_IDS': ','.join(pool_ids),
+        'IPAM_ASSOCIATION_TAG_KEY': 'association',
+        'IPAM_PROPAGATION_TAG_KEY': 'propagation',
+        'ATTACHMENT_TAG_KEY': 'managed-by',
+        'ATTACHMENT_TAG_VALUE': 'tgw-auto-accept',
+    }
+
+
+def build_fleet(ec2, account: str, region: str, transit_gateways: int = 1, pools: int = 1,
+                allocations: int = 0, attachments: int = 10, route_tables: int = 3) -> Fleet:
+    """
+    Create a fleet in moto.
+
+    Args:
+        ec2: EC2 client inside mock_aws
+        account: Account ID moto runs as (MOTO_ACCOUNT_ID)
+        region: Region of the client
+        transit_gateways: Number of transit gateways
+        pools: Number of IPAM pools, assigned to the transit gateways round-robin
+        allocations: Allocations per pool, padded with VPCs outside the fleet
+        attachments: Number of VPC attachments, spread over the transit gateways
+        route_tables: Route tables per transit gateway, the first is associated and the others propagated
+
+    Returns:
+        The Fleet
+    """
+    fleet = Fleet(account=account, region=region)
+    for _ in range(transit_gateways):
+        tgw_id = ec2.create_transit_gateway()['TransitGateway']['TransitGatewayId']
+        fleet.transit_gateway_ids.append(tgw_id)
+        fleet.route_tables[tgw_id] = [
+            ec2.create_transit_gateway_route_table(TransitGatewayId=tgw_id)['TransitGatewayRouteTable']['TransitGatewayRouteTableId']
+            for _ in range(route_tables)
+        ]
+
+    pools_of_tgw: Dict[str, List[str]] = {tgw_id: [] for tgw_id in fleet.transit_gateway_ids}
+    for index in range(pools):
+        tgw_id = fleet.transit_gateway_ids[index % transit_gateways]
+        tables = fleet.route_tables[tgw_id]
+        fleet.ipam_pools[pool_id(index)] = {
+            'tags': {'association': tables[0], 'propagation': ','.join(tables[1:])},
+            'vpcs': [],
+        }
+        pools_of_tgw[tgw_id].append(pool_id(index))
+
+    for n in range(attachments):
+        tgw_id = fleet.transit_gateway_ids[n % transit_gateways]
+        vpc_id = ec2.create_vpc(CidrBlock=f'10.{n // 256 % 256}.{n % 256}.0/24')['Vpc']['VpcId']
+        subnet_id = ec2.create_subnet(VpcId=vpc_id, CidrBlock=f'10.{n // 256 % 256}.{n % 256}.0/26')['Subnet']['SubnetId']
+        fleet.attachments.append(ec2.create_transit_gateway_vpc_attachment(
+            TransitGatewayId=tgw_id, VpcId=vpc_id, SubnetIds=[subnet_id]
+        )['TransitGatewayVpcAttachment'])
+        candidates = pools_of_tgw[tgw_id] or list(fleet.ipam_pools)
+        if candidates:
+            pool = candidates[(n // transit_gateways) % len(candidates)]
+            fleet.ipam_pools[pool]['vpcs'].append(vpc_id)
+            fleet.pool_of_vpc[vpc_id] = pool
+
+    filler = 0
+    for pool in fleet.ipam_pools.values():
+        while len(pool['vpcs']) < allocations:
+            pool['vpcs'].append(f"vpc-{0xf000000000000000 + filler:017x}")
+            filler += 1
+    return fleet
+
+
+def attachment_event(attachment: Dict, account: str, event_name: str) -> Dict:
+    """
+    CloudTrail event for an attachment, as delivered by EventBridge.
+
+    Args:
+        attachment: Item as returned by create_transit_gateway_vpc_attachment
+        account: Account of the requesting principal
+        event_name: 'CreateTransitGatewayVpcAttachment' or 'AcceptTransitGatewayVpcAttachment'
+    """
+    return {
+        'version': '0',
+        'detail-type': 'AWS API Call via CloudTrail',
+        'source': 'aws.ec2',
+        'account': account,
+        'detail': {
+            'eventSource': 'ec2.amazonaws.com',
+            'eventName': event_name,
+            'userIdentity': {
+                'type': 'AssumedRole',
+                'principalId': 'AROAEXAMPLE:terraform',
+                'arn': f'arn:aws:sts::{account}:assumed-role/network-admin/terraform',
+                'accountId': account,
+                'sessionContext': {'sessionIssuer': {'type': 'Role', 'arn': f'arn:aws:iam::{account}:role/network-admin'}},
+            },
+            'responseElements': {f'{event_name}Response': {'transitGatewayVpcAttachment': {
+                'transitGatewayAttachmentId': attachment['TransitGatewayAttachmentId'],
+                'transitGatewayId': attachment['TransitGatewayId'],
+                'vpcId': attachment['VpcId'],
+                'vpcOwnerId': attachment['VpcOwnerId'],
+                'state': 'pendingAcceptance' if event_name.startswith('Create') else 'pending',
+            }}},
+        },
+    }
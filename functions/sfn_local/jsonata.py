@@ -0,0 +1,465 @@
+"""
+Evaluator for the subset of JSONata used by the state machine definitions.
+
+Supports path navigation ($states.input.a.b, with mapping over arrays and
+[index] / [predicate] filters), object and array constructors, string, number,
+boolean, null and regex literals, comparison, boolean, arithmetic and '&'
+operators, the conditional 'a ? b : c', variables and a set of functions
+(including the Step Functions additions $parse and $uuid).
+
+Missing values are represented by UNDEFINED, which is dropped from objects,
+arrays and $merge as in JSONata.
+"""
+
+import json
+import re
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class _Undefined:
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'UNDEFINED'
+
+    def __bool__(self):
+        return False
+
+
+UNDEFINED = _Undefined()
+
+
+class JSONataError(Exception):
+    """Raised for expressions outside the supported subset or failing to evaluate."""
+
+
+_TOKEN = re.compile(r'''
+    (?P<ws>\s+)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  | (?P<name>`[^`]*`|\$?[A-Za-z_][A-Za-z0-9_]*|\$)
+  | (?P<op>!=|<=|>=|:=|[.\[\](){},:?=<>&+\-*/%])
+''', re.VERBOSE)
+
+# After these tokens a '/' starts a regex literal rather than a division
+_OPERAND_EXPECTED = {'(', '[', '{', ',', ':', '?', '=', '!=', '<', '<=', '>', '>=', '&', '+', '-', '*', '%', 'and', 'or', 'in'}
+
+
+def _unquote(text: str) -> str:
+    if text[0] == '"':
+        return json.loads(text)
+    # Single quoted: rewrite as a JSON string, \' is an escaped quote and " needs escaping
+    inner = re.sub(r'\\.|"', lambda m: "'" if m.group() == "\\'" else ('\\"' if m.group() == '"' else m.group()), text[1:-1])
+    return json.loads(f'"{inner}"')
+
+
+def _tokenize(source: str) -> List[Tuple[str, Any]]:
+    tokens: List[Tuple[str, Any]] = []
+    position = 0
+    while position < len(source):
+        last = tokens[-1] if tokens else None
+        if source[position] == '/' and (last is None or (last[0] == 'op' and last[1] in _OPERAND_EXPECTED)):
+            end = position + 1
+            while end < len(source) and source[end] != '/':
+                end += 2 if source[end] == '\\' else 1
+            if end >= len(source):
+                raise JSONataError(f"Unterminated regex at {position} in {source!r}")
+            flags_end = end + 1
+            while flags_end < len(source) and source[flags_end] in 'im':
+                flags_end += 1
+            flags = re.IGNORECASE if 'i' in source[end + 1:flags_end] else 0
+            flags |= re.MULTILINE if 'm' in source[end + 1:flags_end] else 0
+            tokens.append(('regex', re.compile(source[position + 1:end], flags)))
+            position = flags_end
+            continue
+        match = _TOKEN.match(source, position)
+        if not match:
+            raise JSONataError(f"Unexpected character {source[position]!r} at {position} in {source!r}")
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'ws':
+            continue
+        if kind == 'number':
+            tokens.append(('value', float(text) if any(c in text for c in '.eE') else int(text)))
+        elif kind == 'string':
+            tokens.append(('value', _unquote(text)))
+        elif kind == 'name':
+            if text in ('true', 'false', 'null'):
+                tokens.append(('value', {'true': True, 'false': False, 'null': None}[text]))
+            elif text in ('and', 'or', 'in'):
+                tokens.append(('op', text))
+            else:
+                tokens.append(('name', text.strip('`')))
+        else:
+            tokens.append(('op', text))
+    return tokens
+
+
+# Binding power of the binary operators
+_BINARY = {
+    'or': 10, 'and': 20,
+    '=': 40, '!=': 40, '<': 40, '<=': 40, '>': 40, '>=': 40, 'in': 40,
+    '&': 50, '+': 50, '-': 50,
+    '*': 60, '/': 60, '%': 60,
+}
+
+
+class _Parser:
+    """Pratt parser producing a tree of tuples."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.tokens = _tokenize(source)
+        self.position = 0
+
+    def peek(self, offset: int = 0) -> Tuple[Optional[str], Any]:
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self, kind: Optional[str] = None, value: Any = None) -> Tuple[str, Any]:
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value is not None and token[1] != value):
+            raise JSONataError(f"Expected {value or kind} but found {token[1]!r} in {self.source!r}")
+        self.position += 1
+        return token
+
+    def at(self, value: str) -> bool:
+        return self.peek()[0] == 'op' and self.peek()[1] == value
+
+    def parse(self):
+        node = self.expression(0)
+        if self.peek()[0] is not None:
+            raise JSONataError(f"Unexpected {self.peek()[1]!r} in {self.source!r}")
+        return node
+
+    def expression(self, min_power: int):
+        node = self.unary()
+        while True:
+            kind, value = self.peek()
+            if kind == 'op' and value == '?' and min_power < 5:
+                self.take()
+                then = self.expression(0)
+                otherwise = ('value', UNDEFINED)
+                if self.at(':'):
+                    self.take()
+                    otherwise = self.expression(0)
+                node = ('condition', node, then, otherwise)
+                continue
+            if kind != 'op' or value not in _BINARY or _BINARY[value] <= min_power:
+                return node
+            self.take()
+            node = ('binary', value, node, self.expression(_BINARY[value]))
+
+    def unary(self):
+        if self.at('-'):
+            self.take()
+            return ('negate', self.unary())
+        return self.postfix(self.primary())
+
+    def postfix(self, node):
+        while True:
+            if self.at('.'):
+                self.take()
+                node = ('path', node, self.step())
+            elif self.at('['):
+                self.take()
+                predicate = self.expression(0)
+                self.take('op', ']')
+                node = ('filter', node, predicate)
+            else:
+                return node
+
+    def step(self):
+        kind, value = self.peek()
+        if kind == 'name' and not value.startswith('$'):
+            self.take()
+            return ('field', value)
+        return self.primary()
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == 'value':
+            return ('value', value)
+        if kind == 'regex':
+            return ('value', value)
+        if kind == 'name':
+            if value.startswith('$'):
+                if self.at('('):
+                    self.take()
+                    args = []
+                    while not self.at(')'):
+                        args.append(self.expression(0))
+                        if not self.at(')'):
+                            self.take('op', ',')
+                    self.take('op', ')')
+                    return ('call', value, args)
+                return ('variable', value[1:])
+            return ('field', value)
+        if kind == 'op' and value == '(':
+            node = self.expression(0)
+            self.take('op', ')')
+            return node
+        if kind == 'op' and value == '[':
+            items = []
+            while not self.at(']'):
+                items.append(self.expression(0))
+                if not self.at(']'):
+                    self.take('op', ',')
+            self.take('op', ']')
+            return ('array', items)
+        if kind == 'op' and value == '{':
+            pairs = []
+            while not self.at('}'):
+                key = self.expression(0)
+                self.take('op', ':')
+                pairs.append((key, self.expression(0)))
+                if not self.at('}'):
+                    self.take('op', ',')
+            self.take('op', '}')
+            return ('object', pairs)
+        raise JSONataError(f"Unexpected {value!r} in {self.source!r}")
+
+
+def _string(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if value is UNDEFINED:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return json.dumps(value, separators=(',', ':'))
+
+
+def _boolean(value: Any) -> bool:
+    if value is UNDEFINED or value is None:
+        return False
+    if isinstance(value, list):
+        return any(_boolean(v) for v in value)
+    return bool(value)
+
+
+def _contains(value, pattern):
+    if value is UNDEFINED:
+        return UNDEFINED
+    if isinstance(pattern, re.Pattern):
+        return pattern.search(value) is not None
+    return pattern in value
+
+
+def _merge(objects):
+    if objects is UNDEFINED:
+        return UNDEFINED
+    if isinstance(objects, dict):
+        return dict(objects)
+    merged = {}
+    for obj in objects:
+        if obj is not UNDEFINED:
+            merged.update(obj)
+    return merged
+
+
+def _count(value):
+    if value is UNDEFINED:
+        return 0
+    return len(value) if isinstance(value, list) else 1
+
+
+FUNCTIONS: Dict[str, Callable] = {
+    'merge': _merge,
+    'contains': _contains,
+    'exists': lambda value: value is not UNDEFINED,
+    'count': _count,
+    'string': lambda value: UNDEFINED if value is UNDEFINED else _string(value),
+    'number': lambda value: UNDEFINED if value is UNDEFINED else (value if isinstance(value, (int, float)) else float(value)),
+    'boolean': lambda value: UNDEFINED if value is UNDEFINED else _boolean(value),
+    'not': lambda value: UNDEFINED if value is UNDEFINED else not _boolean(value),
+    'keys': lambda value: list(value) if isinstance(value, dict) else UNDEFINED,
+    'lookup': lambda obj, key: obj.get(key, UNDEFINED) if isinstance(obj, dict) else UNDEFINED,
+    'length': lambda value: UNDEFINED if value is UNDEFINED else len(value),
+    'uppercase': lambda value: UNDEFINED if value is UNDEFINED else value.upper(),
+    'lowercase': lambda value: UNDEFINED if value is UNDEFINED else value.lower(),
+    'join': lambda values, separator='': UNDEFINED if values is UNDEFINED else separator.join(values),
+    'append': lambda a, b: (a if isinstance(a, list) else [a]) + (b if isinstance(b, list) else [b]),
+    'sum': lambda values: sum(values) if isinstance(values, list) else values,
+    'parse': lambda value: json.loads(value),
+    'uuid': lambda: str(uuid.uuid4()),
+}
+
+
+def _compare(operator: str, left, right):
+    if left is UNDEFINED or right is UNDEFINED:
+        return False
+    if operator == '=':
+        return left == right
+    if operator == '!=':
+        return left != right
+    if operator == 'in':
+        return left in right if isinstance(right, list) else left == right
+    return {'<': left < right, '<=': left <= right, '>': left > right, '>=': left >= right}[operator]
+
+
+class Expression:
+    """
+    A parsed JSONata expression.
+
+    Attributes:
+        source: Expression text
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._tree = _Parser(source).parse()
+
+    def evaluate(self, variables: Dict[str, Any], context: Any = UNDEFINED) -> Any:
+        """
+        Evaluate the expression.
+
+        Args:
+            variables: Variables by name without the '$' (e.g. {'states': {...}})
+            context: Context item for bare field names, '$' refers to it
+
+        Returns:
+            The result, UNDEFINED if the expression has no value
+        """
+        return self._eval(self._tree, variables, context)
+
+    def _eval(self, node, variables, context):
+        kind = node[0]
+        if kind == 'value':
+            return node[1]
+        if kind == 'variable':
+            if node[1] == '':
+                return context
+            return variables.get(node[1], UNDEFINED)
+        if kind == 'field':
+            return self._field(context, node[1])
+        if kind == 'path':
+            base = self._eval(node[1], variables, context)
+            if base is UNDEFINED:
+                return UNDEFINED
+            if isinstance(base, list):
+                mapped = []
+                for item in base:
+                    value = self._eval(node[2], variables, item)
+                    if isinstance(value, list):
+                        mapped.extend(value)
+                    elif value is not UNDEFINED:
+                        mapped.append(value)
+                return mapped if mapped else UNDEFINED
+            return self._eval(node[2], variables, base)
+        if kind == 'filter':
+            return self._filter(self._eval(node[1], variables, context), node[2], variables)
+        if kind == 'array':
+            items = []
+            for item in node[1]:
+                value = self._eval(item, variables, context)
+                if value is not UNDEFINED:
+                    items.append(value)
+            return items
+        if kind == 'object':
+            obj = {}
+            for key_node, value_node in node[1]:
+                key = self._eval(key_node, variables, context)
+                value = self._eval(value_node, variables, context)
+                if not isinstance(key, str):
+                    raise JSONataError(f"Object key must be a string, got {key!r} in {self.source!r}")
+                if value is not UNDEFINED:
+                    obj[key] = value
+            return obj
+        if kind == 'call':
+            function = FUNCTIONS.get(node[1][1:])
+            if function is None:
+                raise JSONataError(f"Unsupported function {node[1]} in {self.source!r}")
+            return function(*(self._eval(arg, variables, context) for arg in node[2]))
+        if kind == 'negate':
+            value = self._eval(node[1], variables, context)
+            return UNDEFINED if value is UNDEFINED else -value
+        if kind == 'condition':
+            if _boolean(self._eval(node[1], variables, context)):
+                return self._eval(node[2], variables, context)
+            return self._eval(node[3], variables, context)
+        if kind == 'binary':
+            return self._binary(node[1], node[2], node[3], variables, context)
+        raise JSONataError(f"Cannot evaluate {kind} in {self.source!r}")
+
+    @staticmethod
+    def _field(context, name):
+        if isinstance(context, dict):
+            return context.get(name, UNDEFINED)
+        if isinstance(context, list):
+            values = [item[name] for item in context if isinstance(item, dict) and name in item]
+            return values if values else UNDEFINED
+        return UNDEFINED
+
+    def _filter(self, base, predicate, variables):
+        if base is UNDEFINED:
+            return UNDEFINED
+        items = base if isinstance(base, list) else [base]
+        if predicate[0] == 'value' and isinstance(predicate[1], (int, float)):
+            index = int(predicate[1])
+            return items[index] if -len(items) <= index < len(items) else UNDEFINED
+        selected = [item for item in items if _boolean(self._eval(predicate, variables, item))]
+        if not selected:
+            return UNDEFINED
+        return selected[0] if len(selected) == 1 else selected
+
+    def _binary(self, operator, left_node, right_node, variables, context):
+        left = self._eval(left_node, variables, context)
+        if operator == 'and':
+            return _boolean(left) and _boolean(self._eval(right_node, variables, context))
+        if operator == 'or':
+            return _boolean(left) or _boolean(self._eval(right_node, variables, context))
+        right = self._eval(right_node, variables, context)
+        if operator == '&':
+            return _string(left) + _string(right)
+        if operator in ('=', '!=', '<', '<=', '>', '>=', 'in'):
+            return _compare(operator, left, right)
+        if left is UNDEFINED or right is UNDEFINED:
+            return UNDEFINED
+        if operator == '+':
+            return left + right
+        if operator == '-':
+            return left - right
+        if operator == '*':
+            return left * right
+        if operator == '/':
+            return left / right
+        return left % right
+
+
+_cache: Dict[str, Expression] = {}
+
+
+def compile_expression(source: str) -> Expression:
+    """Parse an expression, reusing the parse of identical sources."""
+    expression = _cache.get(source)
+    if expression is None:
+        expression = _cache[source] = Expression(source)
+    return expression
+
+
+def is_template(value: Any) -> bool:
+    """Return True if value is a '{% ... %}' JSONata template string."""
+    return isinstance(value, str) and value.startswith('{%') and value.endswith('%}')
+
+
+def resolve(value: Any, variables: Dict[str, Any]) -> Any:
+    """
+    Evaluate the JSONata templates in a field value, recursing into objects and arrays.
+
+    Values that are not templates are returned unchanged.
+    """
+    if is_template(value):
+        return compile_expression(value[2:-2].strip()).evaluate(variables)
+    if isinstance(value, dict):
+        resolved = {}
+        for key, item in value.items():
+            item = resolve(item, variables)
+            if item is not UNDEFINED:
+                resolved[key] = item
+        return resolved
+    if isinstance(value, list):
+        return [item for item in (resolve(item, variables) for item in value) if item is not UNDEFINED]
+    return value
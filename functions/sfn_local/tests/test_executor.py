@@ -0,0 +1,256 @@
+import json
+import os
+
+import pytest
+
+from sfn_local import UNDEFINED, LocalStateMachine, TaskError, compile_expression
+from sfn_local.aws import source_for
+from sfn_local.executor import MAX_PAYLOAD_BYTES
+
+DEFINITIONS_DIR = os.path.join(os.path.dirname(__file__), '..', 'definitions')
+SOURCE_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'src')
+
+LAMBDA_RETRY = [{
+    "ErrorEquals": ["Lambda.ServiceException", "Lambda.TooManyRequestsException"],
+    "IntervalSeconds": 1, "MaxAttempts": 3, "BackoffRate": 2,
+}]
+
+
+def task(key, next_state, **extra):
+    state = {
+        "Type": "Task",
+        "Resource": "arn:aws:states:::lambda:invoke",
+        "Arguments": {"FunctionName": f"arn:aws:lambda:eu-north-1:123456789012:function:{key}:$LATEST",
+                      "Payload": "{% $states.input %}"},
+        "Output": "{% $merge([$states.input, {'" + key + "': $states.result}]) %}",
+        "Catch": [{"ErrorEquals": ["States.TaskFailed"], "Next": "Failed"}],
+        "Retry": LAMBDA_RETRY,
+        "Next": next_state,
+    }
+    state.update(extra)
+    return state
+
+
+def machine(states, start, resources, **kwargs):
+    states = dict(states, Failed={"Type": "Fail", "Error": "WorkflowFailed", "Cause": "failed"},
+                  Done={"Type": "Succeed"})
+    return LocalStateMachine({"StartAt": start, "States": states, "QueryLanguage": "JSONata"}, resources, **kwargs)
+
+
+def invoke(payload):
+    return {'Payload': payload, 'StatusCode': 200}
+
+
+@pytest.mark.parametrize('expression,expected', [
+    ("$merge([$states.input, {'B': $states.result}])", {'a': 1, 'nested': {'status': 'Approved! ok'}, 'B': 2}),
+    ("$contains($states.input.nested.status, /^Approved!/)", True),
+    ("$contains($states.input.nested.status, /^Rejected!/)", False),
+    ("$states.input.nested.status = 'PENDING'", False),
+    ("$states.input.missing.deeper", UNDEFINED),
+    ("{'kept': $states.input.a, 'dropped': $states.input.missing}", {'kept': 1}),
+    ("$states.input.a > 0 ? 'positive' : 'negative'", 'positive'),
+    ("[{'k': 1}, {'k': 2}].k", [1, 2]),
+    ("'a' & (1 + 2)", 'a3'),
+])
+def test_jsonata_expressions(expression, expected):
+    states = {'input': {'a': 1, 'nested': {'status': 'Approved! ok'}}, 'result': 2}
+
+    assert compile_expression(expression).evaluate({'states': states}) == expected
+
+
+def test_tasks_merge_results_into_the_state_input():
+    m = machine({
+        "First": task("First", "Second"),
+        "Second": task("Second", "Done"),
+    }, "First", {
+        "lambda:First": lambda args, ctx: invoke({'result': 'SUCCESS', 'seen': sorted(args['Payload'])}),
+        "lambda:Second": lambda args, ctx: invoke({'result': 'SUCCESS', 'seen': sorted(args['Payload'])}),
+    })
+
+    result = m.start_execution({'event': 1})
+
+    assert result.status == 'SUCCEEDED'
+    assert result.output['First']['Payload']['seen'] == ['event']
+    assert result.output['Second']['Payload']['seen'] == ['First', 'event']
+    assert [r.name for r in result.states] == ['First', 'Second', 'Done']
+    assert result.states[1].input_bytes > result.states[0].input_bytes
+
+
+def test_retries_matching_errors_with_backoff():
+    calls = []
+    delays = []
+
+    def flaky(args, ctx):
+        calls.append(ctx['State']['RetryCount'])
+        if len(calls) < 3:
+            raise TaskError('Lambda.TooManyRequestsException', 'throttled')
+        return invoke({'result': 'SUCCESS'})
+
+    m = machine({"Flaky": task("Flaky", "Done")}, "Flaky", {"lambda:Flaky": flaky}, sleep=delays.append)
+
+    result = m.start_execution({})
+
+    assert result.status == 'SUCCEEDED'
+    assert calls == [0, 1, 2]
+    assert delays == [1, 2]
+    assert result.states[0].retries == 2
+    assert result.states[0].backoff_seconds == 3
+
+
+def test_catch_routes_errors_that_are_not_retried():
+    attempts = []
+
+    def failing(args, ctx):
+        attempts.append(1)
+        raise TaskError('PermissionError', 'Unauthorized principal')
+
+    m = machine({"Check": task("Check", "Done")}, "Check", {"lambda:Check": failing})
+
+    result = m.start_execution({})
+
+    assert len(attempts) == 1
+    assert result.status == 'FAILED'
+    assert result.error == 'WorkflowFailed'
+    assert [r.name for r in result.states] == ['Check', 'Failed']
+    assert result.states[0].error == 'PermissionError'
+
+
+def test_catch_output_sees_the_error_output():
+    def failing(args, ctx):
+        raise TaskError('Exception', 'boom')
+
+    state = task("Assoc", "Done", Catch=[{
+        "ErrorEquals": ["States.TaskFailed"], "Next": "Done",
+        "Output": "{% $merge([$states.input, {'Assoc': $states.errorOutput}]) %}",
+    }])
+    m = machine({"Assoc": state}, "Assoc", {"lambda:Assoc": failing})
+
+    result = m.start_execution({'event': 1})
+
+    assert result.status == 'SUCCEEDED'
+    assert result.output == {'event': 1, 'Assoc': {'Error': 'Exception', 'Cause': 'boom'}}
+
+
+def test_choice_loops_until_condition_no_longer_matches():
+    polls = []
+
+    def wait(args, ctx):
+        polls.append(1)
+        return invoke({'result': 'PENDING' if len(polls) < 3 else 'SUCCESS'})
+
+    m = machine({
+        "Wait": task("Wait", "Available?"),
+        "Available?": {"Type": "Choice", "Default": "Done", "Choices": [
+            {"Condition": "{% $states.input.Wait.Payload.result = 'PENDING' %}", "Next": "Wait"},
+        ]},
+    }, "Wait", {"lambda:Wait": wait})
+
+    result = m.start_execution({})
+
+    assert result.status == 'SUCCEEDED'
+    assert [r.name for r in result.states] == ['Wait', 'Available?'] * 3 + ['Done']
+
+
+def test_wait_for_task_token_resumes_when_a_poller_completes_the_token():
+    tokens = []
+    m = None
+
+    def register(args, ctx):
+        tokens.append(args['Payload']['TaskToken'])
+        return invoke({'result': 'REGISTERED'})
+
+    def watcher():
+        m.send_task_success(tokens[-1], json.dumps({'result': 'SUCCESS'}))
+
+    state = task("Wait", "Done", Resource="arn:aws:states:::lambda:invoke.waitForTaskToken")
+    state['Arguments']['Payload'] = "{% $merge([$states.input, {'TaskToken': $states.context.Task.Token}]) %}"
+    m = machine({"Wait": state}, "Wait", {"lambda:Wait": register}, token_pollers=[watcher])
+
+    result = m.start_execution({})
+
+    assert result.status == 'SUCCEEDED'
+    assert result.output['Wait'] == {'result': 'SUCCESS'}
+    with pytest.raises(TaskError):
+        m.send_task_success(tokens[-1], '{}')
+
+
+def test_wait_for_task_token_times_out_without_completion():
+    state = task("Wait", "Done", Resource="arn:aws:states:::lambda:invoke.waitForTaskToken", TimeoutSeconds=10,
+                 Catch=[{"ErrorEquals": ["States.TaskFailed"], "Next": "Failed"}])
+    m = machine({"Wait": state}, "Wait", {"lambda:Wait": lambda a, c: invoke({})},
+                token_pollers=[lambda: None], token_poll_seconds=5)
+
+    result = m.start_execution({})
+
+    # States.TaskFailed does not match a timeout
+    assert result.status == 'FAILED'
+    assert result.error == 'States.Timeout'
+
+
+def test_oversized_output_fails_the_execution():
+    m = machine({"Big": task("Big", "Done")}, "Big",
+                {"lambda:Big": lambda a, c: invoke({'blob': 'x' * MAX_PAYLOAD_BYTES})})
+
+    result = m.start_execution({})
+
+    assert result.status == 'FAILED'
+    assert result.error == 'States.DataLimitExceeded'
+
+
+@pytest.mark.parametrize('name', ['accept.json', 'routing_manager.json'])
+def test_bundled_definitions_parse(name):
+    with open(os.path.join(DEFINITIONS_DIR, name)) as f:
+        definition = json.load(f)
+
+    m = LocalStateMachine(definition, {})
+
+    assert m.definition['StartAt'] in m.definition['States']
+
+
+def _idempotent(source):
+    with open(os.path.join(SOURCE_DIR, source, 'handler.py')) as f:
+        return '@idempotent' in f.read()
+
+
+@pytest.mark.parametrize('name', ['accept.json', 'routing_manager.json'])
+def test_idempotent_stages_retry_duplicates_still_in_progress(name):
+    with open(os.path.join(DEFINITIONS_DIR, name)) as f:
+        definition = json.load(f)
+
+    stages = [state_name for state_name, state in definition['States'].items()
+              if isinstance(state.get('Arguments'), dict) and 'FunctionName' in state['Arguments']
+              and _idempotent(source_for(state['Arguments']['FunctionName'].split(':')[6]))]
+
+    assert stages
+    for state_name in stages:
+        retried = [e for r in definition['States'][state_name]['Retry'] for e in r['ErrorEquals']]
+        assert 'IdempotencyInProgressError' in retried, state_name
+
+
+def test_duplicate_still_in_progress_waits_instead_of_publishing_a_failure():
+    with open(os.path.join(DEFINITIONS_DIR, 'accept.json')) as f:
+        definition = json.load(f)
+    attempts = []
+    published = []
+
+    def validate_iam(args, ctx):
+        attempts.append(ctx['State']['RetryCount'])
+        if len(attempts) < 3:
+            # The duplicate's result is not stored yet, see idempotency.run_once
+            raise TaskError('IdempotencyInProgressError', 'still being processed by a duplicate')
+        return invoke({'result': 'SUCCESS', 'replayed': True})
+
+    def succeed(args, ctx):
+        return invoke({'result': 'SUCCESS'})
+
+    resources = {f"lambda:dev-tgw-{name}": succeed for name in ['validate-ipam', 'accepter', 'handle-attachment-tags']}
+    resources['lambda:dev-tgw-validate-iam'] = validate_iam
+    resources['arn:aws:states:::sns:publish'] = lambda args, ctx: published.append(args['Message']) or {}
+    m = LocalStateMachine(definition, resources)
+
+    result = m.start_execution({})
+
+    assert result.status == 'SUCCEEDED'
+    assert attempts == [0, 1, 2]
+    assert published == [{'message': 'Success'}]
+    assert 'Publish failure' not in [r.name for r in result.states]
@@ -0,0 +1,54 @@
+import pytest
+from moto import mock_aws
+
+from sfn_local.aws import count_api_calls, install_ec2_extensions
+from sfn_local.fleet import attachment_event, build_fleet
+
+ACCOUNT = '123456789012'
+REGION = 'eu-north-1'
+
+
+@pytest.fixture
+def ec2(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('MOTO_ACCOUNT_ID', ACCOUNT)
+    with mock_aws():
+        import boto3
+        yield boto3.client('ec2', region_name=REGION)
+
+
+def test_fleet_assigns_attachments_to_pools_of_their_transit_gateway(ec2):
+    fleet = build_fleet(ec2, ACCOUNT, REGION, transit_gateways=2, pools=4, allocations=5, attachments=6)
+
+    assert len(fleet.transit_gateway_ids) == 2
+    assert len(fleet.attachments) == 6
+    for attachment in fleet.attachments:
+        pool = fleet.ipam_pools[fleet.pool_of_vpc[attachment['VpcId']]]
+        assert pool['tags']['association'] == fleet.route_tables[attachment['TransitGatewayId']][0]
+    assert all(len(pool['vpcs']) == 5 for pool in fleet.ipam_pools.values())
+
+
+def test_extensions_page_allocations_and_calls_are_counted(ec2):
+    fleet = build_fleet(ec2, ACCOUNT, REGION, pools=1, allocations=25, attachments=1)
+    install_ec2_extensions(ec2, fleet.ipam_pools, page_size=10)
+    calls = count_api_calls(ec2)
+
+    pool_id = next(iter(fleet.ipam_pools))
+    paginator = ec2.get_paginator('get_ipam_pool_allocations')
+    allocations = [a['ResourceId'] for page in paginator.paginate(IpamPoolId=pool_id) for a in page['IpamPoolAllocations']]
+
+    assert allocations == fleet.ipam_pools[pool_id]['vpcs']
+    assert calls['GetIpamPoolAllocations'] == 3
+
+
+def test_attachment_event_parses_as_the_handlers_see_it(ec2):
+    from models import CloudTrailEvent, TGWAttachment
+
+    fleet = build_fleet(ec2, ACCOUNT, REGION, attachments=1)
+
+    event = CloudTrailEvent.from_raw(attachment_event(fleet.attachments[0], ACCOUNT, 'AcceptTransitGatewayVpcAttachment'))
+    attachment = TGWAttachment.from_event(event)
+
+    assert attachment.attachment_id == fleet.attachments[0]['TransitGatewayAttachmentId']
+    assert attachment.vpc_id == fleet.attachments[0]['VpcId']
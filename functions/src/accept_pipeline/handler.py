@@ -0,0 +1,37 @@
+from typing import Any, Dict
+
+# Import pipeline from common layer
+from pipeline import run_pipeline
+from logs import configure_logging, log_invocation
+from idempotency import idempotent
+from metrics import record_api_calls
+
+# Configure logging
+logger = configure_logging()
+
+
+def pipeline_stage(event: Dict[str, Any]) -> str:
+    # Validation before a manual approval and acceptance after it are separate stages
+    return 'pipeline:' + ','.join(event.get('Stages', []))
+
+
+@record_api_calls
+@idempotent(pipeline_stage)
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Lambda function to run accept workflow stages in a single invocation.
+
+    Args:
+        event: Dict with 'Stages' (stage names in order) and 'Event' (CloudTrail event)
+        context: Lambda context object
+
+    Returns:
+        Dict with 'Results' (stage results keyed like the state machine output) and 'Timings'
+    """
+    stages = event.get('Stages', [])
+    log_invocation(logger, event, context)
+    logger.info('Lambda invocation started for stages: %s', stages)
+
+    result = run_pipeline(event['Event'], stages)
+    logger.info("Pipeline completed with timings (ms): %s", result['Timings'])
+    return result
@@ -0,0 +1,125 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+# Set environment variables before importing the handler
+os.environ['LOG_LEVEL'] = 'DEBUG'
+os.environ['ALLOWED_PRINCIPAL_PATTERNS'] = 'arn:aws:iam::111111111111:role/network-*'
+os.environ['IPAM_POOL_IDS'] = 'ipam-pool-1'
+os.environ['ATTACHMENT_TAG_KEY'] = 'AcceptedBy'
+os.environ['ATTACHMENT_TAG_VALUE'] = 'Pipeline'
+
+from handler import lambda_handler
+from models import synthetic_create_event
+from pipeline import PipelineStageError
+
+ALL_STAGES = ['validate_iam', 'validate_ipam', 'accept', 'tag_attachment']
+
+
+def _create_event(principal='arn:aws:iam::111111111111:role/network-admin', state='pendingAcceptance'):
+    return {
+        'detail-type': 'AWS API Call via CloudTrail',
+        'detail': {
+            'eventName': 'CreateTransitGatewayVpcAttachment',
+            'userIdentity': {'type': 'AssumedRole', 'arn': principal},
+            'responseElements': {
+                'CreateTransitGatewayVpcAttachmentResponse': {
+                    'transitGatewayVpcAttachment': {
+                        'vpcOwnerId': '111111111111',
+                        'vpcId': 'vpc-1',
+                        'transitGatewayAttachmentId': 'tgw-attach-1',
+                        'transitGatewayId': 'tgw-1',
+                        'state': state,
+                    }
+                }
+            }
+        }
+    }
+
+
+@pytest.fixture
+def ec2():
+    client = MagicMock()
+    with patch('accept_stages.get_client', return_value=client):
+        yield client
+
+
+@pytest.fixture
+def find_pool():
+    with patch('accept_stages.find_vpc_pool', return_value='ipam-pool-1') as find:
+        yield find
+
+
+def test_runs_all_stages_with_state_machine_payload_keys(ec2, find_pool):
+    result = lambda_handler({'Stages': ALL_STAGES, 'Event': _create_event()}, MagicMock())
+
+    assert list(result['Results']) == [
+        'IAMValidationPayload', 'IPAMValidationPayload', 'AcceptAttachmentPayload', 'TagAttachmentPayload']
+    for payload in result['Results'].values():
+        assert payload['StatusCode'] == 200
+        assert payload['Payload']['result'] == 'SUCCESS'
+    assert result['Results']['IPAMValidationPayload']['Payload']['attachment']['ipam_pool_id'] == 'ipam-pool-1'
+    assert set(result['Timings']) == set(ALL_STAGES)
+
+    ec2.accept_transit_gateway_vpc_attachment.assert_called_once_with(TransitGatewayAttachmentId='tgw-attach-1')
+    ec2.create_tags.assert_called_once_with(
+        Resources=['tgw-attach-1'], Tags=[{'Key': 'AcceptedBy', 'Value': 'Pipeline'}])
+
+
+def test_runs_only_requested_stages(ec2, find_pool):
+    result = lambda_handler({'Stages': ['validate_iam', 'validate_ipam'], 'Event': _create_event()}, MagicMock())
+
+    assert list(result['Results']) == ['IAMValidationPayload', 'IPAMValidationPayload']
+    ec2.accept_transit_gateway_vpc_attachment.assert_not_called()
+
+
+def test_failing_stage_stops_pipeline(ec2, find_pool):
+    event = _create_event(principal='arn:aws:iam::222222222222:role/other')
+
+    with pytest.raises(PipelineStageError) as exc_info:
+        lambda_handler({'Stages': ALL_STAGES, 'Event': event}, MagicMock())
+
+    assert exc_info.value.stage == 'validate_iam'
+    assert isinstance(exc_info.value.cause, PermissionError)
+    find_pool.assert_not_called()
+    ec2.accept_transit_gateway_vpc_attachment.assert_not_called()
+
+
+def _swept_event():
+    return synthetic_create_event({
+        'TransitGatewayAttachmentId': 'tgw-attach-1', 'TransitGatewayId': 'tgw-1',
+        'ResourceOwnerId': '222222222222', 'ResourceId': 'vpc-1', 'State': 'pendingAcceptance',
+    })
+
+
+def test_swept_attachment_fails_the_principal_check_by_default(ec2, find_pool):
+    with pytest.raises(PipelineStageError) as exc_info:
+        lambda_handler({'Stages': ['validate_iam'], 'Event': _swept_event()}, MagicMock())
+
+    assert isinstance(exc_info.value.cause, PermissionError)
+
+
+def test_swept_attachment_skips_the_principal_check_when_configured(ec2, find_pool):
+    with patch('accept_stages.sweeper_iam_policy', 'skip'):
+        result = lambda_handler({'Stages': ['validate_iam'], 'Event': _swept_event()}, MagicMock())
+
+    assert result['Results']['IAMValidationPayload']['Payload']['result'] == 'SUCCESS'
+
+
+def test_accept_error_keeps_completed_results(ec2, find_pool):
+    ec2.accept_transit_gateway_vpc_attachment.side_effect = ClientError(
+        {'Error': {'Code': 'IncorrectState', 'Message': 'not pending'}}, 'AcceptTransitGatewayVpcAttachment')
+
+    with pytest.raises(PipelineStageError) as exc_info:
+        lambda_handler({'Stages': ALL_STAGES, 'Event': _create_event()}, MagicMock())
+
+    assert exc_info.value.stage == 'accept'
+    assert list(exc_info.value.results) == ['IAMValidationPayload', 'IPAMValidationPayload']
+    ec2.create_tags.assert_not_called()
+
+
+def test_unknown_stage_is_rejected(ec2, find_pool):
+    with pytest.raises(ValueError):
+        lambda_handler({'Stages': ['validate_iam', 'approve'], 'Event': _create_event()}, MagicMock())
@@ -1,15 +1,15 @@
 import os
-import logging
-import boto3
-from typing import Dict
-from botocore.exceptions import ClientError
 
 from models import CloudTrailEvent, TGWAttachment
+from clients import get_client
+from pool_index import find_vpc_pool
+from ipam_lookup import pool_tags
+from logs import configure_logging, log_invocation
+from idempotency import idempotent
+from metrics import record_api_calls
 
 # Configure logging
-log_level = os.environ.get('LOG_LEVEL', 'INFO').upper()
-logger = logging.getLogger()
-logger.setLevel(log_level)
+logger = configure_logging()
 
 # Environment variables
 region_env = os.environ.get('AWS_REGION', 'eu-north-1')
@@ -17,9 +17,11 @@ ipam_pool_ids = os.environ.get('IPAM_POOL_IDS')
 ipam_association_tag_key = os.environ.get('IPAM_ASSOCIATION_TAG_KEY')
 ipam_propagation_tag_key = os.environ.get('IPAM_PROPAGATION_TAG_KEY')
 
+@record_api_calls
+@idempotent('pool_tags')
 def lambda_handler(event, context):
+    log_invocation(logger, event, context)
     logger.info('Lambda invocation started')
-    logger.debug(f'Raw event: {event}')
     
     ct_event = CloudTrailEvent.from_raw(event)
 
@@ -42,59 +44,34 @@ def lambda_handler(event, context):
             'body': 'IPAM tag keys not configured, skipping IPAM tag retrieval'
         }
 
+    from botocore.exceptions import ClientError
+
     attachment = TGWAttachment.from_event(ct_event)
-    attachment_ipam_pool_id = None
-    for ipam_pool_id in ipam_pool_id_list:
-        ec2 = boto3.client('ec2', region_name=region_env)
-        next_token = None
-        while True:
-            params = {'IpamPoolId': ipam_pool_id}
-            if next_token:
-                params['NextToken'] = next_token
-            resp = ec2.get_ipam_pool_allocations(**params)
-            allocations = resp.get('IpamPoolAllocations', [])
-            for alloc in allocations:
-                if alloc.get('ResourceId') == attachment.vpc_id:
-                    logger.info(f"Found IPAM allocation for VPC {attachment.vpc_id} in pool {ipam_pool_id}")
-                    attachment_ipam_pool_id = ipam_pool_id
-                    break
-            next_token = resp.get('NextToken')
-            if not next_token:
-                break
+    ec2 = get_client('ec2', region_env)
+    attachment_ipam_pool_id = find_vpc_pool(ec2, attachment.vpc_id, ipam_pool_id_list)
 
     if attachment_ipam_pool_id:
-        logger.info(f"VPC {attachment.vpc_id} is associated with IPAM pool {attachment_ipam_pool_id}")
+        logger.info("VPC %s is associated with IPAM pool %s", attachment.vpc_id, attachment_ipam_pool_id)
     else:
-        logger.error(f"No IPAM allocation found for VPC {attachment.vpc_id} in any of the specified IPAM pools")
+        logger.error("No IPAM allocation found for VPC %s in any of the specified IPAM pools", attachment.vpc_id)
         raise ValueError(f"No IPAM allocation found for VPC {attachment.vpc_id} in any of the specified IPAM pools")
 
     try:
-        ec2 = boto3.client('ec2', region_name=region_env)
-
-        logger.info(f"Retrieving tags for IPAM pool: {ipam_pool_id}")
-        response = ec2.describe_ipam_pools(IpamPoolIds=[ipam_pool_id])
+        logger.info("Retrieving tags for IPAM pool: %s", attachment_ipam_pool_id)
+        # Tags of all configured pools are described together and cached, they rarely change
+        tag_dict = pool_tags(ec2, attachment_ipam_pool_id, ipam_pool_id_list)
 
-        if not response.get('IpamPools'):
-            logger.error(f"IPAM pool {ipam_pool_id} not found")
-            raise ValueError(f"IPAM pool {ipam_pool_id} not found")
-        
-        pool = response['IpamPools'][0]
-        tags = pool.get('Tags', [])
-        
-        # Convert list of tag dictionaries to a simple key-value dictionary
-        tag_dict = {tag['Key']: tag['Value'] for tag in tags}
-        
-        logger.info(f"Found {len(tag_dict)} route table tags for IPAM pool {ipam_pool_id}")
-        logger.debug(f"Pool tags: {tag_dict}")
-        logger.debug(f"Association tag key: {ipam_association_tag_key}")
-        logger.debug(f"Propagation tag key: {ipam_propagation_tag_key}")
+        logger.info("Found %d route table tags for IPAM pool %s", len(tag_dict), attachment_ipam_pool_id)
+        logger.debug("Pool tags: %s", tag_dict)
+        logger.debug("Association tag key: %s", ipam_association_tag_key)
+        logger.debug("Propagation tag key: %s", ipam_propagation_tag_key)
 
-        logger.info(f"Successfully retrieved route table tags for IPAM pool {ipam_pool_id}")
+        logger.info("Successfully retrieved route table tags for IPAM pool %s", attachment_ipam_pool_id)
 
         return {
             'statusCode': 200,
             'result': "SUCCESS",
-            'ipam_pool_id': ipam_pool_id,
+            'ipam_pool_id': attachment_ipam_pool_id,
             'association': tag_dict.get(ipam_association_tag_key),
             'propagation': tag_dict.get(ipam_propagation_tag_key),
         }
@@ -102,6 +79,5 @@ def lambda_handler(event, context):
     except ClientError as e:
         error_code = e.response['Error']['Code']
         error_message = e.response['Error']['Message']
-        logger.error(f"Failed to retrieve IPAM pool tags: {error_code} - {error_message}")
+        logger.error("Failed to retrieve IPAM pool tags: %s - %s", error_code, error_message)
         raise
-
@@ -0,0 +1,191 @@
+"""
+Stages of the accept workflow.
+
+Each stage takes the parsed CloudTrail event and returns the same result
+payload as the Lambda function running it on its own, so the stages can be
+invoked one Lambda per state (validate_iam, validate_ipam,
+validate_cidr_overlap, handle_accept, handle_attachment_tags) or fused into a
+single invocation by the pipeline.
+"""
+
+import os
+import logging
+from typing import Dict
+
+from cidr_index import find_overlapping_cidrs
+from clients import get_client
+from models import TGW, CloudTrailEvent, TGWAttachment
+from pool_index import find_vpc_pool
+from validation import parse_list, principal_matcher, requesting_principal
+
+logger = logging.getLogger(__name__)
+
+# Environment variables
+region_env = os.environ.get('AWS_REGION', 'eu-north-1')
+allowed_principal_patterns = parse_list(os.environ.get('ALLOWED_PRINCIPAL_PATTERNS', '*'))
+ipam_pool_ids = os.environ.get('IPAM_POOL_IDS', '')
+attachment_tag_key = os.environ.get('ATTACHMENT_TAG_KEY', '')
+attachment_tag_value = os.environ.get('ATTACHMENT_TAG_VALUE', '')
+# 'skip' lets attachments found by the sweeper pass without a principal check, see sweep_pending_attachments
+sweeper_iam_policy = os.environ.get('SWEEPER_IAM_POLICY', 'hold').lower()
+
+
+def validate_iam(ct_event: CloudTrailEvent) -> Dict:
+    """
+    Validate the requesting principal against ALLOWED_PRINCIPAL_PATTERNS.
+
+    Synthetic events from the sweeper only know the VPC owner account, so they
+    skip the check when SWEEPER_IAM_POLICY is 'skip'.
+    """
+    # Compiled once per execution environment
+    matcher = principal_matcher(tuple(allowed_principal_patterns))
+    logger.debug('Using allowed patterns from environment: %s', allowed_principal_patterns)
+
+    identity = requesting_principal(ct_event.detail)
+
+    pattern = matcher.match(identity)
+    if pattern:
+        logger.debug('Principal %s matched allowed pattern %s', identity, pattern)
+    elif ct_event.synthetic and sweeper_iam_policy == 'skip':
+        logger.info('Skipping principal check of swept attachment requested by %s', identity)
+    else:
+        logger.warning('Principal %s did not match any allowed patterns', identity)
+        raise PermissionError(f"Unauthorized principal: {identity} not in patterns {allowed_principal_patterns}")
+
+    attachment = TGWAttachment.from_event(ct_event)
+    logger.info("IAM validation completed successfully for attachment: %s", attachment)
+    return {
+        'result': "SUCCESS",
+        'attachment': {
+            'account_id': attachment.account_id,
+            'vpc_id': attachment.vpc_id,
+            'attachment_id': attachment.attachment_id,
+            'state': attachment.state,
+            'requesting_principal': identity
+        },
+        'message': f"IAM validation passed for attachment {attachment.attachment_id}"
+    }
+
+
+def validate_ipam(ct_event: CloudTrailEvent) -> Dict:
+    """Validate that the attaching VPC is allocated from one of IPAM_POOL_IDS."""
+    attachment = TGWAttachment.from_event(ct_event)
+    if attachment.state != 'pendingAcceptance':
+        logger.info("Skipping attachment with state: %s", attachment.state)
+        raise ValueError(f"Attachment not in pendingAcceptance state: {attachment.state}")
+
+    ipam_pool_id_list = parse_list(ipam_pool_ids)
+
+    ec2 = get_client('ec2', region_env)
+    containing_pool = find_vpc_pool(ec2, attachment.vpc_id, ipam_pool_id_list)
+    if not containing_pool:
+        logger.error("VPC %s in account %s is not allocated in any of the specified IPAM pools: %s", attachment.vpc_id, attachment.account_id, ipam_pool_id_list)
+        raise Exception(f"VPC {attachment.vpc_id} in account {attachment.account_id} is not allocated in any of the specified IPAM pools: {ipam_pool_id_list}")
+    logger.info("Found IPAM allocation for VPC %s in pool %s", attachment.vpc_id, containing_pool)
+
+    logger.info("IPAM validation completed successfully for attachment: %s", attachment)
+    return {
+        'result': "SUCCESS",
+        'attachment': {
+            'account_id': attachment.account_id,
+            'vpc_id': attachment.vpc_id,
+            'attachment_id': attachment.attachment_id,
+            'state': attachment.state,
+            'ipam_pool_id': containing_pool
+        },
+        'message': f"IPAM validation passed for attachment {attachment.attachment_id}"
+    }
+
+
+def validate_cidr_overlap(ct_event: CloudTrailEvent) -> Dict:
+    """Validate that no CIDR of the attaching VPC overlaps a VPC already attached to the Transit Gateway."""
+    attachment = TGWAttachment.from_event(ct_event)
+    tgw = TGW.from_event(ct_event)
+    if attachment.state != 'pendingAcceptance':
+        logger.info("Skipping attachment with state: %s", attachment.state)
+        raise ValueError(f"Attachment not in pendingAcceptance state: {attachment.state}")
+
+    ec2 = get_client('ec2', region_env)
+    cidrs, overlaps = find_overlapping_cidrs(ec2, tgw.tgw_id, attachment.vpc_id, parse_list(ipam_pool_ids))
+    if not cidrs:
+        # Without its CIDRs the VPC cannot be checked, so it is not let through
+        logger.error("IPAM knows no CIDRs of VPC %s in account %s", attachment.vpc_id, attachment.account_id)
+        raise Exception(f"CIDRs of VPC {attachment.vpc_id} not found in IPAM, cannot check for overlaps")
+    if overlaps:
+        conflicts = ', '.join(f"{cidr} ({vpc_id})" for cidr, vpc_id in overlaps)
+        logger.error("VPC %s CIDRs %s overlap VPCs attached to %s: %s", attachment.vpc_id, cidrs, tgw.tgw_id, conflicts)
+        raise Exception(f"VPC {attachment.vpc_id} CIDRs {', '.join(cidrs)} overlap VPCs attached to {tgw.tgw_id}: {conflicts}")
+
+    logger.info("CIDR overlap validation completed successfully for attachment: %s", attachment)
+    return {
+        'result': "SUCCESS",
+        'attachment': {
+            'account_id': attachment.account_id,
+            'vpc_id': attachment.vpc_id,
+            'attachment_id': attachment.attachment_id,
+            'state': attachment.state,
+            'cidrs': cidrs
+        },
+        'message': f"CIDR overlap validation passed for attachment {attachment.attachment_id}"
+    }
+
+
+def accept_attachment(ct_event: CloudTrailEvent) -> Dict:
+    """Accept the attachment if it is still pending acceptance."""
+    attachment = TGWAttachment.from_event(ct_event)
+    if attachment.state != 'pendingAcceptance':
+        logger.info("Skipping attachment with state: %s", attachment.state)
+        return {
+            'result': "SKIPPED",
+            'message': f"Attachment is in {attachment.state} state"
+        }
+    ec2 = get_client('ec2', region_env)
+    try:
+        ec2.accept_transit_gateway_vpc_attachment(TransitGatewayAttachmentId=attachment.attachment_id)
+        logger.info("Accepted TGW attachment %s", attachment.attachment_id)
+    except Exception as e:
+        logger.error("Failed to accept TGW attachment %s: %s", attachment.attachment_id, e)
+        raise
+
+    logger.info("Completed processing for TGWAttachment: %s", attachment)
+    return {
+        'result': "SUCCESS",
+        'message': f"Accepted attachment {attachment.attachment_id}"
+    }
+
+
+def tag_attachment(ct_event: CloudTrailEvent) -> Dict:
+    """Tag the attachment with ATTACHMENT_TAG_KEY/ATTACHMENT_TAG_VALUE."""
+    attachment = TGWAttachment.from_event(ct_event)
+
+    if not attachment_tag_key or not attachment_tag_value:
+        logger.info("No attachment tag key/value configured, skipping tagging")
+        return {
+            'result': "SKIPPED",
+            'message': "No attachment tag key/value configured"
+        }
+    # Imported here so validate_iam and skipped stages do not load botocore
+    from botocore.exceptions import ClientError
+
+    ec2 = get_client('ec2', region_env)
+    try:
+        ec2.create_tags(
+            Resources=[attachment.attachment_id],
+            Tags=[
+                {
+                    'Key': attachment_tag_key,
+                    'Value': attachment_tag_value
+                }
+            ]
+        )
+        logger.info("Tagged TGW attachment %s with %s:%s", attachment.attachment_id, attachment_tag_key, attachment_tag_value)
+    except ClientError as e:
+        error_code = e.response['Error']['Code']
+        error_message = e.response['Error']['Message']
+        logger.error("Failed to tag TGW attachment %s: %s - %s", attachment.attachment_id, error_code, error_message)
+        raise
+
+    return {
+        'result': "SUCCESS",
+        'message': f"Tagged attachment {attachment.attachment_id}"
+    }
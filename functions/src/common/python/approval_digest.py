@@ -0,0 +1,265 @@
+"""
+Digest of pending manual approvals.
+
+In digest mode send_approval_email does not mail each execution's approval
+request. It registers the task token of the waiting state in the key-value
+store instead. A scheduled run of send_approval_digest collects everything
+registered since the previous run into one digest and publishes a single
+notification. The notification has approve/reject links for each item and
+for the whole digest. handle_approval_callback resolves a digest link to
+the selected items and completes their task tokens concurrently.
+
+    approval#<item ID>    one waiting execution: task token, names, attachment
+    digest#<digest ID>    item IDs of one published digest
+
+Approvals not sent in a digest yet are listed in the APPROVAL_COLLECTION
+collection, which is all a digest run reads.
+"""
+
+import json
+import time
+import hashlib
+import secrets
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from urllib.parse import quote_plus
+
+from attachment_waiters import TOKEN_GONE_ERRORS
+from kvstore import Item, KeyValueStore
+from logs import correlation, in_current_context
+
+logger = logging.getLogger(__name__)
+
+APPROVAL_PREFIX = 'approval#'
+DIGEST_PREFIX = 'digest#'
+APPROVAL_COLLECTION = 'approval'
+
+# Step Functions output per action, matched by the "Manual Approval Choice" state
+ACTION_STATUS = {
+    'approve': 'Approved! Task approved by {approvers}',
+    'reject': 'Rejected! Task rejected by {approvers}',
+}
+
+# Item outcomes of complete_approvals()
+COMPLETED = 'COMPLETED'
+GONE = 'GONE'
+FAILED = 'FAILED'
+
+
+def approval_id(task_token: str) -> str:
+    # Derived from the token, so a retried send_approval_email registers the same item
+    return hashlib.sha256(task_token.encode()).hexdigest()[:24]
+
+
+def register_approval(store: KeyValueStore, task_token: str, execution_name: str, state_machine_name: str,
+                      attachment: Optional[Dict], ttl_seconds: float) -> str:
+    """
+    Register an execution waiting for manual approval, to be sent with the next digest.
+
+    Args:
+        store: Key-value store shared with the digest sender and the callback
+        task_token: Step Functions task token of the approval state
+        execution_name: Name of the waiting execution
+        state_machine_name: Name of its state machine
+        attachment: Attachment the approval is about ('attachment_id', 'vpc_id', 'account_id'), if known
+        ttl_seconds: Drop the item after this long, e.g. when nobody ever answered it
+
+    Returns:
+        The item ID
+    """
+    item_id = approval_id(task_token)
+    store.put(f"{APPROVAL_PREFIX}{item_id}", {
+        'task_token': task_token,
+        'execution_name': execution_name,
+        'state_machine_name': state_machine_name,
+        'attachment': attachment or {},
+        'registered_at': time.time(),
+    }, ttl_seconds=ttl_seconds, if_absent=True, collection=APPROVAL_COLLECTION)
+    logger.info("Registered approval of execution %s for the next digest", execution_name)
+    return item_id
+
+
+@dataclass
+class Digest:
+    """
+    A published set of pending approvals.
+
+    Attributes:
+        digest_id: Random ID used in the digest-wide links
+        items: Approval items of the digest, oldest first
+    """
+    digest_id: str
+    items: List[Item]
+
+
+def item_id_of(item: Item) -> str:
+    return item.key[len(APPROVAL_PREFIX):]
+
+
+def collect_digest(store: KeyValueStore, max_items: int, ttl_seconds: float) -> Optional[Digest]:
+    """
+    Move approvals not sent in a digest yet into a new digest.
+
+    Each item is claimed with a conditional write, so overlapping runs never
+    put the same item in two digests.
+
+    Args:
+        store: Key-value store holding the approvals
+        max_items: Maximum number of items in the digest; the rest wait for the next one
+        ttl_seconds: Lifetime of the digest record
+
+    Returns:
+        The digest, or None if nothing is pending
+    """
+    # The collection index can lag behind a claim by another run, those items fail their conditional write
+    pending = sorted((i for i in store.query(APPROVAL_COLLECTION) if 'digest_id' not in i.value),
+                     key=lambda i: i.value['registered_at'])
+    if not pending:
+        return None
+
+    # Unguessable, the digest links approve every item in it
+    digest_id = secrets.token_urlsafe(12)
+    claimed = []
+    for item in pending[:max_items]:
+        value = dict(item.value, digest_id=digest_id)
+        remaining = item.expires_at - time.time() if item.expires_at is not None else None
+        # Leaves the collection, items in a digest are looked up through their digest
+        if store.put(item.key, value, ttl_seconds=remaining, if_version=item.version):
+            claimed.append(Item(item.key, value, item.version + 1, item.expires_at))
+    if not claimed:
+        return None
+
+    store.put(f"{DIGEST_PREFIX}{digest_id}", {
+        'items': [item_id_of(i) for i in claimed],
+        'created_at': time.time(),
+    }, ttl_seconds=ttl_seconds)
+    logger.info("Collected %d pending approvals into digest %s, %s left", len(claimed), digest_id, len(pending) - len(claimed))
+    return Digest(digest_id, claimed)
+
+
+def release_digest(store: KeyValueStore, digest: Digest) -> None:
+    """Return the items of a digest that could not be sent to the pending ones, for the next run."""
+    for item in digest.items:
+        value = {k: v for k, v in item.value.items() if k != 'digest_id'}
+        remaining = item.expires_at - time.time() if item.expires_at is not None else None
+        store.put(item.key, value, ttl_seconds=remaining, if_version=item.version, collection=APPROVAL_COLLECTION)
+    store.delete(f"{DIGEST_PREFIX}{digest.digest_id}")
+
+
+def _link(endpoint: str, action: str, digest_id: str, item_id: Optional[str] = None) -> str:
+    link = f"{endpoint}/execution?action={action}&digest={quote_plus(digest_id)}"
+    return f"{link}&item={quote_plus(item_id)}" if item_id else link
+
+
+def digest_message(digest: Digest, endpoint: str) -> Dict[str, str]:
+    """
+    Build the notification of a digest.
+
+    Args:
+        digest: Digest to send
+        endpoint: Base URL of the approval API, e.g. https://<id>.execute-api.<region>.amazonaws.com/states
+
+    Returns:
+        Dict with 'subject' and 'message'
+    """
+    lines = [
+        "Welcome!\n",
+        f"{len(digest.items)} Transit Gateway attachments are waiting for an approval.\n",
+        "Check the following information and click the \"Approve\" link of each attachment "
+        "you want to approve, or \"Approve all\" to approve every attachment in this message.\n",
+    ]
+    for n, item in enumerate(digest.items, start=1):
+        attachment = item.value.get('attachment') or {}
+        item_id = item_id_of(item)
+        lines.append(f"{n}. Execution Name -> {item.value['execution_name']}")
+        if attachment:
+            lines.append(f"   Attachment {attachment.get('attachment_id')} of VPC {attachment.get('vpc_id')} "
+                         f"in account {attachment.get('account_id')}")
+        lines.append(f"   Approve {_link(endpoint, 'approve', digest.digest_id, item_id)}")
+        lines.append(f"   Reject {_link(endpoint, 'reject', digest.digest_id, item_id)}\n")
+    lines.append(f"Approve all {_link(endpoint, 'approve', digest.digest_id)}\n")
+    lines.append(f"Reject all {_link(endpoint, 'reject', digest.digest_id)}\n")
+    lines.append("Thanks for using Step functions!")
+    return {
+        'subject': f"Required approval of {len(digest.items)} attachments from AWS Step Functions",
+        'message': '\n'.join(lines),
+    }
+
+
+def digest_items(store: KeyValueStore, digest_id: str, item_id: Optional[str] = None) -> List[Item]:
+    """
+    Return the pending items of a digest, or only the selected one.
+
+    Items completed or expired since the digest was sent are left out.
+
+    Raises:
+        KeyError: If the digest does not exist (any more), or item_id is not part of it
+    """
+    digest = store.get(f"{DIGEST_PREFIX}{digest_id}")
+    if digest is None:
+        raise KeyError(f"Digest {digest_id} not found or expired")
+    item_ids = digest.value['items']
+    if item_id is not None:
+        if item_id not in item_ids:
+            raise KeyError(f"Item {item_id} is not part of digest {digest_id}")
+        item_ids = [item_id]
+    items = [store.get(f"{APPROVAL_PREFIX}{i}") for i in item_ids]
+    return [i for i in items if i is not None]
+
+
+def complete_approvals(sfn, store: KeyValueStore, items: List[Item], action: str, approvers: str,
+                       max_workers: int = 10) -> Dict[str, str]:
+    """
+    Send the approval decision to every selected execution, concurrently.
+
+    An item is claimed before its task token is completed, so a second click
+    on the same link does not complete it again. Items whose execution is
+    gone are removed like completed ones; items that failed otherwise are
+    released for another attempt.
+
+    Args:
+        sfn: boto3 Step Functions client
+        store: Key-value store holding the approvals
+        items: Approval items to complete
+        action: 'approve' or 'reject'
+        approvers: Shown in the status sent to the executions
+        max_workers: Maximum number of concurrent Step Functions calls
+
+    Returns:
+        Outcome per item ID: COMPLETED, GONE or FAILED; items claimed by another callback are left out
+    """
+    from botocore.exceptions import ClientError
+
+    output = json.dumps({'Status': ACTION_STATUS[action].format(approvers=approvers)})
+
+    def complete(item: Item) -> Optional[str]:
+        execution_name = item.value['execution_name']
+        with correlation(execution_name=execution_name, **(item.value.get('attachment') or {})):
+            claimed = dict(item.value, claimed_at=time.time())
+            remaining = item.expires_at - time.time() if item.expires_at is not None else None
+            if not store.put(item.key, claimed, ttl_seconds=remaining, if_version=item.version,
+                             collection=item.collection):
+                logger.info("Approval of execution %s is already being completed", execution_name)
+                return None
+            try:
+                sfn.send_task_success(taskToken=item.value['task_token'], output=output)
+                logger.info("Sent %s to execution %s", action, execution_name)
+                outcome = COMPLETED
+            except ClientError as e:
+                if e.response['Error']['Code'] not in TOKEN_GONE_ERRORS:
+                    logger.error("Could not send %s to execution %s: %s", action, execution_name, e)
+                    store.put(item.key, item.value, ttl_seconds=remaining, collection=item.collection)
+                    return FAILED
+                # Already answered, timed out or stopped
+                logger.warning("Execution %s is no longer waiting for an approval: %s", execution_name, e)
+                outcome = GONE
+            store.delete(item.key)
+            return outcome
+
+    if not items:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        outcomes = list(executor.map(in_current_context(complete), items))
+    return {item_id_of(item): outcome for item, outcome in zip(items, outcomes) if outcome is not None}
@@ -0,0 +1,110 @@
+"""
+Short IDs for the task tokens of manual approval links.
+
+A Step Functions task token is up to several KB once URL-encoded. Instead of
+putting it in the approve/reject links, send_approval_email registers it
+under a short random ID with an expiry, and the links carry only that ID.
+handle_approval_callback resolves the ID with one keyed lookup and claims it
+with a conditional write before calling Step Functions, so a second click
+on either link is turned away without completing the task again.
+
+    approval-link#<ID>    task token, execution and state machine name; 'used_at' once claimed
+"""
+
+import time
+import secrets
+import logging
+from typing import Optional
+
+from kvstore import Item, KeyValueStore
+
+logger = logging.getLogger(__name__)
+
+LINK_PREFIX = 'approval-link#'
+
+# 9 random bytes are 12 URL-safe characters
+SHORT_ID_BYTES = 9
+
+# Attempts to find an unused ID before giving up
+REGISTER_ATTEMPTS = 5
+
+
+class LinkNotFoundError(Exception):
+    """The link ID is unknown or expired."""
+
+
+class LinkAlreadyUsedError(Exception):
+    """The link was already used to approve or reject the execution."""
+
+
+def _remaining(item: Item) -> Optional[float]:
+    return item.expires_at - time.time() if item.expires_at is not None else None
+
+
+def register_token(store: KeyValueStore, task_token: str, execution_name: str, state_machine_name: str,
+                   ttl_seconds: float) -> str:
+    """
+    Register a task token under a new short ID.
+
+    Args:
+        store: Key-value store shared with the callback
+        task_token: Step Functions task token of the approval state
+        execution_name: Name of the waiting execution
+        state_machine_name: Name of its state machine
+        ttl_seconds: Seconds the links stay valid
+
+    Returns:
+        The short ID
+
+    Raises:
+        RuntimeError: If no unused ID was found
+    """
+    value = {
+        'task_token': task_token,
+        'execution_name': execution_name,
+        'state_machine_name': state_machine_name,
+        'registered_at': time.time(),
+    }
+    for _ in range(REGISTER_ATTEMPTS):
+        short_id = secrets.token_urlsafe(SHORT_ID_BYTES)
+        if store.put(f"{LINK_PREFIX}{short_id}", value, ttl_seconds=ttl_seconds, if_absent=True):
+            logger.info("Registered approval link %s for execution %s", short_id, execution_name)
+            return short_id
+    raise RuntimeError(f"Could not find an unused approval link ID in {REGISTER_ATTEMPTS} attempts")
+
+
+def claim_token(store: KeyValueStore, short_id: str, action: str) -> Item:
+    """
+    Resolve a link ID and mark it used, so only the first click completes the task.
+
+    The claim is kept until the link expires, so later clicks are reported as
+    already used rather than unknown.
+
+    Args:
+        store: Key-value store holding the links
+        short_id: ID from the link
+        action: 'approve' or 'reject', recorded with the claim
+
+    Returns:
+        The link as it was before the claim
+
+    Raises:
+        LinkNotFoundError: If the ID is unknown or expired
+        LinkAlreadyUsedError: If the link was used before
+    """
+    item = store.get(f"{LINK_PREFIX}{short_id}")
+    if item is None:
+        raise LinkNotFoundError(f"Approval link {short_id} not found or expired")
+    if 'used_at' in item.value:
+        raise LinkAlreadyUsedError(
+            f"Execution {item.value['execution_name']} was already answered with {item.value['action']}")
+    claimed = dict(item.value, used_at=time.time(), action=action)
+    if not store.put(item.key, claimed, ttl_seconds=_remaining(item), if_version=item.version):
+        # Another click claimed it between the read and the write
+        raise LinkAlreadyUsedError(f"Execution {item.value['execution_name']} is already being answered")
+    return item
+
+
+def release_token(store: KeyValueStore, item: Item) -> None:
+    """Undo a claim whose Step Functions call failed, so the link can be used again."""
+    store.put(item.key, item.value, ttl_seconds=_remaining(item), if_version=item.version + 1)
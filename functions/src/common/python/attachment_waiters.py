@@ -0,0 +1,167 @@
+"""
+Shared watcher for workflows waiting on TGW attachments to become available.
+
+Instead of every waiting workflow polling its own attachment, a waiter is
+registered in the key-value store with the Step Functions task token of the
+waiting state. The watcher resolves the states of all waited-on attachments
+with one multi-ID describe call per cycle and completes each task token when
+its attachment becomes available (or can no longer become available).
+"""
+
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, Iterable, Optional
+
+from kvstore import Item, KeyValueStore
+
+logger = logging.getLogger(__name__)
+
+WAITER_PREFIX = 'waiter#'
+# Collection listing the waiters, read by every watch cycle
+WAITER_COLLECTION = 'waiter'
+
+# States from which an attachment will never become available
+TERMINAL_STATES = {'deleted', 'deleting', 'failed', 'failing', 'rejected', 'rejecting'}
+
+# Errors meaning the waiting execution no longer exists
+TOKEN_GONE_ERRORS = {'TaskTimedOut', 'TaskDoesNotExist', 'InvalidToken'}
+
+# Describe results are eventually consistent, a missing attachment is only trusted after this long
+MISSING_GRACE_SECONDS = 60
+
+# describe_transit_gateway_attachments accepts many IDs per call, keep requests reasonably sized
+DESCRIBE_CHUNK_SIZE = 200
+
+
+def waiter_key(attachment_id: str, task_token: str) -> str:
+    # Task tokens are long; a digest keeps keys short while unique per waiting execution
+    digest = hashlib.sha256(task_token.encode()).hexdigest()[:32]
+    return f"{WAITER_PREFIX}{attachment_id}#{digest}"
+
+
+def register_waiter(store: KeyValueStore, attachment_id: str, task_token: str, result: Dict,
+                    max_wait_seconds: float) -> str:
+    """
+    Register a workflow waiting for an attachment to become available.
+
+    Args:
+        store: Key-value store shared with the watcher
+        attachment_id: TGW attachment ID
+        task_token: Step Functions task token of the waiting state
+        result: Task output sent with the token once the attachment is available
+        max_wait_seconds: Fail the waiter after this long
+
+    Returns:
+        The waiter's key
+    """
+    key = waiter_key(attachment_id, task_token)
+    now = time.time()
+    store.put(key, {
+        'attachment_id': attachment_id,
+        'task_token': task_token,
+        'result': result,
+        'registered_at': now,
+        'deadline': now + max_wait_seconds,
+    }, ttl_seconds=max_wait_seconds + 3600, collection=WAITER_COLLECTION)
+    logger.info("Registered waiter for attachment %s", attachment_id)
+    return key
+
+
+def describe_states(ec2, attachment_ids: Iterable[str]) -> Dict[str, str]:
+    """
+    Return the state of each attachment, describing up to DESCRIBE_CHUNK_SIZE per call.
+
+    Attachments that no longer exist are missing from the result.
+    """
+    attachment_ids = sorted(set(attachment_ids))
+    states = {}
+    for start in range(0, len(attachment_ids), DESCRIBE_CHUNK_SIZE):
+        chunk = attachment_ids[start:start + DESCRIBE_CHUNK_SIZE]
+        paginator = ec2.get_paginator('describe_transit_gateway_attachments')
+        # Filtering instead of TransitGatewayAttachmentIds, so one deleted attachment does not fail the chunk
+        for page in paginator.paginate(Filters=[{'Name': 'transit-gateway-attachment-id', 'Values': chunk}]):
+            for attachment in page.get('TransitGatewayAttachments', []):
+                states[attachment['TransitGatewayAttachmentId']] = attachment['State']
+    return states
+
+
+class AttachmentWatcher:
+    """
+    Completes the task tokens of waiters whose attachments changed state.
+
+    Attributes:
+        ec2: boto3 EC2 client
+        sfn: boto3 Step Functions client
+        store: Key-value store holding the waiters
+    """
+
+    def __init__(self, ec2, sfn, store: KeyValueStore):
+        self.ec2 = ec2
+        self.sfn = sfn
+        self.store = store
+
+    def poll_once(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Run one watch cycle over all registered waiters.
+
+        Returns:
+            Count of waiters per outcome: 'available', 'failed', 'waiting'
+        """
+        now = now if now is not None else time.time()
+        waiters = self.store.query(WAITER_COLLECTION)
+        counts = {'available': 0, 'failed': 0, 'waiting': 0}
+        if not waiters:
+            return counts
+
+        states = describe_states(self.ec2, (w.value['attachment_id'] for w in waiters))
+        logger.info("Resolved %d attachment states for %d waiters", len(states), len(waiters))
+
+        for waiter in waiters:
+            attachment_id = waiter.value['attachment_id']
+            state = states.get(attachment_id)
+            if state == 'available':
+                result = dict(waiter.value['result'])
+                result['attachment'] = dict(result.get('attachment', {}), state=state)
+                self._complete(waiter, output=result)
+                counts['available'] += 1
+            elif state is None and now - waiter.value['registered_at'] < MISSING_GRACE_SECONDS:
+                counts['waiting'] += 1
+            elif state is None or state in TERMINAL_STATES:
+                self._complete(waiter, error='AttachmentNotAvailableError',
+                               cause=f"Attachment {attachment_id} is in state {state}, it will not become available")
+                counts['failed'] += 1
+            elif now >= waiter.value['deadline']:
+                self._complete(waiter, error='AttachmentWaitTimeoutError',
+                               cause=f"Attachment {attachment_id} is in state {state}, expected 'available'")
+                counts['failed'] += 1
+            else:
+                counts['waiting'] += 1
+        return counts
+
+    def _complete(self, waiter: Item, output: Optional[Dict] = None, error: str = '', cause: str = '') -> None:
+        from botocore.exceptions import ClientError
+
+        # Claim the waiter first so two overlapping watcher runs do not both complete it.
+        # It stays listed, a claim whose completion fails is retried by the next cycle.
+        if not self.store.put(waiter.key, dict(waiter.value, claimed_at=time.time()),
+                              ttl_seconds=3600, if_version=waiter.version, collection=WAITER_COLLECTION):
+            return
+        attachment_id = waiter.value['attachment_id']
+        token = waiter.value['task_token']
+        try:
+            if output is not None:
+                self.sfn.send_task_success(taskToken=token, output=json.dumps(output))
+                logger.info("Resumed workflow waiting for attachment %s", attachment_id)
+            else:
+                self.sfn.send_task_failure(taskToken=token, error=error, cause=cause)
+                logger.warning("Failed workflow waiting for attachment %s: %s", attachment_id, cause)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in TOKEN_GONE_ERRORS:
+                # Left claimed, the next cycle claims it again and retries
+                logger.error("Could not complete task token for attachment %s: %s", attachment_id, e)
+                return
+            # The execution timed out or was stopped, there is nothing left to resume
+            logger.warning("Workflow waiting for attachment %s is gone: %s", attachment_id, e)
+        self.store.delete(waiter.key)
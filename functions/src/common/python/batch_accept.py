@@ -0,0 +1,310 @@
+"""
+Batch validation and acceptance of TGW VPC attachments.
+
+Used when attachment create events are buffered on a queue instead of each
+starting its own accept state machine execution. A batch shares one set of
+principal and IPAM lookups, checks CIDR overlaps with one index update per
+Transit Gateway, accepts attachments concurrently and tags the accepted
+attachments with a single create_tags call, or one per Transit Gateway when
+the batch was coalesced into groups. Every item gets its own result so
+callers can report failures per item.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from logs import correlation, in_current_context
+from models import TGW, CloudTrailEvent, TGWAttachment
+from cidr_index import find_overlapping_cidrs_of_vpcs
+from pool_index import find_vpc_pools
+from validation import principal_matcher, requesting_principal
+
+logger = logging.getLogger(__name__)
+
+ACCEPTED = 'ACCEPTED'
+SKIPPED = 'SKIPPED'
+REJECTED = 'REJECTED'
+FAILED = 'FAILED'
+
+
+@dataclass
+class BatchItemResult:
+    """
+    Outcome of processing one attachment event.
+
+    Attributes:
+        item_id: Caller's identifier for the item (e.g. SQS message ID)
+        attachment_id: TGW attachment ID, empty if the event could not be parsed
+        result: ACCEPTED, SKIPPED, REJECTED (failed validation) or FAILED (error)
+        message: Human readable detail
+        retryable: True if processing the item again may succeed
+        ipam_pool_id: Pool the VPC was found in, if IPAM validation ran
+    """
+    item_id: str
+    attachment_id: str
+    result: str
+    message: str
+    retryable: bool = False
+    ipam_pool_id: str = ""
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+@dataclass
+class GroupResult:
+    """
+    Outcome of processing the events of one Transit Gateway group.
+
+    Attributes:
+        tgw_id: Transit Gateway ID, coalesce.UNGROUPED for events that could not be parsed
+        results: One BatchItemResult per event of the group, in group order
+    """
+    tgw_id: str
+    results: List[BatchItemResult]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of results per outcome."""
+        counts: Dict[str, int] = {}
+        for result in self.results:
+            counts[result.result] = counts.get(result.result, 0) + 1
+        return counts
+
+
+@dataclass
+class _Item:
+    item_id: str
+    attachment: TGWAttachment
+    principal: str
+    tgw_id: str
+    ipam_pool_id: str = ""
+
+
+class BatchAccepter:
+    """
+    Validates and accepts a batch of CreateTransitGatewayVpcAttachment events.
+
+    Attributes:
+        ec2: boto3 EC2 client
+        allowed_principal_patterns: Patterns the requesting principal must match, empty to skip the check
+        ipam_pool_ids: Pools the VPC must be allocated from, empty to skip the check
+        attachment_tag: Optional (key, value) tag applied to accepted attachments
+        max_workers: Maximum number of concurrent accept calls
+        cidr_overlap_check: Reject VPCs overlapping a VPC attached to the Transit Gateway, needs ipam_pool_ids
+    """
+
+    def __init__(self, ec2, allowed_principal_patterns: List[str], ipam_pool_ids: List[str],
+                 attachment_tag: Optional[Tuple[str, str]] = None, max_workers: int = 8,
+                 cidr_overlap_check: bool = False):
+        self.ec2 = ec2
+        self.allowed_principal_patterns = allowed_principal_patterns
+        self._principal_matcher = principal_matcher(tuple(allowed_principal_patterns))
+        self.ipam_pool_ids = ipam_pool_ids
+        self.attachment_tag = attachment_tag
+        self.max_workers = max_workers
+        self.cidr_overlap_check = cidr_overlap_check
+
+    def process(self, raw_items: Iterable[Tuple[str, object]]) -> List[BatchItemResult]:
+        """
+        Validate and accept every item of a batch.
+
+        Args:
+            raw_items: (item_id, raw CloudTrail event as dict, JSON string or CloudTrailEvent) pairs
+
+        Returns:
+            One BatchItemResult per item, in input order
+        """
+        results: Dict[str, BatchItemResult] = {}
+        order: List[str] = []
+        items = self._validate(raw_items, results, order)
+        items = self._validate_cidr_overlap(items, results)
+        self._accept(items, results)
+        self._tag([results[i.item_id] for i in items if results[i.item_id].result == ACCEPTED])
+
+        return [results[item_id] for item_id in order]
+
+    def process_groups(self, groups: Iterable) -> List[GroupResult]:
+        """
+        Validate and accept events coalesced per Transit Gateway, see coalesce.py.
+
+        The principal and IPAM checks need no Transit Gateway and run once for
+        the whole batch. Each group then goes through the overlap check,
+        acceptance and tagging as a unit, with one CIDR index update and one
+        create_tags call for its Transit Gateway.
+
+        Args:
+            groups: coalesce.TGWGroup instances
+
+        Returns:
+            One GroupResult per group, in group order
+        """
+        groups = list(groups)
+        results: Dict[str, BatchItemResult] = {}
+        validated = {item.item_id: item for item in self._validate(
+            (item for group in groups for item in group.items), results, [])}
+
+        group_results = []
+        for group in groups:
+            items = [validated[item_id] for item_id, _ in group.items if item_id in validated]
+            with correlation(transit_gateway_id=group.tgw_id):
+                items = self._validate_cidr_overlap(items, results)
+                self._accept(items, results)
+                self._tag([results[i.item_id] for i in items if results[i.item_id].result == ACCEPTED])
+            group_results.append(GroupResult(group.tgw_id, [results[item_id] for item_id, _ in group.items]))
+        return group_results
+
+    def _validate(self, raw_items: Iterable[Tuple[str, object]], results: Dict[str, BatchItemResult],
+                  order: List[str]) -> List[_Item]:
+        """Parse the items and run the checks that need no Transit Gateway, appending the item IDs to order."""
+        items: List[_Item] = []
+        seen_attachments: Dict[str, str] = {}
+
+        for item_id, raw_event in raw_items:
+            order.append(item_id)
+            try:
+                ct_event = CloudTrailEvent.from_raw(raw_event)
+                attachment = TGWAttachment.from_event(ct_event)
+                tgw_id = TGW.from_event(ct_event).tgw_id
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error("Could not parse attachment event %s: %s", item_id, e)
+                results[item_id] = BatchItemResult(item_id, "", REJECTED, f"Invalid event: {e}")
+                continue
+            if attachment.state != 'pendingAcceptance':
+                results[item_id] = BatchItemResult(
+                    item_id, attachment.attachment_id, SKIPPED, f"Attachment is in {attachment.state} state")
+                continue
+            if attachment.attachment_id in seen_attachments:
+                # At-least-once delivery can put the same event in a batch twice
+                results[item_id] = BatchItemResult(
+                    item_id, attachment.attachment_id, SKIPPED,
+                    f"Duplicate of item {seen_attachments[attachment.attachment_id]}")
+                continue
+            seen_attachments[attachment.attachment_id] = item_id
+            items.append(_Item(item_id, attachment, requesting_principal(ct_event.detail), tgw_id))
+
+        items = self._validate_principals(items, results)
+        return self._validate_ipam(items, results)
+
+    def _validate_principals(self, items: List[_Item], results: Dict[str, BatchItemResult]) -> List[_Item]:
+        if not self.allowed_principal_patterns:
+            return items
+        valid = []
+        for item in items:
+            if self._principal_matcher.match(item.principal):
+                valid.append(item)
+            else:
+                logger.warning("Principal %s did not match any allowed patterns", item.principal)
+                results[item.item_id] = BatchItemResult(
+                    item.item_id, item.attachment.attachment_id, REJECTED,
+                    f"Unauthorized principal: {item.principal}")
+        return valid
+
+    def _validate_ipam(self, items: List[_Item], results: Dict[str, BatchItemResult]) -> List[_Item]:
+        from botocore.exceptions import ClientError
+
+        if not self.ipam_pool_ids or not items:
+            return items
+        try:
+            pools = find_vpc_pools(self.ec2, [i.attachment.vpc_id for i in items], self.ipam_pool_ids)
+        except ClientError as e:
+            logger.error("IPAM lookup failed for batch: %s", e)
+            for item in items:
+                results[item.item_id] = BatchItemResult(
+                    item.item_id, item.attachment.attachment_id, FAILED, f"IPAM lookup failed: {e}", retryable=True)
+            return []
+
+        valid = []
+        for item in items:
+            pool_id = pools.get(item.attachment.vpc_id)
+            if pool_id:
+                item.ipam_pool_id = pool_id
+                valid.append(item)
+            else:
+                results[item.item_id] = BatchItemResult(
+                    item.item_id, item.attachment.attachment_id, REJECTED,
+                    f"VPC {item.attachment.vpc_id} is not allocated in any of the specified IPAM pools")
+        return valid
+
+    def _validate_cidr_overlap(self, items: List[_Item], results: Dict[str, BatchItemResult]) -> List[_Item]:
+        from botocore.exceptions import ClientError
+
+        if not self.cidr_overlap_check or not self.ipam_pool_ids or not items:
+            return items
+        by_tgw: Dict[str, List[_Item]] = {}
+        for item in items:
+            by_tgw.setdefault(item.tgw_id, []).append(item)
+
+        valid = []
+        for tgw_id, tgw_items in by_tgw.items():
+            try:
+                checked = find_overlapping_cidrs_of_vpcs(
+                    self.ec2, tgw_id, [i.attachment.vpc_id for i in tgw_items], self.ipam_pool_ids)
+            except ClientError as e:
+                logger.error("CIDR overlap check failed for %s: %s", tgw_id, e)
+                for item in tgw_items:
+                    results[item.item_id] = BatchItemResult(
+                        item.item_id, item.attachment.attachment_id, FAILED, f"CIDR overlap check failed: {e}",
+                        retryable=True, ipam_pool_id=item.ipam_pool_id)
+                continue
+            for item in tgw_items:
+                vpc_id = item.attachment.vpc_id
+                cidrs, overlaps = checked[vpc_id]
+                if not cidrs:
+                    # Without its CIDRs the VPC cannot be checked, IPAM may not have discovered it yet
+                    results[item.item_id] = BatchItemResult(
+                        item.item_id, item.attachment.attachment_id, FAILED,
+                        f"CIDRs of VPC {vpc_id} not found in IPAM, cannot check for overlaps",
+                        retryable=True, ipam_pool_id=item.ipam_pool_id)
+                elif overlaps:
+                    conflicts = ', '.join(f"{cidr} ({other})" for cidr, other in overlaps)
+                    logger.warning("VPC %s CIDRs %s overlap VPCs attached to %s: %s", vpc_id, cidrs, tgw_id, conflicts)
+                    results[item.item_id] = BatchItemResult(
+                        item.item_id, item.attachment.attachment_id, REJECTED,
+                        f"VPC {vpc_id} CIDRs {', '.join(cidrs)} overlap VPCs attached to {tgw_id}: {conflicts}",
+                        ipam_pool_id=item.ipam_pool_id)
+                else:
+                    valid.append(item)
+        return valid
+
+    def _accept_one(self, item: _Item) -> BatchItemResult:
+        with correlation(attachment_id=item.attachment.attachment_id, transit_gateway_id=item.tgw_id,
+                         vpc_id=item.attachment.vpc_id, account_id=item.attachment.account_id):
+            return self._accept_attachment(item)
+
+    def _accept_attachment(self, item: _Item) -> BatchItemResult:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.ec2.accept_transit_gateway_vpc_attachment(TransitGatewayAttachmentId=item.attachment.attachment_id)
+            logger.info("Accepted TGW attachment %s", item.attachment.attachment_id)
+            return BatchItemResult(item.item_id, item.attachment.attachment_id, ACCEPTED,
+                                   f"Accepted attachment {item.attachment.attachment_id}", ipam_pool_id=item.ipam_pool_id)
+        except ClientError as e:
+            logger.error("Failed to accept TGW attachment %s: %s", item.attachment.attachment_id, e)
+            return BatchItemResult(item.item_id, item.attachment.attachment_id, FAILED,
+                                   f"Failed to accept attachment: {e}", retryable=True, ipam_pool_id=item.ipam_pool_id)
+
+    def _accept(self, items: List[_Item], results: Dict[str, BatchItemResult]) -> None:
+        if not items:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(items)))) as executor:
+            for result in executor.map(in_current_context(self._accept_one), items):
+                results[result.item_id] = result
+
+    def _tag(self, accepted: List[BatchItemResult]) -> None:
+        from botocore.exceptions import ClientError
+
+        if not self.attachment_tag or not accepted:
+            return
+        key, value = self.attachment_tag
+        attachment_ids = [r.attachment_id for r in accepted]
+        try:
+            self.ec2.create_tags(Resources=attachment_ids, Tags=[{'Key': key, 'Value': value}])
+            logger.info("Tagged %d TGW attachments with %s:%s", len(attachment_ids), key, value)
+        except ClientError as e:
+            # The attachments are accepted already, a missing tag is not worth a retry of the accept
+            logger.error("Failed to tag TGW attachments %s: %s", attachment_ids, e)
+            for result in accepted:
+                result.message += f" (tagging failed: {e})"
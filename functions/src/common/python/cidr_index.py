@@ -0,0 +1,300 @@
+"""
+Interval index of the VPC CIDRs attached to a Transit Gateway.
+
+Used by the CIDR overlap check of the accept workflow. Two CIDR blocks are
+either disjoint or one contains the other, so finding the blocks that
+overlap a new CIDR takes two lookups instead of a scan of every attachment:
+
+- blocks inside the new CIDR: a binary search on the blocks sorted by start
+- blocks containing it: one dict lookup per prefix length in the index
+
+CIDRs come from IPAM: one listing of the VPC resource CIDRs per scope of the
+configured pools (get_ipam_resource_cidrs). The attached VPCs come from
+describe_transit_gateway_attachments, counting attachments pending
+acceptance. The index of each Transit Gateway is kept at module level, so it
+stays warm across invocations of the same Lambda container. Every use lists
+the Transit Gateway's attachments again and brings the index in line with
+them: VPCs detached or rejected since are dropped, new ones are added with a
+listing of their own CIDRs. A check never adds the VPC it checks, so a VPC
+rejected after the check leaves nothing behind. After CIDR_INDEX_TTL_SECONDS
+the index is rebuilt from a full listing, which picks up CIDRs added to or
+removed from VPCs already indexed.
+"""
+
+import os
+import time
+import bisect
+import logging
+import ipaddress
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from ipam_lookup import pool_scope_ids
+
+logger = logging.getLogger(__name__)
+
+# Seconds an index is kept in line with the attachments before it is rebuilt from EC2 and IPAM
+DEFAULT_TTL_SECONDS = float(os.environ.get('CIDR_INDEX_TTL_SECONDS', '300'))
+
+# Attachment states whose VPC routes through the Transit Gateway, or is about to once accepted
+ATTACHED_STATES = ['initiating', 'pendingAcceptance', 'pending', 'available', 'modifying']
+
+# (IP version, first address, prefix length)
+_Block = Tuple[int, int, int]
+
+
+class CidrIndex:
+    """
+    CIDR blocks of VPCs, for overlap queries in O(log n).
+
+    The same block may belong to several VPCs, e.g. VPCs that already overlap.
+    """
+
+    def __init__(self):
+        # Per IP version, (first address, prefix length) sorted by address, then by size
+        self._starts: Dict[int, List[Tuple[int, int]]] = {4: [], 6: []}
+        self._prefixlens: Dict[int, Set[int]] = {4: set(), 6: set()}
+        self._owners: Dict[_Block, Set[str]] = {}
+        self._cidrs: Dict[_Block, str] = {}
+        self._blocks: Dict[str, Set[_Block]] = {}
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    def add(self, cidr: str, owner: str) -> None:
+        """Add a VPC's CIDR block."""
+        network = ipaddress.ip_network(cidr, strict=False)
+        block = (network.version, int(network.network_address), network.prefixlen)
+        owners = self._owners.get(block)
+        if owners is None:
+            owners = self._owners[block] = set()
+            self._cidrs[block] = str(network)
+            bisect.insort(self._starts[network.version], block[1:])
+            self._prefixlens[network.version].add(network.prefixlen)
+        owners.add(owner)
+        self._blocks.setdefault(owner, set()).add(block)
+
+    def cidrs(self, owner: str) -> List[str]:
+        """Return the CIDR blocks of a VPC, in address order."""
+        return [self._cidrs[block] for block in sorted(self._blocks.get(owner, ()))]
+
+    def remove(self, owner: str) -> None:
+        """Remove all CIDR blocks of a VPC."""
+        for block in self._blocks.pop(owner, ()):
+            owners = self._owners[block]
+            owners.discard(owner)
+            if not owners:
+                del self._owners[block]
+                del self._cidrs[block]
+                starts = self._starts[block[0]]
+                del starts[bisect.bisect_left(starts, block[1:])]
+
+    def overlaps(self, cidr: str, exclude_owner: Optional[str] = None) -> List[Tuple[str, str]]:
+        """
+        Return the blocks overlapping a CIDR.
+
+        Args:
+            cidr: CIDR to check
+            exclude_owner: VPC whose own blocks are ignored
+
+        Returns:
+            (CIDR, VPC ID) pairs, containing blocks first
+        """
+        network = ipaddress.ip_network(cidr, strict=False)
+        version, prefixlen = network.version, network.prefixlen
+        first, last = int(network.network_address), int(network.broadcast_address)
+        bits = network.max_prefixlen
+
+        found: List[_Block] = []
+        # The block itself and the blocks containing it start at its address rounded down to their size
+        for length in sorted(p for p in self._prefixlens[version] if p <= prefixlen):
+            block = (version, first >> (bits - length) << (bits - length), length)
+            if block in self._owners:
+                found.append(block)
+        # Any block starting inside the CIDR is smaller and lies entirely within it
+        starts = self._starts[version]
+        i = bisect.bisect_left(starts, (first, prefixlen + 1))
+        while i < len(starts) and starts[i][0] <= last:
+            found.append((version, *starts[i]))
+            i += 1
+
+        return [(self._cidrs[block], owner) for block in found
+                for owner in sorted(self._owners[block]) if owner != exclude_owner]
+
+
+def attached_vpc_ids(ec2, tgw_id: str) -> Set[str]:
+    """VPCs attached to a Transit Gateway, or being attached after acceptance."""
+    vpc_ids = set()
+    paginator = ec2.get_paginator('describe_transit_gateway_attachments')
+    filters = [
+        {'Name': 'transit-gateway-id', 'Values': [tgw_id]},
+        {'Name': 'resource-type', 'Values': ['vpc']},
+        {'Name': 'state', 'Values': ATTACHED_STATES},
+    ]
+    for page in paginator.paginate(Filters=filters, PaginationConfig={'PageSize': 1000}):
+        for attachment in page.get('TransitGatewayAttachments', []):
+            vpc_ids.add(attachment['ResourceId'])
+    return vpc_ids
+
+
+def vpc_cidrs(ec2, scope_ids: Iterable[str], vpc_id: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    VPC CIDRs known to IPAM, listed per scope.
+
+    Args:
+        ec2: boto3 EC2 client
+        scope_ids: IPAM scopes to list
+        vpc_id: Only list this VPC's CIDRs
+
+    Returns:
+        Dict mapping VPC IDs to their CIDRs
+    """
+    cidrs: Dict[str, List[str]] = {}
+    kwargs = {'ResourceType': 'vpc'}
+    if vpc_id:
+        kwargs['ResourceId'] = vpc_id
+    for scope_id in scope_ids:
+        paginator = ec2.get_paginator('get_ipam_resource_cidrs')
+        for page in paginator.paginate(IpamScopeId=scope_id, **kwargs):
+            for resource_cidr in page.get('IpamResourceCidrs', []):
+                vpc_cidr_list = cidrs.setdefault(resource_cidr['ResourceId'], [])
+                if resource_cidr['ResourceCidr'] not in vpc_cidr_list:
+                    vpc_cidr_list.append(resource_cidr['ResourceCidr'])
+    return cidrs
+
+
+def ipam_scope_ids(ec2, pool_ids: Iterable[str]) -> List[str]:
+    """Distinct IPAM scopes of the configured pools, in pool order."""
+    return list(dict.fromkeys(pool_scope_ids(ec2, pool_ids).values()))
+
+
+class TGWCidrIndexes:
+    """
+    One CidrIndex per Transit Gateway, kept between invocations.
+
+    Attributes:
+        ttl_seconds: Age after which an index is rebuilt
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        # tgw_id -> (built at, index, VPCs indexed including those without CIDRs in IPAM)
+        self._indexes: Dict[str, Tuple[float, CidrIndex, Set[str]]] = {}
+
+    def index(self, ec2, tgw_id: str, scope_ids: List[str]) -> CidrIndex:
+        """
+        Return the index of a Transit Gateway, in line with its current attachments.
+
+        The index is built if it is missing or expired. Otherwise only the VPCs
+        attached or detached since the last use are added or removed.
+        """
+        attached = attached_vpc_ids(ec2, tgw_id)
+        entry = self._indexes.get(tgw_id)
+        if entry is None or self._clock() - entry[0] >= self.ttl_seconds:
+            return self._build(ec2, tgw_id, scope_ids, attached)
+
+        _, index, indexed = entry
+        added, removed = attached - indexed, indexed - attached
+        cidrs = {}
+        for vpc_id in added:
+            cidrs.update(vpc_cidrs(ec2, scope_ids, vpc_id))
+        with self._lock:
+            for vpc_id in removed:
+                index.remove(vpc_id)
+            for vpc_id in added:
+                for cidr in cidrs.get(vpc_id, []):
+                    index.add(cidr, vpc_id)
+            indexed.difference_update(removed)
+            indexed.update(added)
+        if added or removed:
+            logger.debug("Updated index of %s: %d VPCs added, %d removed", tgw_id, len(added), len(removed))
+        return index
+
+    def _build(self, ec2, tgw_id: str, scope_ids: List[str], attached: Set[str]) -> CidrIndex:
+        built_at = self._clock()
+        cidrs = vpc_cidrs(ec2, scope_ids)
+        index = CidrIndex()
+        for vpc_id in attached:
+            for cidr in cidrs.get(vpc_id, []):
+                index.add(cidr, vpc_id)
+        unknown = attached - cidrs.keys()
+        if unknown:
+            logger.warning("%d VPCs attached to %s have no CIDRs in IPAM and are not checked: %s",
+                           len(unknown), tgw_id, sorted(unknown)[:10])
+        logger.info("Indexed %d CIDRs of %d VPCs attached to %s", len(index), len(attached), tgw_id)
+        with self._lock:
+            self._indexes[tgw_id] = (built_at, index, set(attached))
+        return index
+
+    def check(self, ec2, tgw_id: str, vpc_id: str, pool_ids: Iterable[str]) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """
+        Find the CIDRs of VPCs attached to a Transit Gateway that overlap a VPC's CIDRs.
+
+        Attachments pending acceptance count as attached, the VPC's own blocks are
+        ignored. The check does not change the index.
+
+        Args:
+            ec2: boto3 EC2 client
+            tgw_id: Transit Gateway the VPC is attaching to
+            vpc_id: VPC to check
+            pool_ids: Configured IPAM pools, whose scopes are searched for CIDRs
+
+        Returns:
+            The VPC's CIDRs, and the overlapping (CIDR, VPC ID) pairs
+        """
+        scope_ids = ipam_scope_ids(ec2, pool_ids)
+        cidrs = vpc_cidrs(ec2, scope_ids, vpc_id).get(vpc_id, [])
+        index = self.index(ec2, tgw_id, scope_ids)
+        overlaps = []
+        with self._lock:
+            for cidr in cidrs:
+                overlaps.extend(index.overlaps(cidr, exclude_owner=vpc_id))
+        return cidrs, overlaps
+
+    def check_all(self, ec2, tgw_id: str, vpc_ids: Iterable[str],
+                  pool_ids: Iterable[str]) -> Dict[str, Tuple[List[str], List[Tuple[str, str]]]]:
+        """
+        Check several VPCs attaching to the same Transit Gateway, see check.
+
+        The index is brought in line with the attachments once for all of them.
+        A VPC pending acceptance is in the index already, with its CIDRs; only
+        the CIDRs of the others are listed.
+
+        Returns:
+            Dict mapping each VPC ID to its CIDRs and overlapping (CIDR, VPC ID) pairs
+        """
+        scope_ids = ipam_scope_ids(ec2, pool_ids)
+        index = self.index(ec2, tgw_id, scope_ids)
+        checked = {}
+        for vpc_id in vpc_ids:
+            with self._lock:
+                cidrs = index.cidrs(vpc_id)
+            if not cidrs:
+                cidrs = vpc_cidrs(ec2, scope_ids, vpc_id).get(vpc_id, [])
+            with self._lock:
+                checked[vpc_id] = (cidrs, [overlap for cidr in cidrs
+                                           for overlap in index.overlaps(cidr, exclude_owner=vpc_id)])
+        return checked
+
+    def clear(self) -> None:
+        """Drop all indexes."""
+        with self._lock:
+            self._indexes.clear()
+
+
+# Shared indexes, kept warm for the lifetime of the Lambda container
+_indexes = TGWCidrIndexes()
+
+
+def find_overlapping_cidrs(ec2, tgw_id: str, vpc_id: str,
+                           pool_ids: Iterable[str]) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Check a VPC against the container-wide index of its Transit Gateway, see TGWCidrIndexes.check."""
+    return _indexes.check(ec2, tgw_id, vpc_id, pool_ids)
+
+
+def find_overlapping_cidrs_of_vpcs(ec2, tgw_id: str, vpc_ids: Iterable[str],
+                                   pool_ids: Iterable[str]) -> Dict[str, Tuple[List[str], List[Tuple[str, str]]]]:
+    """Check VPCs against the container-wide index of their Transit Gateway, see TGWCidrIndexes.check_all."""
+    return _indexes.check_all(ec2, tgw_id, vpc_ids, pool_ids)
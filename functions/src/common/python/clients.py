@@ -0,0 +1,160 @@
+"""
+Shared boto3 clients for the Lambda functions.
+
+Clients are cached per (service, region, role) for the lifetime of the Lambda
+container, so warm invocations reuse the resolved endpoint and the pooled,
+kept-alive connections instead of paying for them on every call.
+
+boto3 and botocore are imported when the first client is created rather than
+when this module is imported, so handler paths that return before calling AWS
+do not pay for loading the SDK. Handlers whose every path needs a client call
+prewarm_clients() at module level: with provisioned concurrency or SnapStart
+the clients are then created during init, off the request path, and on
+on-demand cold starts creation stays deferred to the first call.
+
+Every client is instrumented for API call accounting, see metrics.py, and
+EC2 clients take their calls from the shared rate limits, see rate_limit.py.
+"""
+
+import os
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from metrics import instrument_client
+from rate_limit import install_rate_limiter
+
+# Tuning for all shared clients, overridable per function through the environment
+CLIENT_MAX_POOL_CONNECTIONS = int(os.environ.get('CLIENT_MAX_POOL_CONNECTIONS', '32'))
+CLIENT_CONNECT_TIMEOUT = float(os.environ.get('CLIENT_CONNECT_TIMEOUT', '3'))
+CLIENT_READ_TIMEOUT = float(os.environ.get('CLIENT_READ_TIMEOUT', '10'))
+CLIENT_MAX_ATTEMPTS = int(os.environ.get('CLIENT_MAX_ATTEMPTS', '5'))
+
+ROLE_SESSION_NAME = os.environ.get('ROLE_SESSION_NAME', 'tgw-attachment-manager')
+
+# Create prewarmed clients during init: 'auto' when init is not on the request path, or 'always'/'never'
+CLIENT_PREWARM = os.environ.get('CLIENT_PREWARM', 'auto').lower()
+PREWARM_INITIALIZATION_TYPES = {'provisioned-concurrency', 'snap-start'}
+
+_config = None
+_clients: Dict[Tuple[str, Optional[str], Optional[str]], object] = {}
+_sessions: Dict[str, object] = {}
+_lock = threading.RLock()
+
+
+def client_config():
+    """Return the botocore Config shared by all clients."""
+    global _config
+    if _config is None:
+        from botocore.config import Config
+
+        _config = Config(
+            max_pool_connections=CLIENT_MAX_POOL_CONNECTIONS,
+            tcp_keepalive=True,
+            connect_timeout=CLIENT_CONNECT_TIMEOUT,
+            read_timeout=CLIENT_READ_TIMEOUT,
+            retries={
+                'mode': 'adaptive',
+                'max_attempts': CLIENT_MAX_ATTEMPTS,
+            },
+        )
+    return _config
+
+
+def _role_session(role_arn: str):
+    """Return a boto3 session whose credentials are assumed from role_arn and refreshed before expiry."""
+    session = _sessions.get(role_arn)
+    if session is not None:
+        return session
+
+    import boto3
+    from botocore.credentials import CredentialProvider, RefreshableCredentials
+    from botocore.session import get_session
+
+    sts = get_client('sts')
+
+    def refresh():
+        creds = sts.assume_role(RoleArn=role_arn, RoleSessionName=ROLE_SESSION_NAME)['Credentials']
+        return {
+            'access_key': creds['AccessKeyId'],
+            'secret_key': creds['SecretAccessKey'],
+            'token': creds['SessionToken'],
+            'expiry_time': creds['Expiration'].isoformat(),
+        }
+
+    class AssumeRoleProvider(CredentialProvider):
+        METHOD = 'sts-assume-role'
+        CANONICAL_NAME = 'custom-sts-assume-role'
+
+        def load(self):
+            return RefreshableCredentials.create_from_metadata(
+                metadata=refresh(),
+                refresh_using=refresh,
+                method=self.METHOD,
+            )
+
+    botocore_session = get_session()
+    # Ahead of the environment, whose credentials are the Lambda's own role
+    botocore_session.get_component('credential_provider').insert_before('env', AssumeRoleProvider())
+    session = boto3.Session(botocore_session=botocore_session)
+    _sessions[role_arn] = session
+    return session
+
+
+def get_client(service: str, region: Optional[str] = None, role_arn: Optional[str] = None):
+    """
+    Return a cached boto3 client, creating it on first use.
+
+    Args:
+        service: AWS service name (e.g. "ec2")
+        region: Region name, defaults to the Lambda's region
+        role_arn: Optional role to assume for the client's credentials
+
+    Returns:
+        boto3 client shared by every caller with the same arguments
+    """
+    key = (service, region, role_arn)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            if role_arn:
+                client = _role_session(role_arn).client(service, region_name=region, config=client_config())
+            else:
+                import boto3
+
+                client = boto3.client(service, region_name=region, config=client_config())
+            # Registered first, so time spent waiting for a token is not counted as call latency
+            install_rate_limiter(client)
+            instrument_client(client)
+            _clients[key] = client
+    return client
+
+
+def prewarm_clients(clients: Iterable[Tuple[str, Optional[str]]]) -> bool:
+    """
+    Create clients during init if that keeps them off the request path.
+
+    Args:
+        clients: (service, region) pairs the handler needs on every path
+
+    Returns:
+        True if the clients were created
+    """
+    if CLIENT_PREWARM == 'never':
+        return False
+    if CLIENT_PREWARM != 'always' and \
+            os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') not in PREWARM_INITIALIZATION_TYPES:
+        return False
+    for service, region in clients:
+        get_client(service, region)
+    return True
+
+
+def clear_clients() -> None:
+    """Drop all cached clients and sessions, e.g. between tests."""
+    with _lock:
+        _clients.clear()
+        _sessions.clear()
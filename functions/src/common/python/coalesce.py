@@ -0,0 +1,180 @@
+"""
+Coalescing of attachment events per Transit Gateway.
+
+Bursts of new attachments usually target the same Transit Gateway. The
+batch accepter's queue holds events for up to its batching window
+(accept_batch_window_seconds, at most 300 s) before invoking the function.
+coalesce_by_tgw() then groups the events of the batch by TGW
+(models.TGW.from_event). The batch accepter processes each group as a unit
+(batch_accept.BatchAccepter.process_groups): a burst for one TGW costs one
+CIDR index update and one tagging call rather than one per event, and the
+group's outcome is reported on its own by GroupReport.
+
+The window bounds the latency added by coalescing. CoalescingReport
+measures it per batch from the time each message was sent to the queue.
+"""
+
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models import TGW, CloudTrailEvent
+
+# Group of the events whose TGW could not be read, the stages reject them one by one
+UNGROUPED = ''
+
+# Results of batch_accept, one group metric each
+OUTCOMES = ('ACCEPTED', 'SKIPPED', 'REJECTED', 'FAILED')
+
+
+@dataclass
+class TGWGroup:
+    """
+    Events of one batch for the same Transit Gateway.
+
+    Attributes:
+        tgw_id: Transit Gateway ID, UNGROUPED for events that could not be parsed
+        items: (item_id, event) pairs in arrival order; parsed events are CloudTrailEvent instances
+        oldest_sent_at: Epoch seconds the group's oldest event was queued, if known
+    """
+    tgw_id: str
+    items: List[Tuple[str, object]] = field(default_factory=list)
+    oldest_sent_at: Optional[float] = None
+
+    def delay_seconds(self, now: float) -> float:
+        """Time the group's oldest event waited before processing."""
+        return max(0.0, now - self.oldest_sent_at) if self.oldest_sent_at is not None else 0.0
+
+
+def coalesce_by_tgw(items: Iterable[Tuple[str, object, Optional[float]]]) -> List[TGWGroup]:
+    """
+    Group events by Transit Gateway, largest group first.
+
+    Args:
+        items: (item_id, raw CloudTrail event as dict or JSON string, epoch seconds it was queued or None)
+
+    Returns:
+        One group per Transit Gateway, plus an UNGROUPED group for unparsable events
+    """
+    groups: Dict[str, TGWGroup] = {}
+    for item_id, raw_event, sent_at in items:
+        try:
+            ct_event = CloudTrailEvent.from_raw(raw_event)
+            tgw_id = TGW.from_event(ct_event).tgw_id
+            event = ct_event
+        except (KeyError, TypeError, ValueError):
+            tgw_id, event = UNGROUPED, raw_event
+        group = groups.get(tgw_id)
+        if group is None:
+            group = groups[tgw_id] = TGWGroup(tgw_id)
+        group.items.append((item_id, event))
+        if sent_at is not None and (group.oldest_sent_at is None or sent_at < group.oldest_sent_at):
+            group.oldest_sent_at = sent_at
+    return sorted(groups.values(), key=lambda g: len(g.items), reverse=True)
+
+
+def sqs_items(records: Iterable[Dict]) -> Iterable[Tuple[str, str, Optional[float]]]:
+    """(message ID, body, time sent) of the records of an SQS event."""
+    for record in records:
+        sent_ms = record.get('attributes', {}).get('SentTimestamp')
+        yield record['messageId'], record['body'], int(sent_ms) / 1000 if sent_ms else None
+
+
+@dataclass
+class CoalescingReport:
+    """
+    How one batch was coalesced.
+
+    Attributes:
+        events: Number of events in the batch
+        groups: Number of Transit Gateway groups
+        largest_group: Number of events in the largest group
+        max_delay_seconds: Longest time an event of the batch waited before processing
+    """
+    events: int
+    groups: int
+    largest_group: int
+    max_delay_seconds: float
+
+    @classmethod
+    def of(cls, groups: List[TGWGroup], now: Optional[float] = None) -> 'CoalescingReport':
+        now = now if now is not None else time.time()
+        return cls(
+            events=sum(len(g.items) for g in groups),
+            groups=len(groups),
+            largest_group=max((len(g.items) for g in groups), default=0),
+            max_delay_seconds=max((g.delay_seconds(now) for g in groups), default=0.0),
+        )
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    def emf_document(self, function_name: str, namespace: str, timestamp_ms: Optional[int] = None) -> str:
+        """The report as one CloudWatch Embedded Metric Format line."""
+        return json.dumps({
+            '_aws': {
+                'Timestamp': timestamp_ms if timestamp_ms is not None else int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': [['FunctionName']],
+                    'Metrics': [
+                        {'Name': 'CoalescedEvents', 'Unit': 'Count'},
+                        {'Name': 'CoalescedGroups', 'Unit': 'Count'},
+                        {'Name': 'LargestGroup', 'Unit': 'Count'},
+                        {'Name': 'CoalescingDelayMs', 'Unit': 'Milliseconds'},
+                    ],
+                }],
+            },
+            'FunctionName': function_name,
+            'CoalescedEvents': self.events,
+            'CoalescedGroups': self.groups,
+            'LargestGroup': self.largest_group,
+            'CoalescingDelayMs': round(self.max_delay_seconds * 1000),
+        }, separators=(',', ':'))
+
+
+@dataclass
+class GroupReport:
+    """
+    Outcome of one Transit Gateway group.
+
+    Attributes:
+        tgw_id: Transit Gateway ID, UNGROUPED for events that could not be parsed
+        events: Number of events in the group
+        outcomes: Number of events per batch_accept result (ACCEPTED, SKIPPED, REJECTED, FAILED)
+        delay_seconds: Time the group's oldest event waited before processing
+    """
+    tgw_id: str
+    events: int
+    outcomes: Dict[str, int]
+    delay_seconds: float
+
+    @classmethod
+    def of(cls, group: TGWGroup, outcomes: Dict[str, int], now: Optional[float] = None) -> 'GroupReport':
+        now = now if now is not None else time.time()
+        return cls(group.tgw_id, len(group.items), dict(outcomes), group.delay_seconds(now))
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    def emf_document(self, function_name: str, namespace: str, timestamp_ms: Optional[int] = None) -> str:
+        """The report as one CloudWatch Embedded Metric Format line, with the TGW as a dimension."""
+        outcomes = {f"Group{result.capitalize()}": self.outcomes.get(result, 0) for result in OUTCOMES}
+        return json.dumps({
+            '_aws': {
+                'Timestamp': timestamp_ms if timestamp_ms is not None else int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': [['FunctionName', 'TransitGatewayId']],
+                    'Metrics': [{'Name': 'GroupEvents', 'Unit': 'Count'}]
+                    + [{'Name': name, 'Unit': 'Count'} for name in outcomes]
+                    + [{'Name': 'GroupDelayMs', 'Unit': 'Milliseconds'}],
+                }],
+            },
+            'FunctionName': function_name,
+            'TransitGatewayId': self.tgw_id or 'unparsable',
+            'GroupEvents': self.events,
+            **outcomes,
+            'GroupDelayMs': round(self.delay_seconds * 1000),
+        }, separators=(',', ':'))
@@ -0,0 +1,164 @@
+"""
+Idempotent workflow stages.
+
+EventBridge and CloudTrail deliver at least once, so the same attachment
+event can start two executions of a state machine. A stage handler
+decorated with @idempotent records its run under
+
+    idempotency#<attachment ID>#<event name>#<stage>
+
+before doing any work. The record is claimed with a conditional write, so of
+two concurrent duplicates only one runs the stage. The first run's result
+is kept and replayed to duplicates instead of calling EC2 again:
+
+- no record: claim it IN_PROGRESS with a lease, run the stage, store the result
+- COMPLETED: return the stored result with 'replayed' set
+- IN_PROGRESS: wait up to IDEMPOTENCY_WAIT_SECONDS for the result, then
+  raise IdempotencyInProgressError; a lease that ran out means the first
+  run died, and its record is taken over
+
+A stage that raises deletes its record, so Step Functions retries and later
+duplicates run it again. Enabled with IDEMPOTENCY_ENABLED=true; records live
+in the store of kvstore.store_from_env() for IDEMPOTENCY_TTL_SECONDS.
+"""
+
+import os
+import time
+import functools
+import logging
+from typing import Any, Callable, Dict, Optional, Union
+
+from kvstore import KeyValueStore, store_from_env
+from models import CloudTrailEvent, TGWAttachment
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_ENABLED = os.environ.get('IDEMPOTENCY_ENABLED', 'false').lower() == 'true'
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '10'))
+
+IDEMPOTENCY_PREFIX = 'idempotency#'
+
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+
+# Lease of a run without a Lambda context, e.g. local runs
+DEFAULT_LEASE_SECONDS = 900
+# Time between reads of a duplicate waiting for the first run
+POLL_SECONDS = 0.5
+
+
+class IdempotencyInProgressError(Exception):
+    """A duplicate of this stage is still running; its result was not available in time."""
+
+
+def idempotency_key(attachment_id: str, event_name: str, stage: str) -> str:
+    return f"{IDEMPOTENCY_PREFIX}{attachment_id}#{event_name}#{stage}"
+
+
+def event_key(event: Any, stage: str) -> Optional[str]:
+    """
+    Key of a stage for an attachment event, an accept pipeline event wrapping one, or a state machine payload.
+
+    Returns:
+        The key, or None if the event is not about an attachment
+    """
+    if isinstance(event, dict) and isinstance(event.get('Event'), dict):
+        event = event['Event']
+    try:
+        ct_event = CloudTrailEvent.from_raw(event)
+        attachment = TGWAttachment.from_event(ct_event)
+    except (KeyError, TypeError, ValueError):
+        return None
+    return idempotency_key(attachment.attachment_id, ct_event.detail.get('eventName', ct_event.detail_type), stage)
+
+
+def _lease_seconds(context: Any) -> float:
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        # The run cannot outlive its invocation
+        return context.get_remaining_time_in_millis() / 1000 + 5
+    return DEFAULT_LEASE_SECONDS
+
+
+def run_once(store: KeyValueStore, key: str, run: Callable[[], Dict], lease_seconds: float,
+             wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS, sleep=time.sleep) -> Dict:
+    """
+    Run a stage unless a duplicate already did, returning the first run's result.
+
+    Args:
+        store: Key-value store holding the records
+        key: Idempotency key of the stage
+        run: Runs the stage and returns its JSON-serialisable result
+        lease_seconds: Time after which an unfinished run is considered dead
+        wait_seconds: Time to wait for a duplicate that is still running
+        sleep: Sleep function, replaceable for tests
+
+    Returns:
+        The result of run(), or the stored result of the first run with 'replayed' set
+
+    Raises:
+        IdempotencyInProgressError: If a duplicate is still running after wait_seconds
+    """
+    waited_until = time.time() + wait_seconds
+    while True:
+        now = time.time()
+        claimed = store.put(key, {'status': IN_PROGRESS, 'lease_until': now + lease_seconds},
+                            ttl_seconds=IDEMPOTENCY_TTL_SECONDS, if_absent=True)
+        if not claimed:
+            record = store.get(key)
+            if record is None:
+                # Deleted by a failed run in between, try to claim it again
+                continue
+            if record.value['status'] == COMPLETED:
+                logger.info("Replaying result of %s from %s", key, record.value['completed_at'])
+                return dict(record.value['result'], replayed=True)
+            if record.value['lease_until'] <= now:
+                claimed = store.put(key, {'status': IN_PROGRESS, 'lease_until': now + lease_seconds},
+                                    ttl_seconds=IDEMPOTENCY_TTL_SECONDS, if_version=record.version)
+                if claimed:
+                    logger.warning("Took over %s, its previous run did not finish", key)
+            if not claimed:
+                if now >= waited_until:
+                    raise IdempotencyInProgressError(f"{key} is still being processed by a duplicate")
+                sleep(POLL_SECONDS)
+                continue
+
+        try:
+            result = run()
+        except BaseException:
+            store.delete(key)
+            raise
+        if isinstance(result, dict):
+            store.put(key, {'status': COMPLETED, 'completed_at': time.time(), 'result': result},
+                      ttl_seconds=IDEMPOTENCY_TTL_SECONDS)
+        else:
+            store.delete(key)
+        return result
+
+
+def idempotent(stage: Union[str, Callable[[Any], str]]):
+    """
+    Decorate a Lambda handler to run once per attachment event and stage.
+
+    Events that are not about an attachment run as usual.
+
+    Args:
+        stage: Stage name, or a function returning it for an event
+
+    Usage:
+        @record_api_calls
+        @idempotent('validate_ipam')
+        def lambda_handler(event, context): ...
+    """
+    def decorate(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(event, context, *args, **kwargs):
+            if not IDEMPOTENCY_ENABLED:
+                return handler(event, context, *args, **kwargs)
+            key = event_key(event, stage(event) if callable(stage) else stage)
+            if key is None:
+                return handler(event, context, *args, **kwargs)
+            return run_once(store_from_env(), key, lambda: handler(event, context, *args, **kwargs),
+                            _lease_seconds(context))
+        return wrapper
+    return decorate
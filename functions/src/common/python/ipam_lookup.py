@@ -0,0 +1,148 @@
+"""
+Targeted IPAM lookups for a single resource.
+
+Instead of listing every allocation of every pool, IPAM is asked directly for
+the CIDRs of one resource with get_ipam_resource_cidrs. That costs one call per
+IPAM scope the configured pools belong to, regardless of pool size.
+
+Pool descriptions are fetched with one batched describe_ipam_pools call for all
+pools that are needed. The scope of a pool is cached for good, its tags for
+IPAM_POOL_TAG_TTL_SECONDS.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How long pool tags are served from cache before they are described again
+DEFAULT_TAG_TTL_SECONDS = int(os.environ.get('IPAM_POOL_TAG_TTL_SECONDS', '3600'))
+
+# Pool -> scope mapping; a pool never moves between scopes so it is cached for good
+_pool_scopes: Dict[str, str] = {}
+# Pool -> (described at, tags)
+_pool_tags: Dict[str, Tuple[float, Dict[str, str]]] = {}
+_lock = threading.Lock()
+_clock = time.monotonic
+
+
+def _scope_id_from_arn(scope_arn: str) -> str:
+    # arn:aws:ec2::123456789012:ipam-scope/ipam-scope-0123456789abcdef0
+    return scope_arn.rsplit('/', 1)[-1]
+
+
+def _describe_pools(ec2, pool_ids: List[str]) -> None:
+    """Describe pools in one batched call and cache their scopes and tags."""
+    paginator = ec2.get_paginator('describe_ipam_pools')
+    scopes = {}
+    tags = {}
+    described_at = _clock()
+    for page in paginator.paginate(IpamPoolIds=pool_ids):
+        for pool in page.get('IpamPools', []):
+            if pool.get('IpamScopeArn'):
+                scopes[pool['IpamPoolId']] = _scope_id_from_arn(pool['IpamScopeArn'])
+            tags[pool['IpamPoolId']] = (described_at, {t['Key']: t['Value'] for t in pool.get('Tags', [])})
+    logger.debug("Described %d IPAM pools", len(tags))
+    with _lock:
+        _pool_scopes.update(scopes)
+        _pool_tags.update(tags)
+
+
+def pool_scope_ids(ec2, pool_ids: Iterable[str]) -> Dict[str, str]:
+    """
+    Return the IPAM scope ID of each pool, describing unknown pools in one batched call.
+
+    Args:
+        ec2: boto3 EC2 client
+        pool_ids: IPAM pool IDs
+
+    Returns:
+        Dict mapping pool ID to scope ID for every pool that exists
+    """
+    pool_ids = list(pool_ids)
+    missing = [p for p in pool_ids if p not in _pool_scopes]
+    if missing:
+        _describe_pools(ec2, missing)
+    return {p: _pool_scopes[p] for p in pool_ids if p in _pool_scopes}
+
+
+def pool_tags(ec2, pool_id: str, pool_ids: Iterable[str] = (),
+              ttl_seconds: float = DEFAULT_TAG_TTL_SECONDS) -> Dict[str, str]:
+    """
+    Return the tags of one IPAM pool, served from cache while fresh.
+
+    When the pool's tags have to be described, every other pool in pool_ids
+    whose cached tags are missing or expired is described in the same call.
+
+    Args:
+        ec2: boto3 EC2 client
+        pool_id: Pool to return the tags of
+        pool_ids: Other configured pools to refresh along with it
+        ttl_seconds: Maximum age of cached tags
+
+    Returns:
+        Dict of tag key to value
+
+    Raises:
+        ValueError: If the pool does not exist
+    """
+    now = _clock()
+
+    def is_stale(p: str) -> bool:
+        entry = _pool_tags.get(p)
+        return entry is None or now - entry[0] >= ttl_seconds
+
+    if is_stale(pool_id):
+        stale = [p for p in dict.fromkeys([pool_id, *pool_ids]) if is_stale(p)]
+        logger.info("Describing IPAM pools for tags: %s", stale)
+        _describe_pools(ec2, stale)
+        if is_stale(pool_id):
+            raise ValueError(f"IPAM pool {pool_id} not found")
+    return dict(_pool_tags[pool_id][1])
+
+
+def clear_pool_cache() -> None:
+    """Drop all cached pool scopes and tags."""
+    with _lock:
+        _pool_scopes.clear()
+        _pool_tags.clear()
+
+
+def find_resource_pool(ec2, resource_id: str, pool_ids: Iterable[str]) -> Optional[str]:
+    """
+    Ask IPAM which of the configured pools a resource's CIDRs come from.
+
+    IPAM resource discovery is eventually consistent, so a None result only
+    means IPAM does not know about the allocation yet; callers should fall back
+    to listing pool allocations.
+
+    Args:
+        ec2: boto3 EC2 client
+        resource_id: Resource (VPC) ID
+        pool_ids: Configured IPAM pool IDs, in priority order
+
+    Returns:
+        The highest priority configured pool holding a CIDR of the resource, or None
+    """
+    pool_ids = list(pool_ids)
+    scope_ids: List[str] = []
+    for scope_id in pool_scope_ids(ec2, pool_ids).values():
+        if scope_id not in scope_ids:
+            scope_ids.append(scope_id)
+
+    matched = set()
+    for scope_id in scope_ids:
+        paginator = ec2.get_paginator('get_ipam_resource_cidrs')
+        for page in paginator.paginate(IpamScopeId=scope_id, ResourceId=resource_id):
+            for resource_cidr in page.get('IpamResourceCidrs', []):
+                if resource_cidr.get('IpamPoolId'):
+                    matched.add(resource_cidr['IpamPoolId'])
+
+    for pool_id in pool_ids:
+        if pool_id in matched:
+            logger.debug("IPAM reports %s in pool %s", resource_id, pool_id)
+            return pool_id
+    return None
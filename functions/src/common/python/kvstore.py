@@ -0,0 +1,381 @@
+"""
+Small key-value store for state shared between invocations and functions.
+
+Values are JSON-serialisable dicts. Every write bumps an item's version, and
+writes can be made conditional on the key being absent or on the version read
+before, which is enough to claim work exactly once across concurrent Lambdas.
+Items can carry a TTL after which they are treated as absent. Items of
+a kind that has to be listed, like waiters or approvals, are written with a
+collection name and listed with query(). Other items are not indexed, so a
+listing only reads the items of its collection, however many others the
+store holds.
+
+MemoryStore keeps items in process (tests); SQLiteStore keeps them in a local
+SQLite file shared by the processes of local runs; DynamoDBStore keeps them in
+a DynamoDB table with the layout created by dynamodb.tf:
+
+    pk (S, hash key) | value (S, JSON) | version (N) | expires_at (N, TTL attribute) | collection (S)
+
+collection is the hash key and pk the range key of the sparse global
+secondary index COLLECTION_INDEX, which holds only the items that have it.
+"""
+
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from clients import get_client
+
+logger = logging.getLogger(__name__)
+
+# Table used by store_from_env(); without it state is kept in process memory
+KV_STORE_TABLE = os.environ.get('KV_STORE_TABLE', '')
+# SQLite file used by store_from_env() when no table is set, for local runs
+KV_STORE_SQLITE_PATH = os.environ.get('KV_STORE_SQLITE_PATH', '')
+
+# Global secondary index of the DynamoDB table over the collection attribute
+COLLECTION_INDEX = 'collection'
+
+
+@dataclass
+class Item:
+    """
+    A stored value.
+
+    Attributes:
+        key: Item key
+        value: Stored dict
+        version: Incremented on every write, starting at 1
+        expires_at: Epoch seconds after which the item is treated as absent, or None
+        collection: Collection the item is listed in, or None
+    """
+    key: str
+    value: Dict
+    version: int
+    expires_at: Optional[float] = None
+    collection: Optional[str] = None
+
+
+class KeyValueStore:
+    """Interface of the stores; see MemoryStore, SQLiteStore and DynamoDBStore."""
+
+    def get(self, key: str) -> Optional[Item]:
+        """Return the item stored under key, or None if it is absent or expired."""
+        raise NotImplementedError
+
+    def put(self, key: str, value: Dict, ttl_seconds: Optional[float] = None,
+            if_absent: bool = False, if_version: Optional[int] = None,
+            collection: Optional[str] = None) -> bool:
+        """
+        Store a value.
+
+        Args:
+            key: Item key
+            value: JSON-serialisable dict
+            ttl_seconds: Seconds until the item expires, None to keep it
+            if_absent: Only write if no unexpired item exists under key
+            if_version: Only write if the stored item has this version
+            collection: List the item in this collection, None to leave it out of every collection
+
+        Returns:
+            True if the value was written, False if the condition did not hold
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str, if_version: Optional[int] = None) -> bool:
+        """Delete an item, returning False if if_version did not match."""
+        raise NotImplementedError
+
+    def query(self, collection: str) -> List[Item]:
+        """Return all unexpired items of a collection, in key order."""
+        raise NotImplementedError
+
+
+class MemoryStore(KeyValueStore):
+    """In-process store, shared by the threads of one execution environment."""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._items: Dict[str, Item] = {}
+        self._lock = threading.Lock()
+        self._clock = clock
+
+    def _live(self, key: str) -> Optional[Item]:
+        item = self._items.get(key)
+        if item is not None and item.expires_at is not None and item.expires_at <= self._clock():
+            del self._items[key]
+            return None
+        return item
+
+    def get(self, key: str) -> Optional[Item]:
+        with self._lock:
+            item = self._live(key)
+            return self._copy(item) if item else None
+
+    @staticmethod
+    def _copy(item: Item) -> Item:
+        return Item(item.key, json.loads(json.dumps(item.value)), item.version, item.expires_at, item.collection)
+
+    def put(self, key: str, value: Dict, ttl_seconds: Optional[float] = None,
+            if_absent: bool = False, if_version: Optional[int] = None,
+            collection: Optional[str] = None) -> bool:
+        with self._lock:
+            current = self._live(key)
+            if if_absent and current is not None:
+                return False
+            if if_version is not None and (current is None or current.version != if_version):
+                return False
+            expires_at = self._clock() + ttl_seconds if ttl_seconds is not None else None
+            # Stored as a copy so callers cannot change it in place
+            self._items[key] = Item(key, json.loads(json.dumps(value)), (current.version if current else 0) + 1,
+                                    expires_at, collection)
+            return True
+
+    def delete(self, key: str, if_version: Optional[int] = None) -> bool:
+        with self._lock:
+            current = self._live(key)
+            if if_version is not None and (current is None or current.version != if_version):
+                return False
+            self._items.pop(key, None)
+            return True
+
+    def query(self, collection: str) -> List[Item]:
+        with self._lock:
+            keys = sorted(k for k, i in self._items.items() if i.collection == collection)
+            items = [self._live(k) for k in keys]
+        return [self._copy(i) for i in items if i]
+
+
+class SQLiteStore(KeyValueStore):
+    """
+    Store backed by a SQLite database, for local runs and tests without AWS.
+
+    Conditional writes run in an immediate transaction, so they are atomic
+    across threads and across processes sharing the file.
+    """
+
+    _COLUMNS = 'pk, value, version, expires_at, collection'
+
+    def __init__(self, path: str = ':memory:', clock: Callable[[], float] = time.time):
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Autocommit mode; transactions are started explicitly
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS items '
+            '(pk TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL, expires_at REAL, collection TEXT)'
+        )
+        # Files created before collections existed
+        if 'collection' not in [row[1] for row in self._db.execute('PRAGMA table_info(items)')]:
+            self._db.execute('ALTER TABLE items ADD COLUMN collection TEXT')
+        self._db.execute('CREATE INDEX IF NOT EXISTS items_collection ON items (collection, pk)')
+
+    def _item(self, row) -> Optional[Item]:
+        if row is None:
+            return None
+        key, value, version, expires_at, collection = row
+        if expires_at is not None and expires_at <= self._clock():
+            return None
+        return Item(key, json.loads(value), version, expires_at, collection)
+
+    def _select(self, key: str) -> Optional[Item]:
+        row = self._db.execute(f'SELECT {self._COLUMNS} FROM items WHERE pk = ?', (key,)).fetchone()
+        return self._item(row)
+
+    def get(self, key: str) -> Optional[Item]:
+        with self._lock:
+            return self._select(key)
+
+    def put(self, key: str, value: Dict, ttl_seconds: Optional[float] = None,
+            if_absent: bool = False, if_version: Optional[int] = None,
+            collection: Optional[str] = None) -> bool:
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._db.execute(f'SELECT {self._COLUMNS} FROM items WHERE pk = ?', (key,)).fetchone()
+                current = self._item(row)
+                if if_absent and current is not None:
+                    return False
+                if if_version is not None and (current is None or current.version != if_version):
+                    return False
+                # Like DynamoDB the version keeps counting over an expired item
+                version = (row[2] if row else 0) + 1
+                expires_at = self._clock() + ttl_seconds if ttl_seconds is not None else None
+                self._db.execute(f'INSERT OR REPLACE INTO items ({self._COLUMNS}) VALUES (?, ?, ?, ?, ?)',
+                                 (key, json.dumps(value), version, expires_at, collection))
+                return True
+            finally:
+                self._db.execute('COMMIT')
+
+    def delete(self, key: str, if_version: Optional[int] = None) -> bool:
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                if if_version is not None:
+                    current = self._select(key)
+                    if current is None or current.version != if_version:
+                        return False
+                self._db.execute('DELETE FROM items WHERE pk = ?', (key,))
+                return True
+            finally:
+                self._db.execute('COMMIT')
+
+    def query(self, collection: str) -> List[Item]:
+        with self._lock:
+            rows = self._db.execute(
+                f'SELECT {self._COLUMNS} FROM items WHERE collection = ? ORDER BY pk', (collection,)
+            ).fetchall()
+        return [item for item in map(self._item, rows) if item]
+
+
+class DynamoDBStore(KeyValueStore):
+    """
+    Store backed by a DynamoDB table.
+
+    Reads are strongly consistent so a conditional write can follow a read,
+    except query(): global secondary indexes are eventually consistent, so a
+    listed item can be a write behind and a conditional write on its version
+    can fail. DynamoDB removes expired items lazily, so expiry is also
+    checked on read.
+    """
+
+    def __init__(self, table_name: str, dynamodb=None, clock: Callable[[], float] = time.time):
+        self.table_name = table_name
+        self._dynamodb = dynamodb
+        self._clock = clock
+
+    @property
+    def dynamodb(self):
+        if self._dynamodb is None:
+            self._dynamodb = get_client('dynamodb')
+        return self._dynamodb
+
+    def _item(self, raw: Dict) -> Optional[Item]:
+        expires_at = float(raw['expires_at']['N']) if 'expires_at' in raw else None
+        if expires_at is not None and expires_at <= self._clock():
+            return None
+        collection = raw['collection']['S'] if 'collection' in raw else None
+        return Item(raw['pk']['S'], json.loads(raw['value']['S']), int(raw['version']['N']), expires_at, collection)
+
+    def get(self, key: str) -> Optional[Item]:
+        response = self.dynamodb.get_item(TableName=self.table_name, Key={'pk': {'S': key}}, ConsistentRead=True)
+        return self._item(response['Item']) if 'Item' in response else None
+
+    def put(self, key: str, value: Dict, ttl_seconds: Optional[float] = None,
+            if_absent: bool = False, if_version: Optional[int] = None,
+            collection: Optional[str] = None) -> bool:
+        now = self._clock()
+        item = {'pk': {'S': key}, 'value': {'S': json.dumps(value)}}
+        if ttl_seconds is not None:
+            item['expires_at'] = {'N': str(int(now + ttl_seconds))}
+
+        # The version is incremented in an update so concurrent writers cannot both get the same one
+        names = {'#v': 'value', '#ver': 'version'}
+        values = {':v': item['value'], ':one': {'N': '1'}, ':zero': {'N': '0'}}
+        sets = ['#v = :v', '#ver = if_not_exists(#ver, :zero) + :one']
+        removes = []
+        if ttl_seconds is not None:
+            sets.append('expires_at = :exp')
+            values[':exp'] = item['expires_at']
+        else:
+            removes.append('expires_at')
+        # Only items with the attribute are in the collection index
+        names['#col'] = 'collection'
+        if collection is not None:
+            sets.append('#col = :col')
+            values[':col'] = {'S': collection}
+        else:
+            removes.append('#col')
+        update = 'SET ' + ', '.join(sets)
+        if removes:
+            update += ' REMOVE ' + ', '.join(removes)
+
+        conditions = []
+        if if_absent:
+            # An expired item that DynamoDB has not removed yet counts as absent
+            conditions.append('(attribute_not_exists(pk) OR expires_at <= :now)')
+            values[':now'] = {'N': str(int(now))}
+        if if_version is not None:
+            conditions.append('#ver = :expected')
+            values[':expected'] = {'N': str(if_version)}
+
+        from botocore.exceptions import ClientError
+
+        kwargs = {}
+        if conditions:
+            kwargs['ConditionExpression'] = ' AND '.join(conditions)
+        try:
+            self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key={'pk': {'S': key}},
+                UpdateExpression=update,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                **kwargs
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+    def delete(self, key: str, if_version: Optional[int] = None) -> bool:
+        from botocore.exceptions import ClientError
+
+        kwargs = {}
+        if if_version is not None:
+            kwargs = {
+                'ConditionExpression': '#ver = :expected',
+                'ExpressionAttributeNames': {'#ver': 'version'},
+                'ExpressionAttributeValues': {':expected': {'N': str(if_version)}},
+            }
+        try:
+            self.dynamodb.delete_item(TableName=self.table_name, Key={'pk': {'S': key}}, **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+    def query(self, collection: str) -> List[Item]:
+        paginator = self.dynamodb.get_paginator('query')
+        items = []
+        for page in paginator.paginate(
+            TableName=self.table_name,
+            IndexName=COLLECTION_INDEX,
+            KeyConditionExpression='#col = :col',
+            ExpressionAttributeNames={'#col': 'collection'},
+            ExpressionAttributeValues={':col': {'S': collection}},
+        ):
+            for raw in page.get('Items', []):
+                item = self._item(raw)
+                if item:
+                    items.append(item)
+        return items
+
+
+_store: Optional[KeyValueStore] = None
+_store_lock = threading.Lock()
+
+
+def store_from_env() -> KeyValueStore:
+    """
+    Return the process-wide store: DynamoDB if KV_STORE_TABLE is set, SQLite if
+    KV_STORE_SQLITE_PATH is set, memory otherwise.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            if KV_STORE_TABLE:
+                _store = DynamoDBStore(KV_STORE_TABLE)
+            elif KV_STORE_SQLITE_PATH:
+                _store = SQLiteStore(KV_STORE_SQLITE_PATH)
+            else:
+                logger.warning("KV_STORE_TABLE not set, keeping state in memory")
+                _store = MemoryStore()
+        return _store
@@ -0,0 +1,186 @@
+"""
+Logging setup for the Lambda functions.
+
+configure_logging() sets the root logger level from LOG_LEVEL and, with
+LOG_FORMAT=json (the default in Lambda), formats every record as one JSON
+object per line carrying the correlation IDs of the invocation: request ID
+and the attachment, transit gateway, VPC and account IDs of the event. With
+LOG_FORMAT=text the existing format is kept.
+
+Log with %-style arguments rather than f-strings. The message is then only
+built when a handler emits the record, so a disabled debug line costs one
+level check:
+
+    logger.debug("Indexed %d allocations in pool %s", len(vpc_ids), pool_id)
+
+Wrap an argument in Lazy to defer computing it as well. log_invocation()
+writes the raw event at DEBUG for a sample of invocations
+(LOG_EVENT_SAMPLE_RATE) and truncates it to LOG_EVENT_MAX_CHARS. An event
+that is not logged is never serialised.
+
+Correlation IDs live in a context variable. Threads started by a
+ThreadPoolExecutor do not inherit it; wrap the function they run with
+in_current_context() to keep the IDs on their records.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+from models import ATTACHMENT_RESPONSE_KEYS
+
+# JSON in Lambda, the plain text of the logging defaults when run elsewhere (tests, benchmarks)
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json' if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ else 'text').lower()
+# Share of invocations whose raw event is logged at DEBUG, 0 to 1
+LOG_EVENT_SAMPLE_RATE = float(os.environ.get('LOG_EVENT_SAMPLE_RATE', '1'))
+LOG_EVENT_MAX_CHARS = int(os.environ.get('LOG_EVENT_MAX_CHARS', '8192'))
+
+_correlation: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar('log_correlation', default={})
+
+# Attributes every LogRecord has; anything else was passed in extra= and is added to JSON records
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class Lazy:
+    """A log argument computed only if the record is emitted."""
+
+    __slots__ = ('_compute',)
+
+    def __init__(self, compute: Callable[[], Any]):
+        self._compute = compute
+
+    def __str__(self) -> str:
+        return str(self._compute())
+
+
+class _EventText:
+    """Raw event as compact JSON, truncated, serialised only when formatted."""
+
+    __slots__ = ('_event', '_max_chars')
+
+    def __init__(self, event: Any, max_chars: int):
+        self._event = event
+        self._max_chars = max_chars
+
+    def __str__(self) -> str:
+        text = self._event if isinstance(self._event, str) else json.dumps(self._event, default=str, separators=(',', ':'))
+        if len(text) > self._max_chars:
+            return f"{text[:self._max_chars]}... ({len(text)} chars)"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON with the current correlation IDs."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        document = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        document.update(_correlation.get())
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in document:
+                document[key] = value
+        if record.exc_info:
+            document['exception'] = self.formatException(record.exc_info)
+        return json.dumps(document, default=str)
+
+
+def configure_logging(default_level: str = 'INFO') -> logging.Logger:
+    """
+    Configure the root logger for a Lambda function.
+
+    Args:
+        default_level: Level used when LOG_LEVEL is not set
+
+    Returns:
+        The root logger
+    """
+    root = logging.getLogger()
+    root.setLevel(os.environ.get('LOG_LEVEL', default_level).upper())
+    if LOG_FORMAT == 'json':
+        if not root.handlers:
+            root.addHandler(logging.StreamHandler())
+        # The Lambda runtime installs its own handler; keep it, change its format
+        for handler in root.handlers:
+            handler.setFormatter(JsonFormatter())
+    return root
+
+
+def correlation_ids() -> Dict[str, str]:
+    """Return the correlation IDs of the current context."""
+    return dict(_correlation.get())
+
+
+def bind(**ids: Optional[str]) -> None:
+    """Add correlation IDs to the current context; empty values are ignored."""
+    current = _correlation.get()
+    _correlation.set({key: value for key, value in {**current, **ids}.items() if value})
+
+
+@contextmanager
+def correlation(**ids: Optional[str]):
+    """Add correlation IDs for the duration of a block, e.g. while one item of a batch is processed."""
+    token = _correlation.set({key: value for key, value in {**_correlation.get(), **ids}.items() if value})
+    try:
+        yield
+    finally:
+        _correlation.reset(token)
+
+
+def in_current_context(function: Callable) -> Callable:
+    """Wrap a function to run with the caller's correlation IDs, e.g. in a worker thread."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(function, *args, **kwargs)
+
+    return run
+
+
+def _event_ids(event: Any) -> Dict[str, str]:
+    """Correlation IDs of an attachment event, an accept pipeline event wrapping one, or a state machine payload."""
+    if not isinstance(event, dict):
+        return {}
+    if isinstance(event.get('Event'), dict):
+        event = event['Event']
+    response_elements = (event.get('detail') or {}).get('responseElements') or {}
+    for key in ATTACHMENT_RESPONSE_KEYS:
+        attachment = (response_elements.get(key) or {}).get('transitGatewayVpcAttachment')
+        if attachment:
+            return {
+                'attachment_id': attachment.get('transitGatewayAttachmentId'),
+                'transit_gateway_id': attachment.get('transitGatewayId'),
+                'vpc_id': attachment.get('vpcId'),
+                'account_id': attachment.get('vpcOwnerId'),
+            }
+    return {}
+
+
+def log_invocation(logger: logging.Logger, event: Any, context: Any) -> None:
+    """
+    Start the correlation IDs of an invocation and log the raw event if sampled.
+
+    Call at the start of a handler. The IDs of the previous invocation in the
+    container are dropped.
+
+    Args:
+        logger: Logger to write the raw event to, at DEBUG
+        event: Lambda event
+        context: Lambda context object
+    """
+    _correlation.set({})
+    bind(request_id=getattr(context, 'aws_request_id', None), **_event_ids(event))
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if LOG_EVENT_SAMPLE_RATE < 1 and random.random() >= LOG_EVENT_SAMPLE_RATE:
+        return
+    logger.debug('Raw event: %s', _EventText(event, LOG_EVENT_MAX_CHARS))
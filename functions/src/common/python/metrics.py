@@ -0,0 +1,275 @@
+"""
+Per-invocation accounting of AWS API calls.
+
+instrument_client() hooks botocore events on a client to tally, per
+operation, calls (every page of a paginator is one), HTTP attempts, retries,
+throttled attempts, failed calls and latency. clients.get_client()
+instruments every shared client when it is created.
+
+Wrapping a handler with record_api_calls resets the tallies when an invocation
+starts. When it ends, the tallies go to CloudWatch as Embedded Metric Format
+(EMF) log lines, one per operation and one with the invocation totals, and a
+summary is added to the handler's result under 'api_calls'. Set
+API_METRICS_NAMESPACE to an empty string to stop the EMF lines.
+
+The tallies are container-wide: a Lambda container runs one invocation at a
+time, and calls made from worker threads of that invocation are counted.
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+API_METRICS_NAMESPACE = os.environ.get('API_METRICS_NAMESPACE', 'TransitGatewayAttachmentManager')
+
+# Error codes AWS returns when a request is rate limited, as botocore's retry handler classifies them
+THROTTLE_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'TransactionInProgressException',
+    'SlowDown',
+    'EC2ThrottledException',
+    'BandwidthLimitExceeded',
+    'LimitExceededException',
+    'PriorRequestNotComplete',
+    'RequestThrottled',
+}
+
+# (name, unit) of the metrics emitted for each operation and for the totals
+METRICS = [
+    ('Calls', 'Count'),
+    ('Attempts', 'Count'),
+    ('Retries', 'Count'),
+    ('Throttles', 'Count'),
+    ('Errors', 'Count'),
+    ('LatencyMs', 'Milliseconds'),
+]
+
+_START_KEY = 'api_metrics_started'
+
+
+class OperationStats:
+    """Tallies of one API operation."""
+
+    __slots__ = ('calls', 'attempts', 'retries', 'throttles', 'errors', 'latency_ms', 'max_latency_ms')
+
+    def __init__(self):
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.throttles = 0
+        self.errors = 0
+        self.latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    def add(self, other: 'OperationStats') -> None:
+        self.calls += other.calls
+        self.attempts += other.attempts
+        self.retries += other.retries
+        self.throttles += other.throttles
+        self.errors += other.errors
+        self.latency_ms += other.latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, other.max_latency_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'attempts': self.attempts,
+            'retries': self.retries,
+            'throttles': self.throttles,
+            'errors': self.errors,
+            'latency_ms': round(self.latency_ms, 3),
+            'max_latency_ms': round(self.max_latency_ms, 3),
+        }
+
+
+class ApiCallRecorder:
+    """Thread-safe tallies of API operations, keyed '<service>.<Operation>'."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations: Dict[str, OperationStats] = {}
+
+    def _stats(self, operation: str) -> OperationStats:
+        stats = self._operations.get(operation)
+        if stats is None:
+            stats = self._operations[operation] = OperationStats()
+        return stats
+
+    def record_attempt(self, operation: str, throttled: bool) -> None:
+        """Count one HTTP attempt of a call."""
+        with self._lock:
+            stats = self._stats(operation)
+            stats.attempts += 1
+            stats.throttles += throttled
+
+    def record_call(self, operation: str, latency_ms: float, retries: int, failed: bool) -> None:
+        """Count one completed call, including the time spent on its retries."""
+        with self._lock:
+            stats = self._stats(operation)
+            stats.calls += 1
+            stats.retries += retries
+            stats.errors += failed
+            stats.latency_ms += latency_ms
+            stats.max_latency_ms = max(stats.max_latency_ms, latency_ms)
+
+    def operations(self) -> Dict[str, OperationStats]:
+        """Return a copy of the tallies of every operation called."""
+        with self._lock:
+            copies = {}
+            for operation, stats in self._operations.items():
+                copies[operation] = OperationStats()
+                copies[operation].add(stats)
+            return copies
+
+    def reset(self) -> None:
+        with self._lock:
+            self._operations.clear()
+
+
+# Shared by every instrumented client in the container
+recorder = ApiCallRecorder()
+
+
+def _error_code(parsed: Optional[Dict]) -> str:
+    return ((parsed or {}).get('Error') or {}).get('Code', '')
+
+
+def instrument_client(client, api_recorder: Optional[ApiCallRecorder] = None) -> None:
+    """
+    Register the accounting hooks on a client.
+
+    Args:
+        client: boto3 client
+        api_recorder: Recorder to tally into, the shared one by default
+    """
+    api_recorder = api_recorder or recorder
+    service = client.meta.service_model.service_id.hyphenize()
+    service_name = client.meta.service_model.service_name
+
+    # Not every event carries the operation model, its name ends the event name
+    def operation(event_name):
+        return f"{service_name}.{event_name.rsplit('.', 1)[-1]}"
+
+    def started(context, **kwargs):
+        context[_START_KEY] = time.perf_counter()
+
+    def attempted(event_name, parsed_response=None, **kwargs):
+        api_recorder.record_attempt(operation(event_name), _error_code(parsed_response) in THROTTLE_ERROR_CODES)
+
+    def completed(event_name, context, http_response=None, parsed=None, exception=None, **kwargs):
+        latency_ms = (time.perf_counter() - context.get(_START_KEY, time.perf_counter())) * 1000
+        retries = ((parsed or {}).get('ResponseMetadata') or {}).get('RetryAttempts', 0)
+        failed = exception is not None or (http_response is not None and http_response.status_code >= 300)
+        api_recorder.record_call(operation(event_name), latency_ms, retries, failed)
+
+    client.meta.events.register(f"before-call.{service}", started)
+    client.meta.events.register(f"response-received.{service}", attempted)
+    client.meta.events.register(f"after-call.{service}", completed)
+    client.meta.events.register(f"after-call-error.{service}", completed)
+
+
+def summarize(operations: Dict[str, OperationStats]) -> Dict[str, Any]:
+    """Summary of the tallies for a handler result: totals and per operation."""
+    total = OperationStats()
+    for stats in operations.values():
+        total.add(stats)
+    return {
+        'total': total.to_dict(),
+        'operations': {operation: stats.to_dict() for operation, stats in sorted(operations.items())},
+    }
+
+
+def emf_documents(function_name: str, operations: Dict[str, OperationStats],
+                  namespace: str = API_METRICS_NAMESPACE, timestamp_ms: Optional[int] = None):
+    """
+    Build the EMF documents of an invocation.
+
+    A document has one value per dimension, so there is one document per
+    operation (dimensions FunctionName and Operation) and one with the totals
+    (dimension FunctionName).
+    """
+    timestamp_ms = timestamp_ms if timestamp_ms is not None else int(time.time() * 1000)
+    metrics = [{'Name': name, 'Unit': unit} for name, unit in METRICS]
+    total = OperationStats()
+
+    def document(dimensions, stats):
+        values = stats.to_dict()
+        return {
+            '_aws': {
+                'Timestamp': timestamp_ms,
+                'CloudWatchMetrics': [{'Namespace': namespace, 'Dimensions': [list(dimensions)], 'Metrics': metrics}],
+            },
+            **dimensions,
+            'Calls': values['calls'],
+            'Attempts': values['attempts'],
+            'Retries': values['retries'],
+            'Throttles': values['throttles'],
+            'Errors': values['errors'],
+            'LatencyMs': values['latency_ms'],
+        }
+
+    documents = []
+    for operation, stats in sorted(operations.items()):
+        total.add(stats)
+        documents.append(document({'FunctionName': function_name, 'Operation': operation}, stats))
+    documents.append(document({'FunctionName': function_name}, total))
+    return documents
+
+
+def emit(function_name: str, operations: Dict[str, OperationStats], stream=None) -> None:
+    """Write the EMF documents of an invocation to stdout, one JSON object per line as EMF requires."""
+    if not API_METRICS_NAMESPACE:
+        return
+    stream = stream or sys.stdout
+    for document in emf_documents(function_name, operations):
+        stream.write(json.dumps(document, separators=(',', ':')) + '\n')
+    stream.flush()
+
+
+def record_api_calls(handler: Optional[Callable] = None, *, attach_to_result: bool = False):
+    """
+    Decorate a Lambda handler to account for the API calls of each invocation.
+
+    With attach_to_result, the summary is also added to dict results under
+    'api_calls'. Only opt in for results that end there, e.g. of scheduled
+    functions: state machine steps pass their results on to the next state.
+    Metrics are emitted also when the handler raises.
+
+    Usage:
+        @record_api_calls
+        def lambda_handler(event, context): ...
+    """
+    if handler is None:
+        return functools.partial(record_api_calls, attach_to_result=attach_to_result)
+
+    @functools.wraps(handler)
+    def wrapper(event, context, *args, **kwargs):
+        recorder.reset()
+        result = None
+        try:
+            result = handler(event, context, *args, **kwargs)
+            return result
+        finally:
+            operations = recorder.operations()
+            function_name = getattr(context, 'function_name', None) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+            try:
+                emit(function_name, operations)
+            except Exception as e:
+                logger.warning("Failed to emit API call metrics: %s", e)
+            if attach_to_result and isinstance(result, dict):
+                result['api_calls'] = summarize(operations)
+
+    return wrapper
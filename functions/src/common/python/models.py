@@ -6,11 +6,25 @@ to avoid code duplication and ensure consistent data structures.
 """
 
 import json
-from dataclasses import dataclass
-from typing import Dict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
 
+# orjson is used when the layer ships it; it parses the multi-KB state machine payloads several times faster
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - depends on the packaged layer
+    orjson = None
+    _loads = json.loads
 
-@dataclass
+# responseElements keys of the supported events, each holding a transitGatewayVpcAttachment
+ATTACHMENT_RESPONSE_KEYS = (
+    'CreateTransitGatewayVpcAttachmentResponse',
+    'AcceptTransitGatewayVpcAttachmentResponse',
+)
+
+
+@dataclass(slots=True)
 class CloudTrailEvent:
     """
     Represents a CloudTrail event received from EventBridge.
@@ -21,6 +35,8 @@ class CloudTrailEvent:
     """
     detail_type: str
     detail: Dict
+    # transitGatewayVpcAttachment of the response, extracted on first use
+    _vpc_attachment: Optional[Dict] = field(default=None, repr=False, compare=False)
 
     @classmethod
     def from_raw(cls, raw_event) -> 'CloudTrailEvent':
@@ -28,22 +44,52 @@ class CloudTrailEvent:
         Create a CloudTrailEvent from raw event data.
         
         Args:
-            raw_event: Raw event data (JSON string or dict)
+            raw_event: Raw event data (JSON string, bytes or dict), or an already parsed CloudTrailEvent
             
         Returns:
             CloudTrailEvent instance
+
+        Raises:
+            TypeError: If raw_event is of another type
         """
-        try:
-            data = json.loads(raw_event)
-        except (TypeError, ValueError):
+        if isinstance(raw_event, cls):
+            return raw_event
+        if isinstance(raw_event, dict):
             data = raw_event
+        elif isinstance(raw_event, (str, bytes, bytearray)):
+            data = _loads(raw_event)
+        else:
+            raise TypeError(f"Unsupported event type: {type(raw_event).__name__}")
         return cls(
             detail_type=data.get('detail-type', ''),
             detail=data.get('detail', {})
         )
 
+    def vpc_attachment(self) -> Dict:
+        """
+        Return the transitGatewayVpcAttachment element of the event's response.
+
+        Raises:
+            ValueError: If the event is not one of the supported attachment events
+        """
+        if self._vpc_attachment is None:
+            response_elements = self.detail.get('responseElements') or {}
+            for key in ATTACHMENT_RESPONSE_KEYS:
+                response = response_elements.get(key)
+                if response is not None:
+                    self._vpc_attachment = response['transitGatewayVpcAttachment']
+                    break
+            else:
+                raise ValueError("Invalid event type")
+        return self._vpc_attachment
 
-@dataclass
+    @property
+    def synthetic(self) -> bool:
+        """True for events built by synthetic_create_event rather than delivered by CloudTrail."""
+        return bool((self.detail.get('additionalEventData') or {}).get('synthetic'))
+
+
+@dataclass(slots=True)
 class TGW:
     """
     Represents a Transit Gateway.
@@ -56,7 +102,7 @@ class TGW:
     @classmethod
     def from_event(cls, ct_event: CloudTrailEvent) -> 'TGW':
         """
-        Create a TGW from an AcceptTransitGatewayVpcAttachment CloudTrail event.
+        Create a TGW from a CreateTransitGatewayVpcAttachment or AcceptTransitGatewayVpcAttachment CloudTrail event.
         
         Args:
             ct_event: CloudTrail event containing the creation or acceptance response
@@ -64,20 +110,10 @@ class TGW:
         Returns:
             TGW instance
         """
-        if 'AcceptTransitGatewayVpcAttachmentResponse' in ct_event.detail['responseElements']:
-            resp = ct_event.detail['responseElements']['AcceptTransitGatewayVpcAttachmentResponse']['transitGatewayVpcAttachment']
-            return cls(
-                tgw_id=str(resp['transitGatewayId'])
-            )
-        elif 'CreateTransitGatewayVpcAttachmentResponse' in ct_event.detail['responseElements']:
-            resp = ct_event.detail['responseElements']['CreateTransitGatewayVpcAttachmentResponse']['transitGatewayVpcAttachment']
-            return cls(
-                tgw_id=str(resp['transitGatewayId'])
-            )
-        else:
-            raise ValueError("Invalid event type")
-        
-@dataclass
+        return cls(tgw_id=str(ct_event.vpc_attachment()['transitGatewayId']))
+
+
+@dataclass(slots=True)
 class TGWAttachment:
     """
     Represents a Transit Gateway VPC attachment.
@@ -92,32 +128,67 @@ class TGWAttachment:
     vpc_id: str
     attachment_id: str
     state: str = ""
+
     @classmethod
     def from_event(cls, ct_event: CloudTrailEvent) -> 'TGWAttachment':
         """
-        Create a TGWAttachment from a CreateTransitGatewayVpcAttachment CloudTrail event.
+        Create a TGWAttachment from a CreateTransitGatewayVpcAttachment or AcceptTransitGatewayVpcAttachment CloudTrail event.
         
         Args:
-            ct_event: CloudTrail event containing the creation response
+            ct_event: CloudTrail event containing the creation or acceptance response
             
         Returns:
             TGWAttachment instance
         """
-        if 'AcceptTransitGatewayVpcAttachmentResponse' in ct_event.detail['responseElements']:
-            resp = ct_event.detail['responseElements']['AcceptTransitGatewayVpcAttachmentResponse']['transitGatewayVpcAttachment']
-            return cls(
-                account_id=str(resp['vpcOwnerId']),
-                vpc_id=str(resp['vpcId']),
-                attachment_id=str(resp['transitGatewayAttachmentId']),
-                state=str(resp.get('state', ''))
-            )
-        elif 'CreateTransitGatewayVpcAttachmentResponse' in ct_event.detail['responseElements']:
-            resp = ct_event.detail['responseElements']['CreateTransitGatewayVpcAttachmentResponse']['transitGatewayVpcAttachment']
-            return cls(
-                account_id=str(resp['vpcOwnerId']),
-                vpc_id=str(resp['vpcId']),
-                attachment_id=str(resp['transitGatewayAttachmentId']),
-                state=str(resp.get('state', ''))
-            )
-        else:
-            raise ValueError("Invalid event type")
\ No newline at end of file
+        resp = ct_event.vpc_attachment()
+        return cls(
+            account_id=str(resp['vpcOwnerId']),
+            vpc_id=str(resp['vpcId']),
+            attachment_id=str(resp['transitGatewayAttachmentId']),
+            state=str(resp.get('state', ''))
+        )
+
+
+def synthetic_create_event(attachment: Dict, principal_id: str = '') -> Dict:
+    """
+    Build a CreateTransitGatewayVpcAttachment event from a describe_transit_gateway_attachments item.
+
+    Used to feed attachments whose create event was never delivered through the
+    regular accept path. The requesting principal is unknown, so the event
+    carries an AWSAccount identity for the VPC owner unless principal_id is given.
+
+    Args:
+        attachment: Item from describe_transit_gateway_attachments
+        principal_id: Optional principal ID to report as the requester
+
+    Returns:
+        Raw event accepted by CloudTrailEvent.from_raw
+    """
+    owner_id = str(attachment.get('ResourceOwnerId', ''))
+    return {
+        'detail-type': 'AWS API Call via CloudTrail',
+        'source': 'aws.ec2',
+        'detail': {
+            'eventSource': 'ec2.amazonaws.com',
+            'eventName': 'CreateTransitGatewayVpcAttachment',
+            'userIdentity': {
+                'type': 'AWSAccount',
+                'principalId': principal_id or owner_id,
+                'accountId': owner_id,
+            },
+            'responseElements': {
+                'CreateTransitGatewayVpcAttachmentResponse': {
+                    'transitGatewayVpcAttachment': {
+                        'transitGatewayAttachmentId': attachment['TransitGatewayAttachmentId'],
+                        'transitGatewayId': attachment['TransitGatewayId'],
+                        'vpcId': attachment['ResourceId'],
+                        'vpcOwnerId': owner_id,
+                        'state': attachment.get('State', ''),
+                    }
+                }
+            },
+            'additionalEventData': {
+                'synthetic': True,
+            },
+        }
+    }
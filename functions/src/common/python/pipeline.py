@@ -0,0 +1,77 @@
+"""
+In-process execution of accept workflow stages.
+
+Runs several stages of the accept state machine in one Lambda invocation,
+parsing the CloudTrail event once and skipping the Step Functions transition
+and possible cold start between stages. Each stage result is stored under the
+same key and in the same shape as the state machine's lambda:invoke task
+output, so later states see the same input whether the stages were fused or not.
+"""
+
+import time
+import logging
+from typing import Callable, Dict, List, Tuple
+
+from accept_stages import accept_attachment, tag_attachment, validate_cidr_overlap, validate_iam, validate_ipam
+from models import CloudTrailEvent
+
+logger = logging.getLogger(__name__)
+
+# Stage name -> (state machine output key, stage function)
+STAGES: Dict[str, Tuple[str, Callable[[CloudTrailEvent], Dict]]] = {
+    'validate_iam': ('IAMValidationPayload', validate_iam),
+    'validate_ipam': ('IPAMValidationPayload', validate_ipam),
+    'validate_cidr_overlap': ('CIDRValidationPayload', validate_cidr_overlap),
+    'accept': ('AcceptAttachmentPayload', accept_attachment),
+    'tag_attachment': ('TagAttachmentPayload', tag_attachment),
+}
+
+
+class PipelineStageError(Exception):
+    """Raised when a stage fails, naming the stage and keeping completed results."""
+
+    def __init__(self, stage: str, cause: Exception, results: Dict):
+        super().__init__(f"Stage {stage} failed: {cause}")
+        self.stage = stage
+        self.cause = cause
+        self.results = results
+
+
+def run_pipeline(raw_event, stage_names: List[str]) -> Dict:
+    """
+    Run the named stages in order on one event.
+
+    Args:
+        raw_event: CloudTrail event as received by the state machine
+        stage_names: Stage names from STAGES, in execution order
+
+    Returns:
+        Dict with 'Results' mapping each stage's output key to a lambda:invoke
+        shaped result ({'Payload': ..., 'StatusCode': 200}) and 'Timings' with
+        the duration of each stage in milliseconds
+
+    Raises:
+        ValueError: If a stage name is unknown
+        PipelineStageError: If a stage raises; later stages are not run
+    """
+    unknown = [name for name in stage_names if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown pipeline stages: {unknown}")
+
+    ct_event = CloudTrailEvent.from_raw(raw_event)
+    results: Dict = {}
+    timings: Dict[str, float] = {}
+    for name in stage_names:
+        output_key, stage = STAGES[name]
+        started = time.perf_counter()
+        try:
+            payload = stage(ct_event)
+        except Exception as e:
+            logger.error("Pipeline stage %s failed: %s", name, e)
+            raise PipelineStageError(name, e, results) from e
+        finally:
+            timings[name] = round((time.perf_counter() - started) * 1000, 3)
+        results[output_key] = {'Payload': payload, 'StatusCode': 200}
+        logger.info("Pipeline stage %s completed in %s ms", name, timings[name])
+
+    return {'Results': results, 'Timings': timings}
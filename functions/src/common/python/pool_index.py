@@ -0,0 +1,195 @@
+"""
+Reverse index of VPC IDs to the IPAM pools they are allocated from.
+
+The index is kept at module level so it stays warm across invocations of the
+same Lambda container. Entries expire after a TTL. On a miss IPAM is first
+asked about the one VPC (targeted lookup mode); if it does not know the VPC
+yet, the configured pools are scanned concurrently and every pool listed in
+full along the way is written back, so the index refreshes incrementally as
+lookups miss.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+from ipam_lookup import find_resource_pool
+from pool_scan import scan_pools
+
+logger = logging.getLogger(__name__)
+
+# Seconds an indexed allocation is trusted before the pools are scanned again
+DEFAULT_TTL_SECONDS = float(os.environ.get('IPAM_POOL_INDEX_TTL_SECONDS', '300'))
+
+# 'targeted' asks IPAM about the VPC before scanning pools, 'scan' only scans
+LOOKUP_MODE_TARGETED = 'targeted'
+LOOKUP_MODE_SCAN = 'scan'
+DEFAULT_LOOKUP_MODE = os.environ.get('IPAM_LOOKUP_MODE', LOOKUP_MODE_TARGETED).lower()
+
+
+class PoolIndex:
+    """
+    Maps VPC IDs to the IPAM pools holding an allocation for them.
+
+    Attributes:
+        ttl_seconds: How long an allocation is trusted after it was last seen
+        lookup_mode: 'targeted' or 'scan', see module docstring
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, lookup_mode: str = DEFAULT_LOOKUP_MODE,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.lookup_mode = lookup_mode
+        self._clock = clock
+        self._lock = threading.Lock()
+        # vpc_id -> {pool_id: time the allocation was last seen}
+        self._vpc_pools: Dict[str, Dict[str, float]] = {}
+        self._pool_vpcs: Dict[str, set] = {}
+
+    def lookup(self, vpc_id: str, pool_ids: Iterable[str]) -> Optional[str]:
+        """
+        Return the first of pool_ids known to hold the VPC, without any API calls.
+
+        Only entries seen within the TTL are considered.
+        """
+        pools = self._vpc_pools.get(vpc_id)
+        if not pools:
+            return None
+        now = self._clock()
+        for pool_id in pool_ids:
+            seen_at = pools.get(pool_id)
+            if seen_at is not None and now - seen_at < self.ttl_seconds:
+                return pool_id
+        return None
+
+    def record(self, vpc_id: str, pool_id: str) -> None:
+        """Record a single allocation seen outside of a complete pool listing."""
+        with self._lock:
+            self._vpc_pools.setdefault(vpc_id, {})[pool_id] = self._clock()
+
+    def replace_pool(self, pool_id: str, vpc_ids: Iterable[str]) -> None:
+        """Replace everything known about a pool with a complete listing of its VPCs."""
+        new_vpcs = set(vpc_ids)
+        with self._lock:
+            now = self._clock()
+            for vpc_id in self._pool_vpcs.get(pool_id, set()) - new_vpcs:
+                pools = self._vpc_pools.get(vpc_id)
+                if pools:
+                    pools.pop(pool_id, None)
+                    if not pools:
+                        del self._vpc_pools[vpc_id]
+            for vpc_id in new_vpcs:
+                self._vpc_pools.setdefault(vpc_id, {})[pool_id] = now
+            self._pool_vpcs[pool_id] = new_vpcs
+
+    def refresh_pool(self, ec2, pool_id: str) -> None:
+        """List every allocation in a pool and replace the pool's entries."""
+        vpc_ids = set()
+        paginator = ec2.get_paginator('get_ipam_pool_allocations')
+        for page in paginator.paginate(IpamPoolId=pool_id):
+            for alloc in page.get('IpamPoolAllocations', []):
+                if alloc.get('ResourceId'):
+                    vpc_ids.add(alloc['ResourceId'])
+        logger.debug("Indexed %d resource allocations in IPAM pool %s", len(vpc_ids), pool_id)
+        self.replace_pool(pool_id, vpc_ids)
+
+    def find_pool(self, ec2, vpc_id: str, pool_ids: Iterable[str]) -> Optional[str]:
+        """
+        Return the configured pool holding an allocation for the VPC.
+
+        On a miss IPAM is asked about the VPC directly when the lookup mode is
+        targeted. Otherwise, or if IPAM does not report the VPC, all pools are
+        scanned concurrently and the first of them in configured order holding
+        the VPC is returned.
+        Pools listed in full during the scan replace their cached entries.
+
+        Args:
+            ec2: boto3 EC2 client
+            vpc_id: VPC to look up
+            pool_ids: Configured IPAM pool IDs, in priority order
+
+        Returns:
+            The matching pool ID, or None if the VPC is not allocated in any of them
+        """
+        from botocore.exceptions import ClientError
+
+        pool_ids = list(pool_ids)
+        pool_id = self.lookup(vpc_id, pool_ids)
+        if pool_id:
+            logger.debug("IPAM pool index hit for VPC %s: %s", vpc_id, pool_id)
+            return pool_id
+
+        if self.lookup_mode == LOOKUP_MODE_TARGETED:
+            try:
+                pool_id = find_resource_pool(ec2, vpc_id, pool_ids)
+            except ClientError as e:
+                logger.warning("Targeted IPAM lookup for VPC %s failed, falling back to scan: %s", vpc_id, e)
+                pool_id = None
+            if pool_id:
+                self.record(vpc_id, pool_id)
+                return pool_id
+            logger.debug("IPAM has no resource CIDR for VPC %s in the configured pools, scanning", vpc_id)
+
+        pool_id = scan_pools(ec2, pool_ids, vpc_id, on_complete=self.replace_pool)
+        if pool_id:
+            self.record(vpc_id, pool_id)
+        return pool_id
+
+    def find_pools(self, ec2, vpc_ids: Iterable[str], pool_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Resolve the pools of several VPCs with shared lookups.
+
+        Index hits and targeted lookups are tried per VPC. If more than one VPC
+        is still unresolved, every pool is listed once, concurrently, and the
+        listing serves all of them instead of one scan per VPC.
+
+        Returns:
+            Dict mapping each VPC ID to its pool ID, or None if it is not allocated
+        """
+        from botocore.exceptions import ClientError
+
+        pool_ids = list(pool_ids)
+        results: Dict[str, Optional[str]] = {}
+        misses: List[str] = []
+        for vpc_id in dict.fromkeys(vpc_ids):
+            pool_id = self.lookup(vpc_id, pool_ids)
+            if pool_id is None and self.lookup_mode == LOOKUP_MODE_TARGETED:
+                try:
+                    pool_id = find_resource_pool(ec2, vpc_id, pool_ids)
+                except ClientError as e:
+                    logger.warning("Targeted IPAM lookup for VPC %s failed, falling back to scan: %s", vpc_id, e)
+                if pool_id:
+                    self.record(vpc_id, pool_id)
+            results[vpc_id] = pool_id
+            if pool_id is None:
+                misses.append(vpc_id)
+
+        if len(misses) == 1:
+            results[misses[0]] = scan_pools(ec2, pool_ids, misses[0], on_complete=self.replace_pool)
+        elif misses:
+            scan_pools(ec2, pool_ids, None, on_complete=self.replace_pool)
+            for vpc_id in misses:
+                results[vpc_id] = self.lookup(vpc_id, pool_ids)
+        return results
+
+    def clear(self) -> None:
+        """Drop all cached allocations."""
+        with self._lock:
+            self._vpc_pools.clear()
+            self._pool_vpcs.clear()
+
+
+# Shared index, kept warm for the lifetime of the Lambda container
+_index = PoolIndex()
+
+
+def find_vpc_pool(ec2, vpc_id: str, pool_ids: Iterable[str]) -> Optional[str]:
+    """Look up the IPAM pool for a VPC using the container-wide index."""
+    return _index.find_pool(ec2, vpc_id, pool_ids)
+
+
+def find_vpc_pools(ec2, vpc_ids: Iterable[str], pool_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Look up the IPAM pools for several VPCs using the container-wide index."""
+    return _index.find_pools(ec2, vpc_ids, pool_ids)
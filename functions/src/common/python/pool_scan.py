@@ -0,0 +1,105 @@
+"""
+Concurrent scan of IPAM pool allocations for a single resource.
+
+All configured pools are paged through at the same time on a bounded thread
+pool. The first pool in configured order holding the resource wins, as with a
+sequential scan. As soon as one pool yields an allocation for the resource,
+the scans of pools after it stop at their next page boundary and those that
+have not started yet are cancelled. Pools before it are still listed, one of
+them may hold the resource too.
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on pools paged through at the same time
+DEFAULT_MAX_WORKERS = int(os.environ.get('IPAM_SCAN_MAX_WORKERS', '8'))
+
+
+class _FirstMatch:
+    """Position of the earliest pool found to hold the resource so far."""
+
+    def __init__(self, count: int):
+        self.index = count
+        self._lock = threading.Lock()
+
+    def found(self, index: int) -> None:
+        with self._lock:
+            self.index = min(self.index, index)
+
+    def stop_all(self) -> None:
+        with self._lock:
+            self.index = -1
+
+    def settled_before(self, index: int) -> bool:
+        return self.index < index
+
+
+def _scan_pool(ec2, pool_id: str, index: int, resource_id: Optional[str], first_match: _FirstMatch,
+               on_complete: Optional[Callable[[str, Set[str]], None]]) -> bool:
+    """
+    Page through one pool until the resource is found or an earlier pool matched.
+
+    Returns:
+        True if the pool holds an allocation for the resource
+    """
+    seen = set()
+    paginator = ec2.get_paginator('get_ipam_pool_allocations')
+    for page in paginator.paginate(IpamPoolId=pool_id):
+        if first_match.settled_before(index):
+            logger.debug("Stopped scanning IPAM pool %s after a match in an earlier pool", pool_id)
+            return False
+        for alloc in page.get('IpamPoolAllocations', []):
+            if alloc.get('ResourceId'):
+                seen.add(alloc['ResourceId'])
+        if resource_id is not None and resource_id in seen:
+            first_match.found(index)
+            return True
+    # Only a complete listing is reported, partial ones would hide allocations
+    if on_complete:
+        on_complete(pool_id, seen)
+    return False
+
+
+def scan_pools(ec2, pool_ids: Iterable[str], resource_id: Optional[str],
+               max_workers: int = DEFAULT_MAX_WORKERS,
+               on_complete: Optional[Callable[[str, Set[str]], None]] = None) -> Optional[str]:
+    """
+    Find the pool holding an allocation for a resource by scanning pools concurrently.
+
+    Args:
+        ec2: boto3 EC2 client
+        pool_ids: IPAM pool IDs to scan
+        resource_id: Resource (VPC) ID to look for, or None to list every pool in full
+        max_workers: Maximum number of pools scanned at the same time
+        on_complete: Called with (pool_id, resource_ids) for every pool that was fully listed
+
+    Returns:
+        The first pool in pool_ids order holding the resource, or None if no pool does
+    """
+    pool_ids = list(pool_ids)
+    if not pool_ids:
+        return None
+
+    first_match = _FirstMatch(len(pool_ids))
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pool_ids))))
+    try:
+        futures = [
+            executor.submit(_scan_pool, ec2, pool_id, index, resource_id, first_match, on_complete)
+            for index, pool_id in enumerate(pool_ids)
+        ]
+        # In submission order, a later pool only counts once every earlier one came up empty
+        for pool_id, future in zip(pool_ids, futures):
+            if future.result():
+                logger.info("Found IPAM allocation for %s in pool %s", resource_id, pool_id)
+                return pool_id
+        return None
+    finally:
+        first_match.stop_all()
+        # Scans still in flight end at their next page boundary, no need to wait for them
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,186 @@
+"""
+Matching of principals against large sets of allowed principal patterns.
+
+Patterns are fnmatch-style (*, ?, [seq], [!seq]) and are compiled once into
+three structures:
+
+- exact: patterns without wildcards, in a dict keyed by the ARN
+- prefix trie: one node per character of each pattern's literal prefix.
+  Patterns that are a literal followed by a single trailing '*' are stored on
+  the node where their literal ends. All other wildcard patterns are grouped
+  on the node where their literal part ends and compiled into one regex per
+  node the first time a match reaches it.
+
+A match walks the trie along the identity once, so its cost depends on the
+length of the identity and the patterns sharing its prefix rather than on the
+total number of patterns. When several patterns match, the one listed first
+wins, as with a linear scan.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_WILDCARDS = '*?['
+
+
+def translate(pattern: str) -> str:
+    """
+    Translate an fnmatch pattern to a regex without capturing groups.
+
+    fnmatch.translate adds named groups for patterns with several '*', which
+    would shift the group numbers of the combined per-node regex. Sets are
+    translated as fnmatch does, including reversed ranges and characters
+    that are set operators in a regex.
+    """
+    i, n = 0, len(pattern)
+    parts = []
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '*':
+            # Consecutive stars are equivalent to one
+            while i < n and pattern[i] == '*':
+                i += 1
+            parts.append('.*')
+        elif c == '?':
+            parts.append('.')
+        elif c == '[':
+            j = i
+            if j < n and pattern[j] == '!':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                parts.append('\\[')
+                continue
+            stuff = pattern[i:j]
+            if '-' not in stuff:
+                stuff = stuff.replace('\\', r'\\')
+            else:
+                # Split on the hyphens of ranges, as fnmatch does
+                chunks = []
+                k = i + 2 if pattern[i] == '!' else i + 1
+                while True:
+                    k = pattern.find('-', k, j)
+                    if k < 0:
+                        break
+                    chunks.append(pattern[i:k])
+                    i = k + 1
+                    k = k + 3
+                chunk = pattern[i:j]
+                if chunk:
+                    chunks.append(chunk)
+                else:
+                    chunks[-1] += '-'
+                # Reversed ranges such as b-a match nothing, and are invalid in a regex
+                for k in range(len(chunks) - 1, 0, -1):
+                    if chunks[k - 1][-1] > chunks[k][0]:
+                        chunks[k - 1] = chunks[k - 1][:-1] + chunks[k][1:]
+                        del chunks[k]
+                # Hyphens left inside the chunks are literal, not set difference
+                stuff = '-'.join(part.replace('\\', r'\\').replace('-', r'\-') for part in chunks)
+            # Escape set operations (&&, ~~ and ||)
+            stuff = re.sub(r'([&~|])', r'\\\1', stuff)
+            i = j + 1
+            if not stuff:
+                # Empty set: never match
+                parts.append('(?!)')
+            elif stuff == '!':
+                # Negated empty set: any character
+                parts.append('.')
+            else:
+                if stuff[0] == '!':
+                    stuff = '^' + stuff[1:]
+                elif stuff[0] in ('^', '['):
+                    stuff = '\\' + stuff
+                parts.append(f'[{stuff}]')
+        else:
+            parts.append(re.escape(c))
+    return ''.join(parts)
+
+
+class _Node:
+    __slots__ = ('children', 'prefix', 'wildcards', 'regex', 'group_indexes')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        # Index of the first 'literal*' pattern ending at this node
+        self.prefix: Optional[int] = None
+        # (index, pattern) of other wildcard patterns whose literal part ends here
+        self.wildcards: List[Tuple[int, str]] = []
+        self.regex = None
+        self.group_indexes: List[int] = []
+
+
+class PrincipalMatcher:
+    """
+    Compiled set of allowed principal patterns.
+
+    Attributes:
+        patterns: The patterns in their original order
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = list(patterns)
+        self._exact: Dict[str, int] = {}
+        self._root = _Node()
+
+        for index, pattern in enumerate(self.patterns):
+            literal_end = next((i for i, c in enumerate(pattern) if c in _WILDCARDS), None)
+            if literal_end is None:
+                self._exact.setdefault(pattern, index)
+                continue
+            node = self._insert(pattern[:literal_end])
+            rest = pattern[literal_end:]
+            if rest.strip('*') == '':
+                if node.prefix is None:
+                    node.prefix = index
+            else:
+                node.wildcards.append((index, pattern))
+
+    def _insert(self, literal: str) -> _Node:
+        node = self._root
+        for c in literal:
+            child = node.children.get(c)
+            if child is None:
+                child = node.children[c] = _Node()
+            node = child
+        return node
+
+    @staticmethod
+    def _compile(node: _Node) -> None:
+        # Alternatives are tried in order, so the first group to match is the first listed pattern
+        node.regex = re.compile('|'.join(f'({translate(p)})' for _, p in node.wildcards), re.DOTALL)
+        node.group_indexes = [index for index, _ in node.wildcards]
+
+    def match(self, identity: str) -> Optional[str]:
+        """
+        Return the first listed pattern matching the identity, or None.
+
+        Args:
+            identity: Principal ID or ARN
+        """
+        best = self._exact.get(identity)
+        node = self._root
+        position = 0
+        while node is not None:
+            if node.prefix is not None and (best is None or node.prefix < best):
+                best = node.prefix
+            if node.wildcards:
+                if node.regex is None:
+                    self._compile(node)
+                m = node.regex.fullmatch(identity)
+                if m:
+                    index = node.group_indexes[m.lastindex - 1]
+                    if best is None or index < best:
+                        best = index
+            if best == 0 or position >= len(identity):
+                break
+            node = node.children.get(identity[position])
+            position += 1
+        return self.patterns[best] if best is not None else None
+
+    def __len__(self) -> int:
+        return len(self.patterns)
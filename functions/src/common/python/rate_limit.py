@@ -0,0 +1,237 @@
+"""
+Shared token buckets for the EC2 API rate limits.
+
+EC2 throttles requests per account and region, with separate limits for
+categories of actions. When many executions run at once, their accept,
+propagation and IPAM paging calls compete for the same limits and end in
+RequestLimitExceeded storms. With EC2_RATE_LIMITS set, every EC2 client
+made by clients.get_client() takes a token from the bucket of the call's
+category before each request, pages included. A caller that finds the
+bucket empty waits for the refill instead of being throttled.
+
+The bucket state lives in the key-value store, so all functions using the
+same table share one bucket per category:
+
+    ratelimit#<category>    tokens left and the time they were counted
+
+EC2_RATE_LIMITS is a JSON object of category to refill rate (tokens per
+second) and burst (bucket size), e.g.
+
+    {"mutating": {"rate": 5, "burst": 10}, "ipam": {"rate": 10, "burst": 20}}
+
+Categories without an entry are not limited. A call waits at most
+RATE_LIMIT_MAX_WAIT_SECONDS and then goes ahead, leaving it to the client's
+retries.
+
+A caller whose conditional write loses to another caller backs off for a
+random, growing time before counting again, so a burst of callers spreads out
+instead of retrying in lockstep. An optional "reserve" per category takes up
+to that many tokens in one write and keeps the rest in the container for its
+next calls, for as long as the bucket takes to refill them. Fewer callers
+then contend for the bucket item, at the cost of tokens left unused when a
+container goes idle.
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EC2_RATE_LIMITS = os.environ.get('EC2_RATE_LIMITS', '')
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.environ.get('RATE_LIMIT_MAX_WAIT_SECONDS', '30'))
+
+RATE_LIMIT_PREFIX = 'ratelimit#'
+
+# Backoff after losing a conditional write, doubled per lost write up to the maximum
+CONFLICT_BACKOFF_SECONDS = 0.02
+CONFLICT_BACKOFF_MAX_SECONDS = 1.0
+
+MUTATING = 'mutating'
+NON_MUTATING = 'non_mutating'
+IPAM = 'ipam'
+CATEGORIES = (MUTATING, NON_MUTATING, IPAM)
+
+# IPAM calls page through large pools; they get a bucket of their own
+IPAM_OPERATIONS = {
+    'DescribeIpamPools',
+    'GetIpamPoolAllocations',
+    'GetIpamResourceCidrs',
+    'GetIpamPoolCidrs',
+}
+NON_MUTATING_PREFIXES = ('Describe', 'Get', 'Search', 'List')
+
+
+def category_of(operation_name: str) -> str:
+    """Return the rate limit category of an EC2 operation, e.g. 'AcceptTransitGatewayVpcAttachment'."""
+    if operation_name in IPAM_OPERATIONS:
+        return IPAM
+    if operation_name.startswith(NON_MUTATING_PREFIXES):
+        return NON_MUTATING
+    return MUTATING
+
+
+@dataclass(frozen=True)
+class Bucket:
+    """
+    Size and refill rate of one category's bucket.
+
+    Attributes:
+        rate: Tokens added per second
+        burst: Maximum number of tokens, i.e. calls that can be made at once after a quiet period
+        reserve: Tokens a container takes in one write, the ones it does not use right away are kept for its next calls
+    """
+    rate: float
+    burst: float
+    reserve: int = 1
+
+
+def parse_limits(text: str) -> Dict[str, Bucket]:
+    """
+    Parse EC2_RATE_LIMITS.
+
+    Raises:
+        ValueError: If the text is not a JSON object of known categories with positive rate and burst,
+            and a reserve of at least 1 and at most the burst
+    """
+    if not text.strip():
+        return {}
+    limits = {}
+    for category, bucket in json.loads(text).items():
+        if category not in CATEGORIES:
+            raise ValueError(f"Unknown rate limit category {category!r}, expected one of {', '.join(CATEGORIES)}")
+        rate, burst = float(bucket['rate']), float(bucket.get('burst', bucket['rate']))
+        reserve = int(bucket.get('reserve', 1))
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Rate limit of {category} needs a positive rate and a burst of at least 1")
+        if not 1 <= reserve <= burst:
+            raise ValueError(f"Rate limit reserve of {category} must be between 1 and the burst")
+        limits[category] = Bucket(rate, burst, reserve)
+    return limits
+
+
+class RateLimiter:
+    """
+    Token buckets per category, kept in a key-value store.
+
+    Taking a token is a read followed by a write conditional on the version
+    read, so concurrent callers never take the same token. Tokens reserved
+    beyond the one needed are kept per category until the time the bucket
+    takes to refill them has passed.
+
+    Attributes:
+        store: Key-value store holding the buckets
+        limits: Bucket per category
+    """
+
+    def __init__(self, store, limits: Dict[str, Bucket], max_wait_seconds: float = RATE_LIMIT_MAX_WAIT_SECONDS,
+                 clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep):
+        self.store = store
+        self.limits = limits
+        self.max_wait_seconds = max_wait_seconds
+        self._clock = clock
+        self._sleep = sleep
+        # Category to tokens kept from the last write and the time they expire
+        self._reserved: Dict[str, Tuple[int, float]] = {}
+        self._reserved_lock = threading.Lock()
+
+    def _take_reserved(self, category: str, now: float) -> bool:
+        with self._reserved_lock:
+            tokens, expires_at = self._reserved.get(category, (0, 0.0))
+            if tokens < 1 or now >= expires_at:
+                return False
+            self._reserved[category] = (tokens - 1, expires_at)
+            return True
+
+    def acquire(self, category: str) -> float:
+        """
+        Take a token from a category's bucket, waiting for one if it is empty.
+
+        Returns:
+            Seconds waited
+        """
+        bucket = self.limits.get(category)
+        if bucket is None:
+            return 0.0
+        started = self._clock()
+        if self._take_reserved(category, started):
+            return 0.0
+        key = f"{RATE_LIMIT_PREFIX}{category}"
+        # A bucket left alone refills completely, after that its state carries no information
+        ttl_seconds = bucket.burst / bucket.rate + 60
+        conflicts = 0
+        while True:
+            now = self._clock()
+            item = self.store.get(key)
+            if item is None:
+                tokens = bucket.burst
+            else:
+                elapsed = max(0.0, now - item.value['updated_at'])
+                tokens = min(bucket.burst, item.value['tokens'] + elapsed * bucket.rate)
+
+            if tokens >= 1:
+                taking = min(bucket.reserve, int(tokens))
+                value = {'tokens': tokens - taking, 'updated_at': now}
+                if item is None:
+                    taken = self.store.put(key, value, ttl_seconds=ttl_seconds, if_absent=True)
+                else:
+                    taken = self.store.put(key, value, ttl_seconds=ttl_seconds, if_version=item.version)
+                if taken:
+                    if taking > 1:
+                        with self._reserved_lock:
+                            self._reserved[category] = (taking - 1, now + taking / bucket.rate)
+                    return now - started
+                # Another caller took a token in between. That is contention, not an empty bucket,
+                # so back off with full jitter instead of waiting for the refill and count again
+                conflicts += 1
+                backoff = min(CONFLICT_BACKOFF_MAX_SECONDS, CONFLICT_BACKOFF_SECONDS * 2 ** (conflicts - 1))
+                backoff *= random.random()
+                logger.debug("Lost %s token write %d times, backing off %.3f s", category, conflicts, backoff)
+                self._sleep(backoff)
+                continue
+
+            wait = (1 - tokens) / bucket.rate
+            if now + wait - started > self.max_wait_seconds:
+                logger.warning("No %s token after %.1f s, calling without one", category, now - started)
+                return now - started
+            # Jitter keeps waiting callers from all retrying at the same instant
+            self._sleep(wait * (1 + random.random() * 0.2))
+
+    def install(self, client) -> None:
+        """Take a token before every call of an EC2 client, each page of a paginator included."""
+        def limit(model, **kwargs):
+            category = category_of(model.name)
+            waited = self.acquire(category)
+            if waited >= 1:
+                logger.info("Waited %.1f s for a %s token before %s", waited, category, model.name)
+
+        client.meta.events.register('before-call.ec2', limit)
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def install_rate_limiter(client) -> bool:
+    """
+    Limit an EC2 client's calls with the buckets of EC2_RATE_LIMITS; other clients are left alone.
+
+    Returns:
+        True if the client is now rate limited
+    """
+    global _limiter
+    if not EC2_RATE_LIMITS or client.meta.service_model.service_name != 'ec2':
+        return False
+    with _limiter_lock:
+        if _limiter is None:
+            # Imported here, the store itself creates clients through clients.get_client()
+            from kvstore import store_from_env
+
+            _limiter = RateLimiter(store_from_env(), parse_limits(EC2_RATE_LIMITS))
+    _limiter.install(client)
+    return True
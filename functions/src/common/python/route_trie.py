@@ -0,0 +1,275 @@
+"""
+Longest-prefix index of Transit Gateway route tables.
+
+Used by the routing manager to preview what enabling propagation of a new
+VPC into a route table does to the routes already in it. Each route table is
+loaded into a binary trie keyed by the bits of the destination CIDRs, so that
+for a CIDR of the VPC:
+
+- the routes containing it (the longest prefix match and its supernets) are
+  found walking one path down the trie
+- the routes inside it are the subtree below that path
+
+Relative to a new VPC CIDR an existing route is one of:
+
+- exact: same destination. A static route wins over the propagated one and
+  two propagated routes to the same destination from different attachments
+  are ambiguous
+- shadows: the most specific route containing the CIDR. The propagated route
+  is more specific and takes over the CIDR's traffic from it
+- shadowed_by: routes more specific than the CIDR. They keep their part of
+  the VPC's range away from the new attachment
+
+exact and shadowed_by routes are conflicts, a shadowed route is what a new
+VPC normally does to a default or summary route.
+"""
+
+import logging
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from logs import in_current_context
+
+logger = logging.getLogger(__name__)
+
+# Routes with a destination CIDR, prefix list routes carry a prefix list ID instead
+ROUTE_FILTERS = [
+    {'Name': 'type', 'Values': ['static', 'propagated']},
+    {'Name': 'state', 'Values': ['active', 'blackhole']},
+]
+# Largest page search_transit_gateway_routes returns
+MAX_RESULTS = 1000
+
+
+class _Node:
+    __slots__ = ('children', 'value')
+
+    def __init__(self):
+        self.children: List[Optional['_Node']] = [None, None]
+        self.value = None
+
+
+class RouteTrie:
+    """
+    Binary trie of CIDR prefixes, one per IP version.
+
+    Lookups take one step per prefix bit, independent of the number of routes.
+    """
+
+    def __init__(self):
+        self._roots = {4: _Node(), 6: _Node()}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _bits(network) -> Iterable[int]:
+        address, shift = int(network.network_address), network.max_prefixlen - 1
+        for i in range(network.prefixlen):
+            yield (address >> (shift - i)) & 1
+
+    def insert(self, cidr: str, value) -> None:
+        """Store a value for a CIDR, replacing any previous value of the same prefix."""
+        network = ipaddress.ip_network(cidr, strict=False)
+        node = self._roots[network.version]
+        for bit in self._bits(network):
+            if node.children[bit] is None:
+                node.children[bit] = _Node()
+            node = node.children[bit]
+        if node.value is None:
+            self._size += 1
+        node.value = value
+
+    def supernets(self, cidr: str) -> List:
+        """Return the values of the prefixes containing a CIDR, itself included, least specific first."""
+        network = ipaddress.ip_network(cidr, strict=False)
+        node = self._roots[network.version]
+        found = [node.value] if node.value is not None else []
+        for bit in self._bits(network):
+            node = node.children[bit]
+            if node is None:
+                break
+            if node.value is not None:
+                found.append(node.value)
+        return found
+
+    def longest_prefix_match(self, address: str):
+        """Return the value of the most specific prefix containing an address or CIDR, or None."""
+        matches = self.supernets(address)
+        return matches[-1] if matches else None
+
+    def subnets(self, cidr: str) -> List:
+        """Return the values of the prefixes strictly inside a CIDR, in address order."""
+        network = ipaddress.ip_network(cidr, strict=False)
+        node = self._roots[network.version]
+        for bit in self._bits(network):
+            node = node.children[bit]
+            if node is None:
+                return []
+        found = []
+        stack = [node.children[1], node.children[0]]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if node.value is not None:
+                found.append(node.value)
+            stack.extend((node.children[1], node.children[0]))
+        return found
+
+
+def _search(ec2, route_table_id: str, filters: List[Dict]) -> Tuple[List[Dict], bool]:
+    response = ec2.search_transit_gateway_routes(
+        TransitGatewayRouteTableId=route_table_id,
+        Filters=ROUTE_FILTERS + filters,
+        MaxResults=MAX_RESULTS,
+    )
+    return response.get('Routes', []), bool(response.get('AdditionalRoutesAvailable'))
+
+
+def search_routes(ec2, route_table_id: str) -> List[Dict]:
+    """
+    Return the static and propagated routes of a route table.
+
+    search_transit_gateway_routes has no next token, it only flags a result
+    as truncated. A truncated search is repeated for each half of the address
+    range, plus an exact match of the range itself, until every part fits in
+    one page.
+    """
+    routes, truncated = _search(ec2, route_table_id, [])
+    if not truncated:
+        return routes
+
+    found: Dict[str, Dict] = {}
+    pending = [ipaddress.ip_network('::/0'), ipaddress.ip_network('0.0.0.0/0')]
+    searches = 1
+    while pending:
+        network = pending.pop()
+        routes, truncated = _search(
+            ec2, route_table_id, [{'Name': 'route-search.subnet-of-match', 'Values': [str(network)]}])
+        searches += 1
+        if truncated and network.prefixlen < network.max_prefixlen:
+            exact, _ = _search(ec2, route_table_id, [{'Name': 'route-search.exact-match', 'Values': [str(network)]}])
+            searches += 1
+            routes = routes + exact
+            pending.extend(reversed(list(network.subnets(prefixlen_diff=1))))
+        for route in routes:
+            found[route.get('DestinationCidrBlock') or route.get('PrefixListId', '')] = route
+    logger.debug("Loaded %d routes of %s in %d searches", len(found), route_table_id, searches)
+    return list(found.values())
+
+
+def load_route_table(ec2, route_table_id: str) -> RouteTrie:
+    """Load the routes of a route table with a destination CIDR into a trie."""
+    trie = RouteTrie()
+    for route in search_routes(ec2, route_table_id):
+        if route.get('DestinationCidrBlock'):
+            trie.insert(route['DestinationCidrBlock'], route)
+    return trie
+
+
+def _attachment_ids(route: Dict) -> List[str]:
+    return [a.get('TransitGatewayAttachmentId', '') for a in route.get('TransitGatewayAttachments', [])]
+
+
+def _summary(cidr: str, route: Dict) -> Dict:
+    return {
+        'cidr': cidr,
+        'route': route['DestinationCidrBlock'],
+        'type': route.get('Type', ''),
+        'state': route.get('State', ''),
+        'attachments': _attachment_ids(route),
+    }
+
+
+@dataclass
+class RouteTableImpact:
+    """
+    Routes of one route table affected by propagating a VPC's CIDRs.
+
+    Each route is summarized with the VPC CIDR it was found for.
+
+    Attributes:
+        route_table_id: Route table the VPC propagates to
+        routes: Number of routes in the route table
+        exact: Routes with the same destination as a VPC CIDR
+        shadows: Less specific routes the VPC CIDRs take traffic from
+        shadowed_by: More specific routes keeping traffic inside the VPC CIDRs
+        error: Why the route table could not be loaded
+    """
+    route_table_id: str
+    routes: int = 0
+    exact: List[Dict] = field(default_factory=list)
+    shadows: List[Dict] = field(default_factory=list)
+    shadowed_by: List[Dict] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def conflicts(self) -> List[Dict]:
+        return self.exact + self.shadowed_by
+
+    def to_dict(self) -> Dict:
+        result = {
+            'route_table_id': self.route_table_id,
+            'routes': self.routes,
+            'exact': self.exact,
+            'shadows': self.shadows,
+            'shadowed_by': self.shadowed_by,
+        }
+        if self.error:
+            result['error'] = self.error
+        return result
+
+
+def route_table_impact(trie: RouteTrie, route_table_id: str, cidrs: Iterable[str],
+                       attachment_id: str = '') -> RouteTableImpact:
+    """
+    Classify the routes of a loaded route table against a VPC's CIDRs.
+
+    Routes pointing only at attachment_id are the VPC's own, e.g. when
+    propagation is already enabled, and are ignored.
+    """
+    def foreign(route: Dict) -> bool:
+        attachment_ids = _attachment_ids(route)
+        return not attachment_ids or any(a != attachment_id for a in attachment_ids)
+
+    impact = RouteTableImpact(route_table_id, routes=len(trie))
+    for cidr in cidrs:
+        network = str(ipaddress.ip_network(cidr, strict=False))
+        containing = [r for r in trie.supernets(network) if foreign(r)]
+        if containing and containing[-1]['DestinationCidrBlock'] == network:
+            impact.exact.append(_summary(cidr, containing.pop()))
+        if containing:
+            impact.shadows.append(_summary(cidr, containing[-1]))
+        impact.shadowed_by.extend(_summary(cidr, r) for r in trie.subnets(network) if foreign(r))
+    return impact
+
+
+def propagation_impact(ec2, route_table_ids: List[str], cidrs: List[str], attachment_id: str = '',
+                       max_workers: int = 8) -> List[RouteTableImpact]:
+    """
+    Load route tables concurrently and classify their routes against a VPC's CIDRs.
+
+    A route table that cannot be searched is reported with its error instead of failing the others.
+
+    Returns:
+        One RouteTableImpact per route table, in input order
+    """
+    from botocore.exceptions import ClientError
+
+    def preview(route_table_id: str) -> RouteTableImpact:
+        try:
+            trie = load_route_table(ec2, route_table_id)
+        except ClientError as e:
+            error = f"{e.response['Error']['Code']} - {e.response['Error']['Message']}"
+            logger.warning("Could not search routes of %s: %s", route_table_id, error)
+            return RouteTableImpact(route_table_id, error=error)
+        return route_table_impact(trie, route_table_id, cidrs, attachment_id)
+
+    if not route_table_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(route_table_ids)))) as executor:
+        return list(executor.map(in_current_context(preview), route_table_ids))
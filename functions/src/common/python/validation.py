@@ -0,0 +1,45 @@
+"""
+Validation helpers shared by the single-attachment and batch accept paths.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from principal_matcher import PrincipalMatcher
+
+
+def parse_list(value: Optional[str]) -> List[str]:
+    """Split a comma separated environment variable into its non-empty items."""
+    if not value:
+        return []
+    return [p.strip() for p in value.split(',') if p.strip()]
+
+
+def requesting_principal(detail: Dict) -> str:
+    """
+    Return the identity to validate from a CloudTrail event's detail.
+
+    Root/account calls are identified by their principal ID, everything else by its ARN.
+    """
+    user_identity = detail.get('userIdentity', {})
+    identity_type = user_identity.get('type', '')
+    if identity_type == 'AWSAccount':
+        return user_identity.get('principalId') or ''
+    return user_identity.get('arn', '')
+
+
+@lru_cache(maxsize=8)
+def principal_matcher(patterns: Tuple[str, ...]) -> PrincipalMatcher:
+    """Return the compiled matcher for a set of patterns, compiling it on first use."""
+    return PrincipalMatcher(patterns)
+
+
+def match_principal(identity: str, patterns: List[str]) -> Optional[str]:
+    """
+    Return the first allowed pattern matching the identity, or None.
+
+    Args:
+        identity: Principal ID or ARN from requesting_principal
+        patterns: fnmatch-style allowed principal patterns
+    """
+    return principal_matcher(tuple(patterns)).match(identity)
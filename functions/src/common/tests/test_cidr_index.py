@@ -0,0 +1,149 @@
+import ipaddress
+import random
+
+import pytest
+
+from cidr_index import CidrIndex, TGWCidrIndexes
+from ipam_lookup import clear_pool_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakePaginator:
+    def __init__(self, ec2, operation_name):
+        self.ec2 = ec2
+        self.operation_name = operation_name
+
+    def paginate(self, **kwargs):
+        self.ec2.calls.append(self.operation_name)
+        if self.operation_name == 'describe_ipam_pools':
+            yield {'IpamPools': [{'IpamPoolId': p, 'IpamScopeArn': 'arn:aws:ec2::1:ipam-scope/ipam-scope-1'}
+                                 for p in kwargs['IpamPoolIds']]}
+        elif self.operation_name == 'describe_transit_gateway_attachments':
+            yield {'TransitGatewayAttachments': [{'ResourceId': v} for v in self.ec2.attached]}
+        else:
+            self.ec2.listings.append(kwargs.get('ResourceId'))
+            yield {'IpamResourceCidrs': [
+                {'ResourceId': vpc_id, 'ResourceCidr': cidr}
+                for vpc_id, cidrs in self.ec2.cidrs.items() for cidr in cidrs
+                if kwargs.get('ResourceId') in (None, vpc_id)
+            ]}
+
+
+class FakeEc2:
+    """Minimal EC2 stand-in; moto does not implement get_ipam_resource_cidrs."""
+
+    def __init__(self, attached, cidrs):
+        self.attached = attached
+        self.cidrs = cidrs
+        self.calls = []
+        # VPC of each IPAM CIDR listing, None for a listing of the whole scope
+        self.listings = []
+
+    def get_paginator(self, operation_name):
+        return FakePaginator(self, operation_name)
+
+
+@pytest.fixture(autouse=True)
+def pool_cache():
+    clear_pool_cache()
+    yield
+    clear_pool_cache()
+
+
+def test_overlaps_are_found_in_both_directions():
+    index = CidrIndex()
+    index.add('10.0.0.0/16', 'vpc-a')
+    index.add('10.1.0.0/24', 'vpc-b')
+    index.add('10.1.1.0/24', 'vpc-c')
+    index.add('2001:db8::/56', 'vpc-d')
+
+    assert index.overlaps('10.0.4.0/22') == [('10.0.0.0/16', 'vpc-a')]
+    assert index.overlaps('10.1.0.0/23') == [('10.1.0.0/24', 'vpc-b'), ('10.1.1.0/24', 'vpc-c')]
+    assert index.overlaps('10.1.0.0/24') == [('10.1.0.0/24', 'vpc-b')]
+    assert index.overlaps('10.2.0.0/16') == []
+    assert index.overlaps('2001:db8:0:ff::/64') == [('2001:db8::/56', 'vpc-d')]
+    assert index.overlaps('10.0.0.0/16', exclude_owner='vpc-a') == []
+
+
+def test_index_agrees_with_pairwise_comparison():
+    rng = random.Random(7)
+    index = CidrIndex()
+    blocks = []
+    for n in range(300):
+        prefixlen = rng.randint(16, 28)
+        network = ipaddress.ip_network((rng.getrandbits(32) & 0x0AFFFFFF | 0x0A000000, prefixlen), strict=False)
+        blocks.append((str(network), f'vpc-{n}'))
+        index.add(str(network), f'vpc-{n}')
+
+    for _ in range(200):
+        prefixlen = rng.randint(12, 30)
+        query = ipaddress.ip_network((rng.getrandbits(32) & 0x0AFFFFFF | 0x0A000000, prefixlen), strict=False)
+        expected = {(cidr, vpc_id) for cidr, vpc_id in blocks if ipaddress.ip_network(cidr).overlaps(query)}
+        assert set(index.overlaps(str(query))) == expected
+
+
+def test_index_follows_attachments_and_is_rebuilt_after_ttl():
+    ec2 = FakeEc2(attached=['vpc-a'], cidrs={'vpc-a': ['10.0.0.0/16'], 'vpc-new': ['10.1.0.0/16'],
+                                            'vpc-late': ['10.1.128.0/20']})
+    clock = FakeClock()
+    indexes = TGWCidrIndexes(ttl_seconds=300, clock=clock)
+
+    assert indexes.check(ec2, 'tgw-1', 'vpc-new', ['pool-1']) == (['10.1.0.0/16'], [])
+    # Passing the check does not index vpc-new, it may still be rejected
+    assert indexes.check(ec2, 'tgw-1', 'vpc-late', ['pool-1'])[1] == []
+
+    # Once pending acceptance vpc-new counts as attached, without a full listing of IPAM
+    ec2.attached.append('vpc-new')
+    assert indexes.check(ec2, 'tgw-1', 'vpc-late', ['pool-1'])[1] == [('10.1.0.0/16', 'vpc-new')]
+    # Rejected after all, it is dropped on the next check
+    ec2.attached.remove('vpc-new')
+    assert indexes.check(ec2, 'tgw-1', 'vpc-late', ['pool-1'])[1] == []
+    assert ec2.listings.count(None) == 1
+
+    # CIDRs added to an indexed VPC are seen after the rebuild
+    ec2.cidrs['vpc-a'].append('10.1.128.0/17')
+    assert indexes.check(ec2, 'tgw-1', 'vpc-late', ['pool-1'])[1] == []
+    clock.now = 301
+    assert indexes.check(ec2, 'tgw-1', 'vpc-late', ['pool-1'])[1] == [('10.1.128.0/17', 'vpc-a')]
+
+
+def test_vpcs_of_a_batch_are_checked_with_one_index_update():
+    ec2 = FakeEc2(attached=['vpc-a', 'vpc-b', 'vpc-c'],
+                  cidrs={'vpc-a': ['10.0.0.0/16'], 'vpc-b': ['10.0.1.0/24'], 'vpc-c': ['10.2.0.0/16'],
+                         'vpc-d': ['10.3.0.0/16']})
+
+    checked = TGWCidrIndexes().check_all(ec2, 'tgw-1', ['vpc-b', 'vpc-c', 'vpc-d'], ['pool-1'])
+
+    assert checked == {'vpc-b': (['10.0.1.0/24'], [('10.0.0.0/16', 'vpc-a')]),
+                       'vpc-c': (['10.2.0.0/16'], []), 'vpc-d': (['10.3.0.0/16'], [])}
+    assert ec2.calls.count('describe_transit_gateway_attachments') == 1
+    # Only vpc-d, not attached yet, needed a listing of its own
+    assert ec2.listings == [None, 'vpc-d']
+
+
+def test_removed_vpcs_leave_no_blocks_behind():
+    index = CidrIndex()
+    index.add('10.0.0.0/16', 'vpc-a')
+    index.add('10.0.0.0/16', 'vpc-b')
+    index.add('10.0.1.0/24', 'vpc-b')
+
+    index.remove('vpc-b')
+
+    assert len(index) == 1
+    assert index.overlaps('10.0.1.0/24') == [('10.0.0.0/16', 'vpc-a')]
+    index.remove('vpc-a')
+    assert len(index) == 0
+    assert index.overlaps('10.0.0.0/8') == []
+
+
+def test_vpc_unknown_to_ipam_has_no_cidrs():
+    ec2 = FakeEc2(attached=['vpc-a'], cidrs={'vpc-a': ['10.0.0.0/16']})
+
+    assert TGWCidrIndexes().check(ec2, 'tgw-1', 'vpc-new', ['pool-1']) == ([], [])
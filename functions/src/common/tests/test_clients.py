@@ -0,0 +1,72 @@
+import os
+
+import pytest
+from moto import mock_aws
+
+import clients
+from clients import clear_clients, get_client
+
+
+@pytest.fixture(autouse=True)
+def aws_credentials():
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-west-2'
+    clear_clients()
+    yield
+    clear_clients()
+
+
+def test_clients_are_reused_per_service_and_region():
+    ec2 = get_client('ec2', 'us-west-2')
+
+    assert get_client('ec2', 'us-west-2') is ec2
+    assert get_client('ec2', 'eu-north-1') is not ec2
+    assert get_client('sns', 'us-west-2') is not ec2
+
+
+def test_clients_use_tuned_config():
+    config = get_client('ec2', 'us-west-2').meta.config
+
+    assert config.max_pool_connections == clients.CLIENT_MAX_POOL_CONNECTIONS
+    assert config.tcp_keepalive is True
+    assert config.connect_timeout == clients.CLIENT_CONNECT_TIMEOUT
+    assert config.read_timeout == clients.CLIENT_READ_TIMEOUT
+    assert config.retries['mode'] == 'adaptive'
+
+
+@mock_aws
+def test_role_clients_assume_the_role():
+    role_arn = 'arn:aws:iam::123456789012:role/network-admin'
+    ec2 = get_client('ec2', 'us-west-2', role_arn=role_arn)
+
+    assert get_client('ec2', 'us-west-2', role_arn=role_arn) is ec2
+    assert ec2 is not get_client('ec2', 'us-west-2')
+    # Credentials come from STS, not from the environment
+    ec2.describe_vpcs()
+    assert ec2._request_signer._credentials.access_key != 'testing'
+
+
+def test_prewarm_is_deferred_for_on_demand_init(monkeypatch):
+    monkeypatch.delenv('AWS_LAMBDA_INITIALIZATION_TYPE', raising=False)
+    monkeypatch.setattr(clients, 'CLIENT_PREWARM', 'auto')
+
+    assert clients.prewarm_clients([('ec2', 'us-west-2')]) is False
+    assert clients._clients == {}
+
+
+def test_prewarm_creates_clients_for_provisioned_concurrency(monkeypatch):
+    monkeypatch.setenv('AWS_LAMBDA_INITIALIZATION_TYPE', 'provisioned-concurrency')
+    monkeypatch.setattr(clients, 'CLIENT_PREWARM', 'auto')
+
+    assert clients.prewarm_clients([('ec2', 'us-west-2'), ('sns', 'us-west-2')]) is True
+    assert set(clients._clients) == {('ec2', 'us-west-2', None), ('sns', 'us-west-2', None)}
+
+
+def test_prewarm_can_be_disabled(monkeypatch):
+    monkeypatch.setenv('AWS_LAMBDA_INITIALIZATION_TYPE', 'snap-start')
+    monkeypatch.setattr(clients, 'CLIENT_PREWARM', 'never')
+
+    assert clients.prewarm_clients([('ec2', 'us-west-2')]) is False
+    assert clients._clients == {}
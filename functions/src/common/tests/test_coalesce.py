@@ -0,0 +1,78 @@
+import json
+
+from coalesce import UNGROUPED, CoalescingReport, GroupReport, coalesce_by_tgw, sqs_items
+from models import CloudTrailEvent
+
+
+def _event(attachment_id, tgw_id):
+    return json.dumps({
+        'detail-type': 'AWS API Call via CloudTrail',
+        'detail': {
+            'eventName': 'CreateTransitGatewayVpcAttachment',
+            'responseElements': {'CreateTransitGatewayVpcAttachmentResponse': {'transitGatewayVpcAttachment': {
+                'transitGatewayAttachmentId': attachment_id,
+                'transitGatewayId': tgw_id,
+                'vpcId': f'vpc-{attachment_id}',
+                'vpcOwnerId': '111111111111',
+                'state': 'pendingAcceptance',
+            }}},
+        },
+    })
+
+
+def test_events_are_grouped_per_tgw_largest_group_first():
+    groups = coalesce_by_tgw([
+        ('m1', _event('a', 'tgw-1'), 100.0),
+        ('m2', _event('b', 'tgw-2'), 101.0),
+        ('m3', _event('c', 'tgw-2'), 99.0),
+        ('m4', 'not json', None),
+    ])
+
+    assert [(g.tgw_id, [item_id for item_id, _ in g.items]) for g in groups] == [
+        ('tgw-2', ['m2', 'm3']), ('tgw-1', ['m1']), (UNGROUPED, ['m4'])]
+    assert groups[0].oldest_sent_at == 99.0
+    # Parsed once, the stages reuse the parsed event
+    assert isinstance(groups[0].items[0][1], CloudTrailEvent)
+    assert groups[2].items == [('m4', 'not json')]
+
+
+def test_report_measures_the_longest_wait():
+    groups = coalesce_by_tgw([
+        ('m1', _event('a', 'tgw-1'), 100.0),
+        ('m2', _event('b', 'tgw-1'), 104.0),
+        ('m3', _event('c', 'tgw-2'), None),
+    ])
+
+    report = CoalescingReport.of(groups, now=112.5)
+
+    assert report.to_dict() == {'events': 3, 'groups': 2, 'largest_group': 2, 'max_delay_seconds': 12.5}
+    document = json.loads(report.emf_document('batch', 'Namespace', timestamp_ms=0))
+    assert document['CoalescingDelayMs'] == 12500
+    assert document['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['FunctionName']]
+
+
+def test_group_report_has_the_tgw_as_dimension():
+    group = coalesce_by_tgw([('m1', _event('a', 'tgw-1'), 100.0), ('m2', _event('b', 'tgw-1'), 101.0)])[0]
+
+    report = GroupReport.of(group, {'ACCEPTED': 1, 'REJECTED': 1}, now=103.0)
+
+    assert report.to_dict() == {'tgw_id': 'tgw-1', 'events': 2, 'outcomes': {'ACCEPTED': 1, 'REJECTED': 1},
+                                'delay_seconds': 3.0}
+    document = json.loads(report.emf_document('batch', 'Namespace', timestamp_ms=0))
+    assert document['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['FunctionName', 'TransitGatewayId']]
+    assert (document['TransitGatewayId'], document['GroupAccepted'], document['GroupFailed']) == ('tgw-1', 1, 0)
+    assert document['GroupDelayMs'] == 3000
+
+
+def test_sqs_records_carry_their_sent_time():
+    records = [
+        {'messageId': 'm1', 'body': '{}', 'attributes': {'SentTimestamp': '1700000000500'}},
+        {'messageId': 'm2', 'body': '{}'},
+    ]
+
+    assert list(sqs_items(records)) == [('m1', '{}', 1700000000.5), ('m2', '{}', None)]
+
+
+def test_empty_batch_reports_nothing():
+    assert CoalescingReport.of([], now=0).to_dict() == {
+        'events': 0, 'groups': 0, 'largest_group': 0, 'max_delay_seconds': 0.0}
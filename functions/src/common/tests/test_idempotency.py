@@ -0,0 +1,120 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+import idempotency
+from idempotency import IdempotencyInProgressError, idempotency_key, idempotent, run_once
+from kvstore import MemoryStore, SQLiteStore
+
+EVENT = {
+    'detail-type': 'AWS API Call via CloudTrail',
+    'detail': {
+        'eventName': 'CreateTransitGatewayVpcAttachment',
+        'responseElements': {'CreateTransitGatewayVpcAttachmentResponse': {'transitGatewayVpcAttachment': {
+            'transitGatewayAttachmentId': 'tgw-attach-1',
+            'transitGatewayId': 'tgw-1',
+            'vpcId': 'vpc-1',
+            'vpcOwnerId': '123456789012',
+        }}},
+    },
+}
+KEY = idempotency_key('tgw-attach-1', 'CreateTransitGatewayVpcAttachment', 'accept')
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    store = MemoryStore() if request.param == 'memory' else SQLiteStore(str(tmp_path / 'state.db'))
+    with patch.object(idempotency, 'IDEMPOTENCY_ENABLED', True), \
+            patch.object(idempotency, 'store_from_env', return_value=store):
+        yield store
+
+
+def handler_counting(calls, result=None):
+    @idempotent('accept')
+    def lambda_handler(event, context):
+        calls.append(event)
+        return dict(result or {'result': 'SUCCESS'})
+    return lambda_handler
+
+
+def test_duplicate_event_replays_the_first_result(store):
+    calls = []
+    handler = handler_counting(calls, {'result': 'SUCCESS', 'attachment_id': 'tgw-attach-1'})
+
+    first = handler(EVENT, None)
+    second = handler({'Stages': ['accept'], 'Event': EVENT}, None)
+
+    assert len(calls) == 1
+    assert first == {'result': 'SUCCESS', 'attachment_id': 'tgw-attach-1'}
+    assert second == dict(first, replayed=True)
+
+
+def test_stages_and_events_are_keyed_separately(store):
+    calls = []
+    handler = handler_counting(calls)
+    accept_event = {**EVENT, 'detail': {**EVENT['detail'], 'eventName': 'AcceptTransitGatewayVpcAttachment'}}
+
+    handler(EVENT, None)
+    handler(accept_event, None)
+    idempotent('validate_ipam')(lambda event, context: calls.append(event) or {})(EVENT, None)
+    # Not about an attachment, so not deduplicated
+    handler({'source': 'aws.events'}, None)
+    handler({'source': 'aws.events'}, None)
+
+    assert len(calls) == 5
+
+
+def test_concurrent_duplicates_run_the_stage_once(store):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    @idempotent('accept')
+    def lambda_handler(event, context):
+        calls.append(event)
+        started.set()
+        release.wait(5)
+        return {'result': 'SUCCESS'}
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(lambda_handler(EVENT, None)))
+    first.start()
+    started.wait(5)
+    with patch.object(idempotency, 'POLL_SECONDS', 0.01):
+        second = threading.Thread(target=lambda: results.append(lambda_handler(EVENT, None)))
+        second.start()
+        release.set()
+        first.join()
+        second.join()
+
+    assert len(calls) == 1
+    assert sorted(r.get('replayed', False) for r in results) == [False, True]
+
+
+def test_failed_run_leaves_no_record(store):
+    attempts = []
+
+    @idempotent('accept')
+    def lambda_handler(event, context):
+        attempts.append(event)
+        if len(attempts) == 1:
+            raise RuntimeError('throttled')
+        return {'result': 'SUCCESS'}
+
+    with pytest.raises(RuntimeError):
+        lambda_handler(EVENT, None)
+
+    assert lambda_handler(EVENT, None) == {'result': 'SUCCESS'}
+    assert len(attempts) == 2
+
+
+def test_running_duplicate_times_out_and_dead_run_is_taken_over(store):
+    store.put(KEY, {'status': 'IN_PROGRESS', 'lease_until': 4_000_000_000})
+    with pytest.raises(IdempotencyInProgressError):
+        run_once(store, KEY, lambda: {'result': 'SUCCESS'}, lease_seconds=60, wait_seconds=0, sleep=lambda s: None)
+
+    store.put(KEY, {'status': 'IN_PROGRESS', 'lease_until': 0})
+    result = run_once(store, KEY, lambda: {'result': 'SUCCESS'}, lease_seconds=60, wait_seconds=0)
+
+    assert result == {'result': 'SUCCESS'}
+    assert store.get(KEY).value['status'] == 'COMPLETED'
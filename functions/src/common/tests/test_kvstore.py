@@ -0,0 +1,133 @@
+import os
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from kvstore import COLLECTION_INDEX, DynamoDBStore, MemoryStore, SQLiteStore
+
+TABLE = 'state'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'dynamodb'])
+def store(request, clock, tmp_path):
+    if request.param == 'memory':
+        yield MemoryStore(clock=clock)
+        return
+    if request.param == 'sqlite':
+        yield SQLiteStore(str(tmp_path / 'state.db'), clock=clock)
+        return
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-west-2'
+    with mock_aws():
+        dynamodb = boto3.client('dynamodb', region_name='us-west-2')
+        dynamodb.create_table(
+            TableName=TABLE,
+            KeySchema=[{'AttributeName': 'pk', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[
+                {'AttributeName': 'pk', 'AttributeType': 'S'},
+                {'AttributeName': 'collection', 'AttributeType': 'S'},
+            ],
+            GlobalSecondaryIndexes=[{
+                'IndexName': COLLECTION_INDEX,
+                'KeySchema': [
+                    {'AttributeName': 'collection', 'KeyType': 'HASH'},
+                    {'AttributeName': 'pk', 'KeyType': 'RANGE'},
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+            }],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        yield DynamoDBStore(TABLE, dynamodb=dynamodb, clock=clock)
+
+
+def test_put_get_and_versions(store):
+    assert store.get('a') is None
+    assert store.put('a', {'n': 1})
+    assert store.put('a', {'n': 2})
+
+    item = store.get('a')
+    assert item.value == {'n': 2}
+    assert item.version == 2
+
+
+def test_conditional_writes(store):
+    assert store.put('a', {'n': 1}, if_absent=True)
+    assert not store.put('a', {'n': 2}, if_absent=True)
+
+    version = store.get('a').version
+    assert store.put('a', {'n': 3}, if_version=version)
+    assert not store.put('a', {'n': 4}, if_version=version)
+    assert not store.put('missing', {'n': 1}, if_version=1)
+    assert store.get('a').value == {'n': 3}
+
+
+def test_conditional_delete(store):
+    store.put('a', {})
+    assert not store.delete('a', if_version=5)
+    assert store.delete('a', if_version=1)
+    assert store.get('a') is None
+
+
+def test_expired_items_are_absent(store, clock):
+    store.put('a', {'n': 1}, ttl_seconds=60, collection='c')
+    clock.now += 30
+    assert store.get('a') is not None
+    clock.now += 31
+    assert store.get('a') is None
+    assert store.query('c') == []
+    assert store.put('a', {'n': 2}, if_absent=True)
+
+
+def test_query_lists_a_collection(store):
+    store.put('waiter#2', {'n': 2}, collection='waiter')
+    store.put('waiter#1', {'n': 1}, collection='waiter')
+    store.put('waiter#3', {'n': 3})
+    store.put('other#1', {'n': 4}, collection='other')
+
+    assert [i.key for i in store.query('waiter')] == ['waiter#1', 'waiter#2']
+    assert store.get('waiter#1').collection == 'waiter'
+
+    # Writing without a collection takes an item out of it
+    store.put('waiter#1', {'n': 5}, ttl_seconds=60)
+    assert [i.key for i in store.query('waiter')] == ['waiter#2']
+
+
+def test_sqlite_store_is_shared_through_its_file(tmp_path):
+    path = str(tmp_path / 'state.db')
+    first, second = SQLiteStore(path), SQLiteStore(path)
+
+    assert first.put('a', {'n': 1}, if_absent=True)
+    assert not second.put('a', {'n': 2}, if_absent=True)
+    assert second.get('a').value == {'n': 1}
+
+
+def test_sqlite_store_adds_the_collection_column_to_old_files(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / 'state.db')
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE items (pk TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL, expires_at REAL)')
+    db.execute("INSERT INTO items VALUES ('a', '{}', 1, NULL)")
+    db.commit()
+    db.close()
+
+    store = SQLiteStore(path)
+    assert store.get('a').version == 1
+    assert store.put('b', {}, collection='c')
+    assert [i.key for i in store.query('c')] == ['b']
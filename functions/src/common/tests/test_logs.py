@@ -0,0 +1,100 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import logs
+from logs import JsonFormatter, Lazy, correlation, correlation_ids, in_current_context, log_invocation
+
+EVENT = {
+    'detail-type': 'AWS API Call via CloudTrail',
+    'detail': {'responseElements': {'AcceptTransitGatewayVpcAttachmentResponse': {'transitGatewayVpcAttachment': {
+        'transitGatewayAttachmentId': 'tgw-attach-1',
+        'transitGatewayId': 'tgw-1',
+        'vpcId': 'vpc-1',
+        'vpcOwnerId': '123456789012',
+    }}}},
+}
+
+
+class Context:
+    aws_request_id = 'request-1'
+
+
+class Unserialisable:
+    def __str__(self):
+        raise AssertionError('event was serialised')
+
+
+@pytest.fixture(autouse=True)
+def logger():
+    logger = logging.getLogger('test_logs')
+    logger.setLevel(logging.INFO)
+    yield logger
+    # Drop the IDs bound by the test
+    log_invocation(logger, {}, None)
+
+
+def format_record(logger, message, *args, **kwargs):
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, message, args, None, extra=kwargs or None)
+    return json.loads(JsonFormatter().format(record))
+
+
+def test_records_carry_the_correlation_ids_of_the_invocation(logger):
+    log_invocation(logger, {'Stages': ['accept'], 'Event': EVENT}, Context())
+
+    document = format_record(logger, 'Accepted %s', 'tgw-attach-1', stage='accept')
+
+    assert document['message'] == 'Accepted tgw-attach-1'
+    assert document['request_id'] == 'request-1'
+    assert document['attachment_id'] == 'tgw-attach-1'
+    assert document['transit_gateway_id'] == 'tgw-1'
+    assert document['stage'] == 'accept'
+
+
+def test_next_invocation_drops_previous_ids(logger):
+    log_invocation(logger, EVENT, Context())
+    log_invocation(logger, {'Records': []}, None)
+
+    assert correlation_ids() == {}
+
+
+def test_raw_event_is_not_serialised_unless_debug_is_enabled(logger, caplog):
+    log_invocation(logger, {'detail': {}, 'payload': Unserialisable()}, Context())
+
+    assert not caplog.records
+
+
+def test_raw_event_debug_is_sampled_and_truncated(logger, caplog, monkeypatch):
+    logger.setLevel(logging.DEBUG)
+    monkeypatch.setattr(logs, 'LOG_EVENT_MAX_CHARS', 20)
+
+    with caplog.at_level(logging.DEBUG, logger='test_logs'):
+        log_invocation(logger, {'blob': 'x' * 100}, Context())
+        monkeypatch.setattr(logs, 'LOG_EVENT_SAMPLE_RATE', 0)
+        log_invocation(logger, {'blob': 'x' * 100}, Context())
+
+    assert len(caplog.records) == 1
+    assert caplog.records[0].getMessage().endswith('... (111 chars)')
+
+
+def test_lazy_arguments_are_computed_only_when_emitted(logger, caplog):
+    calls = []
+
+    with caplog.at_level(logging.INFO, logger='test_logs'):
+        logger.debug('Index: %s', Lazy(lambda: calls.append('debug')))
+        logger.info('Index: %s', Lazy(lambda: calls.append('info') or 'built'))
+
+    # Every handler formats the record again, but a disabled level never does
+    assert 'debug' not in calls and 'info' in calls
+    assert caplog.records[0].getMessage() == 'Index: built'
+
+
+def test_worker_threads_keep_the_callers_ids():
+    with correlation(attachment_id='tgw-attach-1'):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            seen = list(executor.map(in_current_context(lambda n: correlation_ids()), range(4)))
+
+    assert all(ids == {'attachment_id': 'tgw-attach-1'} for ids in seen)
+    assert correlation_ids() == {}
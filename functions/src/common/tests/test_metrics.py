@@ -0,0 +1,119 @@
+import io
+import json
+import os
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from moto import mock_aws
+
+import metrics
+from clients import clear_clients, get_client
+from metrics import ApiCallRecorder, emf_documents, instrument_client, record_api_calls
+
+THROTTLED = (b'<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Request limit exceeded.'
+             b'</Message></Error></Errors><RequestID>1</RequestID></Response>')
+DESCRIBED = (b'<DescribeTransitGatewaysResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">'
+             b'<requestId>2</requestId><transitGatewaySet/></DescribeTransitGatewaysResponse>')
+
+
+class RawBody:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class Context:
+    function_name = 'dev-tgw-accepter'
+
+
+@pytest.fixture(autouse=True)
+def aws_credentials():
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-west-2'
+    clear_clients()
+    metrics.recorder.reset()
+    yield
+    clear_clients()
+
+
+def test_throttled_attempts_and_retries_are_counted():
+    recorder = ApiCallRecorder()
+    ec2 = boto3.client('ec2', region_name='us-west-2',
+                       config=Config(retries={'mode': 'standard', 'max_attempts': 3}))
+    instrument_client(ec2, recorder)
+    responses = [(503, THROTTLED), (200, DESCRIBED)]
+
+    def send(request, **kwargs):
+        status, body = responses.pop(0)
+        return AWSResponse(request.url, status, {}, RawBody(body))
+
+    ec2.meta.events.register('before-send.ec2', send)
+
+    ec2.describe_transit_gateways()
+
+    stats = recorder.operations()['ec2.DescribeTransitGateways']
+    assert (stats.calls, stats.attempts, stats.retries, stats.throttles, stats.errors) == (1, 2, 1, 1, 0)
+    assert stats.latency_ms > 0
+
+
+@mock_aws
+def test_handler_result_and_emf_lines_cover_one_invocation(capsys):
+    @record_api_calls(attach_to_result=True)
+    def handler(event, context):
+        ec2 = get_client('ec2', 'us-west-2')
+        for _ in range(event['calls']):
+            ec2.describe_transit_gateways()
+        return {'result': 'SUCCESS'}
+
+    handler({'calls': 3}, Context())
+    capsys.readouterr()
+    result = handler({'calls': 2}, Context())
+
+    assert result['api_calls']['total']['calls'] == 2
+    assert result['api_calls']['operations']['ec2.DescribeTransitGateways']['calls'] == 2
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [line.get('Operation') for line in lines] == ['ec2.DescribeTransitGateways', None]
+    assert lines[-1]['FunctionName'] == 'dev-tgw-accepter'
+    assert lines[-1]['Calls'] == 2
+
+
+def test_results_are_left_alone_by_default():
+    @record_api_calls
+    def handler(event, context):
+        return {'result': 'SUCCESS'}
+
+    assert handler({}, Context()) == {'result': 'SUCCESS'}
+
+
+def test_metrics_are_emitted_when_the_handler_raises(monkeypatch):
+    out = io.StringIO()
+    monkeypatch.setattr(metrics.sys, 'stdout', out)
+
+    @record_api_calls
+    def handler(event, context):
+        metrics.recorder.record_call('ec2.AcceptTransitGatewayVpcAttachment', 5.0, 0, True)
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        handler({}, Context())
+
+    assert json.loads(out.getvalue().splitlines()[-1])['Errors'] == 1
+
+
+def test_emf_documents_declare_their_metrics():
+    recorder = ApiCallRecorder()
+    recorder.record_call('ec2.GetIpamResourceCidrs', 12.5, 1, False)
+
+    documents = emf_documents('fn', recorder.operations(), namespace='Test', timestamp_ms=1)
+
+    directive = documents[0]['_aws']['CloudWatchMetrics'][0]
+    assert directive['Namespace'] == 'Test'
+    assert directive['Dimensions'] == [['FunctionName', 'Operation']]
+    assert {m['Name'] for m in directive['Metrics']} <= set(documents[0])
+    assert documents[1]['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['FunctionName']]
+    assert documents[1]['Retries'] == 1
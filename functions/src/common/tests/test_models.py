@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import models
+from models import TGW, CloudTrailEvent, TGWAttachment
+
+
+def _event(response_key='CreateTransitGatewayVpcAttachmentResponse'):
+    return {
+        'detail-type': 'AWS API Call via CloudTrail',
+        'detail': {
+            'eventName': response_key[:-len('Response')],
+            'responseElements': {
+                response_key: {
+                    'transitGatewayVpcAttachment': {
+                        'vpcOwnerId': '111111111111',
+                        'vpcId': 'vpc-1',
+                        'transitGatewayAttachmentId': 'tgw-attach-1',
+                        'transitGatewayId': 'tgw-1',
+                        'state': 'pendingAcceptance',
+                    }
+                }
+            }
+        },
+        # Earlier state machine steps add their results next to the event
+        'IAMValidationPayload': {'Payload': {'result': 'SUCCESS'}, 'StatusCode': 200},
+    }
+
+
+@pytest.mark.parametrize('raw', [
+    _event(),
+    json.dumps(_event()),
+    json.dumps(_event()).encode(),
+])
+def test_from_raw_accepts_dict_string_and_bytes(raw):
+    ct_event = CloudTrailEvent.from_raw(raw)
+
+    assert ct_event.detail_type == 'AWS API Call via CloudTrail'
+    assert TGWAttachment.from_event(ct_event) == TGWAttachment('111111111111', 'vpc-1', 'tgw-attach-1', 'pendingAcceptance')
+
+
+def test_from_raw_rejects_other_types():
+    with pytest.raises(TypeError):
+        CloudTrailEvent.from_raw(None)
+
+
+@pytest.mark.parametrize('response_key', models.ATTACHMENT_RESPONSE_KEYS)
+def test_attachment_and_tgw_share_one_extraction(response_key):
+    ct_event = CloudTrailEvent.from_raw(_event(response_key))
+
+    assert TGW.from_event(ct_event).tgw_id == 'tgw-1'
+    first = ct_event.vpc_attachment()
+    assert TGWAttachment.from_event(ct_event).attachment_id == 'tgw-attach-1'
+    assert ct_event.vpc_attachment() is first
+
+
+def test_unsupported_event_raises_value_error():
+    ct_event = CloudTrailEvent.from_raw({'detail': {'responseElements': {'DeleteVpcResponse': {}}}})
+
+    with pytest.raises(ValueError):
+        TGWAttachment.from_event(ct_event)
+    with pytest.raises(ValueError):
+        TGW.from_event(CloudTrailEvent.from_raw({'detail': {}}))
+
+
+def test_models_are_slotted():
+    ct_event = CloudTrailEvent.from_raw(_event())
+
+    assert not hasattr(ct_event, '__dict__')
+    assert not hasattr(TGWAttachment.from_event(ct_event), '__dict__')
@@ -0,0 +1,165 @@
+import pytest
+
+from pool_index import PoolIndex
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakePaginator:
+    def __init__(self, ec2):
+        self.ec2 = ec2
+
+    def paginate(self, IpamPoolId):
+        self.ec2.calls.append(IpamPoolId)
+        allocations = [{'ResourceId': r, 'ResourceType': 'vpc'} for r in self.ec2.pools.get(IpamPoolId, [])]
+        # Two allocations per page to exercise pagination
+        for i in range(0, max(len(allocations), 1), 2):
+            yield {'IpamPoolAllocations': allocations[i:i + 2]}
+
+
+class FakeEc2:
+    """Minimal EC2 stand-in; moto does not implement get_ipam_pool_allocations."""
+
+    def __init__(self, pools):
+        self.pools = pools
+        self.calls = []
+
+    def get_paginator(self, operation_name):
+        assert operation_name == 'get_ipam_pool_allocations'
+        return FakePaginator(self)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_find_pool_builds_index_once(clock):
+    ec2 = FakeEc2({'pool-a': ['vpc-1', 'vpc-2', 'vpc-3'], 'pool-b': ['vpc-4']})
+    index = PoolIndex(ttl_seconds=60, lookup_mode='scan', clock=clock)
+
+    assert index.find_pool(ec2, 'vpc-9', ['pool-a', 'pool-b']) is None
+    assert sorted(ec2.calls) == ['pool-a', 'pool-b']
+
+    # Both pools were listed in full, so warm lookups need no API calls
+    assert index.find_pool(ec2, 'vpc-2', ['pool-a', 'pool-b']) == 'pool-a'
+    assert index.find_pool(ec2, 'vpc-4', ['pool-a', 'pool-b']) == 'pool-b'
+    assert sorted(ec2.calls) == ['pool-a', 'pool-b']
+
+
+def test_find_pool_honours_pool_priority(clock):
+    index = PoolIndex(ttl_seconds=60, lookup_mode='scan', clock=clock)
+    index.replace_pool('pool-a', ['vpc-1'])
+    index.replace_pool('pool-b', ['vpc-1'])
+
+    assert index.lookup('vpc-1', ['pool-b', 'pool-a']) == 'pool-b'
+    assert index.lookup('vpc-1', ['pool-a', 'pool-b']) == 'pool-a'
+
+
+def test_expired_entries_are_scanned_again(clock):
+    ec2 = FakeEc2({'pool-a': ['vpc-1']})
+    index = PoolIndex(ttl_seconds=60, lookup_mode='scan', clock=clock)
+    assert index.find_pool(ec2, 'vpc-1', ['pool-a']) == 'pool-a'
+    assert index.find_pool(ec2, 'vpc-1', ['pool-a']) == 'pool-a'
+    assert ec2.calls == ['pool-a']
+
+    clock.now = 61
+    assert index.find_pool(ec2, 'vpc-1', ['pool-a']) == 'pool-a'
+    assert ec2.calls == ['pool-a', 'pool-a']
+
+
+def test_miss_picks_up_new_allocations(clock):
+    ec2 = FakeEc2({'pool-a': ['vpc-1']})
+    index = PoolIndex(ttl_seconds=60, lookup_mode='scan', clock=clock)
+    index.find_pool(ec2, 'vpc-1', ['pool-a'])
+
+    ec2.pools['pool-a'] = ['vpc-1', 'vpc-new']
+    assert index.find_pool(ec2, 'vpc-new', ['pool-a']) == 'pool-a'
+
+
+def test_removed_allocations_are_dropped(clock):
+    ec2 = FakeEc2({'pool-a': ['vpc-1', 'vpc-2']})
+    index = PoolIndex(ttl_seconds=60, lookup_mode='scan', clock=clock)
+    index.refresh_pool(ec2, 'pool-a')
+
+    ec2.pools['pool-a'] = ['vpc-1']
+    index.refresh_pool(ec2, 'pool-a')
+
+    assert index.lookup('vpc-2', ['pool-a']) is None
+    assert index.find_pool(ec2, 'vpc-2', ['pool-a']) is None
+
+
+class TargetedEc2(FakeEc2):
+    """Adds the IPAM resource-scoped calls used by the targeted lookup mode."""
+
+    def __init__(self, pools, resource_cidrs, scope_arn='arn:aws:ec2::123456789012:ipam-scope/ipam-scope-1'):
+        super().__init__(pools)
+        self.resource_cidrs = resource_cidrs
+        self.scope_arn = scope_arn
+        self.operations = []
+
+    def get_paginator(self, operation_name):
+        self.operations.append(operation_name)
+        if operation_name == 'describe_ipam_pools':
+            return self._Pages(lambda IpamPoolIds: [{'IpamPools': [
+                {'IpamPoolId': p, 'IpamScopeArn': self.scope_arn} for p in IpamPoolIds
+            ]}])
+        if operation_name == 'get_ipam_resource_cidrs':
+            return self._Pages(lambda IpamScopeId, ResourceId: [{'IpamResourceCidrs': [
+                c for c in self.resource_cidrs if c['ResourceId'] == ResourceId
+            ]}])
+        return super().get_paginator(operation_name)
+
+    class _Pages:
+        def __init__(self, pages):
+            self.pages = pages
+
+        def paginate(self, **kwargs):
+            return iter(self.pages(**kwargs))
+
+
+def test_targeted_lookup_avoids_pool_scan(clock):
+    ec2 = TargetedEc2(
+        {'pool-a': ['vpc-1'], 'pool-b': ['vpc-2']},
+        [{'ResourceId': 'vpc-2', 'IpamPoolId': 'pool-b', 'ResourceCidr': '10.0.0.0/16'}],
+    )
+    index = PoolIndex(ttl_seconds=60, lookup_mode='targeted', clock=clock)
+
+    assert index.find_pool(ec2, 'vpc-2', ['pool-a', 'pool-b']) == 'pool-b'
+    assert 'get_ipam_pool_allocations' not in ec2.operations
+    assert ec2.calls == []
+
+
+def test_targeted_lookup_falls_back_to_scan(clock):
+    # IPAM resource discovery has not caught up with the new VPC yet
+    ec2 = TargetedEc2({'pool-a': ['vpc-new']}, [])
+    index = PoolIndex(ttl_seconds=60, lookup_mode='targeted', clock=clock)
+
+    assert index.find_pool(ec2, 'vpc-new', ['pool-a']) == 'pool-a'
+    assert ec2.calls == ['pool-a']
+
+
+def test_targeted_lookup_ignores_unconfigured_pools(clock):
+    ec2 = TargetedEc2(
+        {'pool-a': []},
+        [{'ResourceId': 'vpc-3', 'IpamPoolId': 'pool-other', 'ResourceCidr': '10.1.0.0/16'}],
+    )
+    index = PoolIndex(ttl_seconds=60, lookup_mode='targeted', clock=clock)
+
+    assert index.find_pool(ec2, 'vpc-3', ['pool-a']) is None
+
+
+def test_find_pools_lists_each_pool_once_for_a_batch(clock):
+    ec2 = FakeEc2({'pool-a': ['vpc-1', 'vpc-2'], 'pool-b': ['vpc-3']})
+    index = PoolIndex(ttl_seconds=60, lookup_mode='scan', clock=clock)
+
+    pools = index.find_pools(ec2, ['vpc-1', 'vpc-3', 'vpc-9'], ['pool-a', 'pool-b'])
+
+    assert pools == {'vpc-1': 'pool-a', 'vpc-3': 'pool-b', 'vpc-9': None}
+    assert sorted(ec2.calls) == ['pool-a', 'pool-b']
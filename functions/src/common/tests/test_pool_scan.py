@@ -0,0 +1,78 @@
+import threading
+
+from pool_scan import scan_pools
+
+
+class PagedEc2:
+    """EC2 stand-in serving one allocation per page and recording pages served."""
+
+    def __init__(self, pools, gates=None):
+        self.pools = pools
+        self.gates = gates or {}
+        self.pages_served = {}
+        self._lock = threading.Lock()
+
+    def get_paginator(self, operation_name):
+        assert operation_name == 'get_ipam_pool_allocations'
+        return self
+
+    def paginate(self, IpamPoolId):
+        for resource_id in self.pools[IpamPoolId]:
+            gate = self.gates.get(IpamPoolId)
+            if gate:
+                gate.wait(timeout=5)
+            with self._lock:
+                self.pages_served[IpamPoolId] = self.pages_served.get(IpamPoolId, 0) + 1
+            yield {'IpamPoolAllocations': [{'ResourceId': resource_id}]}
+
+
+def test_scan_returns_matching_pool():
+    ec2 = PagedEc2({'pool-a': ['vpc-1', 'vpc-2'], 'pool-b': ['vpc-3']})
+    assert scan_pools(ec2, ['pool-a', 'pool-b'], 'vpc-3') == 'pool-b'
+
+
+def test_scan_returns_none_without_match():
+    completed = {}
+    ec2 = PagedEc2({'pool-a': ['vpc-1', 'vpc-2'], 'pool-b': ['vpc-3']})
+
+    assert scan_pools(ec2, ['pool-a', 'pool-b'], 'vpc-9',
+                      on_complete=lambda pool, ids: completed.update({pool: ids})) is None
+    assert completed == {'pool-a': {'vpc-1', 'vpc-2'}, 'pool-b': {'vpc-3'}}
+
+
+def test_scan_stops_later_pools_after_match():
+    gate = threading.Event()
+    completed = []
+    ec2 = PagedEc2(
+        {'pool-slow': [f'vpc-{i}' for i in range(100)], 'pool-match': ['vpc-target']},
+        gates={'pool-slow': gate},
+    )
+
+    result = scan_pools(ec2, ['pool-match', 'pool-slow'], 'vpc-target',
+                        on_complete=lambda pool, ids: completed.append(pool))
+    gate.set()
+
+    assert result == 'pool-match'
+    assert completed == []
+    assert ec2.pages_served.get('pool-slow', 0) <= 1
+
+
+def test_scan_cancels_pools_not_started():
+    ec2 = PagedEc2({'pool-a': ['vpc-target'], 'pool-b': ['vpc-1'], 'pool-c': ['vpc-2']})
+
+    assert scan_pools(ec2, ['pool-a', 'pool-b', 'pool-c'], 'vpc-target', max_workers=1) == 'pool-a'
+    assert 'pool-c' not in ec2.pages_served
+
+
+def test_scan_prefers_earlier_pool_over_faster_match():
+    gate = threading.Event()
+    ec2 = PagedEc2(
+        {'pool-first': ['vpc-1', 'vpc-2', 'vpc-target'], 'pool-second': ['vpc-target']},
+        gates={'pool-first': gate},
+    )
+    timer = threading.Timer(0.2, gate.set)
+    timer.start()
+
+    # pool-second matches while pool-first is still blocked on its first page
+    assert scan_pools(ec2, ['pool-first', 'pool-second'], 'vpc-target') == 'pool-first'
+    timer.cancel()
@@ -0,0 +1,83 @@
+from unittest.mock import patch
+
+import pytest
+
+import ipam_lookup
+from ipam_lookup import clear_pool_cache, pool_scope_ids, pool_tags
+
+SCOPE_ARN = 'arn:aws:ec2::123456789012:ipam-scope/ipam-scope-1'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeEc2:
+    """Serves describe_ipam_pools from a dict of pool ID to tags and records each call."""
+
+    def __init__(self, pools):
+        self.pools = pools
+        self.calls = []
+
+    def get_paginator(self, operation_name):
+        assert operation_name == 'describe_ipam_pools'
+        return self
+
+    def paginate(self, IpamPoolIds):
+        self.calls.append(list(IpamPoolIds))
+        yield {'IpamPools': [
+            {
+                'IpamPoolId': p,
+                'IpamScopeArn': SCOPE_ARN,
+                'Tags': [{'Key': k, 'Value': v} for k, v in self.pools[p].items()],
+            }
+            for p in IpamPoolIds if p in self.pools
+        ]}
+
+
+@pytest.fixture
+def clock():
+    clear_pool_cache()
+    fake = FakeClock()
+    with patch.object(ipam_lookup, '_clock', fake):
+        yield fake
+    clear_pool_cache()
+
+
+def test_all_configured_pools_described_in_one_call(clock):
+    ec2 = FakeEc2({'pool-a': {'rt': 'rtb-a'}, 'pool-b': {'rt': 'rtb-b'}})
+
+    assert pool_tags(ec2, 'pool-b', ['pool-a', 'pool-b'], ttl_seconds=60) == {'rt': 'rtb-b'}
+    assert pool_tags(ec2, 'pool-a', ['pool-a', 'pool-b'], ttl_seconds=60) == {'rt': 'rtb-a'}
+    assert ec2.calls == [['pool-b', 'pool-a']]
+
+
+def test_expired_tags_are_described_again(clock):
+    ec2 = FakeEc2({'pool-a': {'rt': 'rtb-a'}, 'pool-b': {'rt': 'rtb-b'}})
+    pool_tags(ec2, 'pool-a', ['pool-a', 'pool-b'], ttl_seconds=60)
+
+    ec2.pools['pool-a'] = {'rt': 'rtb-new'}
+    clock.now += 30
+    assert pool_tags(ec2, 'pool-a', ['pool-a', 'pool-b'], ttl_seconds=60) == {'rt': 'rtb-a'}
+    clock.now += 30
+    assert pool_tags(ec2, 'pool-a', ['pool-a', 'pool-b'], ttl_seconds=60) == {'rt': 'rtb-new'}
+    assert len(ec2.calls) == 2
+
+
+def test_scope_lookup_fills_tag_cache(clock):
+    ec2 = FakeEc2({'pool-a': {'rt': 'rtb-a'}})
+
+    assert pool_scope_ids(ec2, ['pool-a']) == {'pool-a': 'ipam-scope-1'}
+    assert pool_tags(ec2, 'pool-a', ['pool-a'], ttl_seconds=60) == {'rt': 'rtb-a'}
+    assert len(ec2.calls) == 1
+
+
+def test_unknown_pool_raises(clock):
+    ec2 = FakeEc2({'pool-a': {}})
+
+    with pytest.raises(ValueError):
+        pool_tags(ec2, 'pool-x', ['pool-a'], ttl_seconds=60)
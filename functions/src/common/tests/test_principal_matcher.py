@@ -0,0 +1,80 @@
+import fnmatch
+import random
+
+import pytest
+
+from principal_matcher import PrincipalMatcher, translate
+
+
+def _first_match(identity, patterns):
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(identity, pattern):
+            return pattern
+    return None
+
+
+def test_exact_prefix_and_wildcard_patterns():
+    matcher = PrincipalMatcher([
+        'arn:aws:iam::111111111111:role/admin',
+        'arn:aws:iam::222222222222:role/network-*',
+        'arn:aws:iam::*:role/tgw-?-attacher',
+        'AROA[A-Z]*',
+    ])
+
+    assert matcher.match('arn:aws:iam::111111111111:role/admin') == 'arn:aws:iam::111111111111:role/admin'
+    assert matcher.match('arn:aws:iam::111111111111:role/admin2') is None
+    assert matcher.match('arn:aws:iam::222222222222:role/network-') == 'arn:aws:iam::222222222222:role/network-*'
+    assert matcher.match('arn:aws:iam::333333333333:role/tgw-a-attacher') == 'arn:aws:iam::*:role/tgw-?-attacher'
+    assert matcher.match('arn:aws:iam::333333333333:role/tgw-ab-attacher') is None
+    assert matcher.match('AROAEXAMPLE') == 'AROA[A-Z]*'
+    assert matcher.match('AROA1EXAMPLE') is None
+    assert matcher.match('') is None
+
+
+def test_first_listed_pattern_wins():
+    patterns = ['arn:aws:iam::*:role/*', 'arn:aws:iam::111111111111:*', 'arn:aws:iam::111111111111:role/admin', '*']
+    matcher = PrincipalMatcher(patterns)
+
+    assert matcher.match('arn:aws:iam::111111111111:role/admin') == 'arn:aws:iam::*:role/*'
+    assert matcher.match('arn:aws:iam::111111111111:user/bob') == 'arn:aws:iam::111111111111:*'
+    assert matcher.match('123456789012') == '*'
+
+
+@pytest.mark.parametrize('pattern', ['a*b*c', '[!x]y', '[]]', '[^a]', 'a[', 'a.b+c', 'a\\b'])
+def test_translate_matches_fnmatch(pattern):
+    for identity in ['abc', 'aXbYc', 'zy', 'xy', ']', '^', 'b', 'a[', 'a.b+c', 'a\\b', 'ab']:
+        assert (PrincipalMatcher([pattern]).match(identity) is not None) == fnmatch.fnmatchcase(identity, pattern), identity
+    assert translate(pattern)
+
+
+@pytest.mark.parametrize('pattern', ['[b-^]x', '[z-a]', '[a-c-e]', '[--]', '[[]', '[a&&b]', '[~~]', '[||]', '[!]'])
+def test_translate_handles_sets_like_fnmatch(pattern, recwarn):
+    for identity in ['bx', '^x', 'a', 'd', '-', '[', '&', 'b', '~', '|', '!', 'z']:
+        assert (PrincipalMatcher([pattern]).match(identity) is not None) == fnmatch.fnmatchcase(identity, pattern), identity
+    assert not [w for w in recwarn if issubclass(w.category, FutureWarning)]
+
+
+def test_matches_linear_fnmatch_scan():
+    rng = random.Random(7)
+    accounts = [f'{n:012d}' for n in range(20)]
+    roles = ['admin', 'network-admin', 'network-ops', 'tgw-attacher', 'readonly']
+
+    def arn(account, role):
+        return f'arn:aws:iam::{account}:role/{role}'
+
+    patterns = []
+    for _ in range(300):
+        account, role = rng.choice(accounts), rng.choice(roles)
+        patterns.append(rng.choice([
+            arn(account, role),
+            arn(account, role[:rng.randint(0, len(role))] + '*'),
+            arn('*', role),
+            arn(account[:6] + '?' * 6, role),
+            arn(account, '[a-n]*'),
+        ]))
+    matcher = PrincipalMatcher(patterns)
+
+    for account in accounts + ['999999999999']:
+        for role in roles + ['other']:
+            identity = arn(account, role)
+            assert matcher.match(identity) == _first_match(identity, patterns), identity
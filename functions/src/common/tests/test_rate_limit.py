@@ -0,0 +1,172 @@
+import threading
+from unittest.mock import patch
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+
+import rate_limit
+from kvstore import MemoryStore, SQLiteStore
+from rate_limit import IPAM, MUTATING, NON_MUTATING, Bucket, RateLimiter, category_of, parse_limits
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    return MemoryStore() if request.param == 'memory' else SQLiteStore(str(tmp_path / 'state.db'))
+
+
+def limiter(store, clock, max_wait_seconds=30, **limits):
+    return RateLimiter(store, {category: Bucket(*bucket) for category, bucket in limits.items()},
+                       max_wait_seconds=max_wait_seconds, clock=clock, sleep=clock.sleep)
+
+
+def test_operations_are_categorised():
+    assert category_of('AcceptTransitGatewayVpcAttachment') == MUTATING
+    assert category_of('EnableTransitGatewayRouteTablePropagation') == MUTATING
+    assert category_of('DescribeTransitGatewayAttachments') == NON_MUTATING
+    assert category_of('GetIpamPoolAllocations') == IPAM
+
+
+def test_limits_are_parsed_and_validated():
+    assert parse_limits('') == {}
+    assert parse_limits('{"mutating": {"rate": 5, "burst": 10}, "ipam": {"rate": 2}}') == {
+        MUTATING: Bucket(5, 10), IPAM: Bucket(2, 2)}
+    with pytest.raises(ValueError):
+        parse_limits('{"writes": {"rate": 5}}')
+    with pytest.raises(ValueError):
+        parse_limits('{"mutating": {"rate": 0, "burst": 10}}')
+    assert parse_limits('{"mutating": {"rate": 5, "burst": 10, "reserve": 3}}') == {MUTATING: Bucket(5, 10, 3)}
+    with pytest.raises(ValueError):
+        parse_limits('{"mutating": {"rate": 5, "burst": 10, "reserve": 11}}')
+
+
+def test_burst_is_free_then_callers_wait_for_the_refill(store):
+    clock = FakeClock()
+    limits = limiter(store, clock, mutating=(2, 3))
+
+    waits = [limits.acquire(MUTATING) for _ in range(5)]
+
+    assert waits[:3] == [0, 0, 0]
+    # Refilling at 2 tokens per second, each further call waits about half a second
+    assert all(0.4 <= wait <= 0.6 for wait in waits[3:])
+    assert 1.0 <= clock.now - 1000 <= 1.2
+    assert limits.acquire(NON_MUTATING) == 0
+
+
+def test_callers_share_the_bucket_through_the_store(store):
+    clock = FakeClock()
+    first, second = limiter(store, clock, ipam=(1, 2)), limiter(store, clock, ipam=(1, 2))
+
+    first.acquire(IPAM)
+    second.acquire(IPAM)
+
+    assert second.acquire(IPAM) > 0
+
+
+def test_caller_gives_up_waiting_after_max_wait(store):
+    clock = FakeClock()
+    limits = limiter(store, clock, max_wait_seconds=2, mutating=(0.1, 1))
+
+    limits.acquire(MUTATING)
+
+    assert limits.acquire(MUTATING) == 0
+    assert clock.slept == []
+
+
+class ConflictingStore(MemoryStore):
+    """Loses the first conditional writes, as if other callers took the token in between."""
+
+    def __init__(self, conflicts):
+        super().__init__()
+        self.conflicts = conflicts
+        self.writes = 0
+
+    def put(self, key, value, **kwargs):
+        self.writes += 1
+        if self.conflicts:
+            self.conflicts -= 1
+            return False
+        return super().put(key, value, **kwargs)
+
+
+def test_lost_writes_back_off_with_growing_jitter():
+    clock = FakeClock()
+    store = ConflictingStore(conflicts=4)
+
+    with patch.object(rate_limit.random, 'random', return_value=0.5):
+        limiter(store, clock, mutating=(1, 10)).acquire(MUTATING)
+
+    assert store.writes == 5
+    assert clock.slept == pytest.approx([0.01, 0.02, 0.04, 0.08])
+    assert store.get('ratelimit#mutating').value['tokens'] == 9
+
+
+def test_reserved_tokens_are_used_before_the_bucket_is_written_again():
+    clock = FakeClock()
+    store = ConflictingStore(conflicts=0)
+    limits = limiter(store, clock, mutating=(2, 10, 3))
+
+    waits = [limits.acquire(MUTATING) for _ in range(4)]
+
+    assert waits == [0, 0, 0, 0]
+    assert store.writes == 2
+    assert store.get('ratelimit#mutating').value['tokens'] == 4
+    # Reserved tokens expire once the bucket would have refilled them
+    clock.now += 2
+    limits.acquire(MUTATING)
+    assert store.writes == 3
+
+
+def test_concurrent_callers_never_take_the_same_token(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'state.db'))
+    # Nothing refills while the callers race
+    limits = RateLimiter(store, {MUTATING: Bucket(0.001, 20)}, max_wait_seconds=0)
+    threads = [threading.Thread(target=limits.acquire, args=(MUTATING,)) for _ in range(20)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.get('ratelimit#mutating').value['tokens'] < 1
+
+
+def test_ec2_client_calls_take_tokens():
+    store = MemoryStore()
+    client = boto3.client('ec2', region_name='us-east-1', aws_access_key_id='a', aws_secret_access_key='b')
+    RateLimiter(store, {MUTATING: Bucket(1, 10)}).install(client)
+    # Answer every request without sending it, after the before-call hooks ran
+    client.meta.events.register('before-send.ec2', lambda request, **kwargs: AWSResponse(
+        request.url, 200, {}, type('Raw', (), {'stream': lambda self, **kwargs: iter([b'<Response/>'])})()))
+
+    client.describe_transit_gateways()
+    client.create_tags(Resources=['tgw-attach-1'], Tags=[{'Key': 'Name', 'Value': 'spoke'}])
+
+    assert store.get('ratelimit#mutating').value['tokens'] == pytest.approx(9, abs=0.1)
+    assert store.get('ratelimit#non_mutating') is None
+
+
+def test_only_ec2_clients_are_limited():
+    sts = boto3.client('sts', region_name='us-east-1', aws_access_key_id='a', aws_secret_access_key='b')
+    ec2 = boto3.client('ec2', region_name='us-east-1', aws_access_key_id='a', aws_secret_access_key='b')
+
+    with patch.object(rate_limit, 'EC2_RATE_LIMITS', '{"mutating": {"rate": 5}}'), \
+            patch.object(rate_limit, '_limiter', None), \
+            patch('kvstore.store_from_env', return_value=MemoryStore()):
+        assert not rate_limit.install_rate_limiter(sts)
+        assert rate_limit.install_rate_limiter(ec2)
+    with patch.object(rate_limit, 'EC2_RATE_LIMITS', ''):
+        assert not rate_limit.install_rate_limiter(ec2)
@@ -0,0 +1,110 @@
+import ipaddress
+import random
+
+from route_trie import RouteTrie, load_route_table, route_table_impact, search_routes
+
+
+def _route(cidr, attachment_id='tgw-attach-other', route_type='propagated'):
+    return {
+        'DestinationCidrBlock': cidr,
+        'Type': route_type,
+        'State': 'active',
+        'TransitGatewayAttachments': [{'TransitGatewayAttachmentId': attachment_id, 'ResourceType': 'vpc'}],
+    }
+
+
+class FakeEc2:
+    """Applies the route search filters to a list of routes and truncates the results like EC2."""
+
+    def __init__(self, routes, page_size):
+        self.routes = routes
+        self.page_size = page_size
+        self.searches = []
+
+    def search_transit_gateway_routes(self, TransitGatewayRouteTableId, Filters, MaxResults):
+        matches = self.routes
+        for f in Filters:
+            if f['Name'].startswith('route-search.'):
+                network = ipaddress.ip_network(f['Values'][0])
+                self.searches.append((f['Name'], f['Values'][0]))
+                if f['Name'] == 'route-search.exact-match':
+                    matches = [r for r in matches if r['DestinationCidrBlock'] == str(network)]
+                else:
+                    matches = [r for r in matches if _strict_subnet_of(r['DestinationCidrBlock'], network)]
+        limit = min(self.page_size, MaxResults)
+        return {'Routes': matches[:limit], 'AdditionalRoutesAvailable': len(matches) > limit}
+
+
+def _strict_subnet_of(cidr, network):
+    route = ipaddress.ip_network(cidr)
+    return route.version == network.version and route != network and route.subnet_of(network)
+
+
+def test_trie_answers_prefix_queries():
+    trie = RouteTrie()
+    for cidr in ['0.0.0.0/0', '10.0.0.0/8', '10.1.0.0/16', '10.1.2.0/24', '10.2.0.0/16', '2001:db8::/32']:
+        trie.insert(cidr, cidr)
+
+    assert len(trie) == 6
+    assert trie.longest_prefix_match('10.1.2.3') == '10.1.2.0/24'
+    assert trie.longest_prefix_match('10.3.0.1') == '10.0.0.0/8'
+    assert trie.longest_prefix_match('2001:db8::1') == '2001:db8::/32'
+    assert trie.longest_prefix_match('2001:db9::1') is None
+    assert trie.supernets('10.1.0.0/16') == ['0.0.0.0/0', '10.0.0.0/8', '10.1.0.0/16']
+    assert trie.subnets('10.0.0.0/8') == ['10.1.0.0/16', '10.1.2.0/24', '10.2.0.0/16']
+    assert trie.subnets('10.1.2.0/24') == []
+
+
+def test_trie_agrees_with_pairwise_comparison():
+    rng = random.Random(11)
+    trie = RouteTrie()
+    cidrs = set()
+    for _ in range(300):
+        network = ipaddress.ip_network((0x0A000000 | rng.getrandbits(16) << 8, rng.randint(8, 24)), strict=False)
+        cidrs.add(network)
+        trie.insert(str(network), network)
+
+    for _ in range(200):
+        query = ipaddress.ip_network((0x0A000000 | rng.getrandbits(24), rng.randint(8, 28)), strict=False)
+        containing = sorted((c for c in cidrs if query.subnet_of(c)), key=lambda c: c.prefixlen)
+        assert trie.supernets(str(query)) == containing
+        assert set(trie.subnets(str(query))) == {c for c in cidrs if c != query and c.subnet_of(query)}
+
+
+def test_truncated_searches_are_split_until_they_fit():
+    routes = [_route(f'10.{i}.0.0/16') for i in range(20)] + [_route('0.0.0.0/0'), _route('2001:db8::/32')]
+    ec2 = FakeEc2(routes, page_size=4)
+
+    found = search_routes(ec2, 'tgw-rtb-1')
+
+    assert sorted(r['DestinationCidrBlock'] for r in found) == sorted(r['DestinationCidrBlock'] for r in routes)
+    assert ('route-search.exact-match', '0.0.0.0/0') in ec2.searches
+    assert len(load_route_table(ec2, 'tgw-rtb-1')) == 22
+
+
+def test_untruncated_search_is_a_single_call():
+    ec2 = FakeEc2([_route('10.0.0.0/16')], page_size=4)
+
+    assert len(search_routes(ec2, 'tgw-rtb-1')) == 1
+    assert ec2.searches == []
+
+
+def test_impact_classifies_routes_against_vpc_cidrs():
+    trie = RouteTrie()
+    for route in [
+        _route('0.0.0.0/0', 'tgw-attach-egress', 'static'),
+        _route('10.0.0.0/8', 'tgw-attach-inspection', 'static'),
+        _route('10.1.0.0/16', 'tgw-attach-new'),
+        _route('10.1.4.0/24', 'tgw-attach-legacy'),
+        _route('10.2.0.0/16', 'tgw-attach-other', 'static'),
+    ]:
+        trie.insert(route['DestinationCidrBlock'], route)
+
+    impact = route_table_impact(trie, 'tgw-rtb-1', ['10.1.0.0/16', '10.2.0.0/16'], 'tgw-attach-new')
+
+    assert [(r['cidr'], r['route']) for r in impact.shadows] == [
+        ('10.1.0.0/16', '10.0.0.0/8'), ('10.2.0.0/16', '10.0.0.0/8')]
+    assert [(r['cidr'], r['route'], r['type']) for r in impact.exact] == [('10.2.0.0/16', '10.2.0.0/16', 'static')]
+    assert [(r['route'], r['attachments']) for r in impact.shadowed_by] == [('10.1.4.0/24', ['tgw-attach-legacy'])]
+    assert len(impact.conflicts) == 2
+    assert impact.to_dict()['routes'] == 5
@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+from typing import Any, Dict, List
+
+# Import shared modules from common layer
+from batch_accept import ACCEPTED, BatchAccepter, GroupResult
+from clients import get_client, prewarm_clients
+from coalesce import CoalescingReport, GroupReport, TGWGroup, coalesce_by_tgw, sqs_items
+from validation import parse_list
+from logs import configure_logging, correlation, log_invocation
+from metrics import API_METRICS_NAMESPACE, record_api_calls
+
+# Configure logging
+logger = configure_logging()
+
+# Environment variables
+region_env = os.environ.get('AWS_REGION', 'eu-north-1')
+allowed_principal_patterns = parse_list(os.environ.get('ALLOWED_PRINCIPAL_PATTERNS', ''))
+ipam_pool_ids = parse_list(os.environ.get('IPAM_POOL_IDS', ''))
+cidr_overlap_check_enabled = os.environ.get('CIDR_OVERLAP_CHECK_ENABLED', 'false').lower() == 'true'
+attachment_tag_key = os.environ.get('ATTACHMENT_TAG_KEY', '')
+attachment_tag_value = os.environ.get('ATTACHMENT_TAG_VALUE', '')
+max_workers = int(os.environ.get('ACCEPT_MAX_WORKERS', '8'))
+sns_topic_arn = os.environ.get('SNS_TOPIC_ARN')
+# Batching window of the queue, the latency coalescing is expected to add
+coalesce_window_seconds = float(os.environ.get('COALESCE_WINDOW_SECONDS', '10'))
+
+# Queue polling and invocation overhead on top of the window
+COALESCE_LATENCY_GRACE_SECONDS = 5
+
+prewarm_clients([('ec2', region_env)])
+
+
+@record_api_calls
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Lambda function to validate and accept a batch of queued attachment create events.
+
+    Args:
+        event: SQS event whose record bodies are EventBridge CloudTrail events
+        context: Lambda context object
+
+    Returns:
+        SQS partial batch response listing the messages to retry
+    """
+    records = event.get('Records', [])
+    log_invocation(logger, event, context)
+    logger.info('Lambda invocation started with %d records', len(records))
+
+    attachment_tag = (attachment_tag_key, attachment_tag_value) if attachment_tag_key and attachment_tag_value else None
+    accepter = BatchAccepter(
+        get_client('ec2', region_env),
+        allowed_principal_patterns,
+        ipam_pool_ids,
+        attachment_tag=attachment_tag,
+        max_workers=max_workers,
+        cidr_overlap_check=cidr_overlap_check_enabled,
+    )
+    groups = coalesce_by_tgw(sqs_items(records))
+    _report_coalescing(groups, context)
+    group_results = accepter.process_groups(groups)
+    results = [result for group_result in group_results for result in group_result.results]
+
+    summary = {}
+    for result in results:
+        summary[result.result] = summary.get(result.result, 0) + 1
+        log = logger.info if result.result == ACCEPTED else logger.warning
+        log(f"{result.item_id}: {result.result} {result.attachment_id} - {result.message}")
+    _report_groups(groups, group_results, context)
+    logger.info("Batch completed: %s", summary)
+
+    if sns_topic_arn:
+        _publish_summary(summary, [r.to_dict() for r in results])
+
+    return {
+        'batchItemFailures': [{'itemIdentifier': r.item_id} for r in results if r.retryable]
+    }
+
+
+def _report_coalescing(groups: List[TGWGroup], context: Any) -> None:
+    """Log how the batch was grouped per TGW and how long its events waited, also as EMF metrics."""
+    report = CoalescingReport.of(groups)
+    logger.info("Coalesced %d events into %d TGW groups, largest %d, oldest event queued %.1f s ago",
+                report.events, report.groups, report.largest_group, report.max_delay_seconds)
+    if report.max_delay_seconds > coalesce_window_seconds + COALESCE_LATENCY_GRACE_SECONDS:
+        # Longer than the window means messages queued behind busy invocations
+        logger.warning("Events waited %.1f s with a %.0f s window, the batch accepter is not keeping up with the queue",
+                       report.max_delay_seconds, coalesce_window_seconds)
+    _emit_metrics([report], context)
+
+
+def _report_groups(groups: List[TGWGroup], group_results: List[GroupResult], context: Any) -> None:
+    """Log the outcome of each TGW group, also as EMF metrics with the TGW as a dimension."""
+    reports = [GroupReport.of(group, group_result.counts()) for group, group_result in zip(groups, group_results)]
+    for report in reports:
+        with correlation(transit_gateway_id=report.tgw_id):
+            logger.info("%s: %s", report.tgw_id or 'Unparsable events', report.outcomes)
+    _emit_metrics(reports, context)
+
+
+def _emit_metrics(reports: list, context: Any) -> None:
+    if not API_METRICS_NAMESPACE:
+        return
+    function_name = getattr(context, 'function_name', None) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+    try:
+        for report in reports:
+            sys.stdout.write(report.emf_document(function_name, API_METRICS_NAMESPACE) + '\n')
+        sys.stdout.flush()
+    except Exception as e:
+        logger.warning("Failed to emit coalescing metrics: %s", e)
+
+
+def _publish_summary(summary: Dict[str, int], results: list) -> None:
+    """Publish one notification for the whole batch instead of one per attachment."""
+    from botocore.exceptions import ClientError
+
+    try:
+        get_client('sns', region_env).publish(
+            TopicArn=sns_topic_arn,
+            Subject='TGW attachment batch processed',
+            Message=json.dumps({'summary': summary, 'results': results}),
+        )
+    except ClientError as e:
+        logger.error('Failed to publish batch summary to SNS: %s', e)
@@ -0,0 +1,170 @@
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+# Set environment variables before importing the handler
+os.environ['LOG_LEVEL'] = 'DEBUG'
+os.environ['ALLOWED_PRINCIPAL_PATTERNS'] = 'arn:aws:iam::111111111111:role/network-*'
+os.environ['IPAM_POOL_IDS'] = ''
+os.environ['ATTACHMENT_TAG_KEY'] = 'AcceptedBy'
+os.environ['ATTACHMENT_TAG_VALUE'] = 'Batch'
+
+from handler import lambda_handler
+
+region = 'us-west-2'
+
+
+@pytest.fixture
+def aws_credentials():
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = region
+
+
+@pytest.fixture
+def sqs(aws_credentials):
+    with mock_aws():
+        yield boto3.client('sqs', region_name=region)
+
+
+def _create_event(attachment_id, principal='arn:aws:iam::111111111111:role/network-admin', state='pendingAcceptance',
+                  tgw_id='tgw-1'):
+    return {
+        'detail-type': 'AWS API Call via CloudTrail',
+        'detail': {
+            'eventName': 'CreateTransitGatewayVpcAttachment',
+            'userIdentity': {'type': 'AssumedRole', 'arn': principal},
+            'responseElements': {
+                'CreateTransitGatewayVpcAttachmentResponse': {
+                    'transitGatewayVpcAttachment': {
+                        'vpcOwnerId': '111111111111',
+                        'vpcId': f'vpc-{attachment_id}',
+                        'transitGatewayAttachmentId': f'tgw-attach-{attachment_id}',
+                        'transitGatewayId': tgw_id,
+                        'state': state,
+                    }
+                }
+            }
+        }
+    }
+
+
+def _queue_batch(sqs, events):
+    """Send events through a moto SQS queue and build the Lambda SQS event from what is received."""
+    queue_url = sqs.create_queue(QueueName='tgw-accept')['QueueUrl']
+    for event in events:
+        sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(event))
+    messages = []
+    while len(messages) < len(events):
+        messages += sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10,
+                                        AttributeNames=['SentTimestamp']).get('Messages', [])
+    return {
+        'Records': [
+            {'messageId': m['MessageId'], 'receiptHandle': m['ReceiptHandle'], 'body': m['Body'],
+             'attributes': m.get('Attributes', {}), 'eventSource': 'aws:sqs'}
+            for m in messages
+        ]
+    }
+
+
+def test_batch_accepts_valid_attachments_and_tags_once(sqs):
+    sqs_event = _queue_batch(sqs, [_create_event('a'), _create_event('b'), _create_event('c')])
+    ec2 = MagicMock()
+
+    with patch('handler.get_client', return_value=ec2):
+        result = lambda_handler(sqs_event, MagicMock())
+
+    assert result == {'batchItemFailures': []}
+    accepted = sorted(c.kwargs['TransitGatewayAttachmentId'] for c in ec2.accept_transit_gateway_vpc_attachment.call_args_list)
+    assert accepted == ['tgw-attach-a', 'tgw-attach-b', 'tgw-attach-c']
+    ec2.create_tags.assert_called_once()
+    assert sorted(ec2.create_tags.call_args.kwargs['Resources']) == accepted
+
+
+def test_batch_reports_failures_per_item(sqs):
+    sqs_event = _queue_batch(sqs, [
+        _create_event('ok'),
+        _create_event('denied', principal='arn:aws:iam::222222222222:role/dev'),
+        _create_event('broken'),
+        _create_event('done', state='available'),
+    ])
+    message_ids = {json.loads(r['body'])['detail']['responseElements']['CreateTransitGatewayVpcAttachmentResponse']
+                   ['transitGatewayVpcAttachment']['transitGatewayAttachmentId']: r['messageId']
+                   for r in sqs_event['Records']}
+    ec2 = MagicMock()
+
+    def accept(TransitGatewayAttachmentId):
+        if TransitGatewayAttachmentId == 'tgw-attach-broken':
+            raise ClientError({'Error': {'Code': 'RequestLimitExceeded', 'Message': 'slow down'}}, 'AcceptTransitGatewayVpcAttachment')
+    ec2.accept_transit_gateway_vpc_attachment.side_effect = accept
+
+    with patch('handler.get_client', return_value=ec2):
+        result = lambda_handler(sqs_event, MagicMock())
+
+    # Only the throttled accept is retried; the unauthorized principal and the
+    # already available attachment are dropped
+    assert result == {'batchItemFailures': [{'itemIdentifier': message_ids['tgw-attach-broken']}]}
+    assert ec2.create_tags.call_args.kwargs['Resources'] == ['tgw-attach-ok']
+
+
+def test_duplicate_events_are_accepted_once(sqs):
+    sqs_event = _queue_batch(sqs, [_create_event('a'), _create_event('a')])
+    ec2 = MagicMock()
+
+    with patch('handler.get_client', return_value=ec2):
+        result = lambda_handler(sqs_event, MagicMock())
+
+    assert result == {'batchItemFailures': []}
+    ec2.accept_transit_gateway_vpc_attachment.assert_called_once_with(TransitGatewayAttachmentId='tgw-attach-a')
+
+
+def test_burst_is_coalesced_per_transit_gateway(sqs, caplog):
+    sqs_event = _queue_batch(sqs, [
+        _create_event('a'), _create_event('b', tgw_id='tgw-2'), _create_event('c'), _create_event('d'),
+    ])
+    ec2 = MagicMock()
+
+    with patch('handler.get_client', return_value=ec2):
+        result = lambda_handler(sqs_event, MagicMock())
+
+    assert result == {'batchItemFailures': []}
+    assert ec2.accept_transit_gateway_vpc_attachment.call_count == 4
+    # Each group is tagged as a unit, largest group first
+    assert [sorted(c.kwargs['Resources']) for c in ec2.create_tags.call_args_list] == [
+        ['tgw-attach-a', 'tgw-attach-c', 'tgw-attach-d'], ['tgw-attach-b']]
+    assert 'Coalesced 4 events into 2 TGW groups, largest 3' in caplog.text
+    assert "tgw-1: {'ACCEPTED': 3}" in caplog.text
+    assert "tgw-2: {'ACCEPTED': 1}" in caplog.text
+
+
+def test_overlap_check_rejects_overlapping_vpcs_with_one_check_per_transit_gateway():
+    from batch_accept import ACCEPTED, FAILED, REJECTED, BatchAccepter
+
+    ec2 = MagicMock()
+    checks = []
+
+    def check(ec2, tgw_id, vpc_ids, pool_ids):
+        checks.append((tgw_id, list(vpc_ids)))
+        found = {'vpc-a': (['10.1.0.0/16'], []), 'vpc-b': (['10.0.0.0/24'], [('10.0.0.0/16', 'vpc-old')]),
+                 'vpc-c': ([], []), 'vpc-d': (['10.2.0.0/16'], [])}
+        return {vpc_id: found[vpc_id] for vpc_id in vpc_ids}
+
+    accepter = BatchAccepter(ec2, [], ['ipam-pool-1'], cidr_overlap_check=True)
+    with patch('batch_accept.find_vpc_pools', side_effect=lambda ec2, vpc_ids, pool_ids: {v: 'ipam-pool-1' for v in vpc_ids}), \
+            patch('batch_accept.find_overlapping_cidrs_of_vpcs', side_effect=check):
+        results = accepter.process([
+            ('m1', _create_event('a')), ('m2', _create_event('b')),
+            ('m3', _create_event('c')), ('m4', _create_event('d', tgw_id='tgw-2')),
+        ])
+
+    assert [(r.item_id, r.result, r.retryable) for r in results] == [
+        ('m1', ACCEPTED, False), ('m2', REJECTED, False), ('m3', FAILED, True), ('m4', ACCEPTED, False)]
+    assert '10.0.0.0/16 (vpc-old)' in results[1].message
+    assert checks == [('tgw-1', ['vpc-a', 'vpc-b', 'vpc-c']), ('tgw-2', ['vpc-d'])]
+    assert ec2.accept_transit_gateway_vpc_attachment.call_count == 2
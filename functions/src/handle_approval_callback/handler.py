@@ -1,19 +1,26 @@
 import json
 import os
-import logging
-from typing import Dict, Any
-import boto3
-from botocore.exceptions import ClientError
+from collections import Counter
+from typing import Dict, Any, Optional
+
+from approval_digest import ACTION_STATUS, complete_approvals, digest_items
+from approval_tokens import LinkAlreadyUsedError, claim_token, release_token
+from attachment_waiters import TOKEN_GONE_ERRORS
+from clients import get_client
+from kvstore import store_from_env
+from logs import configure_logging, log_invocation
+from metrics import record_api_calls
 
 # Configure logging
-log_level = os.environ.get('LOG_LEVEL', 'INFO').upper()
-logger = logging.getLogger()
-logger.setLevel(log_level)
+logger = configure_logging()
 
 # Environment variables
 email_addresses_env = os.environ.get('EMAIL_ADDRESSES', 'user@example.com')
 email_addresses = [email.strip() for email in email_addresses_env.split(',') if email.strip()]
+# Maximum number of concurrent Step Functions calls when completing a digest
+approval_callback_max_workers = int(os.environ.get('APPROVAL_CALLBACK_MAX_WORKERS', '10'))
 
+@record_api_calls
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Lambda function to handle approval/rejection callbacks from API Gateway to Step Functions.
@@ -22,14 +29,17 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     sends the result to Step Functions, and redirects to the AWS console execution page.
     
     Args:
-        event: API Gateway event containing query parameters (action, taskToken, sm, ex)
+        event: API Gateway event containing query parameters: action and either id (short link),
+            digest and item (digest links), or taskToken, sm and ex
         context: Lambda context object
         
     Returns:
         Dict containing HTTP response with redirect to Step Functions console
     """
+    from botocore.exceptions import ClientError
+
+    log_invocation(logger, event, context)
     logger.info('Lambda invocation started')
-    logger.debug(f'Raw event: {event}')
     
     try:
         # Extract query parameters
@@ -38,14 +48,19 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             raise ValueError("No query parameters found in event")
         
         action = query_params.get('action')
+        if query_params.get('digest'):
+            return _handle_digest(context, action, query_params['digest'], query_params.get('item'))
+        if query_params.get('id'):
+            return _handle_short_link(context, action, query_params['id'])
+
         task_token = query_params.get('taskToken')
         state_machine_name = query_params.get('sm')
         execution_name = query_params.get('ex')
         
-        logger.debug(f'action: {action}')
-        logger.debug(f'taskToken (raw): {task_token}')
-        logger.debug(f'statemachineName: {state_machine_name}')
-        logger.debug(f'executionName: {execution_name}')
+        logger.debug('action: %s', action)
+        logger.debug('taskToken (raw): %s', task_token)
+        logger.debug('statemachineName: %s', state_machine_name)
+        logger.debug('executionName: %s', execution_name)
         
         # Validate required parameters
         if not all([action, task_token, state_machine_name, execution_name]):
@@ -67,10 +82,10 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         else:
             raise ValueError(f"Unrecognized action: {action}. Expected: approve, reject")
         
-        logger.info(f'Processing {action} action for execution {execution_name}')
+        logger.info('Processing %s action for execution %s', action, execution_name)
         
         # Send task success to Step Functions
-        stepfunctions = boto3.client('stepfunctions')
+        stepfunctions = get_client('stepfunctions')
         stepfunctions.send_task_success(
             output=json.dumps(message),
             taskToken=task_token
@@ -84,7 +99,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             execution_name
         )
         
-        logger.info(f'Redirecting to: {redirect_url}')
+        logger.info('Redirecting to: %s', redirect_url)
         
         # Return redirect response
         return {
@@ -98,8 +113,20 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             })
         }
         
+    except LinkAlreadyUsedError as e:
+        logger.warning('Approval link used again: %s', e)
+        return {
+            'statusCode': 409,
+            'headers': {
+                'Content-Type': 'application/json'
+            },
+            'body': json.dumps({
+                'error': 'Link already used',
+                'message': str(e)
+            })
+        }
     except ClientError as e:
-        logger.error(f'AWS service error: {str(e)}')
+        logger.error('AWS service error: %s', e)
         return {
             'statusCode': 500,
             'headers': {
@@ -111,7 +138,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             })
         }
     except Exception as e:
-        logger.error(f'Error processing approval callback: {str(e)}')
+        logger.error('Error processing approval callback: %s', e)
         return {
             'statusCode': 400,
             'headers': {
@@ -124,6 +151,126 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
 
+def _handle_short_link(context: Any, action: str, short_id: str) -> Dict[str, Any]:
+    """
+    Complete the approval of a link carrying a short ID instead of the task token.
+
+    The link is claimed before Step Functions is called, so a repeated click
+    raises LinkAlreadyUsedError without a second call.
+
+    Args:
+        context: Lambda context object
+        action: 'approve' or 'reject'
+        short_id: ID from the link
+
+    Returns:
+        Dict containing HTTP response with redirect to Step Functions console
+    """
+    from botocore.exceptions import ClientError
+
+    if action not in ACTION_STATUS:
+        raise ValueError(f"Unrecognized action: {action}. Expected: approve, reject")
+    store = store_from_env()
+    item = claim_token(store, short_id, action)
+    execution_name = item.value['execution_name']
+    logger.info('Processing %s action for execution %s', action, execution_name)
+
+    email_list = ', '.join(email_addresses)
+    try:
+        get_client('stepfunctions').send_task_success(
+            output=json.dumps({"Status": ACTION_STATUS[action].format(approvers=email_list)}),
+            taskToken=item.value['task_token']
+        )
+    except ClientError as e:
+        # Unless the execution is gone, the link is released for another try
+        if e.response['Error']['Code'] not in TOKEN_GONE_ERRORS:
+            release_token(store, item)
+        raise
+    logger.info('Successfully sent task success to Step Functions')
+
+    redirect_url = _construct_console_redirect_url(
+        context.invoked_function_arn,
+        item.value['state_machine_name'],
+        execution_name
+    )
+    return {
+        'statusCode': 302,
+        'headers': {
+            'Location': redirect_url
+        },
+        'body': json.dumps({
+            'message': f'Task {action}d successfully',
+            'redirectUrl': redirect_url
+        })
+    }
+
+
+def _handle_digest(context: Any, action: str, digest_id: str, item_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Complete the approvals selected by a digest link: one item, or every pending item of the digest.
+
+    Args:
+        context: Lambda context object
+        action: 'approve' or 'reject'
+        digest_id: Digest ID of the link
+        item_id: Item ID of the link, None for the digest-wide links
+
+    Returns:
+        Dict containing HTTP response with redirect to the Step Functions console
+    """
+    if action not in ACTION_STATUS:
+        raise ValueError(f"Unrecognized action: {action}. Expected: approve, reject")
+    try:
+        items = digest_items(store_from_env(), digest_id, item_id)
+    except KeyError as e:
+        raise ValueError(e.args[0]) from e
+
+    logger.info('Processing %s action for %d executions of digest %s', action, len(items), digest_id)
+    email_list = ', '.join(email_addresses)
+    outcomes = complete_approvals(get_client('stepfunctions'), store_from_env(), items, action, email_list,
+                                  max_workers=approval_callback_max_workers)
+    counts = dict(Counter(outcomes.values()))
+    logger.info('Digest %s %s outcomes: %s', digest_id, action, counts)
+
+    # One execution is shown directly, several on their state machine's page
+    if len(items) == 1:
+        redirect_url = _construct_console_redirect_url(
+            context.invoked_function_arn,
+            items[0].value['state_machine_name'],
+            items[0].value['execution_name']
+        )
+    else:
+        redirect_url = _construct_state_machine_redirect_url(
+            context.invoked_function_arn,
+            items[0].value['state_machine_name'] if items else ''
+        )
+    return {
+        'statusCode': 302,
+        'headers': {
+            'Location': redirect_url
+        },
+        'body': json.dumps({
+            'message': f"{counts.get('COMPLETED', 0)} of {len(items)} tasks {action}d",
+            'outcomes': outcomes,
+            'redirectUrl': redirect_url
+        })
+    }
+
+
+def _construct_state_machine_redirect_url(lambda_arn: str, state_machine_name: str) -> str:
+    """
+    Construct AWS Step Functions console URL for a state machine, or the state machine list without a name.
+    """
+    arn_parts = lambda_arn.split(':')
+    if len(arn_parts) < 5:
+        raise ValueError(f"Invalid Lambda ARN format: {lambda_arn}")
+    partition, region, account_id = arn_parts[1], arn_parts[3], arn_parts[4]
+    if not state_machine_name:
+        return f"https://console.aws.amazon.com/states/home?region={region}#/statemachines"
+    state_machine_arn = f"arn:{partition}:states:{region}:{account_id}:stateMachine:{state_machine_name}"
+    return f"https://console.aws.amazon.com/states/home?region={region}#/statemachines/view/{state_machine_arn}"
+
+
 def _construct_console_redirect_url(lambda_arn: str, state_machine_name: str, execution_name: str) -> str:
     """
     Construct AWS Step Functions console URL for the execution.
@@ -145,13 +292,13 @@ def _construct_console_redirect_url(lambda_arn: str, state_machine_name: str, ex
     region = arn_parts[3]
     account_id = arn_parts[4]
     
-    logger.debug(f'partition: {partition}')
-    logger.debug(f'region: {region}')
-    logger.debug(f'accountId: {account_id}')
+    logger.debug('partition: %s', partition)
+    logger.debug('region: %s', region)
+    logger.debug('accountId: %s', account_id)
     
     # Construct execution ARN
     execution_arn = f"arn:{partition}:states:{region}:{account_id}:execution:{state_machine_name}:{execution_name}"
-    logger.debug(f'executionArn: {execution_arn}')
+    logger.debug('executionArn: %s', execution_arn)
     
     # Construct console URL
     console_url = f"https://console.aws.amazon.com/states/home?region={region}#/executions/details/{execution_arn}"
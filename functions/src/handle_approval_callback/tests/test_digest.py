@@ -0,0 +1,80 @@
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
+
+os.environ['LOG_LEVEL'] = 'DEBUG'
+os.environ['EMAIL_ADDRESSES'] = 'approver@example.com'
+
+from approval_digest import APPROVAL_PREFIX, collect_digest, register_approval
+from handle_approval_callback.handler import lambda_handler
+from kvstore import MemoryStore
+
+CONTEXT = MagicMock(invoked_function_arn='arn:aws:lambda:us-east-1:123456789012:function:test-function')
+
+
+def _digest(store, count):
+    for n in range(count):
+        register_approval(store, f'token-{n}', f'execution-{n}', 'tgw-auto-accept', {}, ttl_seconds=3600)
+    return collect_digest(store, max_items=count, ttl_seconds=3600)
+
+
+def _click(store, sfn, **params):
+    with patch('handle_approval_callback.handler.store_from_env', return_value=store), \
+            patch('handle_approval_callback.handler.get_client', return_value=sfn):
+        return lambda_handler({'queryStringParameters': params}, CONTEXT)
+
+
+def test_approve_all_completes_every_token_once():
+    store = MemoryStore()
+    digest = _digest(store, 20)
+    sfn = MagicMock()
+
+    response = _click(store, sfn, action='approve', digest=digest.digest_id)
+    again = _click(store, sfn, action='approve', digest=digest.digest_id)
+
+    assert response['statusCode'] == 302
+    assert 'stateMachine:tgw-auto-accept' in response['headers']['Location']
+    assert sorted(c.kwargs['taskToken'] for c in sfn.send_task_success.call_args_list) == sorted(
+        f'token-{n}' for n in range(20))
+    assert json.loads(sfn.send_task_success.call_args.kwargs['output'])['Status'].startswith('Approved!')
+    assert json.loads(again['body'])['outcomes'] == {}
+    assert sfn.send_task_success.call_count == 20
+    assert all(store.get(item.key) is None for item in digest.items)
+
+
+def test_item_link_completes_only_its_execution():
+    store = MemoryStore()
+    digest = _digest(store, 3)
+    item_id = digest.items[1].key[len(APPROVAL_PREFIX):]
+    sfn = MagicMock()
+
+    response = _click(store, sfn, action='reject', digest=digest.digest_id, item=item_id)
+
+    assert 'execution:tgw-auto-accept:execution-1' in response['headers']['Location']
+    sfn.send_task_success.assert_called_once()
+    assert json.loads(sfn.send_task_success.call_args.kwargs['output'])['Status'].startswith('Rejected!')
+    assert [store.get(item.key) is not None for item in digest.items] == [True, False, True]
+
+
+def test_failed_tokens_stay_pending_and_gone_ones_are_dropped():
+    store = MemoryStore()
+    digest = _digest(store, 2)
+    sfn = MagicMock()
+
+    def send_task_success(taskToken, output):
+        code = 'TaskTimedOut' if taskToken == 'token-0' else 'ThrottlingException'
+        raise ClientError({'Error': {'Code': code, 'Message': code}}, 'SendTaskSuccess')
+
+    sfn.send_task_success.side_effect = send_task_success
+    body = json.loads(_click(store, sfn, action='approve', digest=digest.digest_id)['body'])
+
+    assert sorted(body['outcomes'].values()) == ['FAILED', 'GONE']
+    assert [item.value['execution_name'] for item in digest.items if store.get(item.key)] == ['execution-1']
+
+
+def test_unknown_digest_is_rejected():
+    response = _click(MemoryStore(), MagicMock(), action='approve', digest='unknown')
+
+    assert response['statusCode'] == 400
@@ -0,0 +1,86 @@
+import json
+import os
+from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from botocore.exceptions import ClientError
+
+os.environ['LOG_LEVEL'] = 'DEBUG'
+os.environ['EMAIL_ADDRESSES'] = 'approver@example.com'
+os.environ.pop('SNS_TOPIC_ARN', None)
+
+import send_approval_email.handler as send_approval_email
+from handle_approval_callback.handler import lambda_handler
+from kvstore import SQLiteStore
+
+CONTEXT = MagicMock(invoked_function_arn='arn:aws:lambda:us-east-1:123456789012:function:test-function')
+TASK_TOKEN = 'AAAAKgAAAAIAAAAAAAAAAR1VdMVvhzlPuudgWqQTqjg' * 20
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteStore(str(tmp_path / 'state.db'))
+
+
+def _email(store):
+    event = {
+        'ExecutionContext': {
+            'Execution': {'Name': 'execution-1'},
+            'StateMachine': {'Name': 'tgw-auto-accept'},
+            'Task': {'Token': TASK_TOKEN},
+        },
+        'APIGatewayEndpoint': 'https://api.example.com/states',
+    }
+    with patch.object(send_approval_email, 'approval_short_links_enabled', True), \
+            patch.object(send_approval_email, 'store_from_env', return_value=store):
+        return send_approval_email.lambda_handler(event, MagicMock())
+
+
+def _click(store, sfn, link):
+    params = {key: values[0] for key, values in parse_qs(urlparse(link).query).items()}
+    with patch('handle_approval_callback.handler.store_from_env', return_value=store), \
+            patch('handle_approval_callback.handler.get_client', return_value=sfn):
+        return lambda_handler({'queryStringParameters': params}, CONTEXT)
+
+
+def test_links_carry_a_short_id_instead_of_the_task_token(store):
+    response = _email(store)
+
+    assert len(response['approveEndpoint']) < 100
+    assert 'taskToken' not in response['emailMessage']
+    assert parse_qs(urlparse(response['approveEndpoint']).query)['id'] == \
+        parse_qs(urlparse(response['rejectEndpoint']).query)['id']
+
+
+def test_only_the_first_click_completes_the_task(store):
+    links = _email(store)
+    sfn = MagicMock()
+
+    first = _click(store, sfn, links['approveEndpoint'])
+    second = _click(store, sfn, links['rejectEndpoint'])
+
+    assert first['statusCode'] == 302
+    assert 'execution:tgw-auto-accept:execution-1' in first['headers']['Location']
+    sfn.send_task_success.assert_called_once()
+    assert sfn.send_task_success.call_args.kwargs['taskToken'] == TASK_TOKEN
+    assert json.loads(sfn.send_task_success.call_args.kwargs['output'])['Status'].startswith('Approved!')
+    assert second['statusCode'] == 409
+
+
+def test_link_is_released_when_step_functions_fails(store):
+    links = _email(store)
+    sfn = MagicMock()
+    sfn.send_task_success.side_effect = [
+        ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'SendTaskSuccess'),
+        None,
+    ]
+
+    assert _click(store, sfn, links['approveEndpoint'])['statusCode'] == 500
+    assert _click(store, sfn, links['approveEndpoint'])['statusCode'] == 302
+
+
+def test_unknown_link_is_rejected(store):
+    response = _click(store, MagicMock(), 'https://api.example.com/states/execution?action=approve&id=unknown')
+
+    assert response['statusCode'] == 400
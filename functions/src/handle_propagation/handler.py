@@ -1,24 +1,138 @@
-import boto3
 import os
-import logging
-from typing import Dict
-from botocore.exceptions import ClientError
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set
 
 # Import shared models
 from models import CloudTrailEvent, TGWAttachment
+from clients import get_client, prewarm_clients
+from cidr_index import ipam_scope_ids, vpc_cidrs
+from route_trie import propagation_impact
+from logs import configure_logging, in_current_context, log_invocation
+from idempotency import idempotent
+from metrics import record_api_calls
 
 # Configure logging
-log_level = os.environ.get('LOG_LEVEL', 'INFO').upper()
-logger = logging.getLogger()
-logger.setLevel(log_level)
+logger = configure_logging()
 
 # Environment variables
 region_env = os.environ.get('AWS_REGION', 'eu-north-1')
 default_propagate_route_table_ids = os.environ.get('DEFAULT_PROPAGATE_ROUTE_TABLE_IDS', '')
+propagation_max_workers = int(os.environ.get('PROPAGATION_MAX_WORKERS', '8'))
+# off, report (add the route table impact to the result) or block (also fail on conflicts before enabling)
+propagation_impact_mode = os.environ.get('PROPAGATION_IMPACT_MODE', 'off')
+ipam_pool_ids = [p.strip() for p in os.environ.get('IPAM_POOL_IDS', '').split(',') if p.strip()]
 
+prewarm_clients([('ec2', region_env)])
+
+# Per route table propagation status
+ENABLED = 'ENABLED'
+ALREADY_ENABLED = 'ALREADY_ENABLED'
+FAILED = 'FAILED'
+
+
+def current_propagations(ec2, attachment_id: str) -> Set[str]:
+    """
+    Return the route tables the attachment already propagates to (or is being enabled on).
+
+    A failed lookup is not fatal, every route table is then enabled as if none were.
+    """
+    from botocore.exceptions import ClientError
+
+    route_table_ids = set()
+    try:
+        paginator = ec2.get_paginator('get_transit_gateway_attachment_propagations')
+        for page in paginator.paginate(TransitGatewayAttachmentId=attachment_id):
+            for propagation in page.get('TransitGatewayAttachmentPropagations', []):
+                if propagation.get('State') in ('enabled', 'enabling'):
+                    route_table_ids.add(propagation['TransitGatewayRouteTableId'])
+    except ClientError as e:
+        logger.warning("Could not read current propagations for attachment %s: %s", attachment_id, e)
+    return route_table_ids
+
+
+def propagate_route_table(ec2, attachment_id: str, route_table_id: str) -> Dict:
+    """Enable propagation of the attachment to one route table and return its status."""
+    from botocore.exceptions import ClientError
+
+    logger.info("Enabling propagation for attachment %s to route table %s", attachment_id, route_table_id)
+    try:
+        ec2.enable_transit_gateway_route_table_propagation(
+            TransitGatewayRouteTableId=route_table_id,
+            TransitGatewayAttachmentId=attachment_id
+        )
+        logger.info("Enabled propagation for %s to route table %s", attachment_id, route_table_id)
+        return {"route_table_id": route_table_id, "status": ENABLED}
+    except ClientError as e:
+        error_code = e.response['Error']['Code']
+        error_message = e.response['Error']['Message']
+        if error_code == 'TransitGatewayRouteTablePropagation.Duplicate':
+            logger.info("Propagation for %s to route table %s already enabled", attachment_id, route_table_id)
+            return {"route_table_id": route_table_id, "status": ALREADY_ENABLED}
+        logger.error("Failed to enable propagation for attachment %s to route table %s: %s - %s", attachment_id, route_table_id, error_code, error_message)
+        return {"route_table_id": route_table_id, "status": FAILED, "error": f"{error_code} - {error_message}"}
+
+
+def propagate_route_tables(ec2, attachment_id: str, route_table_ids: List[str]) -> List[Dict]:
+    """
+    Enable propagation to every route table not already propagated to, concurrently.
+
+    Returns:
+        One status dict per route table, in input order
+    """
+    enabled = current_propagations(ec2, attachment_id)
+    statuses = {
+        rt_id: {"route_table_id": rt_id, "status": ALREADY_ENABLED}
+        for rt_id in route_table_ids if rt_id in enabled
+    }
+    pending = [rt_id for rt_id in route_table_ids if rt_id not in enabled]
+    if statuses:
+        logger.info("Skipping route tables already propagated to: %s", list(statuses))
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(propagation_max_workers, len(pending)))) as executor:
+            propagate = in_current_context(lambda rt_id: propagate_route_table(ec2, attachment_id, rt_id))
+            for status in executor.map(propagate, pending):
+                statuses[status["route_table_id"]] = status
+    return [statuses[rt_id] for rt_id in route_table_ids]
+
+
+def preview_propagation_impact(ec2, attachment: TGWAttachment, route_table_ids: List[str]) -> Dict:
+    """
+    Report the existing routes the VPC's CIDRs shadow or are shadowed by in each route table.
+
+    The VPC's CIDRs are looked up in the IPAM scopes of the configured pools.
+
+    Raises:
+        Exception: In block mode, if the CIDRs are unknown, a route table could not be searched or has conflicts
+    """
+    cidrs = vpc_cidrs(ec2, ipam_scope_ids(ec2, ipam_pool_ids), attachment.vpc_id).get(attachment.vpc_id, [])
+    if not cidrs:
+        message = f"No CIDRs found in IPAM for VPC {attachment.vpc_id}, propagation impact unknown"
+        if propagation_impact_mode == 'block':
+            logger.error(message)
+            raise Exception(message)
+        logger.warning(message)
+        return {"cidrs": [], "route_tables": []}
+
+    impacts = propagation_impact(ec2, route_table_ids, cidrs, attachment.attachment_id, propagation_max_workers)
+    for impact in impacts:
+        logger.info("Propagating %s to %s: %d exact, %d shadowed and %d more specific routes", cidrs,
+                    impact.route_table_id, len(impact.exact), len(impact.shadows), len(impact.shadowed_by))
+        logger.debug("Impact on %s: %s", impact.route_table_id, impact.to_dict())
+    report = {"cidrs": cidrs, "route_tables": [impact.to_dict() for impact in impacts]}
+
+    blocking = [impact.to_dict() for impact in impacts if impact.error or impact.conflicts]
+    if blocking and propagation_impact_mode == 'block':
+        logger.error("Propagation of attachment %s blocked by conflicting routes", attachment.attachment_id)
+        raise Exception(f"Propagation of attachment {attachment.attachment_id} blocked by conflicting routes: {json.dumps(blocking)}")
+    return report
+
+
+@record_api_calls
+@idempotent('propagation')
 def lambda_handler(event, context):
+    log_invocation(logger, event, context)
     logger.info('Lambda invocation started')
-    logger.debug(f'Raw event: {event}')
 
     # Extract the original CloudTrail event from the Step Functions payload
     ct_event = CloudTrailEvent.from_raw(event)
@@ -27,8 +141,8 @@ def lambda_handler(event, context):
     pool_tags_payload = event.get('GetPoolTagsPayload')
     
     attachment = TGWAttachment.from_event(ct_event)
-    logger.info(f"Processing accepted TGWAttachment: {attachment}")
-    ec2 = boto3.client('ec2', region_name=region_env)
+    logger.info("Processing accepted TGWAttachment: %s", attachment)
+    ec2 = get_client('ec2', region_env)
     # Find route tables from GetPoolTagsPayload and split by comma if multiple
 
     propagation_route_table_ids = []
@@ -37,35 +151,28 @@ def lambda_handler(event, context):
         propagation_id = payload.get('propagation')
         if propagation_id:
             propagation_route_table_ids = [r.strip() for r in propagation_id.split(',') if r.strip()]
-            logger.info(f"Found route tables from pool tags - Propagations: {propagation_route_table_ids}")
+            logger.info("Found route tables from pool tags - Propagations: %s", propagation_route_table_ids)
     
     if not propagation_route_table_ids and default_propagate_route_table_ids:
         propagation_route_table_ids = [r.strip() for r in default_propagate_route_table_ids.split(',') if r.strip()]
-        logger.info(f"Using default propagation route tables: {propagation_route_table_ids}")
+        logger.info("Using default propagation route tables: %s", propagation_route_table_ids)
 
     if not propagation_route_table_ids: 
         logger.error("No route tables found in pool tags and no defaults configured")
         raise Exception("No route tables found in pool tags and no defaults configured")
 
-    propagation_successes = []
-    if propagation_route_table_ids:
-        for route_table_id in propagation_route_table_ids:
-            logger.info(f"Enabling propagation for attachment {attachment.attachment_id} to route table {route_table_id}")
-            try:
-                ec2.enable_transit_gateway_route_table_propagation(
-                    TransitGatewayRouteTableId=route_table_id,
-                    TransitGatewayAttachmentId=attachment.attachment_id
-                )
-                propagation_successes.append(True)
-                logger.info(f"Enabled propagation for {attachment.attachment_id} to route table {route_table_id}")
-            except ClientError as e:
-                logger.error(f"Failed to enable propagation for attachment {attachment.attachment_id} to route table {route_table_id}")
-
-    overall_success = all(propagation_successes)
-    logger.info(f"Propagations operations completed. Overall success: {overall_success}")
+    # Pool tags and defaults may repeat a route table
+    propagation_route_table_ids = list(dict.fromkeys(propagation_route_table_ids))
+    impact = None
+    if propagation_impact_mode != 'off':
+        impact = preview_propagation_impact(ec2, attachment, propagation_route_table_ids)
+    propagations = propagate_route_tables(ec2, attachment.attachment_id, propagation_route_table_ids)
+
+    overall_success = all(p["status"] != FAILED for p in propagations)
+    logger.info("Propagations operations completed. Overall success: %s", overall_success)
 
     if overall_success:
-        return {
+        result = {
             "statusCode": 200 ,
             "result": "SUCCESS",
             "message": f"Processed attachment {attachment.attachment_id}",
@@ -75,14 +182,13 @@ def lambda_handler(event, context):
                 "attachment_id": attachment.attachment_id
             },
             "operations": {
-                "propagations": [
-                    {
-                        "route_table_id": rt_id,
-                    }
-                    for rt_id in propagation_route_table_ids
-                ]
+                "propagations": propagations
             }
         }
+        if impact is not None:
+            result["impact"] = impact
+        return result
     else:
-        logger.error(f"One or more propagation operations failed for attachment {attachment.attachment_id}")
-        raise Exception(f"One or more propagation operations failed for attachment {attachment.attachment_id}")
+        logger.error("One or more propagation operations failed for attachment %s", attachment.attachment_id)
+        # The per route table statuses end up in the error cause seen by the state machine
+        raise Exception(f"One or more propagation operations failed for attachment {attachment.attachment_id}: {json.dumps(propagations)}")
@@ -0,0 +1,108 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+os.environ['LOG_LEVEL'] = 'DEBUG'
+
+from handler import ALREADY_ENABLED, ENABLED, FAILED, preview_propagation_impact, propagate_route_tables
+from models import TGWAttachment
+
+ATTACHMENT_ID = 'tgw-attach-1'
+
+
+def _ec2(enabled=(), errors=None):
+    """MagicMock EC2 client with the given current propagations and per route table errors."""
+    errors = errors or {}
+    ec2 = MagicMock()
+    ec2.get_paginator.return_value.paginate.return_value = [{
+        'TransitGatewayAttachmentPropagations': [
+            {'TransitGatewayRouteTableId': rt_id, 'State': 'enabled'} for rt_id in enabled
+        ]
+    }]
+
+    def enable(TransitGatewayRouteTableId, TransitGatewayAttachmentId):
+        if TransitGatewayRouteTableId in errors:
+            raise ClientError({'Error': {'Code': errors[TransitGatewayRouteTableId], 'Message': 'boom'}},
+                              'EnableTransitGatewayRouteTablePropagation')
+
+    ec2.enable_transit_gateway_route_table_propagation.side_effect = enable
+    return ec2
+
+
+def _enabled_route_tables(ec2):
+    return sorted(c.kwargs['TransitGatewayRouteTableId']
+                  for c in ec2.enable_transit_gateway_route_table_propagation.call_args_list)
+
+
+def test_enables_only_missing_propagations():
+    ec2 = _ec2(enabled=['rtb-2'])
+
+    result = propagate_route_tables(ec2, ATTACHMENT_ID, ['rtb-1', 'rtb-2', 'rtb-3'])
+
+    assert result == [
+        {'route_table_id': 'rtb-1', 'status': ENABLED},
+        {'route_table_id': 'rtb-2', 'status': ALREADY_ENABLED},
+        {'route_table_id': 'rtb-3', 'status': ENABLED},
+    ]
+    assert _enabled_route_tables(ec2) == ['rtb-1', 'rtb-3']
+    ec2.get_paginator.assert_called_once_with('get_transit_gateway_attachment_propagations')
+
+
+def test_reports_failures_per_route_table():
+    ec2 = _ec2(errors={'rtb-2': 'InvalidRouteTableId.NotFound', 'rtb-3': 'TransitGatewayRouteTablePropagation.Duplicate'})
+
+    result = propagate_route_tables(ec2, ATTACHMENT_ID, ['rtb-1', 'rtb-2', 'rtb-3'])
+
+    assert [r['status'] for r in result] == [ENABLED, FAILED, ALREADY_ENABLED]
+    assert result[1]['error'].startswith('InvalidRouteTableId.NotFound')
+
+
+def test_failed_precheck_enables_every_route_table():
+    ec2 = _ec2()
+    ec2.get_paginator.return_value.paginate.side_effect = ClientError(
+        {'Error': {'Code': 'UnauthorizedOperation', 'Message': 'denied'}}, 'GetTransitGatewayAttachmentPropagations')
+
+    result = propagate_route_tables(ec2, ATTACHMENT_ID, ['rtb-1', 'rtb-2'])
+
+    assert [r['status'] for r in result] == [ENABLED, ENABLED]
+    assert _enabled_route_tables(ec2) == ['rtb-1', 'rtb-2']
+
+
+def _preview(mode, cidrs, routes):
+    ec2 = _ec2()
+    ec2.search_transit_gateway_routes.return_value = {'Routes': routes, 'AdditionalRoutesAvailable': False}
+    attachment = TGWAttachment('111111111111', 'vpc-1', ATTACHMENT_ID)
+    with patch('handler.propagation_impact_mode', mode), \
+            patch('handler.ipam_scope_ids', return_value=['ipam-scope-1']), \
+            patch('handler.vpc_cidrs', return_value={'vpc-1': cidrs} if cidrs else {}):
+        return preview_propagation_impact(ec2, attachment, ['rtb-1', 'rtb-2'])
+
+
+def _route(cidr, attachment_id):
+    return {'DestinationCidrBlock': cidr, 'Type': 'propagated', 'State': 'active',
+            'TransitGatewayAttachments': [{'TransitGatewayAttachmentId': attachment_id}]}
+
+
+def test_report_mode_returns_impact_per_route_table():
+    report = _preview('report', ['10.1.0.0/16'], [_route('10.1.0.0/24', 'tgw-attach-2')])
+
+    assert report['cidrs'] == ['10.1.0.0/16']
+    assert [rt['route_table_id'] for rt in report['route_tables']] == ['rtb-1', 'rtb-2']
+    assert report['route_tables'][0]['shadowed_by'][0]['route'] == '10.1.0.0/24'
+
+
+def test_block_mode_fails_on_conflicts():
+    with pytest.raises(Exception, match='blocked by conflicting routes'):
+        _preview('block', ['10.1.0.0/16'], [_route('10.1.0.0/16', 'tgw-attach-2')])
+
+    # Routes of the attachment itself and less specific routes do not block
+    report = _preview('block', ['10.1.0.0/16'], [_route('10.1.0.0/16', ATTACHMENT_ID), _route('10.0.0.0/8', 'tgw-attach-2')])
+    assert report['route_tables'][0]['shadows'][0]['route'] == '10.0.0.0/8'
+
+
+def test_block_mode_fails_when_vpc_cidrs_are_unknown():
+    assert _preview('report', [], [])['route_tables'] == []
+    with pytest.raises(Exception, match='No CIDRs found in IPAM'):
+        _preview('block', [], [])
@@ -0,0 +1,60 @@
+import os
+from typing import Any, Dict
+
+# Import shared modules from common layer
+from approval_digest import collect_digest, digest_message, release_digest
+from clients import get_client
+from kvstore import store_from_env
+from logs import configure_logging, log_invocation
+from metrics import record_api_calls
+
+# Configure logging
+logger = configure_logging()
+
+# Environment variables
+sns_topic_arn = os.environ.get('SNS_TOPIC_ARN')
+approval_api_endpoint = os.environ.get('APPROVAL_API_ENDPOINT', '')
+# Items per notification, keeping the message well below the SNS size limit
+max_items = int(os.environ.get('APPROVAL_DIGEST_MAX_ITEMS', '100'))
+approval_pending_ttl_seconds = float(os.environ.get('APPROVAL_PENDING_TTL_SECONDS', str(7 * 24 * 3600)))
+
+
+@record_api_calls(attach_to_result=True)
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Lambda function to send the approvals registered since the previous run as digests.
+
+    Args:
+        event: Scheduled EventBridge event (unused)
+        context: Lambda context object
+
+    Returns:
+        Dict with the number of digests and approvals sent
+    """
+    from botocore.exceptions import ClientError
+
+    log_invocation(logger, event, context)
+    logger.info('Lambda invocation started')
+    store = store_from_env()
+    sns = get_client('sns')
+
+    digests = 0
+    approvals = 0
+    # More than max_items pending are sent as several digests
+    while True:
+        digest = collect_digest(store, max_items, approval_pending_ttl_seconds)
+        if digest is None:
+            break
+        content = digest_message(digest, approval_api_endpoint)
+        try:
+            sns_response = sns.publish(TopicArn=sns_topic_arn, Message=content['message'], Subject=content['subject'])
+        except ClientError as e:
+            logger.error('Failed to publish digest %s, leaving its approvals for the next run: %s', digest.digest_id, e)
+            release_digest(store, digest)
+            return {'result': "ERROR", 'digests': digests, 'approvals': approvals, 'error': str(e)}
+        logger.info('Digest %s with %d approvals published to SNS. MessageId: %s',
+                    digest.digest_id, len(digest.items), sns_response.get('MessageId'))
+        digests += 1
+        approvals += len(digest.items)
+
+    return {'result': "SUCCESS", 'digests': digests, 'approvals': approvals}
@@ -0,0 +1,75 @@
+import os
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
+
+os.environ['LOG_LEVEL'] = 'DEBUG'
+os.environ['SNS_TOPIC_ARN'] = 'arn:aws:sns:us-east-1:123456789012:test-topic'
+os.environ['APPROVAL_API_ENDPOINT'] = 'https://api.example.com/states'
+
+import handler
+from approval_digest import APPROVAL_COLLECTION, collect_digest, register_approval
+from handler import lambda_handler
+from kvstore import MemoryStore
+
+ATTACHMENT = {'attachment_id': 'tgw-attach-1', 'vpc_id': 'vpc-1', 'account_id': '123456789012'}
+
+
+def _register(store, count):
+    for n in range(count):
+        register_approval(store, f'token-{n}', f'execution-{n}', 'tgw-auto-accept', ATTACHMENT, ttl_seconds=3600)
+
+
+def test_one_digest_with_links_for_each_approval_and_for_all():
+    store = MemoryStore()
+    _register(store, 3)
+    sns = MagicMock()
+
+    with patch('handler.store_from_env', return_value=store), patch('handler.get_client', return_value=sns):
+        result = lambda_handler({}, MagicMock())
+
+    assert (result['result'], result['digests'], result['approvals']) == ('SUCCESS', 1, 3)
+    message = sns.publish.call_args.kwargs['Message']
+    assert message.count('action=approve&digest=') == 4
+    assert message.count('action=reject&digest=') == 4
+    assert 'Approve all https://api.example.com/states/execution?action=approve&digest=' in message
+    # Links carry IDs, not task tokens
+    assert 'token-' not in message
+    assert 'tgw-attach-1' in message
+
+
+def test_approvals_are_sent_once_and_split_across_digests():
+    store = MemoryStore()
+    _register(store, 5)
+    sns = MagicMock()
+
+    with patch('handler.store_from_env', return_value=store), patch('handler.get_client', return_value=sns), \
+            patch.object(handler, 'max_items', 2):
+        first = lambda_handler({}, MagicMock())
+        second = lambda_handler({}, MagicMock())
+
+    assert first['digests'] == 3 and first['approvals'] == 5
+    assert second['digests'] == 0
+    assert sns.publish.call_count == 3
+
+
+def test_approvals_of_a_failed_publish_go_into_the_next_digest():
+    store = MemoryStore()
+    _register(store, 2)
+    sns = MagicMock()
+    sns.publish.side_effect = [ClientError({'Error': {'Code': 'Throttling', 'Message': 'slow down'}}, 'Publish'), {}]
+
+    with patch('handler.store_from_env', return_value=store), patch('handler.get_client', return_value=sns):
+        assert lambda_handler({}, MagicMock())['result'] == 'ERROR'
+        assert lambda_handler({}, MagicMock())['approvals'] == 2
+
+    assert store.query(APPROVAL_COLLECTION) == []
+
+
+def test_registering_the_same_token_twice_keeps_one_approval():
+    store = MemoryStore()
+    _register(store, 1)
+    _register(store, 1)
+
+    assert len(collect_digest(store, max_items=10, ttl_seconds=60).items) == 1
+    assert collect_digest(store, max_items=10, ttl_seconds=60) is None
@@ -1,19 +1,49 @@
 import os
-import logging
 from urllib.parse import quote
 from typing import Dict, Any
 from urllib.parse import quote_plus
-import boto3
-from botocore.exceptions import ClientError
+
+from approval_digest import register_approval
+from approval_tokens import register_token
+from clients import get_client
+from kvstore import store_from_env
+from logs import configure_logging, log_invocation
+from models import CloudTrailEvent, TGWAttachment
+from metrics import record_api_calls
 
 # Configure logging
-log_level = os.environ.get('LOG_LEVEL', 'INFO').upper()
-logger = logging.getLogger()
-logger.setLevel(log_level)
+logger = configure_logging()
 
 # Environment variables
 sns_topic_arn = os.environ.get('SNS_TOPIC_ARN')
+# Register approvals for the scheduled digest instead of mailing each one
+approval_digest_enabled = os.environ.get('APPROVAL_DIGEST_ENABLED', 'false').lower() == 'true'
+# Put a short ID in the links instead of the task token
+approval_short_links_enabled = os.environ.get('APPROVAL_SHORT_LINKS_ENABLED', 'false').lower() == 'true'
+# Pending approvals and links nobody answered are dropped after this long
+approval_pending_ttl_seconds = float(os.environ.get('APPROVAL_PENDING_TTL_SECONDS', str(7 * 24 * 3600)))
+
+
+def _attachment_summary(event: Dict[str, Any]) -> Dict[str, str]:
+    """Attachment IDs shown in the digest, empty if the event does not carry the attachment."""
+    try:
+        attachment = TGWAttachment.from_event(CloudTrailEvent.from_raw(event.get('Event', event)))
+    except (KeyError, TypeError, ValueError):
+        return {}
+    return {
+        'attachment_id': attachment.attachment_id,
+        'vpc_id': attachment.vpc_id,
+        'account_id': attachment.account_id,
+    }
+
+
+def _queue_for_digest(event: Dict[str, Any], task_token: str, execution_name: str,
+                      state_machine_name: str) -> str:
+    return register_approval(store_from_env(), task_token, execution_name, state_machine_name,
+                             _attachment_summary(event), approval_pending_ttl_seconds)
+
 
+@record_api_calls
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Lambda function to generate approval email content for Step Functions human approval task.
@@ -28,8 +58,10 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns:
         Dict containing the email message, subject, and approval URLs
     """
+    from botocore.exceptions import ClientError
+
+    log_invocation(logger, event, context)
     logger.info('Lambda invocation started')
-    logger.debug(f'Raw event: {event}')
     
     try:
         # Extract execution context
@@ -37,7 +69,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not execution_context:
             raise ValueError("ExecutionContext not found in event")
         
-        logger.debug(f'executionContext: {execution_context}')
+        logger.debug('executionContext: %s', execution_context)
         
         # Extract execution details
         execution = execution_context.get('Execution', {})
@@ -45,7 +77,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not execution_name:
             raise ValueError("Execution name not found in ExecutionContext")
         
-        logger.debug(f'executionName: {execution_name}')
+        logger.debug('executionName: %s', execution_name)
         
         # Extract state machine details
         state_machine = execution_context.get('StateMachine', {})
@@ -53,7 +85,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not state_machine_name:
             raise ValueError("StateMachine name not found in ExecutionContext")
         
-        logger.debug(f'statemachineName: {state_machine_name}')
+        logger.debug('statemachineName: %s', state_machine_name)
         
         # Extract task token
         task = execution_context.get('Task', {})
@@ -61,14 +93,14 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not task_token:
             raise ValueError("Task token not found in ExecutionContext")
         
-        logger.debug(f'taskToken: {task_token}')
+        logger.debug('taskToken: %s', task_token)
         
         # Extract API Gateway endpoint
         api_gateway_endpoint = event.get('APIGatewayEndpoint')
         if not api_gateway_endpoint:
             raise ValueError("APIGatewayEndpoint not found in event")
         
-        logger.debug(f'apigwEndpoint: {api_gateway_endpoint}')
+        logger.debug('apigwEndpoint: %s', api_gateway_endpoint)
         
         # Construct approval and rejection URLs
         encoded_task_token = quote_plus(task_token)
@@ -90,8 +122,19 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             f"&taskToken={encoded_task_token}"
         )
         
-        logger.debug(f'approveEndpoint: {approve_endpoint}')
-        logger.debug(f'rejectEndpoint: {reject_endpoint}')
+        # Short links unless the approval goes into a digest, which has links of its own
+        if approval_short_links_enabled and not approval_digest_enabled:
+            try:
+                short_id = register_token(store_from_env(), task_token, execution_name, state_machine_name,
+                                          approval_pending_ttl_seconds)
+                approve_endpoint = f"{api_gateway_endpoint}/execution?action=approve&id={short_id}"
+                reject_endpoint = f"{api_gateway_endpoint}/execution?action=reject&id={short_id}"
+            except (ClientError, RuntimeError) as e:
+                # The links with the full task token still work
+                logger.error('Failed to register short approval links, using full links: %s', e)
+
+        logger.debug('approveEndpoint: %s', approve_endpoint)
+        logger.debug('rejectEndpoint: %s', reject_endpoint)
         
         # Construct email message
         email_message = (
@@ -117,21 +160,30 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
         
         logger.info('Email content generated successfully')
-        logger.debug(f'Response: {response}')
+        logger.debug('Response: %s', response)
         
+        # In digest mode the approval is mailed with the next digest
+        if approval_digest_enabled:
+            try:
+                response['approvalId'] = _queue_for_digest(event, task_token, execution_name, state_machine_name)
+                return response
+            except ClientError as e:
+                # Not registered means never mailed; send this one on its own instead
+                logger.error('Failed to register approval for the digest, sending it now: %s', e)
+
         # Publish to SNS if topic ARN is provided
         if sns_topic_arn:
             try:
-                sns = boto3.client('sns')
+                sns = get_client('sns')
                 sns_response = sns.publish(
                     TopicArn=sns_topic_arn,
                     Message=email_message,
                     Subject=response['emailSubject']
                 )
-                logger.info(f'Email published to SNS. MessageId: {sns_response.get("MessageId")}')
+                logger.info('Email published to SNS. MessageId: %s', sns_response.get('MessageId'))
                 response['snsMessageId'] = sns_response.get('MessageId')
             except ClientError as e:
-                logger.error(f'Failed to publish to SNS: {str(e)}')
+                logger.error('Failed to publish to SNS: %s', e)
                 response['snsError'] = str(e)
         else:
             logger.info('SNS topic ARN not provided, skipping SNS publish')
@@ -139,14 +191,14 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return response
         
     except ClientError as e:
-        logger.error(f'AWS service error: {str(e)}')
+        logger.error('AWS service error: %s', e)
         return {
             'statusCode': 500,
             'result': 'ERROR',
             'error': f'AWS service error: {str(e)}'
         }
     except Exception as e:
-        logger.error(f'Error processing approval email: {str(e)}')
+        logger.error('Error processing approval email: %s', e)
         return {
             'statusCode': 500,
             'result': 'ERROR',
@@ -0,0 +1,182 @@
+import os
+import json
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+# Import shared modules from common layer
+from batch_accept import REJECTED, BatchAccepter
+from clients import get_client, prewarm_clients
+from models import synthetic_create_event
+from validation import parse_list, principal_matcher
+from logs import configure_logging, log_invocation
+from metrics import record_api_calls
+
+# Configure logging
+logger = configure_logging()
+
+# Environment variables
+region_env = os.environ.get('AWS_REGION', 'eu-north-1')
+transit_gateway_ids = parse_list(os.environ.get('TRANSIT_GATEWAY_IDS', ''))
+allowed_principal_patterns = parse_list(os.environ.get('ALLOWED_PRINCIPAL_PATTERNS', ''))
+ipam_pool_ids = parse_list(os.environ.get('IPAM_POOL_IDS', ''))
+cidr_overlap_check_enabled = os.environ.get('CIDR_OVERLAP_CHECK_ENABLED', 'false').lower() == 'true'
+attachment_tag_key = os.environ.get('ATTACHMENT_TAG_KEY', '')
+attachment_tag_value = os.environ.get('ATTACHMENT_TAG_VALUE', '')
+accept_state_machine_arn = os.environ.get('ACCEPT_STATE_MACHINE_ARN', '')
+min_age_seconds = int(os.environ.get('SWEEP_MIN_AGE_SECONDS', '300'))
+max_workers = int(os.environ.get('SWEEP_MAX_WORKERS', '8'))
+# Swept attachments have no known requester: 'hold' leaves them pending when principal patterns are
+# configured, 'skip' accepts them without the principal check
+sweeper_iam_policy = os.environ.get('SWEEPER_IAM_POLICY', 'hold').lower()
+
+# Set on attachments the sweeper leaves pending, removing it has the attachment swept again
+SWEEP_TAG_KEY = 'tgw-auto-accept:sweep'
+HELD = 'HELD'
+
+prewarm_clients([('ec2', region_env)])
+
+
+def find_pending_attachments(ec2, tgw_ids: List[str], older_than: datetime) -> List[Dict]:
+    """
+    List VPC attachments in pendingAcceptance on the given Transit Gateways.
+
+    All filtering except the age check is done server side, so the cost is
+    proportional to the number of pending attachments rather than the size of
+    the Transit Gateway. Attachments tagged SWEEP_TAG_KEY were held or rejected
+    by an earlier sweep and are left alone.
+    """
+    filters = [
+        {'Name': 'state', 'Values': ['pendingAcceptance']},
+        {'Name': 'resource-type', 'Values': ['vpc']},
+    ]
+    if tgw_ids:
+        filters.append({'Name': 'transit-gateway-id', 'Values': tgw_ids})
+
+    pending = []
+    paginator = ec2.get_paginator('describe_transit_gateway_attachments')
+    for page in paginator.paginate(Filters=filters, PaginationConfig={'PageSize': 1000}):
+        for attachment in page.get('TransitGatewayAttachments', []):
+            created = attachment.get('CreationTime')
+            if created and created > older_than:
+                logger.debug("Skipping %s created at %s, too recent", attachment['TransitGatewayAttachmentId'], created)
+                continue
+            if any(tag.get('Key') == SWEEP_TAG_KEY for tag in attachment.get('Tags', [])):
+                logger.debug("Skipping %s, already handled by an earlier sweep", attachment['TransitGatewayAttachmentId'])
+                continue
+            pending.append(attachment)
+    return pending
+
+
+@record_api_calls(attach_to_result=True)
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Lambda function to reconcile attachments stuck in pendingAcceptance.
+
+    Args:
+        event: Scheduled EventBridge event (unused)
+        context: Lambda context object
+
+    Returns:
+        Dict with a count per outcome and the per-attachment results
+    """
+    log_invocation(logger, event, context)
+    logger.info('Lambda invocation started')
+
+    ec2 = get_client('ec2', region_env)
+    older_than = datetime.now(timezone.utc) - timedelta(seconds=min_age_seconds)
+    pending = find_pending_attachments(ec2, transit_gateway_ids, older_than)
+    logger.info("Found %d attachments pending acceptance for more than %ss", len(pending), min_age_seconds)
+
+    if not pending:
+        return {'result': "SUCCESS", 'summary': {}, 'results': []}
+
+    results = []
+    if allowed_principal_patterns and sweeper_iam_policy != 'skip':
+        # Swept events only carry the VPC owner account, attachments whose owner matches no pattern
+        # (e.g. when the patterns name roles) are left for an operator rather than rejected
+        matcher = principal_matcher(tuple(allowed_principal_patterns))
+        held, pending = _split(pending, lambda a: not matcher.match(str(a.get('ResourceOwnerId', ''))))
+        if held:
+            results.extend(_hold(ec2, held))
+
+    if pending and accept_state_machine_arn:
+        results.extend(_start_executions(pending))
+    elif pending:
+        attachment_tag = (attachment_tag_key, attachment_tag_value) if attachment_tag_key and attachment_tag_value else None
+        # The principal check was done above, or is skipped by SWEEPER_IAM_POLICY
+        accepter = BatchAccepter(ec2, [], ipam_pool_ids,
+                                 attachment_tag=attachment_tag, max_workers=max_workers,
+                                 cidr_overlap_check=cidr_overlap_check_enabled)
+        accepted = [r.to_dict() for r in accepter.process(
+            (a['TransitGatewayAttachmentId'], synthetic_create_event(a)) for a in pending
+        )]
+        _mark(ec2, [r['attachment_id'] for r in accepted if r['result'] == REJECTED], 'rejected')
+        results.extend(accepted)
+
+    summary = {}
+    for result in results:
+        summary[result['result']] = summary.get(result['result'], 0) + 1
+    logger.info("Sweep completed: %s", summary)
+    return {'result': "SUCCESS", 'summary': summary, 'results': results}
+
+
+def _split(items: List[Dict], predicate) -> tuple:
+    """Split items into those matching predicate and the rest, keeping their order."""
+    matching, rest = [], []
+    for item in items:
+        (matching if predicate(item) else rest).append(item)
+    return matching, rest
+
+
+def _hold(ec2, pending: List[Dict]) -> List[Dict]:
+    """Leave the attachments pending for an operator and mark them so later sweeps skip them."""
+    attachment_ids = [a['TransitGatewayAttachmentId'] for a in pending]
+    logger.warning("Holding %d swept attachments, their requesting principal cannot be validated: %s",
+                   len(attachment_ids), attachment_ids)
+    _mark(ec2, attachment_ids, 'held')
+    return [
+        {'item_id': attachment_id, 'attachment_id': attachment_id, 'result': HELD,
+         'message': f"Requesting principal of {attachment_id} unknown, left pending"}
+        for attachment_id in attachment_ids
+    ]
+
+
+def _mark(ec2, attachment_ids: List[str], value: str) -> None:
+    """Tag the attachments with SWEEP_TAG_KEY so later sweeps skip them."""
+    from botocore.exceptions import ClientError
+
+    # CreateTags takes up to 1000 resources per call
+    for start in range(0, len(attachment_ids), 1000):
+        batch = attachment_ids[start:start + 1000]
+        try:
+            ec2.create_tags(Resources=batch, Tags=[{'Key': SWEEP_TAG_KEY, 'Value': value}])
+        except ClientError as e:
+            logger.error("Failed to mark %d attachments as %s: %s", len(batch), value, e)
+
+
+def _start_execution(attachment: Dict) -> Dict:
+    """Start one accept state machine execution, named after the attachment to avoid duplicates."""
+    from botocore.exceptions import ClientError
+
+    attachment_id = attachment['TransitGatewayAttachmentId']
+    result = {'item_id': attachment_id, 'attachment_id': attachment_id}
+    try:
+        get_client('stepfunctions', region_env).start_execution(
+            stateMachineArn=accept_state_machine_arn,
+            name=f"sweep-{attachment_id}",
+            input=json.dumps(synthetic_create_event(attachment)),
+        )
+        result.update(result='STARTED', message=f"Started accept execution for {attachment_id}")
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ExecutionAlreadyExists':
+            result.update(result='SKIPPED', message=f"Accept execution for {attachment_id} already started")
+        else:
+            logger.error("Failed to start accept execution for %s: %s", attachment_id, e)
+            result.update(result='FAILED', message=str(e))
+    return result
+
+
+def _start_executions(pending: List[Dict]) -> List[Dict]:
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+        return list(executor.map(_start_execution, pending))
@@ -0,0 +1,143 @@
+import os
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+# Set environment variables before importing the handler
+os.environ['LOG_LEVEL'] = 'DEBUG'
+os.environ['TRANSIT_GATEWAY_IDS'] = 'tgw-1'
+os.environ['ALLOWED_PRINCIPAL_PATTERNS'] = '111111111111'
+os.environ['IPAM_POOL_IDS'] = ''
+os.environ['SWEEP_MIN_AGE_SECONDS'] = '300'
+
+import handler
+from handler import lambda_handler
+from models import CloudTrailEvent, TGWAttachment, synthetic_create_event
+
+
+def _attachment(attachment_id, owner='111111111111', age_seconds=3600, tags=()):
+    return {
+        'TransitGatewayAttachmentId': attachment_id,
+        'TransitGatewayId': 'tgw-1',
+        'ResourceOwnerId': owner,
+        'ResourceType': 'vpc',
+        'ResourceId': f'vpc-{attachment_id}',
+        'State': 'pendingAcceptance',
+        'CreationTime': datetime.now(timezone.utc) - timedelta(seconds=age_seconds),
+        'Tags': [{'Key': key, 'Value': value} for key, value in tags],
+    }
+
+
+@pytest.fixture
+def ec2():
+    client = MagicMock()
+    client.pages = []
+    client.get_paginator.return_value.paginate.side_effect = lambda **kwargs: iter(client.pages)
+    return client
+
+
+def test_synthetic_event_is_parsed_like_a_create_event():
+    ct_event = CloudTrailEvent.from_raw(synthetic_create_event(_attachment('tgw-attach-1')))
+    attachment = TGWAttachment.from_event(ct_event)
+
+    assert attachment.attachment_id == 'tgw-attach-1'
+    assert attachment.vpc_id == 'vpc-tgw-attach-1'
+    assert attachment.account_id == '111111111111'
+    assert attachment.state == 'pendingAcceptance'
+    assert ct_event.detail['userIdentity'] == {
+        'type': 'AWSAccount', 'principalId': '111111111111', 'accountId': '111111111111'}
+
+
+def test_sweep_uses_server_side_filters(ec2):
+    with patch('handler.get_client', return_value=ec2):
+        result = lambda_handler({}, MagicMock())
+
+    assert result['results'] == []
+    ec2.get_paginator.assert_called_once_with('describe_transit_gateway_attachments')
+    filters = ec2.get_paginator.return_value.paginate.call_args.kwargs['Filters']
+    assert {'Name': 'state', 'Values': ['pendingAcceptance']} in filters
+    assert {'Name': 'resource-type', 'Values': ['vpc']} in filters
+    assert {'Name': 'transit-gateway-id', 'Values': ['tgw-1']} in filters
+
+
+def test_sweep_accepts_stale_pending_attachments(ec2):
+    ec2.pages = [
+        {'TransitGatewayAttachments': [_attachment('tgw-attach-1'), _attachment('tgw-attach-2', owner='222222222222')]},
+        {'TransitGatewayAttachments': [_attachment('tgw-attach-new', age_seconds=10)]},
+    ]
+
+    with patch('handler.get_client', return_value=ec2):
+        result = lambda_handler({}, MagicMock())
+
+    ec2.accept_transit_gateway_vpc_attachment.assert_called_once_with(TransitGatewayAttachmentId='tgw-attach-1')
+    assert result['summary'] == {'ACCEPTED': 1, 'HELD': 1}
+
+
+def test_sweep_holds_attachments_whose_owner_matches_no_pattern(ec2):
+    ec2.pages = [{'TransitGatewayAttachments': [_attachment('tgw-attach-1'), _attachment('tgw-attach-2')]}]
+
+    with patch('handler.get_client', return_value=ec2), \
+            patch.object(handler, 'allowed_principal_patterns', ['arn:aws:iam::*:role/network-admin']):
+        result = lambda_handler({}, MagicMock())
+
+    ec2.accept_transit_gateway_vpc_attachment.assert_not_called()
+    ec2.create_tags.assert_called_once_with(
+        Resources=['tgw-attach-1', 'tgw-attach-2'], Tags=[{'Key': handler.SWEEP_TAG_KEY, 'Value': 'held'}])
+    assert result['summary'] == {'HELD': 2}
+
+
+def test_sweep_skips_the_principal_check_when_the_policy_says_so(ec2):
+    ec2.pages = [{'TransitGatewayAttachments': [_attachment('tgw-attach-1', owner='222222222222')]}]
+
+    with patch('handler.get_client', return_value=ec2), \
+            patch.object(handler, 'allowed_principal_patterns', ['arn:aws:iam::*:role/network-admin']), \
+            patch.object(handler, 'sweeper_iam_policy', 'skip'):
+        result = lambda_handler({}, MagicMock())
+
+    ec2.accept_transit_gateway_vpc_attachment.assert_called_once_with(TransitGatewayAttachmentId='tgw-attach-1')
+    assert result['summary'] == {'ACCEPTED': 1}
+
+
+def test_sweep_marks_rejected_attachments(ec2):
+    ec2.pages = [{'TransitGatewayAttachments': [_attachment('tgw-attach-1'), _attachment('tgw-attach-2')]}]
+
+    with patch('handler.get_client', return_value=ec2), \
+            patch.object(handler, 'ipam_pool_ids', ['ipam-pool-1']), \
+            patch('batch_accept.find_vpc_pools', return_value={'vpc-tgw-attach-1': 'ipam-pool-1'}):
+        result = lambda_handler({}, MagicMock())
+
+    assert result['summary'] == {'ACCEPTED': 1, 'REJECTED': 1}
+    ec2.create_tags.assert_any_call(
+        Resources=['tgw-attach-2'], Tags=[{'Key': handler.SWEEP_TAG_KEY, 'Value': 'rejected'}])
+
+
+def test_sweep_skips_attachments_marked_by_an_earlier_sweep(ec2):
+    ec2.pages = [{'TransitGatewayAttachments': [
+        _attachment('tgw-attach-1', tags=[(handler.SWEEP_TAG_KEY, 'rejected')]),
+        _attachment('tgw-attach-2', tags=[(handler.SWEEP_TAG_KEY, 'held')]),
+    ]}]
+
+    with patch('handler.get_client', return_value=ec2):
+        result = lambda_handler({}, MagicMock())
+
+    ec2.accept_transit_gateway_vpc_attachment.assert_not_called()
+    assert result['results'] == []
+
+
+def test_sweep_starts_executions_when_approval_is_required(ec2):
+    ec2.pages = [{'TransitGatewayAttachments': [_attachment('tgw-attach-1'), _attachment('tgw-attach-2')]}]
+
+    def start_execution(stateMachineArn, name, input):
+        if name == 'sweep-tgw-attach-2':
+            raise ClientError({'Error': {'Code': 'ExecutionAlreadyExists', 'Message': 'exists'}}, 'StartExecution')
+
+    ec2.start_execution.side_effect = start_execution
+
+    with patch('handler.get_client', return_value=ec2), \
+            patch.object(handler, 'accept_state_machine_arn', 'arn:aws:states:us-west-2:123456789012:stateMachine:accept'):
+        result = lambda_handler({}, MagicMock())
+
+    ec2.accept_transit_gateway_vpc_attachment.assert_not_called()
+    assert result['summary'] == {'STARTED': 1, 'SKIPPED': 1}
@@ -0,0 +1,17 @@
+# Import shared models and accept workflow stages from common layer
+from models import CloudTrailEvent
+from accept_stages import validate_cidr_overlap
+from logs import configure_logging, log_invocation
+from idempotency import idempotent
+from metrics import record_api_calls
+
+# Configure logging
+logger = configure_logging()
+
+@record_api_calls
+@idempotent('validate_cidr_overlap')
+def lambda_handler(event, context):
+    log_invocation(logger, event, context)
+    logger.info('Lambda invocation started')
+    ct_event = CloudTrailEvent.from_raw(event)
+    return validate_cidr_overlap(ct_event)
@@ -0,0 +1,54 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+os.environ['LOG_LEVEL'] = 'DEBUG'
+os.environ['IPAM_POOL_IDS'] = 'ipam-pool-1'
+
+from handler import lambda_handler
+
+
+def _create_event(state='pendingAcceptance'):
+    return {
+        'detail-type': 'AWS API Call via CloudTrail',
+        'detail': {
+            'eventName': 'CreateTransitGatewayVpcAttachment',
+            'responseElements': {'CreateTransitGatewayVpcAttachmentResponse': {'transitGatewayVpcAttachment': {
+                'transitGatewayAttachmentId': 'tgw-attach-1',
+                'transitGatewayId': 'tgw-1',
+                'vpcId': 'vpc-new',
+                'vpcOwnerId': '111111111111',
+                'state': state,
+            }}},
+        },
+    }
+
+
+def _check(cidrs, overlaps, event=None):
+    with patch('accept_stages.get_client'), \
+            patch('accept_stages.find_overlapping_cidrs', return_value=(cidrs, overlaps)) as find:
+        return lambda_handler(event or _create_event(), MagicMock()), find
+
+
+def test_vpc_without_overlaps_passes():
+    result, find = _check(['10.1.0.0/16'], [])
+
+    assert result['result'] == 'SUCCESS'
+    assert result['attachment']['cidrs'] == ['10.1.0.0/16']
+    assert find.call_args.args[1:] == ('tgw-1', 'vpc-new', ['ipam-pool-1'])
+
+
+def test_overlapping_vpc_is_rejected_naming_the_conflicts():
+    with pytest.raises(Exception, match=r'10\.0\.0\.0/16 \(vpc-a\)'):
+        _check(['10.0.4.0/22'], [('10.0.0.0/16', 'vpc-a')])
+
+
+def test_vpc_unknown_to_ipam_is_rejected():
+    with pytest.raises(Exception, match='not found in IPAM'):
+        _check([], [])
+
+
+def test_attachment_not_pending_is_not_checked():
+    with pytest.raises(ValueError):
+        _check(['10.1.0.0/16'], [], _create_event(state='available'))
@@ -1,47 +1,205 @@
-import boto3
 import os
-import logging
-from botocore.exceptions import ClientError
+import json
+import time
+from typing import Any, Dict, Optional
 
 # Import shared models
 from models import CloudTrailEvent, TGWAttachment
+from clients import get_client, prewarm_clients
+from attachment_waiters import TERMINAL_STATES, register_waiter
+from kvstore import store_from_env
+from logs import configure_logging, log_invocation
+from metrics import THROTTLE_ERROR_CODES, record_api_calls
 
 # Configure logging
 region_env = os.environ.get('AWS_REGION', 'eu-north-1')
-log_level = os.environ.get('LOG_LEVEL', 'INFO').upper()
-logger = logging.getLogger()
-logger.setLevel(log_level)
+logger = configure_logging()
 
-def lambda_handler(event, context):
-    logger.info('Lambda invocation started')
-    logger.debug(f'Raw event: {event}')
+# Polling configuration
+poll_initial_seconds = float(os.environ.get('WAIT_POLL_INITIAL_SECONDS', '2'))
+poll_max_seconds = float(os.environ.get('WAIT_POLL_MAX_SECONDS', '15'))
+poll_backoff_rate = float(os.environ.get('WAIT_POLL_BACKOFF_RATE', '1.5'))
+# Time left for returning a checkpoint when the invocation's budget runs out
+safety_margin_seconds = float(os.environ.get('WAIT_SAFETY_MARGIN_SECONDS', '5'))
+# Give up on an attachment that has not become available after this long, across invocations
+max_wait_seconds = float(os.environ.get('WAIT_MAX_SECONDS', '3600'))
+# Budget used when no Lambda context is available (e.g. local runs)
+default_budget_seconds = float(os.environ.get('WAIT_DEFAULT_BUDGET_SECONDS', '30'))
+# How long after the first poll a NotFound is put down to EC2's eventual consistency
+not_found_grace_seconds = float(os.environ.get('WAIT_NOT_FOUND_GRACE_SECONDS', '60'))
 
-    ct_event = CloudTrailEvent.from_raw(event)
+NOT_FOUND_ERROR_CODE = 'InvalidTransitGatewayAttachmentID.NotFound'
 
-    attachment = TGWAttachment.from_event(ct_event)
+prewarm_clients([('ec2', region_env)])
+
+
+class AttachmentNotAvailableError(Exception):
+    """The attachment reached a state from which it will not become available."""
+
+
+class AttachmentWaitTimeoutError(Exception):
+    """The attachment did not become available within WAIT_MAX_SECONDS."""
+
+
+def describe_state(ec2, attachment_id: str, tolerate_not_found: bool = True) -> Optional[str]:
+    """
+    Return the current state of the attachment, or None if it is worth polling again.
+
+    Throttling is always retried, a NotFound only while tolerate_not_found is set,
+    as a new attachment may not be visible to every API endpoint yet.
+
+    Raises:
+        ClientError: For any other error, e.g. a missing permission, or a NotFound
+            that is no longer tolerated
+    """
+    from botocore.exceptions import ClientError
 
-    ec2 = boto3.client('ec2', region_name=region_env)
     try:
         response = ec2.describe_transit_gateway_attachments(
-            TransitGatewayAttachmentIds=[attachment.attachment_id]
+            TransitGatewayAttachmentIds=[attachment_id]
         )
-        state = response['TransitGatewayAttachments'][0]['State']
-        logger.info(f"TGW Attachment {attachment.attachment_id} is in state: {state}")
     except ClientError as e:
-        logger.error(f"Failed to describe TGW attachment {attachment.attachment_id}: {e}")
+        code = e.response.get('Error', {}).get('Code', '')
+        if code not in THROTTLE_ERROR_CODES and not (tolerate_not_found and code == NOT_FOUND_ERROR_CODE):
+            raise
+        logger.warning("Failed to describe TGW attachment %s, polling again: %s", attachment_id, e)
+        return None
+    attachments = response.get('TransitGatewayAttachments', [])
+    return attachments[0]['State'] if attachments else None
+
+
+def _remaining_seconds(context: Any, started: float) -> float:
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        return context.get_remaining_time_in_millis() / 1000
+    return default_budget_seconds - (time.monotonic() - started)
+
+
+def wait_for_available(ec2, attachment_id: str, context: Any, checkpoint: Optional[Dict] = None,
+                       sleep=time.sleep) -> Dict:
+    """
+    Poll the attachment until it is available or the invocation's time budget runs out.
+
+    The delay between polls grows by WAIT_POLL_BACKOFF_RATE while the state stays
+    the same and drops back to WAIT_POLL_INITIAL_SECONDS when it changes, so an
+    attachment that is moving through its states is checked often.
+
+    Args:
+        ec2: boto3 EC2 client
+        attachment_id: TGW attachment ID
+        context: Lambda context used for the remaining time budget
+        checkpoint: Checkpoint returned by a previous invocation, if resuming
+        sleep: Sleep function, replaceable for tests
+
+    Returns:
+        Dict with 'state' and 'available' (bool) and a 'checkpoint' to resume from
+
+    Raises:
+        AttachmentNotAvailableError: If the attachment reached a terminal state
+        AttachmentWaitTimeoutError: If WAIT_MAX_SECONDS passed since the first poll
+        ClientError: If the attachment cannot be described, see describe_state
+    """
+    started = time.monotonic()
+    checkpoint = checkpoint or {}
+    first_poll_at = checkpoint.get('first_poll_at', time.time())
+    polls = checkpoint.get('polls', 0)
+    delay = checkpoint.get('next_delay_seconds', poll_initial_seconds)
+    last_state = checkpoint.get('state')
+
+    while True:
+        state = describe_state(ec2, attachment_id,
+                               tolerate_not_found=time.time() - first_poll_at < not_found_grace_seconds)
+        polls += 1
+        logger.debug("TGW Attachment %s is in state: %s (poll %d)", attachment_id, state, polls)
 
+        if state == 'available':
+            return {'state': state, 'available': True,
+                    'checkpoint': {'first_poll_at': first_poll_at, 'polls': polls, 'state': state}}
+        if state in TERMINAL_STATES:
+            raise AttachmentNotAvailableError(f"Attachment {attachment_id} is in state {state}, it will not become available")
+        if time.time() - first_poll_at >= max_wait_seconds:
+            raise AttachmentWaitTimeoutError(
+                f"Attachment {attachment_id} is in state {state} after {polls} polls, expected 'available'")
+
+        if state is not None and state != last_state:
+            delay = poll_initial_seconds
+        last_state = state if state is not None else last_state
+
+        if _remaining_seconds(context, started) - safety_margin_seconds < delay:
+            logger.info("Time budget used up after %d polls, returning checkpoint", polls)
+            return {'state': state, 'available': False,
+                    'checkpoint': {'first_poll_at': first_poll_at, 'polls': polls, 'state': last_state,
+                                   'next_delay_seconds': delay}}
+        sleep(delay)
+        delay = min(delay * poll_backoff_rate, poll_max_seconds)
+
+
+def wait_with_watcher(ec2, attachment: TGWAttachment, task_token: str) -> Dict:
+    """
+    Check the attachment once and hand it over to the shared watcher if it is not available yet.
+
+    The task token is completed right away when the attachment is already available,
+    otherwise by the watch_attachments function once it is.
+    """
+    result = {
+        'result': "SUCCESS",
+        'attachment': {
+            'account_id': attachment.account_id,
+            'vpc_id': attachment.vpc_id,
+            'attachment_id': attachment.attachment_id,
+            'state': 'available'
+        },
+        'message': f"Attachment {attachment.attachment_id} is available"
+    }
+    state = describe_state(ec2, attachment.attachment_id)
+    logger.info("TGW Attachment %s is in state: %s", attachment.attachment_id, state)
+    if state in TERMINAL_STATES:
+        raise AttachmentNotAvailableError(f"Attachment {attachment.attachment_id} is in state {state}, it will not become available")
     if state == 'available':
+        get_client('stepfunctions', region_env).send_task_success(taskToken=task_token, output=json.dumps(result))
+        return {'result': "SUCCESS", 'message': result['message']}
+
+    register_waiter(store_from_env(), attachment.attachment_id, task_token, result, max_wait_seconds)
+    return {'result': "REGISTERED", 'message': f"Waiting for attachment {attachment.attachment_id} in watcher"}
+
+
+@record_api_calls
+def lambda_handler(event, context):
+    log_invocation(logger, event, context)
+    logger.info('Lambda invocation started')
+
+    ct_event = CloudTrailEvent.from_raw(event)
+
+    attachment = TGWAttachment.from_event(ct_event)
+
+    ec2 = get_client('ec2', region_env)
+
+    # Watcher mode: the state machine waits for a task token completed by watch_attachments
+    task_token = event.get('TaskToken')
+    if task_token:
+        return wait_with_watcher(ec2, attachment, task_token)
+
+    # The state machine loops back with the previous result when it was PENDING
+    previous = (event.get('WaitForAvailablePayload') or {}).get('Payload') or {}
+    checkpoint = previous.get('checkpoint') if previous.get('result') == "PENDING" else None
+
+    outcome = wait_for_available(ec2, attachment.attachment_id, context, checkpoint)
+
+    attachment_info = {
+        'account_id': attachment.account_id,
+        'vpc_id': attachment.vpc_id,
+        'attachment_id': attachment.attachment_id,
+        'state': outcome['state']
+    }
+    if outcome['available']:
         return {
             'result': "SUCCESS",
-            'attachment': {
-                'account_id': attachment.account_id,
-                'vpc_id': attachment.vpc_id,
-                'attachment_id': attachment.attachment_id,
-                'state': attachment.state
-            },
+            'attachment': attachment_info,
+            'polls': outcome['checkpoint']['polls'],
             'message': f"Attachment {attachment.attachment_id} is available"
         }
-    else:
-        raise Exception(f"Attachment {attachment.attachment_id} is in state {state}, expected 'available'")
-
-
+    return {
+        'result': "PENDING",
+        'attachment': attachment_info,
+        'checkpoint': outcome['checkpoint'],
+        'message': f"Attachment {attachment.attachment_id} is in state {outcome['state']}, still waiting"
+    }
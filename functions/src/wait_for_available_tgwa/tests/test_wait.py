@@ -0,0 +1,179 @@
+import os
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+os.environ['LOG_LEVEL'] = 'DEBUG'
+
+import handler
+from handler import AttachmentNotAvailableError, wait_for_available
+from attachment_waiters import WAITER_COLLECTION
+from kvstore import MemoryStore
+
+ATTACHMENT_ID = 'tgw-attach-1'
+
+
+class FakeContext:
+    """Lambda context whose remaining time shrinks by what FakeSleep slept."""
+
+    def __init__(self, remaining_seconds):
+        self.remaining_seconds = remaining_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(self.remaining_seconds * 1000)
+
+
+class FakeSleep:
+    def __init__(self, context):
+        self.context = context
+        self.delays = []
+
+    def __call__(self, seconds):
+        self.delays.append(seconds)
+        self.context.remaining_seconds -= seconds
+
+
+def _ec2(states):
+    ec2 = MagicMock()
+    responses = []
+    for state in states:
+        if isinstance(state, Exception):
+            responses.append(state)
+        else:
+            responses.append({'TransitGatewayAttachments': [{'State': state}]})
+    ec2.describe_transit_gateway_attachments.side_effect = responses
+    return ec2
+
+
+def test_polls_until_available_within_one_invocation():
+    context = FakeContext(60)
+    sleep = FakeSleep(context)
+    ec2 = _ec2(['pendingAcceptance', 'pending', 'pending', 'pending', 'available'])
+
+    outcome = wait_for_available(ec2, ATTACHMENT_ID, context, sleep=sleep)
+
+    assert outcome['available'] is True
+    assert outcome['checkpoint']['polls'] == 5
+    # Delay drops back when the state changes and grows while it stays the same
+    assert sleep.delays == [2, 2, 3.0, 4.5]
+
+
+def test_describe_errors_are_retried():
+    context = FakeContext(60)
+    error = ClientError({'Error': {'Code': 'RequestLimitExceeded', 'Message': 'slow down'}},
+                        'DescribeTransitGatewayAttachments')
+    ec2 = _ec2([error, 'available'])
+
+    outcome = wait_for_available(ec2, ATTACHMENT_ID, context, sleep=FakeSleep(context))
+
+    assert outcome['available'] is True
+
+
+def _error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'DescribeTransitGatewayAttachments')
+
+
+def test_not_found_is_retried_right_after_creation():
+    context = FakeContext(60)
+    ec2 = _ec2([_error('InvalidTransitGatewayAttachmentID.NotFound'), 'available'])
+
+    outcome = wait_for_available(ec2, ATTACHMENT_ID, context, sleep=FakeSleep(context))
+
+    assert outcome['available'] is True
+
+
+def test_not_found_after_the_grace_period_fails(monkeypatch):
+    monkeypatch.setattr(handler, 'not_found_grace_seconds', 10)
+    context = FakeContext(60)
+    checkpoint = {'first_poll_at': time.time() - 20, 'polls': 3, 'state': 'pending', 'next_delay_seconds': 2}
+    ec2 = _ec2([_error('InvalidTransitGatewayAttachmentID.NotFound')])
+
+    with pytest.raises(ClientError):
+        wait_for_available(ec2, ATTACHMENT_ID, context, checkpoint=checkpoint, sleep=FakeSleep(context))
+
+
+def test_other_describe_errors_fail_at_once():
+    context = FakeContext(60)
+    sleep = FakeSleep(context)
+    ec2 = _ec2([_error('UnauthorizedOperation'), 'available'])
+
+    with pytest.raises(ClientError):
+        wait_for_available(ec2, ATTACHMENT_ID, context, sleep=sleep)
+    assert sleep.delays == []
+
+
+def test_terminal_state_fails_fast():
+    context = FakeContext(60)
+    sleep = FakeSleep(context)
+    ec2 = _ec2(['pending', 'failed'])
+
+    with pytest.raises(AttachmentNotAvailableError):
+        wait_for_available(ec2, ATTACHMENT_ID, context, sleep=sleep)
+    assert len(sleep.delays) == 1
+
+
+def test_returns_checkpoint_when_budget_runs_out_and_resumes():
+    context = FakeContext(10)
+    ec2 = _ec2(['pending'] * 3)
+
+    outcome = wait_for_available(ec2, ATTACHMENT_ID, context, sleep=FakeSleep(context))
+
+    assert outcome['available'] is False
+    checkpoint = outcome['checkpoint']
+    assert checkpoint['polls'] == 3
+    assert checkpoint['state'] == 'pending'
+
+    context = FakeContext(60)
+    sleep = FakeSleep(context)
+    ec2 = _ec2(['pending', 'available'])
+    outcome = wait_for_available(ec2, ATTACHMENT_ID, context, checkpoint=checkpoint, sleep=sleep)
+
+    assert outcome['available'] is True
+    assert outcome['checkpoint']['polls'] == 5
+    # Backoff carries over from the previous invocation
+    assert sleep.delays == [checkpoint['next_delay_seconds']]
+
+
+def test_gives_up_after_max_wait(monkeypatch):
+    monkeypatch.setattr(handler, 'max_wait_seconds', 100)
+    context = FakeContext(60)
+    checkpoint = {'first_poll_at': 0, 'polls': 50, 'state': 'pending', 'next_delay_seconds': 15}
+
+    with pytest.raises(handler.AttachmentWaitTimeoutError):
+        wait_for_available(_ec2(['pending']), ATTACHMENT_ID, context, checkpoint=checkpoint, sleep=FakeSleep(context))
+
+
+def _attachment():
+    return handler.TGWAttachment(
+        account_id='111111111111', vpc_id='vpc-1', attachment_id=ATTACHMENT_ID, state='pendingAcceptance')
+
+
+def test_watcher_mode_registers_pending_attachment():
+    store = MemoryStore()
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(handler, 'store_from_env', lambda: store)
+        result = handler.wait_with_watcher(_ec2(['pending']), _attachment(), 'token-1')
+
+    assert result['result'] == 'REGISTERED'
+    [waiter] = store.query(WAITER_COLLECTION)
+    assert waiter.value['attachment_id'] == ATTACHMENT_ID
+    assert waiter.value['task_token'] == 'token-1'
+
+
+def test_watcher_mode_completes_available_attachment_at_once():
+    sfn = MagicMock()
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(handler, 'get_client', lambda service, region=None: sfn)
+        result = handler.wait_with_watcher(_ec2(['available']), _attachment(), 'token-1')
+
+    assert result['result'] == 'SUCCESS'
+    sfn.send_task_success.assert_called_once()
+
+
+def test_watcher_mode_fails_on_describe_errors():
+    with pytest.raises(ClientError):
+        handler.wait_with_watcher(_ec2([_error('UnauthorizedOperation')]), _attachment(), 'token-1')
@@ -0,0 +1,63 @@
+import os
+import time
+from typing import Any, Dict
+
+# Import shared modules from common layer
+from attachment_waiters import AttachmentWatcher
+from clients import get_client, prewarm_clients
+from kvstore import store_from_env
+from logs import configure_logging, log_invocation
+from metrics import record_api_calls
+
+# Configure logging
+logger = configure_logging()
+
+# Environment variables
+region_env = os.environ.get('AWS_REGION', 'eu-north-1')
+watch_interval_seconds = float(os.environ.get('WATCH_INTERVAL_SECONDS', '5'))
+# Time left for finishing a cycle before the invocation times out
+safety_margin_seconds = float(os.environ.get('WATCH_SAFETY_MARGIN_SECONDS', '10'))
+
+prewarm_clients([('ec2', region_env), ('stepfunctions', region_env)])
+
+
+@record_api_calls(attach_to_result=True)
+def lambda_handler(event: Dict[str, Any], context: Any, sleep=time.sleep) -> Dict[str, Any]:
+    """
+    Lambda function to resume workflows whose attachments became available.
+
+    Args:
+        event: Scheduled EventBridge event (unused)
+        context: Lambda context object, used for the remaining time budget
+        sleep: Sleep function, replaceable for tests
+
+    Returns:
+        Dict with the number of cycles run and waiter counts per outcome
+    """
+    log_invocation(logger, event, context)
+    logger.info('Lambda invocation started')
+    watcher = AttachmentWatcher(get_client('ec2', region_env), get_client('stepfunctions', region_env), store_from_env())
+
+    totals = {'available': 0, 'failed': 0}
+    cycles = 0
+    while True:
+        counts = watcher.poll_once()
+        cycles += 1
+        totals['available'] += counts['available']
+        totals['failed'] += counts['failed']
+        logger.debug("Watch cycle %s: %s", cycles, counts)
+        # Nothing left to watch; new waiters are picked up by the next scheduled run
+        if counts['waiting'] == 0:
+            break
+        if context.get_remaining_time_in_millis() / 1000 - safety_margin_seconds < watch_interval_seconds:
+            break
+        sleep(watch_interval_seconds)
+
+    logger.info("Watcher completed %d cycles: %s, %s still waiting", cycles, totals, counts['waiting'])
+    return {
+        'result': "SUCCESS",
+        'cycles': cycles,
+        'available': totals['available'],
+        'failed': totals['failed'],
+        'waiting': counts['waiting'],
+    }
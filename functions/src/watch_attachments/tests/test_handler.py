@@ -0,0 +1,108 @@
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+os.environ['LOG_LEVEL'] = 'DEBUG'
+
+from attachment_waiters import WAITER_COLLECTION, AttachmentWatcher, register_waiter
+from handler import lambda_handler
+from kvstore import MemoryStore
+
+RESULT = {'result': 'SUCCESS', 'attachment': {'attachment_id': 'tgw-attach-1'}}
+
+
+def _ec2(states):
+    """MagicMock EC2 client describing attachments from a dict of ID to state."""
+    ec2 = MagicMock()
+
+    def paginate(Filters):
+        ids = Filters[0]['Values']
+        yield {'TransitGatewayAttachments': [
+            {'TransitGatewayAttachmentId': i, 'State': states[i]} for i in ids if i in states
+        ]}
+
+    ec2.get_paginator.return_value.paginate.side_effect = paginate
+    return ec2
+
+
+class FakeContext:
+    def __init__(self, remaining_seconds):
+        self.remaining_seconds = remaining_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(self.remaining_seconds * 1000)
+
+
+def test_one_describe_call_per_cycle_for_all_waiters():
+    store = MemoryStore()
+    for n in range(50):
+        register_waiter(store, f'tgw-attach-{n}', f'token-{n}', RESULT, max_wait_seconds=600)
+    ec2 = _ec2({f'tgw-attach-{n}': 'available' if n % 2 else 'pending' for n in range(50)})
+    sfn = MagicMock()
+
+    counts = AttachmentWatcher(ec2, sfn, store).poll_once()
+
+    assert counts == {'available': 25, 'failed': 0, 'waiting': 25}
+    assert ec2.get_paginator.return_value.paginate.call_count == 1
+    assert sfn.send_task_success.call_count == 25
+    assert len(store.query(WAITER_COLLECTION)) == 25
+    output = json.loads(sfn.send_task_success.call_args.kwargs['output'])
+    assert output['attachment']['state'] == 'available'
+
+
+def test_terminal_missing_and_expired_waiters_fail():
+    store = MemoryStore()
+    register_waiter(store, 'tgw-attach-rejected', 'token-1', RESULT, max_wait_seconds=600)
+    register_waiter(store, 'tgw-attach-gone', 'token-2', RESULT, max_wait_seconds=600)
+    register_waiter(store, 'tgw-attach-slow', 'token-3', RESULT, max_wait_seconds=600)
+    ec2 = _ec2({'tgw-attach-rejected': 'rejected', 'tgw-attach-slow': 'pending'})
+    sfn = MagicMock()
+    watcher = AttachmentWatcher(ec2, sfn, store)
+
+    # A missing attachment gets a grace period for eventual consistency
+    assert watcher.poll_once()['failed'] == 1
+    counts = watcher.poll_once(now=store.query(WAITER_COLLECTION)[0].value['registered_at'] + 601)
+
+    assert counts == {'available': 0, 'failed': 2, 'waiting': 0}
+    errors = sorted(c.kwargs['error'] for c in sfn.send_task_failure.call_args_list)
+    assert errors == ['AttachmentNotAvailableError', 'AttachmentNotAvailableError', 'AttachmentWaitTimeoutError']
+    assert store.query(WAITER_COLLECTION) == []
+
+
+def test_waiter_is_kept_when_completion_fails_transiently():
+    store = MemoryStore()
+    register_waiter(store, 'tgw-attach-1', 'token-1', RESULT, max_wait_seconds=600)
+    sfn = MagicMock()
+    sfn.send_task_success.side_effect = [
+        ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'SendTaskSuccess'),
+        None,
+    ]
+    watcher = AttachmentWatcher(_ec2({'tgw-attach-1': 'available'}), sfn, store)
+
+    watcher.poll_once()
+    assert len(store.query(WAITER_COLLECTION)) == 1
+    watcher.poll_once()
+    assert store.query(WAITER_COLLECTION) == []
+    assert sfn.send_task_success.call_count == 2
+
+
+def test_handler_cycles_until_no_waiters_left():
+    store = MemoryStore()
+    register_waiter(store, 'tgw-attach-1', 'token-1', RESULT, max_wait_seconds=600)
+    states = {'tgw-attach-1': 'pending'}
+    ec2 = _ec2(states)
+    sfn = MagicMock()
+
+    def sleep(seconds):
+        states['tgw-attach-1'] = 'available'
+
+    with patch('handler.store_from_env', return_value=store), \
+            patch('handler.get_client', side_effect=lambda service, region=None: ec2 if service == 'ec2' else sfn):
+        result = lambda_handler({}, FakeContext(60), sleep=sleep)
+
+    assert result['cycles'] == 2
+    assert result['available'] == 1
+    assert result['waiting'] == 0
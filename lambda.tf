@@ -12,7 +12,11 @@ module "lambda_layer" {
   description         = "Common dependencies for Lambda functions"
   compatible_runtimes = ["python3.11"]
 
-  source_path = "${path.module}/functions/src/common"
+  # The layer ships the modules under python/, not their tests
+  source_path = [{
+    path     = "${path.module}/functions/src/common"
+    patterns = ["!tests/.*"]
+  }]
 }
 
 
@@ -44,11 +48,17 @@ module "lambda_validate_iam" {
 
   environment_variables = {
     ALLOWED_PRINCIPAL_PATTERNS = join(",", var.allowed_principal_patterns)
+    SWEEPER_IAM_POLICY         = var.sweeper_iam_policy
+    IDEMPOTENCY_ENABLED        = var.idempotency_enabled
+    KV_STORE_TABLE             = var.idempotency_enabled ? aws_dynamodb_table.state[0].name : ""
     LOG_LEVEL                  = var.log_level
+    LOG_EVENT_SAMPLE_RATE      = var.log_event_sample_rate
+    API_METRICS_NAMESPACE      = var.api_metrics_namespace
   }
 
-  # No additional IAM permissions needed beyond basic Lambda execution
-  attach_policy_statements = false
+  # Only state table access for idempotency records
+  attach_policy_statements = var.idempotency_enabled
+  policy_statements        = local.state_item_policy_statements
 
   # Include common layer
   layers = [module.lambda_layer.lambda_layer_arn]
@@ -86,22 +96,34 @@ module "lambda_validate_ipam" {
   cloudwatch_logs_log_group_class   = var.log_group_class
 
   environment_variables = {
-    IPAM_POOL_IDS = join(",", var.ipam_pool_ids)
-    LOG_LEVEL     = var.log_level
+    IPAM_POOL_IDS               = join(",", var.ipam_pool_ids)
+    IPAM_POOL_INDEX_TTL_SECONDS = var.ipam_pool_index_ttl_seconds
+    IPAM_LOOKUP_MODE            = var.ipam_lookup_mode
+    IDEMPOTENCY_ENABLED         = var.idempotency_enabled
+    KV_STORE_TABLE              = local.state_item_access_enabled ? aws_dynamodb_table.state[0].name : ""
+    EC2_RATE_LIMITS             = local.ec2_rate_limits
+    LOG_LEVEL                   = var.log_level
+    LOG_EVENT_SAMPLE_RATE       = var.log_event_sample_rate
+    API_METRICS_NAMESPACE       = var.api_metrics_namespace
   }
 
   # EC2 IPAM permissions for validating VPC allocations
   attach_policy_statements = true
-  policy_statements = {
-    ec2_ipam_permissions = {
-      effect = "Allow",
-      actions = [
-        "ec2:DescribeIpamPoolAllocations",
-        "ec2:GetIpamPoolAllocations"
-      ],
-      resources = ["*"]
-    }
-  }
+  policy_statements = merge(
+    {
+      ec2_ipam_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeIpamPoolAllocations",
+          "ec2:GetIpamPoolAllocations",
+          "ec2:DescribeIpamPools",
+          "ec2:GetIpamResourceCidrs"
+        ],
+        resources = ["*"]
+      }
+    },
+    local.state_item_policy_statements
+  )
 
   # Include common layer
   layers = [module.lambda_layer.lambda_layer_arn]
@@ -112,6 +134,75 @@ module "lambda_validate_ipam" {
   )
 }
 
+############################################################
+# Lambda: validate_cidr_overlap
+############################################################
+module "lambda_validate_cidr_overlap" {
+  count   = local.accept_sfn_include_cidr_validation ? 1 : 0
+  source  = "terraform-aws-modules/lambda/aws"
+  version = "8.1.0"
+
+  function_name = format("%s-validate-cidr-overlap", local.name_prefix)
+  description   = "Validate that VPCs attaching to a TGW do not overlap attached VPCs"
+  handler       = "handler.lambda_handler"
+  runtime       = "python3.11"
+  timeout       = var.function_timeout
+  memory_size   = var.function_memory_size
+  publish       = true
+
+  # Use source path for automatic ZIP creation
+  source_path = "${path.module}/functions/src/validate_cidr_overlap"
+
+  # Disable function URL (not needed for Step Functions-invoked Lambda)
+  create_lambda_function_url = false
+
+  # CloudWatch Logs configuration
+  cloudwatch_logs_retention_in_days = var.log_group_retention_days
+  cloudwatch_logs_log_group_class   = var.log_group_class
+
+  environment_variables = {
+    IPAM_POOL_IDS          = join(",", var.ipam_pool_ids)
+    CIDR_INDEX_TTL_SECONDS = var.cidr_index_ttl_seconds
+    IDEMPOTENCY_ENABLED    = var.idempotency_enabled
+    KV_STORE_TABLE         = local.state_item_access_enabled ? aws_dynamodb_table.state[0].name : ""
+    EC2_RATE_LIMITS        = local.ec2_rate_limits
+    LOG_LEVEL              = var.log_level
+    LOG_EVENT_SAMPLE_RATE  = var.log_event_sample_rate
+    API_METRICS_NAMESPACE  = var.api_metrics_namespace
+  }
+
+  # EC2 permissions for listing attached VPCs and IPAM permissions for their CIDRs
+  attach_policy_statements = true
+  policy_statements = merge(
+    {
+      ec2_tgw_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeTransitGatewayAttachments"
+        ],
+        resources = ["*"]
+      }
+      ec2_ipam_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeIpamPools",
+          "ec2:GetIpamResourceCidrs"
+        ],
+        resources = ["*"]
+      }
+    },
+    local.state_item_policy_statements
+  )
+
+  # Include common layer
+  layers = [module.lambda_layer.lambda_layer_arn]
+
+  tags = merge(
+    { Name = format("%s-validate-cidr-overlap-function", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
+
 ############################################################
 # Lambda: accepter
 ############################################################
@@ -138,21 +229,29 @@ module "lambda_accepter" {
   cloudwatch_logs_log_group_class   = var.log_group_class
 
   environment_variables = {
-    LOG_LEVEL = var.log_level
+    IDEMPOTENCY_ENABLED   = var.idempotency_enabled
+    KV_STORE_TABLE        = local.state_item_access_enabled ? aws_dynamodb_table.state[0].name : ""
+    EC2_RATE_LIMITS       = local.ec2_rate_limits
+    LOG_LEVEL             = var.log_level
+    LOG_EVENT_SAMPLE_RATE = var.log_event_sample_rate
+    API_METRICS_NAMESPACE = var.api_metrics_namespace
   }
 
   # EC2 permissions for TGW operations
   attach_policy_statements = true
-  policy_statements = {
-    ec2_tgw_permissions = {
-      effect = "Allow",
-      actions = [
-        "ec2:DescribeTransitGateway*",
-        "ec2:AcceptTransitGatewayVpcAttachment"
-      ],
-      resources = ["*"]
-    }
-  }
+  policy_statements = merge(
+    {
+      ec2_tgw_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeTransitGateway*",
+          "ec2:AcceptTransitGatewayVpcAttachment"
+        ],
+        resources = ["*"]
+      }
+    },
+    local.state_item_policy_statements
+  )
 
   # Include common layer
   layers = [module.lambda_layer.lambda_layer_arn]
@@ -163,6 +262,84 @@ module "lambda_accepter" {
   )
 }
 
+############################################################
+# Lambda: accept_pipeline
+############################################################
+module "lambda_accept_pipeline" {
+  count   = var.accept_sfn_fused_pipeline ? 1 : 0
+  source  = "terraform-aws-modules/lambda/aws"
+  version = "8.1.0"
+
+  function_name = format("%s-accept-pipeline", local.name_prefix)
+  description   = "Validate, accept and tag TGW VPC attachments in a single invocation"
+  handler       = "handler.lambda_handler"
+  runtime       = "python3.11"
+  timeout       = var.function_timeout
+  memory_size   = var.function_memory_size
+  publish       = true
+
+  # Use source path for automatic ZIP creation
+  source_path = "${path.module}/functions/src/accept_pipeline"
+
+  # Disable function URL (not needed for Step Functions-invoked Lambda)
+  create_lambda_function_url = false
+
+  # CloudWatch Logs configuration
+  cloudwatch_logs_retention_in_days = var.log_group_retention_days
+  cloudwatch_logs_log_group_class   = var.log_group_class
+
+  environment_variables = {
+    ALLOWED_PRINCIPAL_PATTERNS  = join(",", var.allowed_principal_patterns)
+    IPAM_POOL_IDS               = join(",", var.ipam_pool_ids)
+    IPAM_POOL_INDEX_TTL_SECONDS = var.ipam_pool_index_ttl_seconds
+    IPAM_LOOKUP_MODE            = var.ipam_lookup_mode
+    CIDR_INDEX_TTL_SECONDS      = var.cidr_index_ttl_seconds
+    ATTACHMENT_TAG_KEY          = var.attachment_tag_key
+    ATTACHMENT_TAG_VALUE        = var.attachment_tag_value
+    SWEEPER_IAM_POLICY          = var.sweeper_iam_policy
+    IDEMPOTENCY_ENABLED         = var.idempotency_enabled
+    KV_STORE_TABLE              = local.state_item_access_enabled ? aws_dynamodb_table.state[0].name : ""
+    EC2_RATE_LIMITS             = local.ec2_rate_limits
+    LOG_LEVEL                   = var.log_level
+    LOG_EVENT_SAMPLE_RATE       = var.log_event_sample_rate
+    API_METRICS_NAMESPACE       = var.api_metrics_namespace
+  }
+
+  # EC2 permissions for all accept workflow stages
+  attach_policy_statements = true
+  policy_statements = merge(
+    {
+      ec2_tgw_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeTransitGateway*",
+          "ec2:AcceptTransitGatewayVpcAttachment",
+          "ec2:CreateTags"
+        ],
+        resources = ["*"]
+      }
+      ec2_ipam_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:GetIpamPoolAllocations",
+          "ec2:DescribeIpamPools",
+          "ec2:GetIpamResourceCidrs"
+        ],
+        resources = ["*"]
+      }
+    },
+    local.state_item_policy_statements
+  )
+
+  # Include common layer
+  layers = [module.lambda_layer.lambda_layer_arn]
+
+  tags = merge(
+    { Name = format("%s-accept-pipeline-function", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
+
 ############################################################
 # Lambda: wait_for_available_tgwa
 ############################################################
@@ -189,20 +366,45 @@ module "lambda_wait_for_available_tgwa" {
   cloudwatch_logs_log_group_class   = var.log_group_class
 
   environment_variables = {
-    LOG_LEVEL = var.log_level
+    WAIT_MAX_SECONDS      = var.wait_for_available_max_seconds
+    KV_STORE_TABLE        = local.state_table_enabled ? aws_dynamodb_table.state[0].name : ""
+    EC2_RATE_LIMITS       = local.ec2_rate_limits
+    LOG_LEVEL             = var.log_level
+    LOG_EVENT_SAMPLE_RATE = var.log_event_sample_rate
+    API_METRICS_NAMESPACE = var.api_metrics_namespace
   }
 
-  # EC2 permissions for TGW operations
+  # EC2 permissions for TGW operations, plus state table and task token access in watcher mode
   attach_policy_statements = true
-  policy_statements = {
-    ec2_tgw_permissions = {
-      effect = "Allow",
-      actions = [
-        "ec2:DescribeTransitGateway*"
-      ],
-      resources = ["*"]
-    }
-  }
+  policy_statements = merge(
+    {
+      ec2_tgw_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeTransitGateway*"
+        ],
+        resources = ["*"]
+      }
+    },
+    var.attachment_watcher_enabled ? {
+      state_table_permissions = {
+        effect = "Allow",
+        actions = [
+          "dynamodb:GetItem",
+          "dynamodb:UpdateItem"
+        ],
+        resources = [aws_dynamodb_table.state[0].arn]
+      }
+      stepfunctions_permissions = {
+        effect = "Allow",
+        actions = [
+          "states:SendTaskSuccess"
+        ],
+        resources = [local.routing_manager_state_machine_arn]
+      }
+    } : {},
+    local.state_item_policy_statements
+  )
 
   # Include common layer
   layers = [module.lambda_layer.lambda_layer_arn]
@@ -240,25 +442,37 @@ module "lambda_get_pool_tags" {
   cloudwatch_logs_log_group_class   = var.log_group_class
 
   environment_variables = {
-    IPAM_POOL_IDS            = join(",", var.ipam_pool_ids)
-    LOG_LEVEL                = var.log_level
-    IPAM_ASSOCIATION_TAG_KEY = var.ipam_association_tag_key
-    IPAM_PROPAGATION_TAG_KEY = var.ipam_propagation_tag_key
+    IPAM_POOL_IDS               = join(",", var.ipam_pool_ids)
+    IPAM_POOL_INDEX_TTL_SECONDS = var.ipam_pool_index_ttl_seconds
+    IPAM_LOOKUP_MODE            = var.ipam_lookup_mode
+    IPAM_POOL_TAG_TTL_SECONDS   = var.ipam_pool_tag_ttl_seconds
+    IPAM_ASSOCIATION_TAG_KEY    = var.ipam_association_tag_key
+    IPAM_PROPAGATION_TAG_KEY    = var.ipam_propagation_tag_key
+    IDEMPOTENCY_ENABLED         = var.idempotency_enabled
+    KV_STORE_TABLE              = local.state_item_access_enabled ? aws_dynamodb_table.state[0].name : ""
+    EC2_RATE_LIMITS             = local.ec2_rate_limits
+    LOG_LEVEL                   = var.log_level
+    LOG_EVENT_SAMPLE_RATE       = var.log_event_sample_rate
+    API_METRICS_NAMESPACE       = var.api_metrics_namespace
   }
 
   # EC2 IPAM permissions for describing IPAM pools
   attach_policy_statements = true
-  policy_statements = {
-    ec2_ipam_permissions = {
-      effect = "Allow",
-      actions = [
-        "ec2:DescribeIpamPoolAllocations",
-        "ec2:GetIpamPoolAllocations",
-        "ec2:DescribeIpamPools"
-      ],
-      resources = ["*"]
-    }
-  }
+  policy_statements = merge(
+    {
+      ec2_ipam_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeIpamPoolAllocations",
+          "ec2:GetIpamPoolAllocations",
+          "ec2:DescribeIpamPools",
+          "ec2:GetIpamResourceCidrs"
+        ],
+        resources = ["*"]
+      }
+    },
+    local.state_item_policy_statements
+  )
 
   # Include common layer
   layers = [module.lambda_layer.lambda_layer_arn]
@@ -297,21 +511,29 @@ module "lambda_handle_association" {
 
   environment_variables = {
     DEFAULT_ASSOCIATE_ROUTE_TABLE_ID = var.default_associate_route_table_id
+    IDEMPOTENCY_ENABLED              = var.idempotency_enabled
+    KV_STORE_TABLE                   = local.state_item_access_enabled ? aws_dynamodb_table.state[0].name : ""
+    EC2_RATE_LIMITS                  = local.ec2_rate_limits
     LOG_LEVEL                        = var.log_level
+    LOG_EVENT_SAMPLE_RATE            = var.log_event_sample_rate
+    API_METRICS_NAMESPACE            = var.api_metrics_namespace
   }
 
   # EC2 permissions for TGW association operations
   attach_policy_statements = true
-  policy_statements = {
-    ec2_tgw_association_permissions = {
-      effect = "Allow",
-      actions = [
-        "ec2:DescribeTransitGateway*",
-        "ec2:AssociateTransitGatewayRouteTable"
-      ],
-      resources = ["*"]
-    }
-  }
+  policy_statements = merge(
+    {
+      ec2_tgw_association_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeTransitGateway*",
+          "ec2:AssociateTransitGatewayRouteTable"
+        ],
+        resources = ["*"]
+      }
+    },
+    local.state_item_policy_statements
+  )
 
   # Include common layer
   layers = [module.lambda_layer.lambda_layer_arn]
@@ -350,21 +572,44 @@ module "lambda_handle_propagation" {
 
   environment_variables = {
     DEFAULT_PROPAGATE_ROUTE_TABLE_IDS = var.default_propagate_route_table_ids
+    PROPAGATION_MAX_WORKERS           = var.propagation_max_workers
+    PROPAGATION_IMPACT_MODE           = local.propagation_impact_mode
+    IPAM_POOL_IDS                     = join(",", var.ipam_pool_ids)
+    IDEMPOTENCY_ENABLED               = var.idempotency_enabled
+    KV_STORE_TABLE                    = local.state_item_access_enabled ? aws_dynamodb_table.state[0].name : ""
+    EC2_RATE_LIMITS                   = local.ec2_rate_limits
     LOG_LEVEL                         = var.log_level
+    LOG_EVENT_SAMPLE_RATE             = var.log_event_sample_rate
+    API_METRICS_NAMESPACE             = var.api_metrics_namespace
   }
 
   # EC2 permissions for TGW propagation operations
   attach_policy_statements = true
-  policy_statements = {
-    ec2_tgw_propagation_permissions = {
-      effect = "Allow",
-      actions = [
-        "ec2:DescribeTransitGateway*",
-        "ec2:EnableTransitGatewayRouteTablePropagation"
-      ],
-      resources = ["*"]
-    }
-  }
+  policy_statements = merge(
+    {
+      ec2_tgw_propagation_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeTransitGateway*",
+          "ec2:GetTransitGatewayAttachmentPropagations",
+          "ec2:EnableTransitGatewayRouteTablePropagation"
+        ],
+        resources = ["*"]
+      }
+    },
+    local.propagation_impact_mode != "off" ? {
+      ec2_route_search_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:SearchTransitGatewayRoutes",
+          "ec2:DescribeIpamPools",
+          "ec2:GetIpamResourceCidrs"
+        ],
+        resources = ["*"]
+      }
+    } : {},
+    local.state_item_policy_statements
+  )
 
   # Include common layer
   layers = [module.lambda_layer.lambda_layer_arn]
@@ -397,23 +642,31 @@ module "lambda_handle_attachment_tags" {
   cloudwatch_logs_retention_in_days = var.log_group_retention_days
   cloudwatch_logs_log_group_class   = var.log_group_class
   environment_variables = {
-    ATTACHMENT_TAG_KEY   = var.attachment_tag_key
-    ATTACHMENT_TAG_VALUE = var.attachment_tag_value
-    LOG_LEVEL            = var.log_level
+    ATTACHMENT_TAG_KEY    = var.attachment_tag_key
+    ATTACHMENT_TAG_VALUE  = var.attachment_tag_value
+    IDEMPOTENCY_ENABLED   = var.idempotency_enabled
+    KV_STORE_TABLE        = local.state_item_access_enabled ? aws_dynamodb_table.state[0].name : ""
+    EC2_RATE_LIMITS       = local.ec2_rate_limits
+    LOG_LEVEL             = var.log_level
+    LOG_EVENT_SAMPLE_RATE = var.log_event_sample_rate
+    API_METRICS_NAMESPACE = var.api_metrics_namespace
   }
   # EC2 permissions for TGW operations
   attach_policy_statements = true
-  policy_statements = {
-    ec2_tgw_describe_permissions = {
-      effect = "Allow",
-      actions = [
-        "ec2:DescribeTransitGateway*",
-        "ec2:CreateTags",
-        "ec2:DeleteTags"
-      ],
-      resources = ["*"]
-    }
-  }
+  policy_statements = merge(
+    {
+      ec2_tgw_describe_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeTransitGateway*",
+          "ec2:CreateTags",
+          "ec2:DeleteTags"
+        ],
+        resources = ["*"]
+      }
+    },
+    local.state_item_policy_statements
+  )
   # Include common layer
   layers = [module.lambda_layer.lambda_layer_arn]
   tags = merge(
@@ -449,21 +702,37 @@ module "lambda_send_approval_email" {
   cloudwatch_logs_log_group_class   = var.log_group_class
 
   environment_variables = {
-    SNS_TOPIC_ARN = aws_sns_topic.human_approval_email[0].arn
-    LOG_LEVEL     = var.log_level
+    SNS_TOPIC_ARN                = aws_sns_topic.human_approval_email[0].arn
+    APPROVAL_DIGEST_ENABLED      = local.approval_digest_enabled
+    APPROVAL_SHORT_LINKS_ENABLED = local.approval_short_links_enabled
+    KV_STORE_TABLE               = local.approval_state_enabled ? aws_dynamodb_table.state[0].name : ""
+    LOG_LEVEL                    = var.log_level
+    LOG_EVENT_SAMPLE_RATE        = var.log_event_sample_rate
+    API_METRICS_NAMESPACE        = var.api_metrics_namespace
   }
 
-  # SNS permissions for publishing approval emails
+  # SNS permissions for publishing approval emails, plus state table access for digests and short links
   attach_policy_statements = true
-  policy_statements = {
-    sns_publish_permissions = {
-      effect = "Allow",
-      actions = [
-        "sns:Publish"
-      ],
-      resources = [aws_sns_topic.tgw_notifications.arn]
-    }
-  }
+  policy_statements = merge(
+    {
+      sns_publish_permissions = {
+        effect = "Allow",
+        actions = [
+          "sns:Publish"
+        ],
+        resources = [aws_sns_topic.tgw_notifications.arn]
+      }
+    },
+    local.approval_state_enabled ? {
+      state_table_permissions = {
+        effect = "Allow",
+        actions = [
+          "dynamodb:UpdateItem"
+        ],
+        resources = [aws_dynamodb_table.state[0].arn]
+      }
+    } : {}
+  )
 
   # Include common layer
   layers = [module.lambda_layer.lambda_layer_arn]
@@ -509,20 +778,112 @@ module "lambda_handle_approval_callback" {
   cloudwatch_logs_log_group_class   = var.log_group_class
 
   environment_variables = {
-    EMAIL_ADDRESSES = var.approval_email_addresses
-    LOG_LEVEL       = var.log_level
+    EMAIL_ADDRESSES       = var.approval_email_addresses
+    KV_STORE_TABLE        = local.approval_state_enabled ? aws_dynamodb_table.state[0].name : ""
+    LOG_LEVEL             = var.log_level
+    LOG_EVENT_SAMPLE_RATE = var.log_event_sample_rate
+    API_METRICS_NAMESPACE = var.api_metrics_namespace
   }
 
-  # Step Functions permissions for sending task success
+  # Step Functions permissions for sending task success, plus state table access for digests and short links
+  attach_policy_statements = true
+  policy_statements = merge(
+    {
+      stepfunctions_permissions = {
+        effect = "Allow",
+        actions = [
+          "states:SendTaskSuccess",
+          "states:SendTaskFailure"
+        ],
+        resources = ["*"]
+      }
+    },
+    local.approval_state_enabled ? {
+      state_table_permissions = {
+        effect = "Allow",
+        actions = [
+          "dynamodb:GetItem",
+          "dynamodb:UpdateItem",
+          "dynamodb:DeleteItem"
+        ],
+        resources = [aws_dynamodb_table.state[0].arn]
+      }
+    } : {}
+  )
+
+  # Include common layer
+  layers = [module.lambda_layer.lambda_layer_arn]
+
+  tags = merge(
+    { Name = format("%s-handle-approval-callback-function", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
+
+############################################################
+# Lambda: send_approval_digest
+############################################################
+module "lambda_send_approval_digest" {
+  count   = local.approval_digest_enabled ? 1 : 0
+  source  = "terraform-aws-modules/lambda/aws"
+  version = "8.1.0"
+
+  function_name = format("%s-send-approval-digest", local.name_prefix)
+  description   = "Send pending manual approvals as one digest notification"
+  handler       = "handler.lambda_handler"
+  runtime       = "python3.11"
+  timeout       = var.function_timeout
+  memory_size   = var.function_memory_size
+  publish       = true
+
+  # Use source path for automatic ZIP creation
+  source_path = "${path.module}/functions/src/send_approval_digest"
+
+  # Disable function URL (not needed for EventBridge-triggered Lambda)
+  create_lambda_function_url = false
+
+  # CloudWatch Logs configuration
+  cloudwatch_logs_retention_in_days = var.log_group_retention_days
+  cloudwatch_logs_log_group_class   = var.log_group_class
+
+  environment_variables = {
+    SNS_TOPIC_ARN             = aws_sns_topic.human_approval_email[0].arn
+    APPROVAL_API_ENDPOINT     = local.approval_api_endpoint
+    APPROVAL_DIGEST_MAX_ITEMS = var.approval_digest_max_items
+    KV_STORE_TABLE            = aws_dynamodb_table.state[0].name
+    LOG_LEVEL                 = var.log_level
+    LOG_EVENT_SAMPLE_RATE     = var.log_event_sample_rate
+    API_METRICS_NAMESPACE     = var.api_metrics_namespace
+  }
+
+  # Allow the schedule rule to invoke the function
+  create_current_version_allowed_triggers = false
+  allowed_triggers = {
+    digest_schedule = {
+      principal  = "events.amazonaws.com"
+      source_arn = aws_cloudwatch_event_rule.send_approval_digest[0].arn
+    }
+  }
+
+  # State table and SNS permissions for collecting and publishing the digest
   attach_policy_statements = true
   policy_statements = {
-    stepfunctions_permissions = {
+    state_table_permissions = {
+      effect = "Allow",
+      actions = [
+        "dynamodb:Query",
+        "dynamodb:UpdateItem",
+        "dynamodb:DeleteItem"
+      ],
+      # Pending approvals are listed through the collection index
+      resources = [aws_dynamodb_table.state[0].arn, "${aws_dynamodb_table.state[0].arn}/index/collection"]
+    }
+    sns_publish_permissions = {
       effect = "Allow",
       actions = [
-        "states:SendTaskSuccess",
-        "states:SendTaskFailure"
+        "sns:Publish"
       ],
-      resources = ["*"]
+      resources = [aws_sns_topic.human_approval_email[0].arn]
     }
   }
 
@@ -530,7 +891,287 @@ module "lambda_handle_approval_callback" {
   layers = [module.lambda_layer.lambda_layer_arn]
 
   tags = merge(
-    { Name = format("%s-handle-approval-callback-function", local.name_prefix) },
+    { Name = format("%s-send-approval-digest-function", local.name_prefix) },
     local.common_merged_tags
   )
-}
\ No newline at end of file
+}
+
+############################################################
+# Lambda: accept_batch
+############################################################
+module "lambda_accept_batch" {
+  count   = local.accept_batch_enabled ? 1 : 0
+  source  = "terraform-aws-modules/lambda/aws"
+  version = "8.1.0"
+
+  function_name = format("%s-accept-batch", local.name_prefix)
+  description   = "Validate and accept queued TGW VPC attachments in batches"
+  handler       = "handler.lambda_handler"
+  runtime       = "python3.11"
+  timeout       = var.function_timeout
+  memory_size   = var.function_memory_size
+  publish       = true
+
+  # Use source path for automatic ZIP creation
+  source_path = "${path.module}/functions/src/handle_accept_batch"
+
+  # Disable function URL (not needed for SQS-triggered Lambda)
+  create_lambda_function_url = false
+
+  # CloudWatch Logs configuration
+  cloudwatch_logs_retention_in_days = var.log_group_retention_days
+  cloudwatch_logs_log_group_class   = var.log_group_class
+
+  environment_variables = {
+    ALLOWED_PRINCIPAL_PATTERNS  = join(",", var.allowed_principal_patterns)
+    IPAM_POOL_IDS               = join(",", var.ipam_pool_ids)
+    IPAM_POOL_INDEX_TTL_SECONDS = var.ipam_pool_index_ttl_seconds
+    IPAM_LOOKUP_MODE            = var.ipam_lookup_mode
+    CIDR_OVERLAP_CHECK_ENABLED  = local.accept_sfn_include_cidr_validation
+    CIDR_INDEX_TTL_SECONDS      = var.cidr_index_ttl_seconds
+    ATTACHMENT_TAG_KEY          = var.attachment_tag_key
+    ATTACHMENT_TAG_VALUE        = var.attachment_tag_value
+    SNS_TOPIC_ARN               = aws_sns_topic.tgw_notifications.arn
+    COALESCE_WINDOW_SECONDS     = var.accept_batch_window_seconds
+    KV_STORE_TABLE              = local.state_item_access_enabled ? aws_dynamodb_table.state[0].name : ""
+    EC2_RATE_LIMITS             = local.ec2_rate_limits
+    LOG_LEVEL                   = var.log_level
+    LOG_EVENT_SAMPLE_RATE       = var.log_event_sample_rate
+    API_METRICS_NAMESPACE       = var.api_metrics_namespace
+  }
+
+  event_source_mapping = {
+    sqs = {
+      event_source_arn                   = aws_sqs_queue.accept_batch[0].arn
+      batch_size                         = var.accept_batch_size
+      maximum_batching_window_in_seconds = var.accept_batch_window_seconds
+      function_response_types            = ["ReportBatchItemFailures"]
+      scaling_config = {
+        maximum_concurrency = var.accept_batch_max_concurrency
+      }
+    }
+  }
+
+  # SQS, EC2 and SNS permissions for batch acceptance
+  attach_policy_statements = true
+  policy_statements = merge(
+    {
+      sqs_consume_permissions = {
+        effect = "Allow",
+        actions = [
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:GetQueueAttributes",
+          "sqs:ChangeMessageVisibility"
+        ],
+        resources = [aws_sqs_queue.accept_batch[0].arn]
+      }
+      ec2_tgw_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeTransitGateway*",
+          "ec2:AcceptTransitGatewayVpcAttachment",
+          "ec2:CreateTags",
+          "ec2:GetIpamPoolAllocations",
+          "ec2:DescribeIpamPools",
+          "ec2:GetIpamResourceCidrs"
+        ],
+        resources = ["*"]
+      }
+      sns_publish_permissions = {
+        effect = "Allow",
+        actions = [
+          "sns:Publish"
+        ],
+        resources = [aws_sns_topic.tgw_notifications.arn]
+      }
+    },
+    local.state_item_policy_statements
+  )
+
+  # Include common layer
+  layers = [module.lambda_layer.lambda_layer_arn]
+
+  tags = merge(
+    { Name = format("%s-accept-batch-function", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
+
+############################################################
+# Lambda: sweep_pending_attachments
+############################################################
+module "lambda_sweep_pending_attachments" {
+  count   = var.sweeper_enabled ? 1 : 0
+  source  = "terraform-aws-modules/lambda/aws"
+  version = "8.1.0"
+
+  function_name = format("%s-sweep-pending-attachments", local.name_prefix)
+  description   = "Reconcile TGW VPC attachments left in pendingAcceptance"
+  handler       = "handler.lambda_handler"
+  runtime       = "python3.11"
+  timeout       = var.function_timeout
+  memory_size   = var.function_memory_size
+  publish       = true
+
+  # Use source path for automatic ZIP creation
+  source_path = "${path.module}/functions/src/sweep_pending_attachments"
+
+  # Disable function URL (not needed for EventBridge-triggered Lambda)
+  create_lambda_function_url = false
+
+  # CloudWatch Logs configuration
+  cloudwatch_logs_retention_in_days = var.log_group_retention_days
+  cloudwatch_logs_log_group_class   = var.log_group_class
+
+  environment_variables = {
+    TRANSIT_GATEWAY_IDS         = join(",", var.sweeper_transit_gateway_ids)
+    SWEEP_MIN_AGE_SECONDS       = var.sweeper_min_age_seconds
+    ALLOWED_PRINCIPAL_PATTERNS  = join(",", var.allowed_principal_patterns)
+    SWEEPER_IAM_POLICY          = var.sweeper_iam_policy
+    IPAM_POOL_IDS               = join(",", var.ipam_pool_ids)
+    IPAM_POOL_INDEX_TTL_SECONDS = var.ipam_pool_index_ttl_seconds
+    IPAM_LOOKUP_MODE            = var.ipam_lookup_mode
+    CIDR_OVERLAP_CHECK_ENABLED  = local.accept_sfn_include_cidr_validation
+    CIDR_INDEX_TTL_SECONDS      = var.cidr_index_ttl_seconds
+    ATTACHMENT_TAG_KEY          = var.attachment_tag_key
+    ATTACHMENT_TAG_VALUE        = var.attachment_tag_value
+    # With manual approval, swept attachments go through the accept state machine instead
+    ACCEPT_STATE_MACHINE_ARN = local.accept_sfn_include_manual_approval ? aws_sfn_state_machine.tgw_auto_accept.arn : ""
+    KV_STORE_TABLE           = local.state_item_access_enabled ? aws_dynamodb_table.state[0].name : ""
+    EC2_RATE_LIMITS          = local.ec2_rate_limits
+    LOG_LEVEL                = var.log_level
+    LOG_EVENT_SAMPLE_RATE    = var.log_event_sample_rate
+    API_METRICS_NAMESPACE    = var.api_metrics_namespace
+  }
+
+  # Allow the schedule rule to invoke the function
+  create_current_version_allowed_triggers = false
+  allowed_triggers = {
+    sweep_schedule = {
+      principal  = "events.amazonaws.com"
+      source_arn = aws_cloudwatch_event_rule.sweep_pending_attachments[0].arn
+    }
+  }
+
+  # EC2 and Step Functions permissions for reconciling attachments
+  attach_policy_statements = true
+  policy_statements = merge(
+    {
+      ec2_tgw_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeTransitGateway*",
+          "ec2:AcceptTransitGatewayVpcAttachment",
+          "ec2:CreateTags",
+          "ec2:GetIpamPoolAllocations",
+          "ec2:DescribeIpamPools",
+          "ec2:GetIpamResourceCidrs"
+        ],
+        resources = ["*"]
+      }
+      stepfunctions_permissions = {
+        effect = "Allow",
+        actions = [
+          "states:StartExecution"
+        ],
+        resources = [aws_sfn_state_machine.tgw_auto_accept.arn]
+      }
+    },
+    local.state_item_policy_statements
+  )
+
+  # Include common layer
+  layers = [module.lambda_layer.lambda_layer_arn]
+
+  tags = merge(
+    { Name = format("%s-sweep-pending-attachments-function", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
+
+############################################################
+# Lambda: watch_attachments
+############################################################
+module "lambda_watch_attachments" {
+  count   = var.attachment_watcher_enabled ? 1 : 0
+  source  = "terraform-aws-modules/lambda/aws"
+  version = "8.1.0"
+
+  function_name = format("%s-watch-attachments", local.name_prefix)
+  description   = "Resume routing manager executions waiting for TGW attachments to become available"
+  handler       = "handler.lambda_handler"
+  runtime       = "python3.11"
+  timeout       = var.function_timeout
+  memory_size   = var.function_memory_size
+  publish       = true
+
+  # Use source path for automatic ZIP creation
+  source_path = "${path.module}/functions/src/watch_attachments"
+
+  # Disable function URL (not needed for EventBridge-triggered Lambda)
+  create_lambda_function_url = false
+
+  # CloudWatch Logs configuration
+  cloudwatch_logs_retention_in_days = var.log_group_retention_days
+  cloudwatch_logs_log_group_class   = var.log_group_class
+
+  environment_variables = {
+    KV_STORE_TABLE         = aws_dynamodb_table.state[0].name
+    WATCH_INTERVAL_SECONDS = var.attachment_watcher_interval_seconds
+    EC2_RATE_LIMITS        = local.ec2_rate_limits
+    LOG_LEVEL              = var.log_level
+    LOG_EVENT_SAMPLE_RATE  = var.log_event_sample_rate
+    API_METRICS_NAMESPACE  = var.api_metrics_namespace
+  }
+
+  # Allow the schedule rule to invoke the function
+  create_current_version_allowed_triggers = false
+  allowed_triggers = {
+    watch_schedule = {
+      principal  = "events.amazonaws.com"
+      source_arn = aws_cloudwatch_event_rule.watch_attachments[0].arn
+    }
+  }
+
+  # EC2, state table and task token permissions for resuming waiting executions
+  attach_policy_statements = true
+  policy_statements = merge(
+    {
+      ec2_tgw_permissions = {
+        effect = "Allow",
+        actions = [
+          "ec2:DescribeTransitGatewayAttachments"
+        ],
+        resources = ["*"]
+      }
+      state_table_permissions = {
+        effect = "Allow",
+        actions = [
+          "dynamodb:Query",
+          "dynamodb:UpdateItem",
+          "dynamodb:DeleteItem"
+        ],
+        # Waiters are listed through the collection index
+        resources = [aws_dynamodb_table.state[0].arn, "${aws_dynamodb_table.state[0].arn}/index/collection"]
+      }
+      stepfunctions_permissions = {
+        effect = "Allow",
+        actions = [
+          "states:SendTaskSuccess",
+          "states:SendTaskFailure"
+        ],
+        resources = [local.routing_manager_state_machine_arn]
+      }
+    },
+    local.state_item_policy_statements
+  )
+
+  # Include common layer
+  layers = [module.lambda_layer.lambda_layer_arn]
+
+  tags = merge(
+    { Name = format("%s-watch-attachments-function", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
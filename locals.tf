@@ -15,15 +15,18 @@ locals {
 
   # Merge validation steps based on configuration
   accept_sfn_conditional_validation_steps = merge(
-    local.accept_sfn_include_iam_validation ? local.accept_sfn_check_iam_step : {},
-    local.accept_sfn_include_ipam_validation ? local.accept_sfn_check_ipam_step : {},
+    !local.accept_sfn_fused_pipeline && local.accept_sfn_include_iam_validation ? local.accept_sfn_check_iam_step : {},
+    !local.accept_sfn_fused_pipeline && local.accept_sfn_include_ipam_validation ? local.accept_sfn_check_ipam_step : {},
+    !local.accept_sfn_fused_pipeline && local.accept_sfn_include_cidr_validation ? local.accept_sfn_check_cidr_step : {},
+    local.accept_sfn_fused_pipeline && local.accept_sfn_include_manual_approval && length(local.accept_sfn_fused_validation_stages) > 0 ? local.accept_sfn_fused_validate_step : {},
     local.accept_sfn_include_manual_approval ? local.accept_sfn_manual_approval_step : null
   )
 
   # Merge acceptance steps based on configuration
   accept_sfn_conditional_acceptance_steps = merge(
-    local.accept_sfn_accept_step,
-    local.accept_sfn_include_attachment_tagging ? local.accept_sfn_tag_attachment_step : {},
+    local.accept_sfn_fused_pipeline ? local.accept_sfn_fused_accept_step : {},
+    !local.accept_sfn_fused_pipeline ? local.accept_sfn_accept_step : {},
+    !local.accept_sfn_fused_pipeline && local.accept_sfn_include_attachment_tagging ? local.accept_sfn_tag_attachment_step : {},
     local.accept_sfn_tag_publish_success_step,
     local.accept_sfn_tag_publish_failure_step,
     local.accept_sfn_failure_step,
@@ -36,7 +39,7 @@ locals {
   )
 
   # Determine the start step based on configuration
-  accept_sfn_start_step = coalesce(
+  accept_sfn_start_step = local.accept_sfn_fused_pipeline ? local.accept_sfn_fused_start_step : coalesce(
     length(var.allowed_principal_patterns) > 0 ? "Check IAM principal" : null,
     length(var.ipam_pool_ids) > 0 ? "Check IPAM pool" : null,
     length(var.approval_email_addresses) > 0 ? "Manual Approval" : "Accept attachment",
@@ -47,14 +50,51 @@ locals {
   accept_sfn_include_manual_approval    = length(var.approval_email_addresses) > 0 ? true : false
   accept_sfn_include_iam_validation     = length(var.allowed_principal_patterns) > 0 ? true : false
   accept_sfn_include_ipam_validation    = length(var.ipam_pool_ids) > 0 ? true : false
+  accept_sfn_include_cidr_validation    = var.cidr_overlap_check_enabled && length(var.ipam_pool_ids) > 0
   accept_sfn_include_attachment_tagging = var.attachment_tag_key != "" && var.attachment_tag_value != "" ? true : false
+
+  # Manual approvals are collected for a digest only when there is a manual approval step
+  approval_digest_enabled      = var.approval_digest_enabled && local.accept_sfn_include_manual_approval
+  approval_short_links_enabled = var.approval_short_links_enabled && local.accept_sfn_include_manual_approval
+  # Digest items and short link IDs are kept in the state table
+  approval_state_enabled = local.approval_digest_enabled || local.approval_short_links_enabled
+  approval_api_endpoint  = local.accept_sfn_include_manual_approval ? "https://${aws_api_gateway_rest_api.approval_api[0].id}.execute-api.${data.aws_region.current.region}.amazonaws.com/states" : ""
+
+  # Token buckets shared by every function calling EC2, empty when not limited
+  ec2_rate_limits_enabled = length(var.ec2_rate_limits) > 0
+  ec2_rate_limits         = local.ec2_rate_limits_enabled ? jsonencode({
+    for category, bucket in var.ec2_rate_limits : category => merge(bucket, { reserve = min(var.ec2_rate_limit_reserve, bucket.burst) })
+  }) : ""
+
+  # DynamoDB table for state shared between functions
+  state_table_enabled = var.attachment_watcher_enabled || local.approval_state_enabled || var.idempotency_enabled || local.ec2_rate_limits_enabled
+
+  # Read, claim and release idempotency records of the state machine stages and rate limit buckets
+  state_item_access_enabled = var.idempotency_enabled || local.ec2_rate_limits_enabled
+  state_item_policy_statements = local.state_item_access_enabled ? {
+    state_item_permissions = {
+      effect = "Allow",
+      actions = [
+        "dynamodb:GetItem",
+        "dynamodb:UpdateItem",
+        "dynamodb:DeleteItem"
+      ],
+      resources = [aws_dynamodb_table.state[0].arn]
+    }
+  } : {}
+
+  # Built from the name, referencing the state machine would create a cycle with the functions it invokes
+  routing_manager_state_machine_arn = format("arn:aws:states:%s:%s:stateMachine:%s-routing-manager", data.aws_region.current.region, data.aws_caller_identity.current.account_id, local.name_prefix)
+
+  # Batch acceptance bypasses the accept state machine, so it cannot be combined with manual approval
+  accept_batch_enabled = var.accept_batch_enabled && !local.accept_sfn_include_manual_approval
   accept_sfn_manual_approval_step = {
     "Manual Approval" : {
       "Type" : "Task",
       "Resource" : "arn:aws:states:::lambda:invoke.waitForTaskToken",
       "Arguments" : {
         "FunctionName" : local.accept_sfn_include_manual_approval ? "${module.lambda_send_approval_email[0].lambda_function_arn}:$LATEST" : "",
-        "Payload" : local.accept_sfn_include_manual_approval ? "{% $merge([$states.input, {'ExecutionContext': $states.context, 'APIGatewayEndpoint': 'https://${aws_api_gateway_rest_api.approval_api[0].id}.execute-api.${data.aws_region.current.region}.amazonaws.com/states'}]) %}" : ""
+        "Payload" : local.accept_sfn_include_manual_approval ? "{% $merge([$states.input, {'ExecutionContext': $states.context, 'APIGatewayEndpoint': '${local.approval_api_endpoint}'}]) %}" : ""
       },
       "Output" : "{% $merge([$states.input, {'GetManualApprovalEventPayload': $states.result}]) %}",
       "Catch" : [
@@ -88,6 +128,9 @@ locals {
     length(var.approval_email_addresses) > 0 ? "Manual Approval" : "Accept attachment",
     "Accept attachment"
   )
+  accept_sfn_check_ipam_step_next = local.accept_sfn_include_cidr_validation ? "Check CIDR overlap" : (
+    length(var.approval_email_addresses) > 0 ? "Manual Approval" : "Accept attachment"
+  )
   accept_sfn_check_iam_step = {
     "Check IAM principal" : {
       "Type" : "Task",
@@ -117,6 +160,16 @@ locals {
           "MaxAttempts" : 3,
           "BackoffRate" : 2,
           "JitterStrategy" : "FULL"
+        },
+        # A duplicate execution still running the stage, see idempotency.py
+        {
+          "ErrorEquals" : [
+            "IdempotencyInProgressError"
+          ],
+          "IntervalSeconds" : 5,
+          "MaxAttempts" : 6,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
         }
       ],
       "Next" : local.accept_sfn_accept_sfn_check_iam_step_next
@@ -151,6 +204,61 @@ locals {
           "MaxAttempts" : 3,
           "BackoffRate" : 2,
           "JitterStrategy" : "FULL"
+        },
+        # A duplicate execution still running the stage, see idempotency.py
+        {
+          "ErrorEquals" : [
+            "IdempotencyInProgressError"
+          ],
+          "IntervalSeconds" : 5,
+          "MaxAttempts" : 6,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
+        }
+      ],
+      "Next" : local.accept_sfn_check_ipam_step_next
+    },
+  }
+
+  accept_sfn_check_cidr_step = {
+    "Check CIDR overlap" : {
+      "Type" : "Task",
+      "Resource" : "arn:aws:states:::lambda:invoke",
+      "Arguments" : {
+        "FunctionName" : local.accept_sfn_include_cidr_validation ? "${module.lambda_validate_cidr_overlap[0].lambda_function_arn}:$LATEST" : "",
+        "Payload" : "{% $states.input %}"
+      },
+      "Output" : "{% $merge([$states.input, {'CIDRValidationPayload': $states.result}]) %}",
+      "Catch" : [
+        {
+          "ErrorEquals" : [
+            "States.TaskFailed"
+          ],
+          "Next" : "Publish failure"
+        }
+      ],
+      "Retry" : [
+        {
+          "ErrorEquals" : [
+            "Lambda.ServiceException",
+            "Lambda.AWSLambdaException",
+            "Lambda.SdkClientException",
+            "Lambda.TooManyRequestsException"
+          ],
+          "IntervalSeconds" : 1,
+          "MaxAttempts" : 3,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
+        },
+        # A duplicate execution still running the stage, see idempotency.py
+        {
+          "ErrorEquals" : [
+            "IdempotencyInProgressError"
+          ],
+          "IntervalSeconds" : 5,
+          "MaxAttempts" : 6,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
         }
       ],
       "Next" : length(var.approval_email_addresses) > 0 ? "Manual Approval" : "Accept attachment"
@@ -187,6 +295,16 @@ locals {
           "MaxAttempts" : 3,
           "BackoffRate" : 2,
           "JitterStrategy" : "FULL"
+        },
+        # A duplicate execution still running the stage, see idempotency.py
+        {
+          "ErrorEquals" : [
+            "IdempotencyInProgressError"
+          ],
+          "IntervalSeconds" : 5,
+          "MaxAttempts" : 6,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
         }
       ],
       "Next" : "Publish success"
@@ -250,6 +368,16 @@ locals {
           "MaxAttempts" : 3,
           "BackoffRate" : 2,
           "JitterStrategy" : "FULL"
+        },
+        # A duplicate execution still running the stage, see idempotency.py
+        {
+          "ErrorEquals" : [
+            "IdempotencyInProgressError"
+          ],
+          "IntervalSeconds" : 5,
+          "MaxAttempts" : 6,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
         }
       ],
       "Next" : local.accept_sfn_include_attachment_tagging ? "Tag attachment" : "Publish success"
@@ -264,6 +392,118 @@ locals {
     }
   }
 
+  # Fused pipeline: stages run in-process by the accept_pipeline Lambda. Without manual approval
+  # every stage runs in the "Accept attachment" step, with it validation runs before the approval.
+  accept_sfn_fused_pipeline = var.accept_sfn_fused_pipeline
+  accept_sfn_fused_validation_stages = compact([
+    local.accept_sfn_include_iam_validation ? "validate_iam" : "",
+    local.accept_sfn_include_ipam_validation ? "validate_ipam" : "",
+    local.accept_sfn_include_cidr_validation ? "validate_cidr_overlap" : ""
+  ])
+  accept_sfn_fused_acceptance_stages = compact([
+    "accept",
+    local.accept_sfn_include_attachment_tagging ? "tag_attachment" : ""
+  ])
+  accept_sfn_fused_start_step = local.accept_sfn_include_manual_approval ? (
+    length(local.accept_sfn_fused_validation_stages) > 0 ? "Validate attachment" : "Manual Approval"
+  ) : "Accept attachment"
+
+  accept_sfn_fused_validate_step = {
+    "Validate attachment" : {
+      "Type" : "Task",
+      "Resource" : "arn:aws:states:::lambda:invoke",
+      "Arguments" : {
+        "FunctionName" : local.accept_sfn_fused_pipeline ? "${module.lambda_accept_pipeline[0].lambda_function_arn}:$LATEST" : "",
+        "Payload" : {
+          "Stages" : local.accept_sfn_fused_validation_stages,
+          "Event" : "{% $states.input %}"
+        }
+      },
+      "Output" : "{% $merge([$states.input, $states.result.Payload.Results]) %}",
+      "Catch" : [
+        {
+          "ErrorEquals" : [
+            "States.TaskFailed"
+          ],
+          "Next" : "Publish failure"
+        }
+      ],
+      "Retry" : [
+        {
+          "ErrorEquals" : [
+            "Lambda.ServiceException",
+            "Lambda.AWSLambdaException",
+            "Lambda.SdkClientException",
+            "Lambda.TooManyRequestsException"
+          ],
+          "IntervalSeconds" : 1,
+          "MaxAttempts" : 3,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
+        },
+        # A duplicate execution still running the stage, see idempotency.py
+        {
+          "ErrorEquals" : [
+            "IdempotencyInProgressError"
+          ],
+          "IntervalSeconds" : 5,
+          "MaxAttempts" : 6,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
+        }
+      ],
+      "Next" : "Manual Approval"
+    },
+  }
+
+  accept_sfn_fused_accept_step = {
+    "Accept attachment" : {
+      "Type" : "Task",
+      "Resource" : "arn:aws:states:::lambda:invoke",
+      "Arguments" : {
+        "FunctionName" : local.accept_sfn_fused_pipeline ? "${module.lambda_accept_pipeline[0].lambda_function_arn}:$LATEST" : "",
+        "Payload" : {
+          "Stages" : local.accept_sfn_include_manual_approval ? local.accept_sfn_fused_acceptance_stages : concat(local.accept_sfn_fused_validation_stages, local.accept_sfn_fused_acceptance_stages),
+          "Event" : "{% $states.input %}"
+        }
+      },
+      "Output" : "{% $merge([$states.input, $states.result.Payload.Results]) %}",
+      "Catch" : [
+        {
+          "ErrorEquals" : [
+            "States.TaskFailed"
+          ],
+          "Next" : "Publish failure"
+        }
+      ],
+      "Retry" : [
+        {
+          "ErrorEquals" : [
+            "Lambda.ServiceException",
+            "Lambda.AWSLambdaException",
+            "Lambda.SdkClientException",
+            "Lambda.TooManyRequestsException"
+          ],
+          "IntervalSeconds" : 1,
+          "MaxAttempts" : 3,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
+        },
+        # A duplicate execution still running the stage, see idempotency.py
+        {
+          "ErrorEquals" : [
+            "IdempotencyInProgressError"
+          ],
+          "IntervalSeconds" : 5,
+          "MaxAttempts" : 6,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
+        }
+      ],
+      "Next" : "Publish success"
+    },
+  }
+
 
   ####################################
   # Routing manager state machine
@@ -292,21 +532,27 @@ locals {
   routing_manager_sfn_include_get_pool_tags_step      = var.ipam_association_tag_key != "" || var.ipam_propagation_tag_key != "" ? true : false
   routing_manager_sfn_include_handle_association_step = var.ipam_association_tag_key != "" || var.default_associate_route_table_id != "" ? true : false
   routing_manager_sfn_include_handle_propagation_step = var.ipam_propagation_tag_key != "" || var.default_propagate_route_table_ids != "" ? true : false
+  # The VPC CIDRs compared with the route tables come from IPAM
+  propagation_impact_mode = length(var.ipam_pool_ids) > 0 ? var.propagation_impact_mode : "off"
 
   routing_manager_sfn_start_step = "Wait for attachment available"
+  # In watcher mode the Lambda registers the task token and watch_attachments completes it.
+  # The task result is then the Lambda payload itself, it is wrapped to keep the same shape.
   routing_manager_sfn_wait_for_available_step = {
     "Wait for attachment available" : {
       "Type" : "Task",
-      "Resource" : "arn:aws:states:::lambda:invoke",
+      "Resource" : var.attachment_watcher_enabled ? "arn:aws:states:::lambda:invoke.waitForTaskToken" : "arn:aws:states:::lambda:invoke",
       "Arguments" : {
         "FunctionName" : "${module.lambda_wait_for_available_tgwa.lambda_function_arn}:$LATEST",
-        "Payload" : "{% $states.input %}"
+        "Payload" : var.attachment_watcher_enabled ? "{% $merge([$states.input, {'TaskToken': $states.context.Task.Token}]) %}" : "{% $states.input %}"
       },
-      "Output" : "{% $merge([$states.input, {'WaitForAvailablePayload': $states.result}]) %}",
+      "Output" : var.attachment_watcher_enabled ? "{% $merge([$states.input, {'WaitForAvailablePayload': {'Payload': $states.result}}]) %}" : "{% $merge([$states.input, {'WaitForAvailablePayload': $states.result}]) %}",
+      "TimeoutSeconds" : var.wait_for_available_max_seconds + 600,
       "Catch" : [
         {
           "ErrorEquals" : [
-            "States.TaskFailed"
+            "States.TaskFailed",
+            "States.Timeout"
           ],
           "Next" : "Publish failure"
         }
@@ -323,18 +569,20 @@ locals {
           "MaxAttempts" : 3,
           "BackoffRate" : 2,
           "JitterStrategy" : "FULL"
-        },
+        }
+      ],
+      "Next" : "Attachment available?"
+    },
+    # The Lambda polls until its time budget runs out and returns PENDING with a checkpoint to resume from
+    "Attachment available?" : {
+      "Type" : "Choice",
+      "Choices" : [
         {
-          "ErrorEquals" : [
-            "States.TaskFailed"
-          ],
-          "IntervalSeconds" : 10,
-          "MaxAttempts" : 30,
-          "BackoffRate" : 1.2,
-          "JitterStrategy" : "FULL"
+          "Condition" : "{% $states.input.WaitForAvailablePayload.Payload.result = 'PENDING' %}",
+          "Next" : "Wait for attachment available"
         }
       ],
-      "Next" : local.routing_manager_sfn_include_get_pool_tags_step ? "Get pool tags" : local.routing_manager_sfn_include_handle_association_step ? "Handle association" : local.routing_manager_sfn_include_handle_propagation_step ? "Handle propagation" : "Publish success"
+      "Default" : local.routing_manager_sfn_include_get_pool_tags_step ? "Get pool tags" : local.routing_manager_sfn_include_handle_association_step ? "Handle association" : local.routing_manager_sfn_include_handle_propagation_step ? "Handle propagation" : "Publish success"
     }
   }
 
@@ -367,6 +615,16 @@ locals {
           "MaxAttempts" : 3,
           "BackoffRate" : 2,
           "JitterStrategy" : "FULL"
+        },
+        # A duplicate execution still running the stage, see idempotency.py
+        {
+          "ErrorEquals" : [
+            "IdempotencyInProgressError"
+          ],
+          "IntervalSeconds" : 5,
+          "MaxAttempts" : 6,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
         }
       ],
       "Next" : local.routing_manager_sfn_include_handle_association_step ? "Handle association" : local.routing_manager_sfn_include_handle_propagation_step ? "Handle propagation" : "Publish success"
@@ -402,6 +660,16 @@ locals {
           "MaxAttempts" : 3,
           "BackoffRate" : 2,
           "JitterStrategy" : "FULL"
+        },
+        # A duplicate execution still running the stage, see idempotency.py
+        {
+          "ErrorEquals" : [
+            "IdempotencyInProgressError"
+          ],
+          "IntervalSeconds" : 5,
+          "MaxAttempts" : 6,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
         }
       ],
       "Next" : local.routing_manager_sfn_include_handle_propagation_step ? "Handle propagation" : "Publish success"
@@ -438,6 +706,16 @@ locals {
           "MaxAttempts" : 3,
           "BackoffRate" : 2,
           "JitterStrategy" : "FULL"
+        },
+        # A duplicate execution still running the stage, see idempotency.py
+        {
+          "ErrorEquals" : [
+            "IdempotencyInProgressError"
+          ],
+          "IntervalSeconds" : 5,
+          "MaxAttempts" : 6,
+          "BackoffRate" : 2,
+          "JitterStrategy" : "FULL"
         }
       ],
       "Next" : "Publish success"
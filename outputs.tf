@@ -48,6 +48,11 @@ output "lambda_validate_ipam_function_arn" {
   value       = local.accept_sfn_include_ipam_validation ? module.lambda_validate_ipam[0].lambda_function_arn : ""
 }
 
+output "lambda_validate_cidr_overlap_function_arn" {
+  description = "The ARN of the Lambda function that checks attaching VPCs for overlapping CIDRs"
+  value       = local.accept_sfn_include_cidr_validation ? module.lambda_validate_cidr_overlap[0].lambda_function_arn : ""
+}
+
 output "lambda_get_pool_tags_function_arn" {
   description = "The ARN of the Lambda function that retrieves IPAM pool tags"
   value       = local.routing_manager_sfn_include_get_pool_tags_step ? module.lambda_get_pool_tags[0].lambda_function_arn : ""
@@ -78,3 +83,48 @@ output "routing_manager_state_machine_arn" {
   value       = aws_sfn_state_machine.routing_manager.arn
 }
 
+output "tgw_auto_accept_state_machine_definition" {
+  description = "The rendered definition of the auto-accept state machine, for running it locally"
+  value       = aws_sfn_state_machine.tgw_auto_accept.definition
+}
+
+output "routing_manager_state_machine_definition" {
+  description = "The rendered definition of the routing manager state machine, for running it locally"
+  value       = aws_sfn_state_machine.routing_manager.definition
+}
+
+
+output "lambda_accept_pipeline_function_arn" {
+  description = "The ARN of the Lambda function running the fused accept pipeline"
+  value       = var.accept_sfn_fused_pipeline ? module.lambda_accept_pipeline[0].lambda_function_arn : ""
+}
+
+output "lambda_accept_batch_function_arn" {
+  description = "The ARN of the Lambda function that accepts queued TGW attachments in batches"
+  value       = local.accept_batch_enabled ? module.lambda_accept_batch[0].lambda_function_arn : ""
+}
+
+output "accept_batch_queue_arn" {
+  description = "The ARN of the SQS queue buffering attachment create events for the batch accepter"
+  value       = local.accept_batch_enabled ? aws_sqs_queue.accept_batch[0].arn : ""
+}
+
+output "lambda_sweep_pending_attachments_function_arn" {
+  description = "The ARN of the Lambda function that sweeps attachments left in pendingAcceptance"
+  value       = var.sweeper_enabled ? module.lambda_sweep_pending_attachments[0].lambda_function_arn : ""
+}
+
+output "lambda_watch_attachments_function_arn" {
+  description = "The ARN of the Lambda function resolving attachment states for waiting routing manager executions"
+  value       = var.attachment_watcher_enabled ? module.lambda_watch_attachments[0].lambda_function_arn : ""
+}
+
+output "lambda_send_approval_digest_function_arn" {
+  description = "The ARN of the Lambda function sending pending manual approvals as digests"
+  value       = local.approval_digest_enabled ? module.lambda_send_approval_digest[0].lambda_function_arn : ""
+}
+
+output "state_table_name" {
+  description = "The name of the DynamoDB table holding state shared between functions"
+  value       = local.state_table_enabled ? aws_dynamodb_table.state[0].name : ""
+}
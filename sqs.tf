@@ -0,0 +1,59 @@
+########################################################
+# SQS queue for batched attachment acceptance
+########################################################
+
+resource "aws_sqs_queue" "accept_batch_dlq" {
+  count = local.accept_batch_enabled ? 1 : 0
+  name  = format("%s-accept-batch-dlq", local.name_prefix)
+
+  message_retention_seconds = 1209600
+
+  tags = merge(
+    { Name = format("%s-accept-batch-dlq", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
+
+resource "aws_sqs_queue" "accept_batch" {
+  count = local.accept_batch_enabled ? 1 : 0
+  name  = format("%s-accept-batch", local.name_prefix)
+
+  # Lambda recommends at least six times the function timeout for SQS event sources
+  visibility_timeout_seconds = var.function_timeout * 6
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.accept_batch_dlq[0].arn
+    maxReceiveCount     = 5
+  })
+
+  tags = merge(
+    { Name = format("%s-accept-batch", local.name_prefix) },
+    local.common_merged_tags
+  )
+}
+
+# Allow the create rule to deliver events to the queue
+resource "aws_sqs_queue_policy" "accept_batch" {
+  count     = local.accept_batch_enabled ? 1 : 0
+  queue_url = aws_sqs_queue.accept_batch[0].id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Sid    = "AllowEventBridgeSend"
+        Effect = "Allow"
+        Principal = {
+          Service = "events.amazonaws.com"
+        }
+        Action   = "sqs:SendMessage"
+        Resource = aws_sqs_queue.accept_batch[0].arn
+        Condition = {
+          ArnEquals = {
+            "aws:SourceArn" = module.eventbridge.eventbridge_rule_arns["tgw_create_auto_attach"]
+          }
+        }
+      }
+    ]
+  })
+}
@@ -41,7 +41,9 @@ resource "aws_iam_policy" "step_functions_lambda" {
         Resource = compact([
           length(var.allowed_principal_patterns) > 0 ? "${module.lambda_validate_iam[0].lambda_function_arn}:*" : null,
           length(var.ipam_pool_ids) > 0 ? "${module.lambda_validate_ipam[0].lambda_function_arn}:*" : null,
+          local.accept_sfn_include_cidr_validation ? "${module.lambda_validate_cidr_overlap[0].lambda_function_arn}:*" : null,
           "${module.lambda_accepter.lambda_function_arn}:*",
+          var.accept_sfn_fused_pipeline ? "${module.lambda_accept_pipeline[0].lambda_function_arn}:*" : null,
           var.attachment_tag_key != "" && var.attachment_tag_value != "" ? "${module.lambda_handle_attachment_tags[0].lambda_function_arn}:*" : null,
           length(var.approval_email_addresses) > 0 ? "${module.lambda_send_approval_email[0].lambda_function_arn}:*" : null,
           length(var.approval_email_addresses) > 0 ? "${module.lambda_handle_approval_callback[0].lambda_function_arn}:*" : null
@@ -55,10 +55,50 @@ variable "default_propagate_route_table_ids" {
   default     = ""
 }
 
+variable "propagation_max_workers" {
+  description = "Maximum number of route table propagations enabled concurrently for one attachment"
+  type        = number
+  default     = 8
+}
+
+variable "propagation_impact_mode" {
+  description = "Preview of the existing routes a new VPC's CIDRs shadow or are shadowed by in its propagation route tables: 'off', 'report' to add it to the propagation result, or 'block' to also fail before enabling propagation on exact or more specific conflicting routes. CIDRs are looked up in the IPAM scopes of ipam_pool_ids, so the preview only runs when ipam_pool_ids is set"
+  type        = string
+  default     = "off"
+
+  validation {
+    condition     = contains(["off", "report", "block"], var.propagation_impact_mode)
+    error_message = "propagation_impact_mode must be 'off', 'report' or 'block'."
+  }
+}
+
+variable "wait_for_available_max_seconds" {
+  description = "Maximum number of seconds the routing manager waits for an accepted attachment to become available before failing"
+  type        = number
+  default     = 3600
+}
+
 variable "log_level" {
   description = "Log level for the Lambda function"
   type        = string
-  default     = "DEBUG"
+  default     = "INFO"
+}
+
+variable "log_event_sample_rate" {
+  description = "Share of invocations, from 0 to 1, whose raw event is logged when log_level is DEBUG"
+  type        = number
+  default     = 1
+
+  validation {
+    condition     = var.log_event_sample_rate >= 0 && var.log_event_sample_rate <= 1
+    error_message = "log_event_sample_rate must be between 0 and 1."
+  }
+}
+
+variable "api_metrics_namespace" {
+  description = "CloudWatch namespace of the per-invocation AWS API call metrics the Lambda functions log in Embedded Metric Format. Set to an empty string to disable them"
+  type        = string
+  default     = "TransitGatewayAttachmentManager"
 }
 
 variable "ipam_pool_ids" {
@@ -67,6 +107,41 @@ variable "ipam_pool_ids" {
   default     = []
 }
 
+variable "cidr_overlap_check_enabled" {
+  description = "Reject attachments of VPCs with a CIDR overlapping a VPC already attached to the Transit Gateway. CIDRs are looked up in the IPAM scopes of ipam_pool_ids, so the check only runs when ipam_pool_ids is set"
+  type        = bool
+  default     = false
+}
+
+variable "cidr_index_ttl_seconds" {
+  description = "Seconds the CIDR overlap check keeps its index of attached VPC CIDRs in line with the attachments before rebuilding it from a full IPAM listing"
+  type        = number
+  default     = 300
+}
+
+variable "ipam_pool_index_ttl_seconds" {
+  description = "Seconds a cached listing of an IPAM pool's allocations is reused by warm Lambda containers before it is refreshed"
+  type        = number
+  default     = 300
+}
+
+variable "ipam_pool_tag_ttl_seconds" {
+  description = "Seconds the tags of IPAM pools are reused by warm Lambda containers before they are described again"
+  type        = number
+  default     = 3600
+}
+
+variable "ipam_lookup_mode" {
+  description = "How a VPC's IPAM pool is found on a cache miss: 'targeted' asks IPAM for the VPC's resource CIDRs and falls back to listing pool allocations, 'scan' only lists pool allocations"
+  type        = string
+  default     = "targeted"
+
+  validation {
+    condition     = contains(["targeted", "scan"], var.ipam_lookup_mode)
+    error_message = "ipam_lookup_mode must be either 'targeted' or 'scan'."
+  }
+}
+
 variable "ipam_association_tag_key" {
   description = "Tag key to retrieve association route table ID from the IPAM pool"
   type        = string
@@ -94,4 +169,147 @@ variable "approval_email_addresses" {
   description = "Comma-separated list of email addresses for approval notifications. Will create a SNS subscription for each email address provided."
   type        = string
   default     = ""
-}
\ No newline at end of file
+}
+
+variable "approval_short_links_enabled" {
+  description = "Put a short random ID in the approve/reject links instead of the Step Functions task token. The ID is kept in the state table, and only the first click on a link completes the approval. Creates the state table when enabled"
+  type        = bool
+  default     = false
+}
+
+variable "approval_digest_enabled" {
+  description = "Send pending manual approvals as one digest email per approval_digest_schedule_expression run, with approve/reject links per attachment and for all of them, instead of one email per execution"
+  type        = bool
+  default     = false
+}
+
+variable "approval_digest_schedule_expression" {
+  description = "EventBridge schedule expression for the approval digest, i.e. how long approvals are collected before they are sent"
+  type        = string
+  default     = "rate(15 minutes)"
+}
+
+variable "approval_digest_max_items" {
+  description = "Maximum number of approvals in one digest email, larger bursts are sent as several emails"
+  type        = number
+  default     = 100
+}
+
+variable "accept_sfn_fused_pipeline" {
+  description = "Run the validation, accept and tagging steps of the accept state machine in a single Lambda invocation instead of one Lambda per step. With manual approval, validation runs in one invocation before the approval step and accept and tagging in another after it."
+  type        = bool
+  default     = false
+}
+
+variable "accept_batch_enabled" {
+  description = "Queue attachment create events on SQS and accept them in batches instead of starting one accept state machine execution per attachment. Ignored when approval_email_addresses is set."
+  type        = bool
+  default     = false
+}
+
+variable "accept_batch_size" {
+  description = "Maximum number of queued attachment events processed per batch accepter invocation"
+  type        = number
+  default     = 25
+}
+
+variable "accept_batch_window_seconds" {
+  description = "Maximum number of seconds the queue waits to fill a batch before invoking the batch accepter. Events of a batch are coalesced per Transit Gateway, so this bounds the latency coalescing adds to an event"
+  type        = number
+  default     = 10
+
+  validation {
+    condition     = var.accept_batch_window_seconds >= 0 && var.accept_batch_window_seconds <= 300
+    error_message = "accept_batch_window_seconds must be between 0 and 300."
+  }
+}
+
+variable "accept_batch_max_concurrency" {
+  description = "Maximum number of concurrent batch accepter invocations"
+  type        = number
+  default     = 2
+}
+
+variable "idempotency_enabled" {
+  description = "Record each state machine stage per attachment event in the state table, so an event delivered twice runs every stage once and the duplicate execution replays the recorded results"
+  type        = bool
+  default     = false
+}
+
+variable "ec2_rate_limits" {
+  description = "Token buckets shared by all functions for EC2 API calls, per category (mutating, non_mutating, ipam): refill rate in calls per second and burst size. Callers wait for a token instead of being throttled. Empty disables rate limiting"
+  type = map(object({
+    rate  = number
+    burst = number
+  }))
+  default = {}
+
+  validation {
+    condition     = alltrue([for category, bucket in var.ec2_rate_limits : contains(["mutating", "non_mutating", "ipam"], category) && bucket.rate > 0 && bucket.burst >= 1])
+    error_message = "Categories must be mutating, non_mutating or ipam, with a positive rate and a burst of at least 1."
+  }
+}
+
+variable "ec2_rate_limit_reserve" {
+  description = "Tokens a Lambda container takes from a rate limit bucket in one write, keeping the ones it does not use right away for its next calls. Values above 1 cut contention on the bucket items during bursts, tokens left unused expire. Capped at each bucket's burst"
+  type        = number
+  default     = 1
+
+  validation {
+    condition     = var.ec2_rate_limit_reserve >= 1 && floor(var.ec2_rate_limit_reserve) == var.ec2_rate_limit_reserve
+    error_message = "The reserve must be a whole number of at least 1."
+  }
+}
+
+variable "sweeper_enabled" {
+  description = "Periodically look for attachments left in pendingAcceptance (e.g. because their create event was lost) and run them through validation and acceptance"
+  type        = bool
+  default     = false
+}
+
+variable "sweeper_schedule_expression" {
+  description = "EventBridge schedule expression for the pendingAcceptance sweeper"
+  type        = string
+  default     = "rate(5 minutes)"
+}
+
+variable "sweeper_transit_gateway_ids" {
+  description = "Transit Gateway IDs swept for pending attachments. Empty sweeps every Transit Gateway visible to the account."
+  type        = list(string)
+  default     = []
+}
+
+variable "sweeper_min_age_seconds" {
+  description = "Minimum age of a pending attachment before the sweeper picks it up, leaving time for the regular event path"
+  type        = number
+  default     = 300
+}
+
+variable "sweeper_iam_policy" {
+  description = "How swept attachments, whose requesting principal is unknown, are checked against allowed_principal_patterns: hold leaves those whose VPC owner account matches no pattern pending and tagged for an operator, skip validates and accepts them without the principal check (with manual approval, an approver still decides)"
+  type        = string
+  default     = "hold"
+
+  validation {
+    condition     = contains(["hold", "skip"], var.sweeper_iam_policy)
+    error_message = "The sweeper IAM policy must be hold or skip."
+  }
+}
+
+variable "attachment_watcher_enabled" {
+  description = "Let one scheduled watcher resolve the state of all attachments the routing manager waits for, instead of each execution polling its own attachment"
+  type        = bool
+  default     = false
+}
+
+variable "attachment_watcher_schedule_expression" {
+  description = "EventBridge schedule expression for the attachment watcher"
+  type        = string
+  default     = "rate(1 minute)"
+}
+
+variable "attachment_watcher_interval_seconds" {
+  description = "Seconds between watch cycles within one attachment watcher run"
+  type        = number
+  default     = 5
+}